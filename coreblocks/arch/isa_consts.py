@@ -171,6 +171,7 @@ class ExceptionCause(IntEnum, shape=5):
     STORE_PAGE_FAULT = 15
     _COREBLOCKS_ASYNC_INTERRUPT = 24
     _COREBLOCKS_MISPREDICTION = 25
+    _COREBLOCKS_REPLAY = 26
 
     @classmethod
     def smode_delegable_mask(cls, xlen: int) -> int:
@@ -70,10 +70,10 @@ class CfiType(IntEnum):
     """
     Types of control flow instructions.
 
-    There are 4 main types: invalid, branch, JAL, and JALR. CALL and RET are
-    just special cases of respectively JAL and JALR and thus the encoding
+    There are 4 main types: invalid, branch, JAL, and JALR. CALL, CALL_INDIRECT and RET
+    are just special cases of respectively JAL and JALR and thus the encoding
     was chosen in the way that it is sufficient to check the lowest two bits to
-    get the main type and the third bit is just a hint about the specialized type.
+    get the main type and the upper bits are just hints about the specialized type.
 
     Because of these encoding tweaks, helper functions should be preferred to use
     to get the CFI type.
@@ -84,6 +84,7 @@ class CfiType(IntEnum):
 
     JALR = 0b010  # Jump and Link Register
     RET = 0b110  # Return from a function (JALR with rs1 equal to x1 or x5)
+    CALL_INDIRECT = 0b1010  # Call a function indirectly (JALR with rd equal to x1 or x5)
 
     JAL = 0b011  # Jump and Link
     CALL = 0b111  # Call a function (JAL with rd equal to x1 or x5))
@@ -104,6 +105,14 @@ class CfiType(IntEnum):
     def is_jalr(val: ValueLike) -> Value:
         return Value.cast(val)[0:2] == CfiType.JALR
 
+    @staticmethod
+    def is_call(val: ValueLike) -> Value:
+        return (Value.cast(val) == CfiType.CALL) | (Value.cast(val) == CfiType.CALL_INDIRECT)
+
+    @staticmethod
+    def is_ret(val: ValueLike) -> Value:
+        return Value.cast(val) == CfiType.RET
+
 
 #
 # Operation types grouped by extensions
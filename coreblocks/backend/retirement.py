@@ -28,6 +28,7 @@ from coreblocks.interface.keys import (
     CSRInstancesKey,
     SideFxGuardKey,
     FTQCommitKey,
+    InstructionCommitKey,
 )
 from coreblocks.priv.csr.csr_instances import CSRAddress, counteren_access_filter
 from coreblocks.priv.csr.csr_register import CSRRegister
@@ -116,6 +117,9 @@ class Retirement(Elaboratable):
         m.submodules.instret_shadow = self.instret_shadow
 
         ftq_commit = self.dependency_manager.get_dependency(FTQCommitKey())
+        instr_commit = self.dependency_manager.get_optional_dependency(InstructionCommitKey())
+        if instr_commit is not None:
+            m.submodules += instr_commit[1]
 
         def free_phys_reg(i: int, rp_dst: Value):
             # mark reg in Register File as free
@@ -221,6 +225,14 @@ class Retirement(Elaboratable):
                             # Do not modify trap related CSRs
                             m.d.av_comb += arch_trap.eq(0)
 
+                            m.d.sync += continue_pc_override.eq(1)
+                            m.d.sync += continue_pc.eq(cause_register.pc)
+                        with m.Elif(cause_register.cause == ExceptionCause._COREBLOCKS_REPLAY):
+                            # Instruction has to be executed again - don't commit it, flush core and
+                            # continue from it. Value of ExceptionCauseRegister pc field is the instruction address.
+                            m.d.av_comb += commit_trapping.eq(0)
+                            m.d.av_comb += arch_trap.eq(0)
+
                             m.d.sync += continue_pc_override.eq(1)
                             m.d.sync += continue_pc.eq(cause_register.pc)
                         with m.Else():
@@ -256,11 +268,14 @@ class Retirement(Elaboratable):
                         with m.Else():
                             m.next = "TRAP_FLUSH"
 
-                    self.instret_csr.write(
-                        m,
-                        data=self.instret_csr.read(m).data
-                        + Mux(exception, no_trap_count + commit_trapping, retire_count),
-                    )
+                    commit_count = Signal.like(retire_count)
+                    m.d.av_comb += commit_count.eq(Mux(exception, no_trap_count + commit_trapping, retire_count))
+
+                    self.instret_csr.write(m, data=self.instret_csr.read(m).data + commit_count)
+
+                    if instr_commit is not None:
+                        with m.If(commit_count != 0):
+                            instr_commit[0](m, rob_id=rob_entries.entries[0].rob_id, count=commit_count)
 
                     last_commit_ftq_ptr = Signal.like(rob_entries.entries[0].rob_data.ftq_ptr)
                     for i in range(self.gen_params.retirement_superscalarity):
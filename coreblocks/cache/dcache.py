@@ -0,0 +1,901 @@
+from dataclasses import dataclass
+from functools import reduce
+import operator
+
+from amaranth import *
+import amaranth.lib.memory as memory
+from amaranth.utils import ceil_log2, exact_log2
+
+from transactron import Method, Methods, Transaction, TModule, def_method, def_methods
+from transactron.lib import *
+from transactron.utils import OneHotMux, assign, logging, popcount
+from transactron.utils.transactron_helpers import make_layout
+from transactron.utils.amaranth_ext.coding import PriorityEncoder
+
+from coreblocks.params import GenParams, DCacheParameters
+from coreblocks.peripherals.bus_adapter import BusMasterInterface, BusParametersInterface, CommonBusMasterMethodLayout
+from coreblocks.func_blocks.fu.lsu.pma import PMAChecker
+from coreblocks.cache.replacement import CacheReplacement
+
+__all__ = ["DCache"]
+
+log = logging.HardwareLogger("backend.lsu.dcache")
+
+
+class DCache(Elaboratable):
+    """A non-blocking, write-back, write-allocate set-associative data cache.
+
+    The cache is placed between the LSU and the data bus. It exposes the same interface
+    as a bus master, so the LSU does not need to know whether the cache is present.
+    Several ports can be created, each of them has its own request and response methods.
+    The read and the write responses of a port are returned separately, each of them
+    in the order of the requests.
+
+    Accepted requests are kept in a table of `DCacheParameters.max_pending_requests` entries
+    until their responses are read. A request is looked up in the cycle after it is accepted.
+    A load hit returns the whole word, a store hit writes the selected bytes and marks
+    the line dirty.
+
+    A miss allocates one of the miss status holding registers (MSHRs). The tag of the victim
+    way is invalidated, the victim line is written back to the bus if it is dirty and the requested
+    line is refilled. Misses of other requests to the same line are merged into the MSHR
+    (secondary misses). The requests waiting for an MSHR are looked up again, in the order
+    of their arrival, when the refill finishes. Meanwhile, the requests to other lines can hit
+    the cache and other lines can be refilled. Only one line of a set is refilled at a time,
+    so that the victim ways are distinct. A request never overtakes an older request to the same
+    line, so the accesses to the same address are performed in order.
+
+    The requests to MMIO regions (see `PMAChecker`) bypass the cache. They are sent directly
+    to the bus when they are the oldest pending request and no other bus access is in progress,
+    so that the order of the device accesses is preserved.
+
+    All the dirty lines can be written back to memory using the `writeback_req` and
+    `writeback_resp` methods, e.g. for FENCE.I or fences ordering device accesses. The sets
+    which contain dirty lines are tracked, so only those sets are visited.
+
+    Attributes
+    ----------
+    ports : list[BusMasterInterface]
+        The ports of the cache.
+    writeback_req : Method
+        Starts writing back all the dirty lines. Ready when the cache is idle.
+    writeback_resp : Method
+        Ready when the write back is finished.
+    """
+
+    def __init__(self, gen_params: GenParams, bus_master: BusMasterInterface, port_count: int = 1) -> None:
+        """
+        Parameters
+        ----------
+        gen_params : GenParams
+            Core generation parameters.
+        bus_master : BusMasterInterface
+            The bus used for refills, write backs and uncached requests. The responses
+            must be returned in the order of the requests.
+        port_count : int
+            Number of ports to be created.
+        """
+        self.gen_params = gen_params
+        self.params = gen_params.dcache_params
+        self.bus_master = bus_master
+        self.port_count = port_count
+
+        self.bus_params = bus_master.params
+        self.method_layouts = CommonBusMasterMethodLayout(self.bus_params)
+
+        self.request_read = Methods(port_count, i=self.method_layouts.request_read_layout)
+        self.request_write = Methods(port_count, i=self.method_layouts.request_write_layout)
+        self.get_read_response = Methods(port_count, o=self.method_layouts.read_response_layout)
+        self.get_write_response = Methods(port_count, o=self.method_layouts.write_response_layout)
+
+        @dataclass(frozen=True)
+        class _Port(BusMasterInterface):
+            params: BusParametersInterface
+            request_read: Method
+            request_write: Method
+            get_read_response: Method
+            get_write_response: Method
+
+        self.ports = [
+            _Port(
+                params=self.bus_params,
+                request_read=self.request_read[i],
+                request_write=self.request_write[i],
+                get_read_response=self.get_read_response[i],
+                get_write_response=self.get_write_response[i],
+            )
+            for i in range(port_count)
+        ]
+
+        self.writeback_req = Method()
+        self.writeback_resp = Method()
+
+        self.word_bytes_log = exact_log2(self.params.word_width_bytes)
+
+        # Addresses of the requests are word addresses.
+        self.addr_layout = make_layout(
+            ("word", self.params.offset_bits - self.word_bytes_log),
+            ("index", self.params.index_bits),
+            ("tag", self.params.tag_bits),
+        )
+
+        self.perf_loads = HwCounter("backend.lsu.dcache.loads", "Number of loads sent to the L1 Data Cache")
+        self.perf_stores = HwCounter("backend.lsu.dcache.stores", "Number of stores sent to the L1 Data Cache")
+        self.perf_hits = HwCounter("backend.lsu.dcache.hits")
+        self.perf_hits_under_miss = HwCounter(
+            "backend.lsu.dcache.hits_under_miss", "Number of requests hitting the cache while a line is being refilled"
+        )
+        self.perf_misses = HwCounter("backend.lsu.dcache.misses", "Number of misses which allocated an MSHR")
+        self.perf_secondary_misses = HwCounter(
+            "backend.lsu.dcache.secondary_misses", "Number of misses merged into an MSHR of the same line"
+        )
+        self.perf_mshr_stalls = HwCounter(
+            "backend.lsu.dcache.mshr_stalls", "Number of misses which had to wait for a free MSHR"
+        )
+        self.perf_bypasses = HwCounter(
+            "backend.lsu.dcache.bypasses", "Number of requests to MMIO regions sent directly to the bus"
+        )
+        self.perf_writebacks = HwCounter("backend.lsu.dcache.writebacks", "Number of dirty lines written back")
+        self.perf_flushes = HwCounter(
+            "backend.lsu.dcache.flushes", "Number of requests to write back all the dirty lines"
+        )
+        self.perf_errors = HwCounter("backend.lsu.dcache.bus_errors")
+        self.perf_mshrs = HwExpHistogram(
+            "backend.lsu.dcache.mshrs",
+            description="Number of busy MSHRs",
+            bucket_count=ceil_log2(self.params.num_of_mshrs + 1) + 1,
+            sample_width=ceil_log2(self.params.num_of_mshrs + 1),
+        )
+        self.perf_pending_requests = HwExpHistogram(
+            "backend.lsu.dcache.pending_requests",
+            description="Number of requests accepted by the cache and not yet responded",
+            bucket_count=ceil_log2(self.params.max_pending_requests + 1) + 1,
+            sample_width=ceil_log2(self.params.max_pending_requests + 1),
+        )
+
+    def elaborate(self, platform):
+        m = TModule()
+
+        m.submodules += [
+            self.perf_loads,
+            self.perf_stores,
+            self.perf_hits,
+            self.perf_hits_under_miss,
+            self.perf_misses,
+            self.perf_secondary_misses,
+            self.perf_mshr_stalls,
+            self.perf_bypasses,
+            self.perf_writebacks,
+            self.perf_flushes,
+            self.perf_errors,
+            self.perf_mshrs,
+            self.perf_pending_requests,
+        ]
+
+        m.submodules.mem = mem = DCacheMemory(self.params)
+        m.submodules.pma_checker = pma_checker = PMAChecker(self.gen_params)
+        m.submodules.replacement = replacement = CacheReplacement(
+            self.params.replacement_policy, self.params.num_of_ways, self.params.num_of_sets_bits
+        )
+
+        read_results = [BasicFifo(self.method_layouts.read_response_layout, 2) for _ in range(self.port_count)]
+        write_results = [BasicFifo(self.method_layouts.write_response_layout, 2) for _ in range(self.port_count)]
+        for i, (read_fifo, write_fifo) in enumerate(zip(read_results, write_results)):
+            m.submodules[f"read_results_{i}"] = read_fifo
+            m.submodules[f"write_results_{i}"] = write_fifo
+
+        sel_width = self.bus_params.data_width // self.bus_params.granularity
+        all_bytes = C(1).replicate(sel_width)
+        last_word = self.params.words_in_line - 1
+        num_requests = self.params.max_pending_requests
+        num_mshrs = self.params.num_of_mshrs
+
+        def same_line(a: Value, b: Value) -> Value:
+            return (a.index == b.index) & (a.tag == b.tag)
+
+        def next_request(idx: Value) -> Value:
+            return Mux(idx == num_requests - 1, 0, idx + 1)
+
+        # The pending requests, in the order of their arrival. A request waits either for an MSHR
+        # to finish the refill (`waiting`), or to be looked up again (`replay`). The data of a load
+        # is replaced with the result, when it is `done`.
+        request_layout = make_layout(
+            ("valid", 1),
+            ("done", 1),
+            ("mmio", 1),
+            ("store", 1),
+            ("port", range(self.port_count)),
+            ("addr", self.addr_layout),
+            ("data", self.bus_params.data_width),
+            ("sel", sel_width),
+            ("err", 1),
+            ("waiting", 1),
+            ("replay", 1),
+            ("mshr", range(num_mshrs)),
+        )
+        requests = [Signal(request_layout, name=f"request_{i}") for i in range(num_requests)]
+        requests_array = Array(request.as_value() for request in requests)
+        head = Signal(range(num_requests))
+        tail = Signal(range(num_requests))
+        request_count = Signal(range(num_requests + 1))
+        accepting = Signal()
+        retiring = Signal()
+        m.d.sync += request_count.eq(request_count + accepting - retiring)
+
+        def age(idx: Value) -> Value:
+            return Mux(idx >= head, idx - head, idx + num_requests - head)
+
+        # Miss status holding registers
+        mshr_layout = make_layout(
+            ("busy", 1),
+            ("started", 1),
+            ("addr", self.addr_layout),
+            ("way", self.params.num_of_ways),
+            ("victim_dirty", 1),
+            ("victim_tag", self.params.tag_bits),
+        )
+        mshrs = [Signal(mshr_layout, name=f"mshr_{i}") for i in range(num_mshrs)]
+        mshrs_array = Array(mshr.as_value() for mshr in mshrs)
+        refilling = Signal()
+        m.d.comb += refilling.eq(Cat(mshr.busy for mshr in mshrs).any())
+
+        # The MSHR whose refill finishes in this cycle
+        mshr_finish = Signal(num_mshrs)
+        mshr_finish_error = Signal()
+
+        # Sets which may contain dirty lines
+        dirty_sets = Signal(self.params.num_of_sets)
+
+        # The write back unit, used for the victims and when writing back all dirty lines
+        wb_active = Signal()
+        wb_start = Signal()
+        wb_index = Signal(self.params.index_bits)
+        wb_tag = Signal(self.params.tag_bits)
+        wb_way = Signal(self.params.num_of_ways)
+        wb_flushing = Signal()
+        wb_reading = Signal()
+        wb_resp_pending = Signal(range(2 * self.params.words_in_line + 1))
+
+        # The uncached request being sent to the bus
+        bypass_sent = Signal()
+
+        # The bus is idle when no refill, write back nor uncached request is in progress.
+        bus_idle = Signal()
+        m.d.comb += bus_idle.eq(
+            ~Cat(mshr.busy & mshr.started for mshr in mshrs).any() & ~wb_active & (wb_resp_pending == 0) & ~bypass_sent
+        )
+
+        writeback_start = Signal()
+        writeback_done = Signal()
+
+        init_index = Signal(self.params.index_bits)
+        flush_tags_valid = Signal()
+        flush_index = Signal(self.params.index_bits)
+        m.submodules.flush_enc = flush_enc = PriorityEncoder(self.params.num_of_sets)
+        m.d.comb += flush_enc.i.eq(dirty_sets)
+
+        flush_tags = Signal(self.params.num_of_ways)
+        m.d.comb += flush_tags.eq(Cat(tag.valid & tag.dirty for tag in mem.tag_rd_data))
+        m.submodules.flush_way_enc = flush_way_enc = PriorityEncoder(self.params.num_of_ways)
+        m.d.comb += flush_way_enc.i.eq(flush_tags)
+
+        # The address read from the memories for the request entering the lookup
+        launch_addr = Signal(self.addr_layout)
+        m.d.comb += [
+            mem.tag_rd_index.eq(launch_addr.index),
+            mem.data_rd_addr.index.eq(launch_addr.index),
+            mem.data_rd_addr.word.eq(launch_addr.word),
+        ]
+
+        with m.FSM(init="INIT") as fsm:
+            with m.State("INIT"):
+                m.d.comb += [
+                    mem.tag_wr_index.eq(init_index),
+                    mem.tag_wr_data.valid.eq(0),
+                    mem.tag_wr_data.dirty.eq(0),
+                    mem.tag_wr_en.eq(1),
+                    mem.tag_way_wr_en.eq(C(1).replicate(self.params.num_of_ways)),
+                ]
+                m.d.sync += init_index.eq(init_index + 1)
+                with m.If(init_index == self.params.num_of_sets - 1):
+                    m.next = "LOOKUP"
+
+            with m.State("LOOKUP"):
+                with m.If(writeback_start):
+                    m.next = "FLUSH"
+
+            with m.State("FLUSH"):
+                with m.If(~wb_active & ~flush_tags_valid):
+                    m.d.comb += mem.tag_rd_index.eq(flush_enc.o)
+                    m.d.sync += flush_index.eq(flush_enc.o)
+                    with m.If(flush_enc.n):
+                        # The written back data must reach the memory before the fence finishes.
+                        with m.If(wb_resp_pending == 0):
+                            m.d.sync += writeback_done.eq(1)
+                            m.next = "LOOKUP"
+                    with m.Else():
+                        m.d.sync += flush_tags_valid.eq(1)
+                with m.If(flush_tags_valid):
+                    m.d.sync += flush_tags_valid.eq(0)
+                    with m.If(flush_tags.any()):
+                        m.d.comb += wb_start.eq(1)
+                        m.d.sync += [
+                            wb_index.eq(flush_index),
+                            wb_tag.eq(mem.tag_rd_data[flush_way_enc.o].tag),
+                            wb_way.eq(1 << flush_way_enc.o),
+                            wb_flushing.eq(1),
+                        ]
+                    with m.Else():
+                        m.d.sync += dirty_sets.bit_select(flush_index, 1).eq(0)
+
+        # Launching lookups. The requests waiting for a replay are looked up again, oldest first,
+        # before any new request is accepted. The write back unit has priority in reading the memory.
+        lookup_valid = Signal()
+        lookup_idx = Signal(range(num_requests))
+        can_launch = Signal()
+        m.d.comb += can_launch.eq(fsm.ongoing("LOOKUP") & ~wb_reading)
+
+        replay_requests = Signal(num_requests)
+        m.d.comb += replay_requests.eq(Cat(request.valid & request.replay for request in requests))
+        m.submodules.replay_enc = replay_enc = PriorityEncoder(num_requests)
+        m.submodules.replay_older_enc = replay_older_enc = PriorityEncoder(num_requests)
+        m.d.comb += [
+            replay_enc.i.eq(replay_requests),
+            replay_older_enc.i.eq(replay_requests & Cat(head <= i for i in range(num_requests))),
+        ]
+        replay_idx = Signal(range(num_requests))
+        m.d.comb += replay_idx.eq(Mux(replay_older_enc.n, replay_enc.o, replay_older_enc.o))
+
+        replaying = Signal()
+        issuing = Signal()
+        m.d.comb += replaying.eq(can_launch & replay_requests.any())
+        m.d.sync += lookup_valid.eq(replaying | issuing)
+
+        with m.If(replaying):
+            replayed = Signal(request_layout)
+            m.d.comb += replayed.eq(requests_array[replay_idx])
+            m.d.comb += launch_addr.eq(replayed.addr)
+            m.d.sync += lookup_idx.eq(replay_idx)
+            for i, request in enumerate(requests):
+                with m.If(replay_idx == i):
+                    m.d.sync += request.replay.eq(0)
+
+        # Lookup. The tags and data read in the previous cycle belong to the request.
+        lookup = Signal(request_layout)
+        m.d.comb += lookup.eq(requests_array[lookup_idx])
+
+        mshrs_on_set = Signal(num_mshrs)
+        m.d.comb += mshrs_on_set.eq(Cat(mshr.busy & (mshr.addr.index == lookup.addr.index) for mshr in mshrs))
+        mshrs_on_line = Signal(num_mshrs)
+        m.d.comb += mshrs_on_line.eq(Cat(mshr.busy & same_line(mshr.addr, lookup.addr) for mshr in mshrs))
+
+        # The ways being refilled can't be hit - their data is being overwritten.
+        refilled_ways = Signal(self.params.num_of_ways)
+        m.d.comb += refilled_ways.eq(
+            reduce(operator.or_, (Mux(on_set, mshr.way, 0) for on_set, mshr in zip(mshrs_on_set, mshrs)))
+        )
+        hits = Signal(self.params.num_of_ways)
+        m.d.comb += hits.eq(Cat(tag.valid & (tag.tag == lookup.addr.tag) for tag in mem.tag_rd_data) & ~refilled_ways)
+
+        older_requests = Signal(num_requests)
+        m.d.comb += older_requests.eq(
+            Cat(
+                request.valid
+                & ~request.done
+                & ~request.mmio
+                & same_line(request.addr, lookup.addr)
+                & (age(C(i, range(num_requests))) < age(lookup_idx))
+                for i, request in enumerate(requests)
+            )
+        )
+        m.submodules.older_enc = older_enc = PriorityEncoder(num_requests)
+        m.d.comb += older_enc.i.eq(older_requests)
+        older = Signal(request_layout)
+        m.d.comb += older.eq(requests_array[older_enc.o])
+
+        m.submodules.line_mshr_enc = line_mshr_enc = PriorityEncoder(num_mshrs)
+        m.d.comb += line_mshr_enc.i.eq(mshrs_on_line)
+        m.submodules.set_mshr_enc = set_mshr_enc = PriorityEncoder(num_mshrs)
+        m.d.comb += set_mshr_enc.i.eq(mshrs_on_set)
+        m.submodules.free_mshr_enc = free_mshr_enc = PriorityEncoder(num_mshrs)
+        m.d.comb += free_mshr_enc.i.eq(Cat(~mshr.busy for mshr in mshrs))
+
+        m.d.comb += [
+            replacement.touch_index.eq(lookup.addr.index),
+            replacement.touch_ways.eq(hits),
+            replacement.victim_index.eq(lookup.addr.index),
+        ]
+        victim = Signal(mem.tag_data_layout)
+        m.d.comb += victim.eq(OneHotMux.create(m, zip(replacement.victim, mem.tag_rd_data)))
+
+        lookup_hit = Signal()
+        lookup_secondary_miss = Signal()
+        lookup_alloc = Signal()
+        lookup_stall = Signal()
+        lookup_mem_write = Signal()
+
+        # The new state of the looked up request
+        lookup_done = Signal()
+        lookup_data = Signal(self.bus_params.data_width)
+        lookup_waiting = Signal()
+        lookup_replay = Signal()
+        lookup_mshr = Signal(range(num_mshrs))
+
+        def wait_for(mshr_idx: Value):
+            # A request waiting for an MSHR finishing in this cycle saw the old tags.
+            finishing = mshr_finish.bit_select(mshr_idx, 1)
+            m.d.comb += [
+                lookup_mshr.eq(mshr_idx),
+                lookup_waiting.eq(~finishing),
+                lookup_replay.eq(finishing),
+            ]
+
+        with m.If(lookup_valid):
+            with m.If(older_requests.any()):
+                # Waiting behind the older request to the same line
+                with m.If(older.waiting):
+                    wait_for(older.mshr)
+                with m.Else():
+                    m.d.comb += lookup_replay.eq(1)
+            with m.Elif(hits.any()):
+                m.d.comb += [
+                    lookup_hit.eq(1),
+                    lookup_done.eq(1),
+                    lookup_data.eq(Mux(lookup.store, 0, OneHotMux.create(m, zip(hits, mem.data_rd_data)))),
+                    replacement.touch_en.eq(1),
+                ]
+                with m.If(lookup.store):
+                    m.d.comb += [
+                        lookup_mem_write.eq(1),
+                        mem.data_wr_addr.index.eq(lookup.addr.index),
+                        mem.data_wr_addr.word.eq(lookup.addr.word),
+                        mem.data_wr_data.eq(lookup.data),
+                        mem.data_wr_sel.eq(lookup.sel),
+                        mem.data_wr_en.eq(1),
+                        mem.data_way_wr_en.eq(hits),
+                        mem.tag_wr_index.eq(lookup.addr.index),
+                        mem.tag_wr_data.valid.eq(1),
+                        mem.tag_wr_data.dirty.eq(1),
+                        mem.tag_wr_data.tag.eq(lookup.addr.tag),
+                        mem.tag_wr_en.eq(1),
+                        mem.tag_way_wr_en.eq(hits),
+                    ]
+                    m.d.sync += dirty_sets.bit_select(lookup.addr.index, 1).eq(1)
+            with m.Elif(mshrs_on_line.any()):
+                m.d.comb += lookup_secondary_miss.eq(1)
+                wait_for(line_mshr_enc.o)
+            with m.Elif(~mshrs_on_set.any() & ~free_mshr_enc.n):
+                m.d.comb += [
+                    lookup_alloc.eq(1),
+                    lookup_mem_write.eq(1),
+                    replacement.alloc_en.eq(1),
+                    # The victim way is overwritten by the refill.
+                    mem.tag_wr_index.eq(lookup.addr.index),
+                    mem.tag_wr_data.valid.eq(0),
+                    mem.tag_wr_data.dirty.eq(0),
+                    mem.tag_wr_en.eq(1),
+                    mem.tag_way_wr_en.eq(replacement.victim),
+                ]
+                for i, mshr in enumerate(mshrs):
+                    with m.If(free_mshr_enc.o == i):
+                        m.d.sync += [
+                            mshr.busy.eq(1),
+                            mshr.started.eq(0),
+                            assign(mshr.addr, lookup.addr),
+                            mshr.way.eq(replacement.victim),
+                            mshr.victim_dirty.eq(victim.valid & victim.dirty),
+                            mshr.victim_tag.eq(victim.tag),
+                        ]
+                wait_for(free_mshr_enc.o)
+            with m.Else():
+                # If no MSHR is free, all of them are busy.
+                m.d.comb += lookup_stall.eq(1)
+                wait_for(Mux(mshrs_on_set.any(), set_mshr_enc.o, 0))
+
+            for i, request in enumerate(requests):
+                with m.If(lookup_idx == i):
+                    m.d.sync += [
+                        request.waiting.eq(lookup_waiting),
+                        request.replay.eq(lookup_replay),
+                        request.mshr.eq(lookup_mshr),
+                    ]
+                    with m.If(lookup_done):
+                        m.d.sync += [request.done.eq(1), request.data.eq(lookup_data)]
+
+        with Transaction(name="LookupPerf").body(m):
+            self.perf_hits.incr(m, enable_call=lookup_hit)
+            self.perf_hits_under_miss.incr(m, enable_call=lookup_hit & refilling)
+            self.perf_misses.incr(m, enable_call=lookup_alloc)
+            self.perf_secondary_misses.incr(m, enable_call=lookup_secondary_miss)
+            self.perf_mshr_stalls.incr(m, enable_call=lookup_stall)
+
+        # Requests
+        issue = Method(
+            i=make_layout(
+                ("port", range(self.port_count)),
+                ("store", 1),
+                ("addr", self.bus_params.addr_width),
+                ("data", self.bus_params.data_width),
+                ("sel", sel_width),
+            )
+        )
+
+        @def_method(m, issue, ready=can_launch & ~replay_requests.any() & (request_count != num_requests))
+        def _(port, store, addr, data, sel):
+            new_addr = Signal(self.addr_layout)
+            m.d.av_comb += new_addr.eq(addr)
+            m.d.av_comb += pma_checker.paddr.eq(Cat(C(0, self.word_bytes_log), addr))
+            mmio = pma_checker.result.mmio
+
+            self.perf_loads.incr(m, enable_call=~store)
+            self.perf_stores.incr(m, enable_call=store)
+            self.perf_bypasses.incr(m, enable_call=mmio)
+
+            m.d.comb += accepting.eq(1)
+            m.d.sync += tail.eq(next_request(tail))
+            for i, request in enumerate(requests):
+                with m.If(tail == i):
+                    m.d.sync += [
+                        request.valid.eq(1),
+                        request.done.eq(0),
+                        request.mmio.eq(mmio),
+                        request.store.eq(store),
+                        request.port.eq(port),
+                        request.addr.eq(addr),
+                        request.data.eq(data),
+                        request.sel.eq(sel),
+                        request.err.eq(0),
+                        request.waiting.eq(0),
+                        request.replay.eq(0),
+                    ]
+
+            with m.If(~mmio):
+                m.d.comb += [issuing.eq(1), launch_addr.eq(new_addr)]
+                m.d.sync += lookup_idx.eq(tail)
+
+        @def_methods(m, self.request_read)
+        def _(i, arg):
+            issue(m, port=i, store=0, addr=arg.addr, data=0, sel=arg.sel)
+
+        @def_methods(m, self.request_write)
+        def _(i, arg):
+            issue(m, port=i, store=1, addr=arg.addr, data=arg.data, sel=arg.sel)
+
+        @def_methods(m, self.get_read_response)
+        def _(i):
+            return read_results[i].read(m)
+
+        @def_methods(m, self.get_write_response)
+        def _(i):
+            return write_results[i].read(m)
+
+        # Responses, in the order of the requests
+        head_request = Signal(request_layout)
+        m.d.comb += head_request.eq(requests_array[head])
+
+        with Transaction(name="Respond").body(m, ready=head_request.valid & head_request.done):
+            with condition(m) as branch:
+                for i in range(self.port_count):
+                    with branch((head_request.port == i) & ~head_request.store):
+                        read_results[i].write(m, data=head_request.data, err=head_request.err)
+                    with branch((head_request.port == i) & head_request.store):
+                        write_results[i].write(m, err=head_request.err)
+
+            m.d.comb += retiring.eq(1)
+            m.d.sync += head.eq(next_request(head))
+            for i, request in enumerate(requests):
+                with m.If(head == i):
+                    m.d.sync += request.valid.eq(0)
+
+        # Uncached requests
+        head_bypass = Signal()
+        m.d.comb += head_bypass.eq(head_request.valid & head_request.mmio & ~head_request.done)
+
+        with Transaction(name="BypassRequest").body(m, ready=head_bypass & bus_idle):
+            with condition(m) as branch:
+                with branch(head_request.store):
+                    self.bus_master.request_write(
+                        m, addr=head_request.addr.as_value(), data=head_request.data, sel=head_request.sel
+                    )
+                with branch():
+                    self.bus_master.request_read(m, addr=head_request.addr.as_value(), sel=head_request.sel)
+            m.d.sync += bypass_sent.eq(1)
+
+        with Transaction(name="BypassResponse").body(m, ready=bypass_sent):
+            data = Signal(self.bus_params.data_width)
+            err = Signal()
+            with condition(m) as branch:
+                with branch(head_request.store):
+                    m.d.comb += err.eq(self.bus_master.get_write_response(m).err)
+                with branch():
+                    resp = self.bus_master.get_read_response(m)
+                    m.d.comb += [data.eq(resp.data), err.eq(resp.err)]
+            for i, request in enumerate(requests):
+                with m.If(head == i):
+                    m.d.sync += [request.done.eq(1), request.data.eq(data), request.err.eq(err)]
+            m.d.sync += bypass_sent.eq(0)
+            self.perf_errors.incr(m, enable_call=err)
+
+        # Starting the MSHRs. The victim is written back first, then the refill is requested.
+        # The uncached requests have priority, so that they are not starved.
+        m.submodules.start_mshr_enc = start_enc = PriorityEncoder(num_mshrs)
+        m.d.comb += start_enc.i.eq(Cat(mshr.busy & ~mshr.started for mshr in mshrs))
+
+        job_idx = Signal(range(num_mshrs))
+        job = Signal(mshr_layout)
+        m.d.comb += job.eq(mshrs_array[job_idx])
+        job_start = Signal()
+        job_writeback = Signal()
+        job_refill_done = Signal()
+
+        with m.FSM(init="IDLE", name="bus_fsm") as bus_fsm:
+            with m.State("IDLE"):
+                with m.If(job_start):
+                    with m.If(job_writeback):
+                        m.next = "WRITEBACK"
+                    with m.Else():
+                        m.next = "REFILL"
+
+            with m.State("WRITEBACK"):
+                with m.If(~wb_active):
+                    m.next = "REFILL"
+
+            with m.State("REFILL"):
+                with m.If(job_refill_done):
+                    m.next = "IDLE"
+
+        with Transaction(name="StartMSHR").body(
+            m,
+            ready=bus_fsm.ongoing("IDLE")
+            & fsm.ongoing("LOOKUP")
+            & ~start_enc.n
+            & ~wb_active
+            & ~head_bypass
+            & ~bypass_sent,
+        ):
+            started = Signal(mshr_layout)
+            m.d.av_comb += started.eq(mshrs_array[start_enc.o])
+            log.debug(
+                m,
+                True,
+                "Refilling line 0x{:x}",
+                Cat(C(0, self.params.offset_bits), started.addr.index, started.addr.tag),
+            )
+
+            m.d.comb += [job_start.eq(1), job_writeback.eq(started.victim_dirty)]
+            m.d.sync += job_idx.eq(start_enc.o)
+            for i, mshr in enumerate(mshrs):
+                with m.If(start_enc.o == i):
+                    m.d.sync += mshr.started.eq(1)
+
+            with m.If(started.victim_dirty):
+                m.d.comb += wb_start.eq(1)
+                m.d.sync += [
+                    wb_index.eq(started.addr.index),
+                    wb_tag.eq(started.victim_tag),
+                    wb_way.eq(started.way),
+                    wb_flushing.eq(0),
+                ]
+
+        # Write back of a dirty line. The words are read from the memory when no lookup
+        # is launched and are buffered before being sent to the bus.
+        wb_read_word = Signal(range(self.params.words_in_line))
+        wb_reads_done = Signal()
+        wb_send_word = Signal(range(self.params.words_in_line))
+        wb_data_valid = Signal()
+        wb_buffered = Signal(range(3))
+        wb_sending = Signal()
+        wb_responded = Signal()
+        m.submodules.wb_buffer = wb_buffer = BasicFifo([("data", self.bus_params.data_width)], 2)
+
+        with m.If(wb_start):
+            m.d.sync += [wb_active.eq(1), wb_reads_done.eq(0), wb_read_word.eq(0), wb_send_word.eq(0)]
+
+        m.d.comb += wb_reading.eq(wb_active & ~wb_reads_done & (wb_buffered < 2))
+        m.d.sync += wb_data_valid.eq(wb_reading)
+        m.d.sync += wb_buffered.eq(wb_buffered + wb_reading - wb_sending)
+        m.d.sync += wb_resp_pending.eq(wb_resp_pending + wb_sending - wb_responded)
+
+        with m.If(wb_reading):
+            m.d.comb += [
+                mem.data_rd_addr.index.eq(wb_index),
+                mem.data_rd_addr.word.eq(wb_read_word),
+            ]
+            m.d.sync += wb_read_word.eq(wb_read_word + 1)
+            with m.If(wb_read_word == last_word):
+                m.d.sync += wb_reads_done.eq(1)
+
+        with Transaction(name="WritebackBuffer").body(m, ready=wb_data_valid):
+            wb_buffer.write(m, data=OneHotMux.create(m, zip(wb_way, mem.data_rd_data)))
+
+        with Transaction(name="WritebackRequest").body(m, ready=wb_active):
+            m.d.comb += wb_sending.eq(1)
+            self.bus_master.request_write(
+                m,
+                addr=Cat(wb_send_word, wb_index, wb_tag),
+                data=wb_buffer.read(m).data,
+                sel=all_bytes,
+            )
+            m.d.sync += wb_send_word.eq(wb_send_word + 1)
+            with m.If(wb_send_word == last_word):
+                m.d.sync += wb_active.eq(0)
+                self.perf_writebacks.incr(m)
+
+                # When flushing, the line stays in the cache.
+                with m.If(wb_flushing):
+                    m.d.comb += [
+                        mem.tag_wr_index.eq(wb_index),
+                        mem.tag_wr_data.valid.eq(1),
+                        mem.tag_wr_data.dirty.eq(0),
+                        mem.tag_wr_data.tag.eq(wb_tag),
+                        mem.tag_wr_en.eq(1),
+                        mem.tag_way_wr_en.eq(wb_way),
+                    ]
+
+        with Transaction(name="WritebackResponse").body(m, ready=wb_resp_pending != 0):
+            m.d.comb += wb_responded.eq(1)
+            err = self.bus_master.get_write_response(m).err
+            self.perf_errors.incr(m, enable_call=err)
+            log.error(m, err, "Bus error while writing back a line")
+
+        # Refills. The responses are returned in the order of the requests, the refilled MSHRs
+        # are queued when their first word is requested, so that the responses can be received
+        # before the whole line is requested. The refills wait when the memories are written by a lookup.
+        refill_word = Signal(range(self.params.words_in_line))
+        m.submodules.refill_queue = refill_queue = BasicFifo([("mshr", range(num_mshrs))], num_mshrs)
+
+        with Transaction(name="RefillRequest").body(m, ready=bus_fsm.ongoing("REFILL")):
+            self.bus_master.request_read(m, addr=Cat(refill_word, job.addr.index, job.addr.tag), sel=all_bytes)
+            m.d.sync += refill_word.eq(refill_word + 1)
+            with condition(m, nonblocking=True) as branch:
+                with branch(refill_word == 0):
+                    refill_queue.write(m, mshr=job_idx)
+            with m.If(refill_word == last_word):
+                m.d.comb += job_refill_done.eq(1)
+                m.d.sync += refill_word.eq(0)
+
+        refill_resp_word = Signal(range(self.params.words_in_line))
+        refill_error = Signal()
+
+        with Transaction(name="RefillResponse").body(m, ready=~lookup_mem_write):
+            refilled_idx = refill_queue.peek(m).mshr
+            refilled = Signal(mshr_layout)
+            m.d.av_comb += refilled.eq(mshrs_array[refilled_idx])
+
+            resp = self.bus_master.get_read_response(m)
+            self.perf_errors.incr(m, enable_call=resp.err)
+
+            m.d.comb += [
+                mem.data_wr_addr.index.eq(refilled.addr.index),
+                mem.data_wr_addr.word.eq(refill_resp_word),
+                mem.data_wr_data.eq(resp.data),
+                mem.data_wr_sel.eq(all_bytes),
+                mem.data_wr_en.eq(1),
+                mem.data_way_wr_en.eq(refilled.way),
+            ]
+
+            m.d.sync += [refill_resp_word.eq(refill_resp_word + 1), refill_error.eq(refill_error | resp.err)]
+            with m.If(refill_resp_word == last_word):
+                refill_queue.read(m)
+                m.d.sync += [refill_resp_word.eq(0), refill_error.eq(0)]
+
+                # A line refilled with an error is not valid.
+                error = refill_error | resp.err
+                m.d.comb += [
+                    mshr_finish.eq(1 << refilled_idx),
+                    mshr_finish_error.eq(error),
+                    mem.tag_wr_index.eq(refilled.addr.index),
+                    mem.tag_wr_data.valid.eq(~error),
+                    mem.tag_wr_data.dirty.eq(0),
+                    mem.tag_wr_data.tag.eq(refilled.addr.tag),
+                    mem.tag_wr_en.eq(1),
+                    mem.tag_way_wr_en.eq(refilled.way),
+                ]
+
+        # Finishing the MSHRs. The requests waiting for the refilled line get the error,
+        # the other waiting requests are looked up again.
+        for i, mshr in enumerate(mshrs):
+            with m.If(mshr_finish[i]):
+                m.d.sync += mshr.busy.eq(0)
+
+        for request in requests:
+            with m.If(request.valid & request.waiting & mshr_finish.bit_select(request.mshr, 1)):
+                own_line = Cat(same_line(request.addr, mshr.addr) for mshr in mshrs).bit_select(request.mshr, 1)
+                m.d.sync += request.waiting.eq(0)
+                with m.If(mshr_finish_error & own_line):
+                    m.d.sync += [request.done.eq(1), request.err.eq(1), request.data.eq(0)]
+                with m.Else():
+                    m.d.sync += request.replay.eq(1)
+
+        # Write back of all dirty lines
+        writeback_ready = (
+            fsm.ongoing("LOOKUP") & (request_count == 0) & ~refilling & bus_idle & ~lookup_valid & ~writeback_done
+        )
+
+        @def_method(m, self.writeback_req, ready=writeback_ready)
+        def _():
+            self.perf_flushes.incr(m)
+            m.d.comb += writeback_start.eq(1)
+            m.d.sync += flush_tags_valid.eq(0)
+
+        @def_method(m, self.writeback_resp, ready=writeback_done)
+        def _():
+            m.d.sync += writeback_done.eq(0)
+
+        if self.perf_mshrs.metrics_enabled() or self.perf_pending_requests.metrics_enabled():
+            busy_mshrs = Signal(range(num_mshrs + 1))
+            m.d.comb += busy_mshrs.eq(popcount(Cat(mshr.busy for mshr in mshrs)))
+            with Transaction(name="perf").body(m):
+                self.perf_mshrs.add(m, busy_mshrs)
+                self.perf_pending_requests.add(m, request_count)
+
+        return m
+
+
+class DCacheMemory(Elaboratable):
+    """A helper module for managing memories used in the data cache.
+
+    All address and write data lines are shared between the ways. Writes are multiplexed
+    using one-hot `tag_way_wr_en` and `data_way_wr_en` signals. Read data lines from
+    all ways are separately exposed (as an array). The data memory is addressed using words
+    and can be written with a byte granularity.
+    """
+
+    def __init__(self, params: DCacheParameters) -> None:
+        self.params = params
+
+        self.tag_data_layout = make_layout(("valid", 1), ("dirty", 1), ("tag", self.params.tag_bits))
+
+        self.tag_rd_index = Signal(self.params.index_bits)
+        self.tag_rd_data = Array([Signal(self.tag_data_layout) for _ in range(self.params.num_of_ways)])
+        self.tag_wr_index = Signal(self.params.index_bits)
+        self.tag_wr_en = Signal()
+        self.tag_wr_data = Signal(self.tag_data_layout)
+        self.tag_way_wr_en = Signal(self.params.num_of_ways)
+
+        self.data_addr_layout = make_layout(
+            ("word", self.params.offset_bits - exact_log2(self.params.word_width_bytes)),
+            ("index", self.params.index_bits),
+        )
+
+        self.data_rd_addr = Signal(self.data_addr_layout)
+        self.data_rd_data = Array([Signal(self.params.word_width) for _ in range(self.params.num_of_ways)])
+        self.data_wr_addr = Signal(self.data_addr_layout)
+        self.data_wr_en = Signal()
+        self.data_wr_data = Signal(self.params.word_width)
+        self.data_wr_sel = Signal(self.params.word_width_bytes)
+        self.data_way_wr_en = Signal(self.params.num_of_ways)
+
+    def elaborate(self, platform):
+        m = TModule()
+
+        for i in range(self.params.num_of_ways):
+            tag_mem = memory.Memory(shape=self.tag_data_layout, depth=self.params.num_of_sets, init=[])
+            tag_mem_wp = tag_mem.write_port()
+            tag_mem_rp = tag_mem.read_port(transparent_for=[tag_mem_wp])
+            m.submodules[f"tag_mem_{i}"] = tag_mem
+
+            m.d.comb += [
+                assign(self.tag_rd_data[i], tag_mem_rp.data),
+                tag_mem_rp.addr.eq(self.tag_rd_index),
+                tag_mem_wp.addr.eq(self.tag_wr_index),
+                assign(tag_mem_wp.data, self.tag_wr_data),
+                tag_mem_wp.en.eq(self.tag_wr_en & self.tag_way_wr_en[i]),
+            ]
+
+            data_mem = memory.Memory(
+                shape=self.params.word_width, depth=self.params.num_of_sets * self.params.words_in_line, init=[]
+            )
+            data_mem_wp = data_mem.write_port(granularity=8)
+            data_mem_rp = data_mem.read_port(transparent_for=[data_mem_wp])
+            m.submodules[f"data_mem_{i}"] = data_mem
+
+            m.d.comb += [
+                self.data_rd_data[i].eq(data_mem_rp.data),
+                data_mem_rp.addr.eq(self.data_rd_addr),
+                data_mem_wp.addr.eq(self.data_wr_addr),
+                data_mem_wp.data.eq(self.data_wr_data),
+                data_mem_wp.en.eq(Mux(self.data_wr_en & self.data_way_wr_en[i], self.data_wr_sel, 0)),
+            ]
+
+        return m
@@ -15,7 +15,9 @@ from transactron.lib import *
 from coreblocks.peripherals.bus_adapter import BusMasterInterface
 
 from coreblocks.cache.iface import CacheInterface, CacheRefillerInterface
+from coreblocks.cache.replacement import CacheReplacement
 from transactron.utils.transactron_helpers import make_layout
+from transactron.utils.amaranth_ext.coding import PriorityEncoder
 
 __all__ = [
     "ICache",
@@ -33,6 +35,7 @@ class ICacheBypass(Elaboratable, CacheInterface):
         self.issue_req = Method(i=layouts.issue_req)
         self.accept_res = Method(o=layouts.accept_res)
         self.flush = Method()
+        self.prefetch = Method(i=layouts.issue_req)
 
         if params.words_in_fetch_block != 1:
             raise ValueError("ICacheBypass only supports fetch block size equal to the word size.")
@@ -63,14 +66,18 @@ class ICacheBypass(Elaboratable, CacheInterface):
         def _() -> None:
             pass
 
+        @def_method(m, self.prefetch)
+        def _(paddr: Value) -> None:
+            pass
+
         return m
 
 
 class ICache(Elaboratable, CacheInterface):
     """A simple set-associative instruction cache.
 
-    The replacement policy is a pseudo random scheme. Every time a line is trashed,
-    we select the next way we write to (we keep one global counter for selecting the next way).
+    The replacement policy is selected with `ICacheParameters.replacement_policy` - either
+    a global round-robin counter, or tree PLRU or true LRU with a per-set state.
 
     Refilling a cache line is abstracted away from this module. ICache module needs two methods
     from the refiller `refiller_start`, which is called whenever we need to refill a cache line.
@@ -78,6 +85,23 @@ class ICache(Elaboratable, CacheInterface):
     ready to be written to cache. `refiller_accept` should set `last` bit when either an error
     occurs or the transfer is over. After issuing `last` bit, `refiller_accept` shouldn't be ready
     until the next transfer is started.
+
+    The cache is non-blocking. A miss allocates one of the line fill buffers and the refill
+    is started as soon as the refiller is free. The refilled blocks are written directly to
+    the victim way, and the fill buffer keeps track of the blocks which already arrived.
+    While a line is being refilled, the requests to other lines can still hit, and the requests
+    to the refilled line are served as soon as their blocks arrive. A refill starts from
+    the requested fetch block and wraps around the line, so the requested block is returned first.
+
+    Lines can also be prefetched with the `prefetch` method. The tags of a prefetched line
+    are checked using a separate read port and, on a miss, a fill buffer is allocated for it.
+    Misses of fetch requests are refilled first. Prefetched lines are marked until the first
+    request hits them, to measure how useful the prefetches are.
+
+    With `ICacheParameters.way_prediction`, only the data memory of the most recently used
+    way of the set is read, and the read data is selected without waiting for the tag compare.
+    On a misprediction, the hit way is read in the next cycle and the response is delayed by
+    a cycle.
     """
 
     def __init__(self, layouts: ICacheLayouts, params: ICacheParameters, refiller: CacheRefillerInterface) -> None:
@@ -103,6 +127,7 @@ class ICache(Elaboratable, CacheInterface):
         self.accept_res = Method(o=layouts.accept_res)
         self.flush = Method()
         self.flush.add_conflict(self.issue_req, Priority.LEFT)
+        self.prefetch = Method(i=layouts.issue_req)
 
         self.addr_layout = make_layout(
             ("offset", self.params.offset_bits),
@@ -112,9 +137,28 @@ class ICache(Elaboratable, CacheInterface):
 
         self.perf_loads = HwCounter("frontend.icache.loads", "Number of requests to the L1 Instruction Cache")
         self.perf_hits = HwCounter("frontend.icache.hits")
+        self.perf_hits_under_miss = HwCounter(
+            "frontend.icache.hits_under_miss", "Number of requests hitting the cache while a line is being refilled"
+        )
+        self.perf_fill_buffer_hits = HwCounter(
+            "frontend.icache.fill_buffer_hits", "Number of requests served from the lines being refilled"
+        )
         self.perf_misses = HwCounter("frontend.icache.misses")
+        self.perf_way_mispredictions = HwCounter(
+            "frontend.icache.way_mispredictions", "Number of requests which had to read the data of another way"
+        )
         self.perf_errors = HwCounter("frontend.icache.fetch_errors")
         self.perf_flushes = HwCounter("frontend.icache.flushes")
+        self.perf_prefetches = HwCounter("frontend.icache.prefetches", "Number of lines refilled by prefetches")
+        self.perf_prefetch_useful = HwCounter(
+            "frontend.icache.prefetch_useful", "Number of prefetched lines hit by a fetch request"
+        )
+        self.perf_prefetch_late = HwCounter(
+            "frontend.icache.prefetch_late", "Number of prefetched lines requested before their refill finished"
+        )
+        self.perf_prefetch_useless = HwCounter(
+            "frontend.icache.prefetch_useless", "Number of prefetched lines evicted before being used"
+        )
         self.req_latency = FIFOLatencyMeasurer(
             "frontend.icache.req_latency", "Latencies of cache requests", slots_number=2, max_latency=500
         )
@@ -135,9 +179,16 @@ class ICache(Elaboratable, CacheInterface):
         m.submodules += [
             self.perf_loads,
             self.perf_hits,
+            self.perf_hits_under_miss,
+            self.perf_fill_buffer_hits,
             self.perf_misses,
+            self.perf_way_mispredictions,
             self.perf_errors,
             self.perf_flushes,
+            self.perf_prefetches,
+            self.perf_prefetch_useful,
+            self.perf_prefetch_late,
+            self.perf_prefetch_useless,
             self.req_latency,
         ]
 
@@ -145,11 +196,6 @@ class ICache(Elaboratable, CacheInterface):
         m.submodules.req_zipper = req_zipper = ArgumentsToResultsZipper(self.addr_layout, self.layouts.accept_res)
 
         # State machine logic
-        needs_refill = Signal()
-        refill_finish = Signal()
-        refill_error = Signal()
-        refill_error_saved = Signal()
-
         flush_start = Signal()
         flush_finish = Signal()
 
@@ -162,19 +208,48 @@ class ICache(Elaboratable, CacheInterface):
                     m.next = "LOOKUP"
 
             with m.State("LOOKUP"):
-                with m.If(needs_refill):
-                    m.next = "REFILL"
-                with m.Elif(flush_start):
+                with m.If(flush_start):
                     m.next = "FLUSH"
 
-            with m.State("REFILL"):
-                with m.If(refill_finish):
-                    m.next = "LOOKUP"
+        m.submodules.replacement = replacement = CacheReplacement(
+            self.params.replacement_policy, self.params.num_of_ways, self.params.num_of_sets_bits
+        )
 
-        # Replacement policy
-        way_selector = Signal(self.params.num_of_ways, init=1)
-        with m.If(refill_finish):
-            m.d.sync += way_selector.eq(way_selector.rotate_left(1))
+        def tag_hit(tags: Array, addr: View) -> list[Value]:
+            return [tag_data.valid & (tag_data.tag == addr.tag) for tag_data in tags]
+
+        def same_line(a: View, b: View) -> Value:
+            return (a.index == b.index) & (a.tag == b.tag)
+
+        def block_index(addr: View) -> Value:
+            return addr.offset[self.params.fetch_block_bytes_log :]
+
+        # Line fill buffers. The refilled blocks are written directly to the victim way,
+        # a fill buffer keeps track of the blocks of the line which already arrived.
+        fill_buffer_layout = make_layout(
+            ("valid", 1),
+            ("started", 1),
+            ("prefetch", 1),
+            ("victim_prefetched", 1),
+            ("addr", self.addr_layout),
+            ("way", self.params.num_of_ways),
+            ("blocks", self.params.fetch_blocks_in_line),
+        )
+        fill_buffers = [
+            Signal(fill_buffer_layout, name=f"fill_buffer_{i}") for i in range(self.params.num_of_fill_buffers)
+        ]
+        refilling = Signal()
+        m.d.comb += refilling.eq(Cat(fill_buffer.valid for fill_buffer in fill_buffers).any())
+
+        def fill_buffers_on_set(addr: View) -> list[Value]:
+            return [fill_buffer.valid & (fill_buffer.addr.index == addr.index) for fill_buffer in fill_buffers]
+
+        # The block delivered by the refiller in this cycle
+        refill_now = Signal()
+        refill_now_addr = Signal(self.addr_layout)
+        refill_now_data = Signal(self.params.fetch_block_bytes * 8)
+        refill_now_error = Signal()
+        refill_finish = Signal()
 
         # Fast path - read requests
         mem_read_addr = Signal(self.addr_layout)
@@ -185,32 +260,128 @@ class ICache(Elaboratable, CacheInterface):
         forwarding_response_now = Signal()
         accepting_requests = ~mem_read_output_valid | forwarding_response_now
 
+        # The tags read in the previous cycle belong to the pending request. The ways
+        # being refilled can't be hit - their data is being overwritten.
+        refilled_ways = Signal(self.params.num_of_ways)
+        m.d.comb += refilled_ways.eq(
+            reduce(
+                operator.or_,
+                [
+                    Mux(on_set, fill_buffer.way, 0)
+                    for on_set, fill_buffer in zip(fill_buffers_on_set(prev_mem_read_addr), fill_buffers)
+                ],
+            )
+        )
+        mem_hits = Signal(self.params.num_of_ways)
+        m.d.comb += mem_hits.eq(Cat(tag_hit(self.mem.tag_rd_data, prev_mem_read_addr)) & ~refilled_ways)
+        demand_hit = Signal()
+        m.d.comb += demand_hit.eq(mem_hits.any())
+
+        # Requests to the lines being refilled are served as soon as their blocks arrive.
+        fill_buffer_match = Signal(self.params.num_of_fill_buffers)
+        m.d.comb += fill_buffer_match.eq(
+            Cat(fill_buffer.valid & same_line(fill_buffer.addr, prev_mem_read_addr) for fill_buffer in fill_buffers)
+        )
+        matched_fill_buffer = Signal(fill_buffer_layout)
+        m.d.comb += matched_fill_buffer.eq(
+            OneHotMux.create(m, [(match, fill_buffer) for match, fill_buffer in zip(fill_buffer_match, fill_buffers)])
+        )
+        fill_buffer_hit = Signal()
+        m.d.comb += fill_buffer_hit.eq(
+            fill_buffer_match.any() & matched_fill_buffer.blocks.bit_select(block_index(prev_mem_read_addr), 1)
+        )
+        refill_hit = Signal()
+        m.d.comb += refill_hit.eq(
+            refill_now
+            & same_line(refill_now_addr, prev_mem_read_addr)
+            & (block_index(refill_now_addr) == block_index(prev_mem_read_addr))
+        )
+
+        # Only the data of the ways read in the previous cycle is valid.
+        demand_data_ready = Signal()
+        fill_buffer_data_ready = Signal()
+        if self.params.way_prediction:
+            data_read_ways = Signal(self.params.num_of_ways)
+            m.d.sync += data_read_ways.eq(self.mem.data_rd_ways)
+            m.d.comb += [
+                demand_data_ready.eq((mem_hits & data_read_ways).any()),
+                fill_buffer_data_ready.eq((matched_fill_buffer.way & data_read_ways).any()),
+            ]
+            data_ways = data_read_ways
+        else:
+            m.d.comb += [demand_data_ready.eq(1), fill_buffer_data_ready.eq(1)]
+            data_ways = Mux(demand_hit, mem_hits, matched_fill_buffer.way)
+
+        way_mispredict = Signal()
+        m.d.comb += way_mispredict.eq(
+            fsm.ongoing("LOOKUP")
+            & mem_read_output_valid
+            & ((demand_hit & ~demand_data_ready) | (fill_buffer_hit & ~fill_buffer_data_ready))
+        )
+        with Transaction().body(m):
+            self.perf_way_mispredictions.incr(m, enable_call=way_mispredict)
+
+        demand_miss = Signal()
+        m.d.comb += demand_miss.eq(mem_read_output_valid & ~demand_hit & ~fill_buffer_match.any())
+
+        # The first hit of a prefetched line clears its mark.
+        hit_prefetched = Signal()
+        m.d.comb += hit_prefetched.eq(
+            reduce(operator.or_, [hit & tag_data.prefetched for hit, tag_data in zip(mem_hits, self.mem.tag_rd_data)])
+        )
+        clear_prefetched = Signal()
+
         with Transaction(name="MemRead").body(
-            m, ready=fsm.ongoing("LOOKUP") & (mem_read_output_valid | refill_error_saved)
+            m,
+            ready=fsm.ongoing("LOOKUP")
+            & mem_read_output_valid
+            & ((demand_hit & demand_data_ready) | (fill_buffer_hit & fill_buffer_data_ready) | refill_hit)
+            # The tags are written when a refill finishes, the mark will be cleared in the next cycle.
+            & ~(demand_hit & hit_prefetched & refill_finish),
         ):
-            req_addr = req_zipper.peek_arg(m)
+            m.d.comb += forwarding_response_now.eq(1)
+            self.perf_hits.incr(m, enable_call=demand_hit)
+            self.perf_hits_under_miss.incr(m, enable_call=demand_hit & refilling)
+            self.perf_fill_buffer_hits.incr(m, enable_call=~demand_hit)
+            self.perf_prefetch_useful.incr(m, enable_call=hit_prefetched)
 
-            tag_hit = [tag_data.valid & (tag_data.tag == req_addr.tag) for tag_data in self.mem.tag_rd_data]
-            tag_hit_any = reduce(operator.or_, tag_hit)
+            m.d.comb += clear_prefetched.eq(hit_prefetched)
 
-            with m.If(tag_hit_any | refill_error_saved):
-                m.d.comb += forwarding_response_now.eq(1)
-                self.perf_hits.incr(m, enable_call=tag_hit_any)
-                mem_out = Signal(self.params.fetch_block_bytes * 8)
-                m.d.av_comb += mem_out.eq(OneHotMux.create(m, zip(tag_hit, self.mem.data_rd_data)))
+            m.d.comb += [
+                replacement.touch_index.eq(prev_mem_read_addr.index),
+                replacement.touch_ways.eq(mem_hits),
+                replacement.touch_en.eq(demand_hit),
+            ]
 
-                req_zipper.write_results(m, fetch_block=mem_out, error=refill_error_saved)
-                m.d.sync += refill_error_saved.eq(0)
-                m.d.sync += mem_read_output_valid.eq(0)
+            mem_out = Signal(self.params.fetch_block_bytes * 8)
+            with m.If(demand_hit | fill_buffer_hit):
+                m.d.av_comb += mem_out.eq(OneHotMux.create(m, zip(data_ways, self.mem.data_rd_data)))
             with m.Else():
-                self.perf_misses.incr(m)
+                m.d.av_comb += mem_out.eq(refill_now_data)
 
-                m.d.comb += needs_refill.eq(1)
+            # Errors are not cached, they are only returned by the refilled block itself.
+            req_zipper.write_results(m, fetch_block=mem_out, error=~demand_hit & ~fill_buffer_hit & refill_now_error)
 
-                # Align to the beginning of the cache line
-                aligned_addr = self.serialize_addr(req_addr) & ~((1 << self.params.offset_bits) - 1)
-                log.debug(m, True, "Refilling line 0x{:x}", aligned_addr)
-                self.refiller.start_refill(m, paddr=aligned_addr)
+        # Defined before issue_req, so that a new request accepted in the same cycle sets it again.
+        with m.If(forwarding_response_now):
+            m.d.sync += mem_read_output_valid.eq(0)
+
+        # A fetch request to a line being prefetched makes the prefetch late. The refill
+        # gets the priority of a fetch request miss.
+        prefetch_late = Signal()
+
+        with Transaction(name="LatePrefetch").body(
+            m,
+            ready=fsm.ongoing("LOOKUP")
+            & mem_read_output_valid
+            & fill_buffer_match.any()
+            & matched_fill_buffer.prefetch,
+        ):
+            self.perf_prefetch_late.incr(m)
+            m.d.comb += prefetch_late.eq(1)
+            for match, fill_buffer in zip(fill_buffer_match, fill_buffers):
+                with m.If(match):
+                    m.d.sync += fill_buffer.prefetch.eq(0)
 
         @def_method(m, self.accept_res)
         def _():
@@ -237,12 +408,160 @@ class ICache(Elaboratable, CacheInterface):
             self.mem.data_rd_addr.offset.eq(mem_read_addr.offset),
         ]
 
+        if self.params.way_prediction:
+            # The most recently used way of each set - the way which was hit or allocated last.
+            m.submodules.mru_mem = mru_mem = memory.Memory(
+                shape=self.params.num_of_ways, depth=self.params.num_of_sets, init=[1] * self.params.num_of_sets
+            )
+            mru_wr = mru_mem.write_port()
+            mru_rd = mru_mem.read_port(domain="comb")
+            m.d.comb += mru_rd.addr.eq(mem_read_addr.index)
+
+            with m.If(replacement.alloc_en):
+                m.d.comb += [
+                    mru_wr.addr.eq(replacement.victim_index),
+                    mru_wr.data.eq(replacement.victim),
+                    mru_wr.en.eq(1),
+                ]
+            with m.Elif(replacement.touch_en):
+                m.d.comb += [
+                    mru_wr.addr.eq(replacement.touch_index),
+                    mru_wr.data.eq(replacement.touch_ways),
+                    mru_wr.en.eq(1),
+                ]
+
+            # A waiting request is read again from the way which was actually hit.
+            waiting_for_data = mem_read_output_valid & ~forwarding_response_now
+            with m.If(waiting_for_data & demand_hit):
+                m.d.comb += self.mem.data_rd_ways.eq(mem_hits)
+            with m.Elif(waiting_for_data & fill_buffer_match.any()):
+                m.d.comb += self.mem.data_rd_ways.eq(matched_fill_buffer.way)
+            with m.Else():
+                m.d.comb += self.mem.data_rd_ways.eq(mru_rd.data)
+
+        # Prefetching - the tags of the requested line are read using the second port. The last
+        # prefetched address is kept, so that repeated requests for the same line are dropped.
+        prefetch_addr = Signal(self.addr_layout)
+        prefetch_pending = Signal()
+
+        m.d.comb += self.mem.prefetch_tag_rd_index.eq(prefetch_addr.index)
+
+        prefetch_miss = Signal()
+        m.d.comb += prefetch_miss.eq(
+            prefetch_pending
+            & ~reduce(operator.or_, tag_hit(self.mem.prefetch_tag_rd_data, prefetch_addr))
+            & ~Cat(fill_buffer.valid & same_line(fill_buffer.addr, prefetch_addr) for fill_buffer in fill_buffers).any()
+        )
+        with m.If(prefetch_pending & ~prefetch_miss):
+            m.d.sync += prefetch_pending.eq(0)
+
+        @def_method(m, self.prefetch, ready=~prefetch_pending)
+        def _(paddr: Value) -> None:
+            deserialized = Signal(self.addr_layout)
+            m.d.av_comb += assign(deserialized, self.deserialize_addr(paddr))
+
+            with m.If(~same_line(deserialized, prefetch_addr)):
+                m.d.comb += self.mem.prefetch_tag_rd_index.eq(deserialized.index)
+                m.d.sync += assign(prefetch_addr, deserialized)
+                m.d.sync += prefetch_pending.eq(1)
+
+        # Slow path - allocating fill buffers. Misses of fetch requests have priority over prefetches.
+        # Only one line of a set is refilled at a time, so that the victim ways are distinct.
+        demand_alloc = Signal()
+        m.d.comb += demand_alloc.eq(demand_miss & ~Cat(fill_buffers_on_set(prev_mem_read_addr)).any())
+        prefetch_alloc = Signal()
+        m.d.comb += prefetch_alloc.eq(prefetch_miss & ~Cat(fill_buffers_on_set(prefetch_addr)).any())
+
+        m.d.comb += replacement.victim_index.eq(Mux(demand_alloc, prev_mem_read_addr.index, prefetch_addr.index))
+
+        m.submodules.free_fill_buffer_enc = free_enc = PriorityEncoder(self.params.num_of_fill_buffers)
+        m.d.comb += free_enc.i.eq(Cat(~fill_buffer.valid for fill_buffer in fill_buffers))
+
+        with Transaction(name="AllocateFillBuffer").body(
+            m, ready=fsm.ongoing("LOOKUP") & ~free_enc.n & (demand_alloc | prefetch_alloc)
+        ) as t:
+            addr = Signal(self.addr_layout)
+            victims = Array(Signal.like(tag_data) for tag_data in self.mem.tag_rd_data)
+            with m.If(demand_alloc):
+                self.perf_misses.incr(m)
+                m.d.av_comb += assign(addr, prev_mem_read_addr)
+                m.d.av_comb += [victim.eq(tag_data) for victim, tag_data in zip(victims, self.mem.tag_rd_data)]
+            with m.Else():
+                self.perf_prefetches.incr(m)
+                m.d.av_comb += assign(addr, prefetch_addr)
+                m.d.av_comb += [victim.eq(tag_data) for victim, tag_data in zip(victims, self.mem.prefetch_tag_rd_data)]
+                m.d.sync += prefetch_pending.eq(0)
+
+            log.debug(
+                m, True, "Allocating a fill buffer for 0x{:x} prefetch={}", self.serialize_addr(addr), ~demand_alloc
+            )
+
+            new_fill_buffer = Signal(fill_buffer_layout)
+            m.d.av_comb += [
+                new_fill_buffer.valid.eq(1),
+                new_fill_buffer.prefetch.eq(~demand_alloc),
+                assign(new_fill_buffer.addr, addr),
+                new_fill_buffer.way.eq(replacement.victim),
+                # A victim hit in this cycle is no longer a prefetched line.
+                new_fill_buffer.victim_prefetched.eq(
+                    reduce(
+                        operator.or_,
+                        [
+                            replacement.victim[i]
+                            & victim.valid
+                            & victim.prefetched
+                            & ~(clear_prefetched & mem_hits[i] & (prev_mem_read_addr.index == addr.index))
+                            for i, victim in enumerate(victims)
+                        ],
+                    )
+                ),
+            ]
+            for i, fill_buffer in enumerate(fill_buffers):
+                with m.If(free_enc.o == i):
+                    m.d.sync += fill_buffer.eq(new_fill_buffer)
+
+            m.d.comb += replacement.alloc_en.eq(1)
+
+        # Slow path - starting refills. The refiller transfers one line at a time.
+        refill_busy = Signal()
+        refill_idx = Signal(range(self.params.num_of_fill_buffers))
+        refill_fill_buffer = Signal(fill_buffer_layout)
+        m.d.comb += refill_fill_buffer.eq(Array(fill_buffer.as_value() for fill_buffer in fill_buffers)[refill_idx])
+
+        waiting = Cat(fill_buffer.valid & ~fill_buffer.started for fill_buffer in fill_buffers)
+        waiting_demand = Cat(
+            fill_buffer.valid & ~fill_buffer.started & ~fill_buffer.prefetch for fill_buffer in fill_buffers
+        )
+        m.submodules.start_refill_enc = start_enc = PriorityEncoder(self.params.num_of_fill_buffers)
+        m.d.comb += start_enc.i.eq(Mux(waiting_demand.any(), waiting_demand, waiting))
+
+        with Transaction(name="StartRefill").body(m, ready=~refill_busy & ~start_enc.n):
+            start_fill_buffer = Signal(fill_buffer_layout)
+            m.d.av_comb += start_fill_buffer.eq(
+                Array(fill_buffer.as_value() for fill_buffer in fill_buffers)[start_enc.o]
+            )
+
+            # The refill starts from the requested fetch block
+            aligned_addr = self.serialize_addr(start_fill_buffer.addr) & ~(self.params.fetch_block_bytes - 1)
+            log.debug(m, True, "Refilling line 0x{:x}", aligned_addr)
+            self.refiller.start_refill(m, paddr=aligned_addr)
+
+            m.d.sync += refill_busy.eq(1)
+            m.d.sync += refill_idx.eq(start_enc.o)
+            for i, fill_buffer in enumerate(fill_buffers):
+                with m.If(start_enc.o == i):
+                    m.d.sync += fill_buffer.started.eq(1)
+
         # Flush logic
         flush_index = Signal(self.params.index_bits)
         with m.If(fsm.ongoing("FLUSH")):
             m.d.sync += flush_index.eq(flush_index + 1)
 
-        @def_method(m, self.flush, ready=accepting_requests)
+        # Flushes start only when no line is being refilled - the refilled lines would
+        # be written after the flush.
+        self.flush.add_conflict(t, Priority.LEFT)
+
+        @def_method(m, self.flush, ready=accepting_requests & fsm.ongoing("LOOKUP") & ~refilling)
         def _() -> None:
             log.info(m, True, "Flushing the cache...")
             m.d.sync += flush_index.eq(0)
@@ -250,24 +569,39 @@ class ICache(Elaboratable, CacheInterface):
 
         m.d.comb += flush_finish.eq(flush_index == self.params.num_of_sets - 1)
 
-        # Slow path - data refilling
-        with Transaction().body(m):
+        # Slow path - data refilling. Errors are not cached - the line is just not stored.
+        with Transaction(name="Refill").body(m):
             ret = self.refiller.accept_refill(m)
-            deserialized = self.deserialize_addr(ret.paddr)
+            deserialized = Signal(self.addr_layout)
+            m.d.av_comb += assign(deserialized, self.deserialize_addr(ret.paddr))
 
             self.perf_errors.incr(m, enable_call=ret.error)
 
-            m.d.top_comb += [
-                self.mem.data_wr_addr.index.eq(deserialized["index"]),
-                self.mem.data_wr_addr.offset.eq(deserialized["offset"]),
+            m.d.comb += [
+                self.mem.data_way_wr_en.eq(refill_fill_buffer.way),
+                self.mem.data_wr_addr.index.eq(deserialized.index),
+                self.mem.data_wr_addr.offset.eq(deserialized.offset),
                 self.mem.data_wr_data.eq(ret.fetch_block),
+                self.mem.data_wr_en.eq(1),
             ]
 
-            m.d.comb += self.mem.data_wr_en.eq(1)
-            m.d.comb += refill_finish.eq(ret.last)
-            m.d.comb += refill_error.eq(ret.error)
-            with m.If(ret.error):
-                m.d.sync += refill_error_saved.eq(1)
+            m.d.comb += [
+                refill_now.eq(1),
+                assign(refill_now_addr, deserialized),
+                refill_now_data.eq(ret.fetch_block),
+                refill_now_error.eq(ret.error),
+                refill_finish.eq(ret.last),
+            ]
+
+            for i, fill_buffer in enumerate(fill_buffers):
+                with m.If(refill_idx == i):
+                    m.d.sync += fill_buffer.blocks.bit_select(block_index(deserialized), 1).eq(1)
+                    with m.If(ret.last):
+                        m.d.sync += fill_buffer.valid.eq(0)
+
+            with m.If(ret.last):
+                m.d.sync += refill_busy.eq(0)
+                self.perf_prefetch_useless.incr(m, enable_call=refill_fill_buffer.victim_prefetched)
 
         with m.If(fsm.ongoing("FLUSH")):
             m.d.comb += [
@@ -275,15 +609,29 @@ class ICache(Elaboratable, CacheInterface):
                 self.mem.tag_wr_index.eq(flush_index),
                 self.mem.tag_wr_data.valid.eq(0),
                 self.mem.tag_wr_data.tag.eq(0),
+                self.mem.tag_wr_data.prefetched.eq(0),
                 self.mem.tag_wr_en.eq(1),
             ]
-        with m.Else():
+        with m.Elif(refill_finish):
             m.d.comb += [
-                self.mem.way_wr_en.eq(way_selector),
-                self.mem.tag_wr_index.eq(mem_read_addr.index),
-                self.mem.tag_wr_data.valid.eq(~refill_error),
-                self.mem.tag_wr_data.tag.eq(mem_read_addr.tag),
-                self.mem.tag_wr_en.eq(refill_finish),
+                self.mem.way_wr_en.eq(refill_fill_buffer.way),
+                self.mem.tag_wr_index.eq(refill_fill_buffer.addr.index),
+                self.mem.tag_wr_data.valid.eq(~refill_now_error),
+                self.mem.tag_wr_data.tag.eq(refill_fill_buffer.addr.tag),
+                self.mem.tag_wr_data.prefetched.eq(
+                    refill_fill_buffer.prefetch
+                    & ~(prefetch_late & same_line(refill_fill_buffer.addr, prev_mem_read_addr))
+                ),
+                self.mem.tag_wr_en.eq(1),
+            ]
+        with m.Elif(clear_prefetched):
+            m.d.comb += [
+                self.mem.way_wr_en.eq(mem_hits),
+                self.mem.tag_wr_index.eq(prev_mem_read_addr.index),
+                self.mem.tag_wr_data.valid.eq(1),
+                self.mem.tag_wr_data.tag.eq(prev_mem_read_addr.tag),
+                self.mem.tag_wr_data.prefetched.eq(0),
+                self.mem.tag_wr_en.eq(1),
             ]
 
         return m
@@ -294,7 +642,10 @@ class ICacheMemory(Elaboratable):
 
     In case of an associative cache, all address and write data lines are shared.
     Writes are multiplexed using one-hot `way_wr_en` signal. Read data lines from all
-    ways are separately exposed (as an array).
+    ways are separately exposed (as an array). Only the data memories of the ways selected
+    by `data_rd_ways` are read, the others keep their previous output. The tags have a second read port,
+    used by the prefetcher. The tag and data memories have separate write enables of
+    the ways, as the tags can be written while a line is being refilled.
 
     The data memory is addressed using fetch blocks.
     """
@@ -302,12 +653,14 @@ class ICacheMemory(Elaboratable):
     def __init__(self, params: ICacheParameters) -> None:
         self.params = params
 
-        self.tag_data_layout = make_layout(("valid", 1), ("tag", self.params.tag_bits))
+        self.tag_data_layout = make_layout(("valid", 1), ("tag", self.params.tag_bits), ("prefetched", 1))
 
         self.way_wr_en = Signal(self.params.num_of_ways)
 
         self.tag_rd_index = Signal(self.params.index_bits)
         self.tag_rd_data = Array([Signal(self.tag_data_layout) for _ in range(self.params.num_of_ways)])
+        self.prefetch_tag_rd_index = Signal(self.params.index_bits)
+        self.prefetch_tag_rd_data = Array([Signal(self.tag_data_layout) for _ in range(self.params.num_of_ways)])
         self.tag_wr_index = Signal(self.params.index_bits)
         self.tag_wr_en = Signal()
         self.tag_wr_data = Signal(self.tag_data_layout)
@@ -318,6 +671,8 @@ class ICacheMemory(Elaboratable):
 
         self.data_rd_addr = Signal(self.data_addr_layout)
         self.data_rd_data = Array([Signal(self.fetch_block_bits) for _ in range(self.params.num_of_ways)])
+        self.data_rd_ways = Signal(self.params.num_of_ways, init=2**self.params.num_of_ways - 1)
+        self.data_way_wr_en = Signal(self.params.num_of_ways)
         self.data_wr_addr = Signal(self.data_addr_layout)
         self.data_wr_en = Signal()
         self.data_wr_data = Signal(self.fetch_block_bits)
@@ -331,11 +686,14 @@ class ICacheMemory(Elaboratable):
             tag_mem = memory.Memory(shape=self.tag_data_layout, depth=self.params.num_of_sets, init=[])
             tag_mem_wp = tag_mem.write_port()
             tag_mem_rp = tag_mem.read_port(transparent_for=[tag_mem_wp])
+            tag_mem_prefetch_rp = tag_mem.read_port(transparent_for=[tag_mem_wp])
             m.submodules[f"tag_mem_{i}"] = tag_mem
 
             m.d.comb += [
                 assign(self.tag_rd_data[i], tag_mem_rp.data),
                 tag_mem_rp.addr.eq(self.tag_rd_index),
+                assign(self.prefetch_tag_rd_data[i], tag_mem_prefetch_rp.data),
+                tag_mem_prefetch_rp.addr.eq(self.prefetch_tag_rd_index),
                 tag_mem_wp.addr.eq(self.tag_wr_index),
                 assign(tag_mem_wp.data, self.tag_wr_data),
                 tag_mem_wp.en.eq(self.tag_wr_en & way_wr),
@@ -356,9 +714,10 @@ class ICacheMemory(Elaboratable):
             m.d.comb += [
                 self.data_rd_data[i].eq(data_mem_rp.data),
                 data_mem_rp.addr.eq(rd_addr),
+                data_mem_rp.en.eq(self.data_rd_ways[i]),
                 data_mem_wp.addr.eq(wr_addr),
                 data_mem_wp.data.eq(self.data_wr_data),
-                data_mem_wp.en.eq(self.data_wr_en & way_wr),
+                data_mem_wp.en.eq(self.data_wr_en & self.data_way_wr_en[i]),
             ]
 
         return m
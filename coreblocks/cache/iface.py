@@ -19,11 +19,14 @@ class CacheInterface(HasElaborate, Protocol):
         A method that is used to accept the result of a cache lookup request.
     flush : Method
         A method that is used to flush the whole cache.
+    prefetch : Method
+        A method that is used to hint that a cache line will be requested soon.
     """
 
     issue_req: Method
     accept_res: Method
     flush: Method
+    prefetch: Method
 
 
 class CacheRefillerInterface(HasElaborate, Protocol):
@@ -33,7 +36,8 @@ class CacheRefillerInterface(HasElaborate, Protocol):
     Parameters
     ----------
     start_refill : Method
-        A method that is used to start a refill for a given cache line.
+        A method that is used to start a refill for a given cache line. The fetch block
+        containing the given address is returned first, then the refill wraps around the line.
     accept_refill : Method
         A method that is used to accept one fetch block from the requested cache line.
     """
@@ -13,6 +13,12 @@ __all__ = ["SimpleCommonBusCacheRefiller"]
 
 
 class SimpleCommonBusCacheRefiller(Elaboratable, CacheRefillerInterface):
+    """Refills cache lines word by word over a common bus interface.
+
+    The refill starts from the fetch block containing the requested address and
+    wraps around the line, so that the requested block is returned first.
+    """
+
     def __init__(self, layouts: ICacheLayouts, params: ICacheParameters, bus_master: BusMasterInterface):
         self.layouts = layouts
         self.params = params
@@ -32,8 +38,12 @@ class SimpleCommonBusCacheRefiller(Elaboratable, CacheRefillerInterface):
         flushing = Signal()
 
         sending_requests = Signal()
+        start_word = Signal(range(self.params.words_in_line))
         req_word_counter = Signal(range(self.params.words_in_line))
 
+        def is_last_word(word_counter: Value) -> Value:
+            return (word_counter + 1)[: len(word_counter)] == start_word
+
         with Transaction().body(m, ready=sending_requests):
             self.bus_master.request_read(
                 m,
@@ -42,7 +52,7 @@ class SimpleCommonBusCacheRefiller(Elaboratable, CacheRefillerInterface):
             )
 
             m.d.sync += req_word_counter.eq(req_word_counter + 1)
-            with m.If(req_word_counter == (self.params.words_in_line - 1)):
+            with m.If(is_last_word(req_word_counter)):
                 m.d.sync += sending_requests.eq(0)
 
         resp_word_counter = Signal(range(self.params.words_in_line))
@@ -75,10 +85,10 @@ class SimpleCommonBusCacheRefiller(Elaboratable, CacheRefillerInterface):
                         paddr=fetch_block_addr,
                         fetch_block=block,
                         error=bus_response.err,
-                        last=(resp_word_counter == self.params.words_in_line - 1) | bus_response.err,
+                        last=is_last_word(resp_word_counter) | bus_response.err,
                     )
 
-                with m.If(resp_word_counter == self.params.words_in_line - 1):
+                with m.If(is_last_word(resp_word_counter)):
                     m.d.sync += refill_active.eq(0)
                 with m.Elif(bus_response.err):
                     m.d.sync += sending_requests.eq(0)
@@ -92,11 +102,18 @@ class SimpleCommonBusCacheRefiller(Elaboratable, CacheRefillerInterface):
 
         @def_method(m, self.start_refill, ready=~refill_active)
         def _(paddr) -> None:
+            # The first word of the fetch block containing the address
+            first_word = Cat(
+                C(0, exact_log2(self.params.words_in_fetch_block)),
+                paddr[self.params.fetch_block_bytes_log : self.params.offset_bits],
+            )
+
             m.d.sync += cache_line_address.eq(paddr[self.params.offset_bits :])
-            m.d.sync += req_word_counter.eq(0)
+            m.d.sync += start_word.eq(first_word)
+            m.d.sync += req_word_counter.eq(first_word)
             m.d.sync += sending_requests.eq(1)
 
-            m.d.sync += resp_word_counter.eq(0)
+            m.d.sync += resp_word_counter.eq(first_word)
 
             m.d.sync += refill_active.eq(1)
 
@@ -0,0 +1,159 @@
+from functools import reduce
+import operator
+
+from amaranth import *
+import amaranth.lib.memory as memory
+from amaranth.utils import exact_log2
+
+from coreblocks.params import ICacheReplacementPolicy
+
+__all__ = ["CacheReplacement"]
+
+
+class CacheReplacement(Elaboratable):
+    """Replacement state of a set-associative cache.
+
+    Selects the ways to be replaced according to the chosen policy. The per-set state
+    of PLRU and LRU is kept in a small memory with asynchronous reads, it is updated
+    whenever a way is hit and when a victim is allocated - the allocated way becomes
+    the most recently used one.
+
+    The tree PLRU keeps a bit for every inner node of a binary tree over the ways,
+    pointing towards the less recently used half. The true LRU keeps an age matrix -
+    a bit for every pair of ways, telling which of them was used more recently.
+
+    Only one state update can be written per cycle. When a hit and an allocation
+    in different sets happen in the same cycle, the hit is not recorded.
+
+    Attributes
+    ----------
+    touch_index : Signal, in
+        The set of the hit way.
+    touch_ways : Signal, in
+        One-hot encoded hit way.
+    touch_en : Signal, in
+        Records a hit of `touch_ways` in the set `touch_index`.
+    victim_index : Signal, in
+        The set in which a way is to be replaced.
+    victim : Signal, out
+        One-hot encoded way to be replaced in the set `victim_index`.
+    alloc_en : Signal, in
+        Records that the `victim` way was allocated.
+    """
+
+    def __init__(self, policy: ICacheReplacementPolicy, num_of_ways: int, num_of_sets_bits: int):
+        self.policy = policy
+        self.num_of_ways = num_of_ways
+        self.num_of_sets_bits = num_of_sets_bits
+
+        self.touch_index = Signal(num_of_sets_bits)
+        self.touch_ways = Signal(num_of_ways)
+        self.touch_en = Signal()
+
+        self.victim_index = Signal(num_of_sets_bits)
+        self.victim = Signal(num_of_ways)
+        self.alloc_en = Signal()
+
+        if num_of_ways == 1:
+            self.state_bits = 0
+        elif policy == ICacheReplacementPolicy.PLRU:
+            self.state_bits = num_of_ways - 1
+        elif policy == ICacheReplacementPolicy.LRU:
+            self.state_bits = num_of_ways * (num_of_ways - 1) // 2
+        else:
+            self.state_bits = 0
+
+    def _plru_victim(self, state: Value) -> Value:
+        # Nodes of the tree are numbered from 1 (the root), children of node n are 2n and 2n+1.
+        levels = exact_log2(self.num_of_ways)
+        victim = []
+        for way in range(self.num_of_ways):
+            node = self.num_of_ways + way
+            conds = []
+            for _ in range(levels):
+                conds.append(state[node // 2 - 1] == node % 2)
+                node //= 2
+            victim.append(reduce(operator.and_, conds))
+        return Cat(victim)
+
+    def _plru_touch(self, state: Value, ways: Value) -> Value:
+        new_state = []
+        for node in range(1, self.num_of_ways):
+            # The ways in the left and the right subtree of the node
+            level = node.bit_length() - 1
+            size = self.num_of_ways >> (level + 1)
+            first = (node - (1 << level)) * 2 * size
+            left = ways[first : first + size].any()
+            right = ways[first + size : first + 2 * size].any()
+            new_state.append(Mux(left | right, left, state[node - 1]))
+        return Cat(new_state)
+
+    def _lru_pairs(self) -> list[tuple[int, int]]:
+        return [(i, j) for i in range(self.num_of_ways) for j in range(i + 1, self.num_of_ways)]
+
+    def _lru_victim(self, state: Value) -> Value:
+        # The bit of a pair (i, j) is set when the way i was used more recently than the way j.
+        pairs = self._lru_pairs()
+        victim = []
+        for way in range(self.num_of_ways):
+            conds = []
+            for bit, (i, j) in enumerate(pairs):
+                if i == way:
+                    conds.append(~state[bit])
+                elif j == way:
+                    conds.append(state[bit])
+            victim.append(reduce(operator.and_, conds))
+        return Cat(victim)
+
+    def _lru_touch(self, state: Value, ways: Value) -> Value:
+        return Cat(Mux(ways[i], 1, Mux(ways[j], 0, state[bit])) for bit, (i, j) in enumerate(self._lru_pairs()))
+
+    def elaborate(self, platform):
+        m = Module()
+
+        if self.state_bits == 0:
+            if self.num_of_ways == 1:
+                m.d.comb += self.victim.eq(1)
+            else:
+                round_robin = Signal(self.num_of_ways, init=1)
+                with m.If(self.alloc_en):
+                    m.d.sync += round_robin.eq(round_robin.rotate_left(1))
+                m.d.comb += self.victim.eq(round_robin)
+            return m
+
+        if self.policy == ICacheReplacementPolicy.PLRU:
+            victim_of, touch = self._plru_victim, self._plru_touch
+        else:
+            victim_of, touch = self._lru_victim, self._lru_touch
+
+        m.submodules.mem = mem = memory.Memory(shape=self.state_bits, depth=2**self.num_of_sets_bits, init=[])
+        wr = mem.write_port()
+        touch_rd = mem.read_port(domain="comb")
+        victim_rd = mem.read_port(domain="comb")
+
+        m.d.comb += [
+            touch_rd.addr.eq(self.touch_index),
+            victim_rd.addr.eq(self.victim_index),
+        ]
+
+        # A hit in the same cycle is taken into account when selecting the victim.
+        same_set = Signal()
+        m.d.comb += same_set.eq(self.touch_en & (self.touch_index == self.victim_index))
+        victim_state = Signal(self.state_bits)
+        m.d.comb += victim_state.eq(Mux(same_set, touch(victim_rd.data, self.touch_ways), victim_rd.data))
+        m.d.comb += self.victim.eq(victim_of(victim_state))
+
+        with m.If(self.alloc_en):
+            m.d.comb += [
+                wr.addr.eq(self.victim_index),
+                wr.data.eq(touch(victim_state, self.victim)),
+                wr.en.eq(1),
+            ]
+        with m.Elif(self.touch_en):
+            m.d.comb += [
+                wr.addr.eq(self.touch_index),
+                wr.data.eq(touch(touch_rd.data, self.touch_ways)),
+                wr.en.eq(1),
+            ]
+
+        return m
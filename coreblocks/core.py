@@ -13,6 +13,8 @@ from coreblocks.interface.layouts import *
 from coreblocks.interface.keys import (
     CSRInstancesKey,
     CommonBusDataKey,
+    DCacheWritebackKey,
+    ROBIndicesKey,
     InstructionAddressTranslatorBackingDeviceKey,
     DataAddressTranslatorBackingDeviceKey,
 )
@@ -29,7 +31,8 @@ from coreblocks.scheduler.scheduler import Scheduler
 from coreblocks.backend.announcement import ResultAnnouncement
 from coreblocks.backend.retirement import Retirement
 from coreblocks.peripherals.bus_adapter import WishboneMasterAdapter
-from coreblocks.peripherals.wishbone import WishboneMaster, WishboneInterface
+from coreblocks.cache.dcache import DCache
+from coreblocks.peripherals.wishbone import WishboneMaster, PipelinedWishboneMaster, WishboneInterface
 from coreblocks.priv.vmem.tlb import FullyAssociativeTLB, SetAssociativeTLB
 from coreblocks.priv.vmem.walker import PageTableWalker
 from transactron.lib.metrics import HwMetricsEnabledKey, TaggedCounter
@@ -59,23 +62,36 @@ class Core(Component):
             self.dm.add_dependency(HwMetricsEnabledKey(), True)
             self.dm.add_dependency(EvLogEnabledKey(), True)
 
-        self.wb_master_instr = WishboneMaster(self.gen_params.wb_params, "instr")
+        self.wb_master_instr = (
+            PipelinedWishboneMaster(self.gen_params.wb_params, max_req=self.gen_params.icache_params.words_in_line)
+            if self.gen_params.instr_bus_pipelined
+            else WishboneMaster(self.gen_params.wb_params, "instr")
+        )
         self.wb_master_data = WishboneMaster(self.gen_params.wb_params, "data")
 
         self.bus_master_instr_adapter = WishboneMasterAdapter(self.wb_master_instr)
-        self.bus_master_data_adapter = WishboneMasterAdapter(
-            self.wb_master_data,
-            port_count=2 if self.gen_params.vmem_params.supported_non_bare_schemes else 1,
-        )
-
-        self.dm.add_dependency(CommonBusDataKey(), self.bus_master_data_adapter.ports[0])
+        data_port_count = 2 if self.gen_params.vmem_params.supported_non_bare_schemes else 1
+
+        # With the data cache, the page table walker also goes through the cache,
+        # so that it sees the page tables written by the stores.
+        self.dcache = None
+        if self.gen_params.dcache_params.enable:
+            self.bus_master_data_adapter = WishboneMasterAdapter(self.wb_master_data)
+            self.dcache = DCache(self.gen_params, self.bus_master_data_adapter.ports[0], port_count=data_port_count)
+            data_ports = self.dcache.ports
+            self.dm.add_dependency(DCacheWritebackKey(), (self.dcache.writeback_req, self.dcache.writeback_resp))
+        else:
+            self.bus_master_data_adapter = WishboneMasterAdapter(self.wb_master_data, port_count=data_port_count)
+            data_ports = self.bus_master_data_adapter.ports
+
+        self.dm.add_dependency(CommonBusDataKey(), data_ports[0])
 
         self.ptw = None
         self.l2_tlb = None
         self.l1i_tlb = None
         self.l1d_tlb = None
         if self.gen_params.vmem_params.supported_non_bare_schemes:
-            self.ptw = PageTableWalker(self.gen_params, bus=self.bus_master_data_adapter.ports[1])
+            self.ptw = PageTableWalker(self.gen_params, bus=data_ports[1])
             self.l2_tlb = SetAssociativeTLB(
                 self.gen_params,
                 entries=self.gen_params.tlb_config.l2tlb_entries,
@@ -121,6 +137,7 @@ class Core(Component):
         self.ROB = ReorderBuffer(
             gen_params=self.gen_params, mark_done_ports=self.gen_params.announcement_superscalarity
         )
+        self.dm.add_dependency(ROBIndicesKey(), self.ROB.get_indices)
 
         self.retirement = Retirement(self.gen_params)
 
@@ -151,7 +168,10 @@ class Core(Component):
 
         m.submodules += [self.announcement_counter]
 
-        connect(m.top_module, flipped(self.wb_instr), self.wb_master_instr.wb_master)
+        if isinstance(self.wb_master_instr, PipelinedWishboneMaster):
+            connect(m.top_module, flipped(self.wb_instr), self.wb_master_instr.wb)
+        else:
+            connect(m.top_module, flipped(self.wb_instr), self.wb_master_instr.wb_master)
         connect(m.top_module, flipped(self.wb_data), self.wb_master_data.wb_master)
 
         m.submodules.wb_master_instr = self.wb_master_instr
@@ -159,6 +179,8 @@ class Core(Component):
 
         m.submodules.bus_master_instr_adapter = self.bus_master_instr_adapter
         m.submodules.bus_master_data_adapter = self.bus_master_data_adapter
+        if self.dcache is not None:
+            m.submodules.dcache = self.dcache
         if self.gen_params.vmem_params.supported_non_bare_schemes:
             assert self.ptw is not None
             assert self.l2_tlb is not None
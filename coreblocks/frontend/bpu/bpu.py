@@ -6,17 +6,59 @@ from transactron.utils import logging
 from transactron.lib import Pipe
 
 from coreblocks.params import *
+from coreblocks.arch import CfiType
 from coreblocks.frontend import FrontendParams
+from coreblocks.frontend.bpu.btb import BranchTargetBuffer
+from coreblocks.frontend.bpu.gshare import GSharePredictor
+from coreblocks.frontend.bpu.tage import TAGEPredictor
+from coreblocks.frontend.bpu.ras import ReturnAddressStack
+from coreblocks.frontend.bpu.indirect import IndirectTargetPredictor
+from coreblocks.frontend.bpu.loop import LoopPredictor
 from coreblocks.interface.layouts import CommonLayoutFields
-from coreblocks.interface.layouts import BranchPredictionLayouts
+from coreblocks.interface.layouts import BranchPredictionLayouts, FetchLayouts
 
 log = logging.HardwareLogger("frontend.bpu")
 
 
 class BranchPredictionUnit(Elaboratable):
+    """Branch Prediction Unit
+
+    For every fetch block requested by the FTQ the unit predicts the address of the
+    next fetch block, together with the control flow instruction which redirects
+    the fetch. The prediction is made by looking up the fetch block address in
+    the branch target buffer - on a miss, the next sequential fetch block is predicted.
+    The direction of conditional branches found in the BTB is predicted by
+    a direction predictor, selected by `bpu_type` in the core configuration. If enabled,
+    the loop predictor overrides it for loop branches with a learned trip count.
+
+    Targets of returns are predicted by a return address stack, which calls found
+    in the BTB push their return addresses onto. Targets of other indirect jumps are
+    predicted by an indirect target predictor, falling back to the last target recorded
+    in the BTB.
+
+    The unit keeps a speculative global history of conditional branch outcomes, updated
+    with every prediction. The history, the return address stack pointer and the direction
+    predictor table used for a prediction are returned to the FTQ as prediction metadata.
+    The FTQ uses it to restore the state after a redirect and to train the predictor.
+
+    The prediction is made in the cycle after the request and the FTQ can request the
+    predicted block in the same cycle, so predicted-taken blocks are fetched back to back.
+    """
+
     request: Provided[Method]
+    """Requests a prediction for the fetch block starting at the given PC."""
+
     write_prediction: Required[Method]
+    """Called with the prediction for a requested fetch block."""
+
     flush: Provided[Method]
+    """Drops all predictions in flight."""
+
+    restore: Provided[Method]
+    """Sets the speculative global history and return address stack. Used to repair them after a redirect."""
+
+    update: Provided[Method]
+    """Trains the predictor with a resolved control flow instruction."""
 
     def __init__(self, gen_params: GenParams) -> None:
         self.gen_params = gen_params
@@ -25,6 +67,8 @@ class BranchPredictionUnit(Elaboratable):
         self.request = Method(i=self.layouts.request)
         self.write_prediction = Method(i=self.layouts.write_prediction)
         self.flush = Method()
+        self.restore = Method(i=self.layouts.restore)
+        self.update = Method(i=self.layouts.update)
 
     def elaborate(self, platform):
         m = TModule()
@@ -32,17 +76,146 @@ class BranchPredictionUnit(Elaboratable):
         fparams = self.gen_params.get(FrontendParams)
         fields = self.gen_params.get(CommonLayoutFields)
 
-        m.submodules.pipe = pipe = Pipe(layout=make_layout(fields.pc, fields.ftq_ptr))
+        m.submodules.btb = btb = BranchTargetBuffer(self.gen_params)
+        match self.gen_params.bpu_type:
+            case BPUType.GSHARE:
+                direction_predictor = GSharePredictor(self.gen_params)
+            case BPUType.TAGE:
+                direction_predictor = TAGEPredictor(self.gen_params)
+        m.submodules.direction_predictor = direction_predictor
+        m.submodules.ras = ras = ReturnAddressStack(self.gen_params)
+        m.submodules.indirect = indirect = IndirectTargetPredictor(self.gen_params)
+        if self.gen_params.loop_predictor_enable:
+            m.submodules.loop = loop = LoopPredictor(self.gen_params)
+        m.submodules.pipe = pipe = Pipe(layout=make_layout(fields.pc, fields.ftq_ptr, self.layouts.ghist))
+
+        # The speculative global history. Requests made in the same cycle as a prediction
+        # already see the history updated by that prediction.
+        ghist = Signal(self.gen_params.bpu_history_len)
+        ghist_next = Signal.like(ghist)
+        m.d.comb += ghist_next.eq(ghist)
+        m.d.sync += ghist.eq(ghist_next)
 
         @def_method(m, self.request)
         def _(pc, ftq_ptr):
-            pipe.write(m, pc=fparams.pc_from_fb(fparams.fb_addr(pc) + 1, 0), ftq_ptr=ftq_ptr)
+            btb.lookup(m, fb_addr=fparams.fb_addr(pc))
+            direction_predictor.lookup(m, fb_addr=fparams.fb_addr(pc), ghist=ghist_next)
+            indirect.lookup(m, fb_addr=fparams.fb_addr(pc), ghist=ghist_next)
+            if self.gen_params.loop_predictor_enable:
+                loop.lookup(m, fb_addr=fparams.fb_addr(pc))
+            pipe.write(m, pc=pc, ftq_ptr=ftq_ptr, ghist=ghist_next)
 
         with Transaction(name="BPU_Stage1").body(m):
-            self.write_prediction(m, pipe.read(m))
+            req = pipe.read(m)
+            btb_res = btb.read(m)
+            direction = direction_predictor.read(m)
+            ras_top = ras.read(m)
+            indirect_res = indirect.read(m)
+
+            prediction = Signal(self.gen_params.get(FetchLayouts).bpu_prediction)
+            next_pc = Signal(self.gen_params.isa.xlen)
+            m.d.av_comb += next_pc.eq(fparams.pc_from_fb(fparams.fb_addr(req.pc) + 1, 0))
+
+            # Entries describing instructions before the fetch start address are ignored.
+            btb_hit = Signal()
+            m.d.av_comb += btb_hit.eq(btb_res.hit & (btb_res.entry.cfi_idx >= fparams.fb_instr_idx(req.pc)))
+
+            is_branch = Signal()
+            m.d.av_comb += is_branch.eq(btb_hit & CfiType.is_branch(btb_res.entry.cfi_type))
+
+            taken = Signal()
+            m.d.av_comb += taken.eq(direction.taken)
+
+            meta = Signal(self.layouts.meta[1])
+            m.d.av_comb += [
+                meta.ghist.eq(req.ghist),
+                meta.ras_ptr.eq(ras_top.ras_ptr),
+                meta.provider.eq(direction.provider),
+            ]
+
+            if self.gen_params.loop_predictor_enable:
+                loop_res = loop.read(m)
+                loop_hit = Signal()
+                m.d.av_comb += loop_hit.eq(is_branch & loop_res.hit & (loop_res.cfi_idx == btb_res.entry.cfi_idx))
+
+                m.d.av_comb += [
+                    meta.loop_hit.eq(loop_hit),
+                    meta.loop_idx.eq(loop_res.last_idx),
+                    meta.loop_iter.eq(loop_res.last_iter),
+                    meta.loop_cfi_idx.eq(btb_res.entry.cfi_idx),
+                ]
+
+                with m.If(loop_hit):
+                    with m.If(loop_res.confident):
+                        m.d.av_comb += taken.eq(loop_res.taken)
+                    loop.speculate(m, loop_idx=loop_res.loop_idx, taken=taken)
+                    m.d.av_comb += [
+                        meta.loop_idx.eq(loop_res.loop_idx),
+                        meta.loop_iter.eq(loop_res.loop_iter),
+                    ]
+
+            with m.If(btb_hit & (~is_branch | taken)):
+                m.d.av_comb += [
+                    prediction.cfi_idx.eq(btb_res.entry.cfi_idx),
+                    prediction.cfi_type.eq(btb_res.entry.cfi_type),
+                    prediction.cfi_target.eq(btb_res.entry.cfi_target),
+                    prediction.cfi_target_valid.eq(1),
+                    next_pc.eq(btb_res.entry.cfi_target),
+                ]
+
+                with m.If(CfiType.is_call(btb_res.entry.cfi_type)):
+                    cfi_pc = fparams.pc_from_fb(fparams.fb_addr(req.pc), btb_res.entry.cfi_idx)
+                    ras.push(m, ret_addr=cfi_pc + Mux(btb_res.entry.cfi_short, 2, 4))
+                with m.If(CfiType.is_ret(btb_res.entry.cfi_type)):
+                    ras.pop(m)
+                    m.d.av_comb += [
+                        prediction.cfi_target.eq(ras_top.ret_addr),
+                        next_pc.eq(ras_top.ret_addr),
+                    ]
+                with m.Elif(CfiType.is_jalr(btb_res.entry.cfi_type) & indirect_res.hit):
+                    m.d.av_comb += [
+                        prediction.cfi_target.eq(indirect_res.cfi_target),
+                        next_pc.eq(indirect_res.cfi_target),
+                    ]
+
+            with m.If(is_branch):
+                # A branch predicted not taken is marked, so that the fetch unit doesn't
+                # apply its static prediction to it.
+                m.d.av_comb += prediction.branch_mask.eq(1 << btb_res.entry.cfi_idx)
+                m.d.comb += ghist_next.eq(Cat(taken, req.ghist))
+
+            log.debug(m, CfiType.valid(prediction.cfi_type), "BTB hit pc=0x{:x} target=0x{:x}", req.pc, next_pc)
+
+            self.write_prediction(
+                m,
+                pc=next_pc,
+                ftq_ptr=req.ftq_ptr,
+                prediction=prediction,
+                meta=meta,
+            )
 
         @def_method(m, self.flush, nonexclusive=True)
         def _():
             pipe.clear(m)
 
+        @def_method(m, self.restore)
+        def _(ghist, ras_ptr, ras_push, ret_addr, loop_idx, loop_iter):
+            m.d.comb += ghist_next.eq(ghist)
+            ras.restore(m, ras_ptr=ras_ptr, ras_push=ras_push, ret_addr=ret_addr)
+            if self.gen_params.loop_predictor_enable:
+                loop.restore(m, loop_idx=loop_idx, loop_iter=loop_iter)
+
+        @def_method(m, self.update)
+        def _(arg):
+            btb.update(m, arg)
+
+            with m.If(CfiType.is_branch(arg.cfi_type)):
+                direction_predictor.update(
+                    m, fb_addr=arg.fb_addr, ghist=arg.ghist, provider=arg.provider, taken=arg.taken
+                )
+                if self.gen_params.loop_predictor_enable:
+                    loop.update(m, fb_addr=arg.fb_addr, cfi_idx=arg.cfi_idx, cfi_target=arg.cfi_target, taken=arg.taken)
+            with m.If(CfiType.is_jalr(arg.cfi_type) & ~CfiType.is_ret(arg.cfi_type)):
+                indirect.update(m, fb_addr=arg.fb_addr, ghist=arg.ghist, cfi_target=arg.cfi_target)
+
         return m
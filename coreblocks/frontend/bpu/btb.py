@@ -0,0 +1,158 @@
+from amaranth import *
+from amaranth.lib.data import StructLayout, ArrayLayout
+import amaranth.lib.memory as memory
+
+from transactron import *
+from transactron.lib import Pipe, HwCounter
+from transactron.utils import OneHotMux, mod_incr
+from transactron.utils.transactron_helpers import make_layout
+
+from coreblocks.arch import CfiType
+from coreblocks.params import GenParams
+from coreblocks.interface.layouts import BranchPredictionLayouts, CommonLayoutFields
+
+__all__ = ["BranchTargetBuffer", "BTBEntry"]
+
+
+class BTBEntry(StructLayout):
+    def __init__(self, gen_params: GenParams):
+        super().__init__(
+            {
+                "valid": 1,
+                "tag": gen_params.isa.xlen - gen_params.fetch_block_bytes_log - gen_params.btb_sets_bits,
+                "cfi_idx": gen_params.fetch_width_log,
+                "cfi_type": CfiType,
+                "cfi_target": gen_params.isa.xlen,
+                "cfi_short": 1,
+            }
+        )
+
+
+class BranchTargetBuffer(Elaboratable):
+    """Set-associative branch target buffer.
+
+    The buffer is indexed by fetch block addresses. Each entry describes the first
+    taken control flow instruction of a fetch block: its index in the block, its type
+    and its target. Replacement is a round-robin scheme with a single global counter.
+    """
+
+    lookup: Provided[Method]
+    """Starts a lookup of the given fetch block. The result is available in the next cycle."""
+
+    read: Provided[Method]
+    """Returns the result of the last lookup. Nonexclusive."""
+
+    update: Provided[Method]
+    """Records a resolved control flow instruction. Taken instructions are allocated."""
+
+    def __init__(self, gen_params: GenParams):
+        self.gen_params = gen_params
+
+        self.ways = gen_params.btb_ways
+        self.sets_bits = gen_params.btb_sets_bits
+
+        fields = gen_params.get(CommonLayoutFields)
+        layouts = gen_params.get(BranchPredictionLayouts)
+
+        self.entry_layout = BTBEntry(gen_params)
+
+        self.lookup = Method(i=make_layout(fields.fb_addr))
+        self.read = Method(o=make_layout(("hit", 1), ("entry", self.entry_layout)))
+        self.update = Method(i=layouts.update)
+
+        self.perf_lookups = HwCounter("frontend.bpu.btb.lookups", "Number of BTB lookups")
+        self.perf_hits = HwCounter("frontend.bpu.btb.hits", "Number of BTB hits")
+        self.perf_allocs = HwCounter("frontend.bpu.btb.allocs", "Number of BTB entries written")
+
+    def elaborate(self, platform):
+        m = TModule()
+
+        m.submodules += [self.perf_lookups, self.perf_hits, self.perf_allocs]
+
+        def index(fb_addr: Value) -> Value:
+            return fb_addr[: self.sets_bits]
+
+        def tag(fb_addr: Value) -> Value:
+            return fb_addr[self.sets_bits :]
+
+        m.submodules.mem = mem = memory.Memory(
+            shape=ArrayLayout(self.entry_layout, self.ways), depth=2**self.sets_bits, init=[]
+        )
+        wr = mem.write_port()
+        lookup_rd = mem.read_port(transparent_for=[wr])
+        update_rd = mem.read_port(transparent_for=[wr])
+
+        lookup_fb_addr = Signal.like(self.lookup.data_in.fb_addr)
+
+        @def_method(m, self.lookup)
+        def _(fb_addr):
+            self.perf_lookups.incr(m)
+            m.d.sync += lookup_fb_addr.eq(fb_addr)
+            m.d.comb += lookup_rd.addr.eq(index(fb_addr))
+            m.d.comb += lookup_rd.en.eq(1)
+
+        lookup_match = Signal(self.ways)
+        for way in range(self.ways):
+            m.d.comb += lookup_match[way].eq(
+                lookup_rd.data[way].valid & (lookup_rd.data[way].tag == tag(lookup_fb_addr))
+            )
+
+        @def_method(m, self.read, nonexclusive=True)
+        def _():
+            self.perf_hits.incr(m, enable_call=lookup_match.any())
+            entry = OneHotMux.create(m, [(lookup_match[way], lookup_rd.data[way]) for way in range(self.ways)])
+            return {"hit": lookup_match.any(), "entry": entry}
+
+        # Updates read the set first, then write back the chosen way in the next cycle.
+        m.submodules.update_pipe = update_pipe = Pipe(self.update.layout_in)
+
+        @def_method(m, self.update)
+        def _(arg):
+            m.d.comb += update_rd.addr.eq(index(arg.fb_addr))
+            m.d.comb += update_rd.en.eq(1)
+            update_pipe.write(m, arg)
+
+        replacement_rr_index = Signal(range(self.ways))
+
+        with Transaction(name="BTB_Update").body(m):
+            upd = update_pipe.read(m)
+
+            update_match = Signal(self.ways)
+            for way in range(self.ways):
+                m.d.av_comb += update_match[way].eq(
+                    update_rd.data[way].valid & (update_rd.data[way].tag == tag(upd.fb_addr))
+                )
+
+            # The order of checks: currently present entry -> invalid entry -> round-robin.
+            replace_candidate = Signal(range(self.ways))
+            m.d.av_comb += replace_candidate.eq(replacement_rr_index)
+            for way in reversed(range(self.ways)):
+                with m.If(~update_rd.data[way].valid):
+                    m.d.av_comb += replace_candidate.eq(way)
+            for way in range(self.ways):
+                with m.If(update_match[way]):
+                    m.d.av_comb += replace_candidate.eq(way)
+
+            new_entry = Signal(self.entry_layout)
+            m.d.av_comb += [
+                new_entry.valid.eq(1),
+                new_entry.tag.eq(tag(upd.fb_addr)),
+                new_entry.cfi_idx.eq(upd.cfi_idx),
+                new_entry.cfi_type.eq(upd.cfi_type),
+                new_entry.cfi_target.eq(upd.cfi_target),
+                new_entry.cfi_short.eq(upd.cfi_short),
+            ]
+
+            # For indirect jumps, the recorded target is the last one seen. It is used when
+            # the indirect target predictor misses.
+            with m.If(upd.taken):
+                self.perf_allocs.incr(m)
+                m.d.comb += wr.addr.eq(index(upd.fb_addr))
+                m.d.comb += wr.data.eq(update_rd.data)
+                m.d.comb += wr.data[replace_candidate].eq(new_entry)
+                m.d.comb += wr.en.eq(1)
+
+                with m.If(~update_match.any()):
+                    m.d.sync += replacement_rr_index.eq(mod_incr(replacement_rr_index, self.ways))
+
+        return m
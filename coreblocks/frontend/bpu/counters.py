@@ -0,0 +1,26 @@
+from amaranth import *
+
+__all__ = ["counter_update", "counter_taken"]
+
+
+def counter_update(counter: Value, taken: Value) -> Value:
+    """Returns the new value of a saturating counter after a branch outcome.
+
+    Parameters
+    ----------
+    counter : Value
+        Current value of the counter.
+    taken : Value
+        Whether the branch was taken.
+    """
+    max_val = 2 ** len(counter) - 1
+    return Mux(
+        taken,
+        Mux(counter == max_val, counter, counter + 1),
+        Mux(counter == 0, counter, counter - 1),
+    )[: len(counter)]
+
+
+def counter_taken(counter: Value) -> Value:
+    """Returns the prediction of a saturating counter - the upper half of the range predicts taken."""
+    return counter[-1]
@@ -0,0 +1,131 @@
+from amaranth import *
+import amaranth.lib.memory as memory
+
+from transactron import *
+from transactron.lib import Pipe, HwCounter
+
+from coreblocks.params import GenParams
+from coreblocks.interface.layouts import BranchPredictionLayouts
+from coreblocks.frontend.bpu.counters import counter_update, counter_taken
+
+__all__ = ["GSharePredictor"]
+
+
+class GSharePredictor(Elaboratable):
+    """Conditional branch direction predictor.
+
+    The predictor combines two tables of 2-bit saturating counters: a bimodal table
+    indexed by the fetch block address and a gshare table indexed by the fetch block
+    address XOR-ed with the global branch history. A third table of counters, indexed
+    by the fetch block address, chooses which of the two predictions is used.
+
+    There is one prediction per fetch block - it applies to the conditional branch
+    found in the block by the branch target buffer.
+    """
+
+    lookup: Provided[Method]
+    """Starts a lookup of the given fetch block. The result is available in the next cycle."""
+
+    read: Provided[Method]
+    """Returns the direction predicted by the last lookup. Nonexclusive."""
+
+    update: Provided[Method]
+    """Trains the predictor with the outcome of a conditional branch."""
+
+    def __init__(self, gen_params: GenParams):
+        self.gen_params = gen_params
+        self.table_bits = gen_params.bpu_table_bits
+
+        layouts = gen_params.get(BranchPredictionLayouts)
+
+        self.lookup = Method(i=layouts.direction_lookup)
+        self.read = Method(o=layouts.direction_read)
+        self.update = Method(i=layouts.direction_update)
+
+        self.perf_gshare_chosen = HwCounter(
+            "frontend.bpu.gshare.gshare_chosen", "Number of predictions made by the gshare table"
+        )
+
+    def elaborate(self, platform):
+        m = TModule()
+
+        m.submodules += [self.perf_gshare_chosen]
+
+        def bimodal_index(fb_addr: Value) -> Value:
+            return fb_addr[: self.table_bits]
+
+        def gshare_index(fb_addr: Value, ghist: Value) -> Value:
+            return (fb_addr ^ ghist)[: self.table_bits]
+
+        # Branches are allocated in the BTB only when taken, so counters start weakly taken.
+        depth = 2**self.table_bits
+        m.submodules.bimodal = bimodal = memory.Memory(shape=2, depth=depth, init=[2] * depth)
+        m.submodules.gshare = gshare = memory.Memory(shape=2, depth=depth, init=[2] * depth)
+        m.submodules.chooser = chooser = memory.Memory(shape=2, depth=depth, init=[])
+
+        tables = [bimodal, gshare, chooser]
+        write_ports = [table.write_port() for table in tables]
+        lookup_ports = [table.read_port(transparent_for=[wr]) for table, wr in zip(tables, write_ports)]
+        update_ports = [table.read_port(transparent_for=[wr]) for table, wr in zip(tables, write_ports)]
+
+        bimodal_wr, gshare_wr, chooser_wr = write_ports
+        bimodal_rd, gshare_rd, chooser_rd = lookup_ports
+        bimodal_upd, gshare_upd, chooser_upd = update_ports
+
+        @def_method(m, self.lookup)
+        def _(fb_addr, ghist):
+            m.d.comb += [
+                bimodal_rd.addr.eq(bimodal_index(fb_addr)),
+                gshare_rd.addr.eq(gshare_index(fb_addr, ghist)),
+                chooser_rd.addr.eq(bimodal_index(fb_addr)),
+            ]
+            for port in lookup_ports:
+                m.d.comb += port.en.eq(1)
+
+        @def_method(m, self.read, nonexclusive=True)
+        def _():
+            use_gshare = counter_taken(chooser_rd.data)
+            self.perf_gshare_chosen.incr(m, enable_call=use_gshare)
+            return {
+                "taken": counter_taken(Mux(use_gshare, gshare_rd.data, bimodal_rd.data)),
+                "provider": use_gshare,
+            }
+
+        # Updates read the counters first, then write back the new values in the next cycle.
+        m.submodules.update_pipe = update_pipe = Pipe(self.update.layout_in)
+
+        @def_method(m, self.update)
+        def _(arg):
+            m.d.comb += [
+                bimodal_upd.addr.eq(bimodal_index(arg.fb_addr)),
+                gshare_upd.addr.eq(gshare_index(arg.fb_addr, arg.ghist)),
+                chooser_upd.addr.eq(bimodal_index(arg.fb_addr)),
+            ]
+            for port in update_ports:
+                m.d.comb += port.en.eq(1)
+            update_pipe.write(m, arg)
+
+        with Transaction(name="GShare_Update").body(m):
+            upd = update_pipe.read(m)
+
+            bimodal_correct = counter_taken(bimodal_upd.data) == upd.taken
+            gshare_correct = counter_taken(gshare_upd.data) == upd.taken
+
+            m.d.comb += [
+                bimodal_wr.addr.eq(bimodal_index(upd.fb_addr)),
+                bimodal_wr.data.eq(counter_update(bimodal_upd.data, upd.taken)),
+                bimodal_wr.en.eq(1),
+                gshare_wr.addr.eq(gshare_index(upd.fb_addr, upd.ghist)),
+                gshare_wr.data.eq(counter_update(gshare_upd.data, upd.taken)),
+                gshare_wr.en.eq(1),
+            ]
+
+            # The chooser is trained only when exactly one of the tables was right.
+            with m.If(bimodal_correct != gshare_correct):
+                m.d.comb += [
+                    chooser_wr.addr.eq(bimodal_index(upd.fb_addr)),
+                    chooser_wr.data.eq(counter_update(chooser_upd.data, gshare_correct)),
+                    chooser_wr.en.eq(1),
+                ]
+
+        return m
@@ -0,0 +1,136 @@
+from amaranth import *
+from amaranth.lib.data import StructLayout
+import amaranth.lib.memory as memory
+
+from transactron import *
+from transactron.lib import Pipe, HwCounter
+from transactron.utils.transactron_helpers import make_layout
+
+from coreblocks.params import GenParams
+from coreblocks.interface.layouts import BranchPredictionLayouts, CommonLayoutFields
+from coreblocks.frontend.bpu.counters import counter_update
+
+__all__ = ["IndirectTargetPredictor"]
+
+
+class IndirectTargetEntry(StructLayout):
+    def __init__(self, gen_params: GenParams):
+        super().__init__(
+            {
+                "valid": 1,
+                "tag": gen_params.indirect_tag_bits,
+                "target": gen_params.isa.xlen,
+                "confidence": 2,
+            }
+        )
+
+
+class IndirectTargetPredictor(Elaboratable):
+    """Target predictor for indirect jumps.
+
+    A tagged table of targets, indexed by the fetch block address XOR-ed with the global
+    branch history, so that a jump can have different targets depending on the path
+    leading to it. On a miss, the BPU falls back to the last target recorded in the BTB.
+
+    Each entry has a confidence counter - a wrong target is replaced only after
+    the counter drops to zero.
+    """
+
+    lookup: Provided[Method]
+    """Starts a lookup of the given fetch block. The result is available in the next cycle."""
+
+    read: Provided[Method]
+    """Returns the result of the last lookup. Nonexclusive."""
+
+    update: Provided[Method]
+    """Records the target of a resolved indirect jump."""
+
+    def __init__(self, gen_params: GenParams):
+        self.gen_params = gen_params
+        self.table_bits = gen_params.indirect_table_bits
+
+        fields = gen_params.get(CommonLayoutFields)
+        layouts = gen_params.get(BranchPredictionLayouts)
+
+        self.entry_layout = IndirectTargetEntry(gen_params)
+
+        self.lookup = Method(i=layouts.direction_lookup)
+        self.read = Method(o=make_layout(("hit", 1), fields.cfi_target))
+        self.update = Method(i=make_layout(fields.fb_addr, layouts.ghist, fields.cfi_target))
+
+        self.perf_hits = HwCounter("frontend.bpu.indirect.hits", "Number of indirect target table hits")
+        self.perf_replacements = HwCounter(
+            "frontend.bpu.indirect.replacements", "Number of targets written to the indirect target table"
+        )
+
+    def elaborate(self, platform):
+        m = TModule()
+
+        m.submodules += [self.perf_hits, self.perf_replacements]
+
+        tag_bits = self.gen_params.indirect_tag_bits
+
+        def index(fb_addr: Value, ghist: Value) -> Value:
+            return (fb_addr ^ ghist)[: self.table_bits]
+
+        def tag(fb_addr: Value) -> Value:
+            return fb_addr[self.table_bits : self.table_bits + tag_bits]
+
+        m.submodules.mem = mem = memory.Memory(shape=self.entry_layout, depth=2**self.table_bits, init=[])
+        wr = mem.write_port()
+        lookup_rd = mem.read_port(transparent_for=[wr])
+        update_rd = mem.read_port(transparent_for=[wr])
+
+        lookup_tag = Signal(tag_bits)
+
+        @def_method(m, self.lookup)
+        def _(fb_addr, ghist):
+            m.d.comb += lookup_rd.addr.eq(index(fb_addr, ghist))
+            m.d.comb += lookup_rd.en.eq(1)
+            m.d.sync += lookup_tag.eq(tag(fb_addr))
+
+        @def_method(m, self.read, nonexclusive=True)
+        def _():
+            hit = lookup_rd.data.valid & (lookup_rd.data.tag == lookup_tag)
+            self.perf_hits.incr(m, enable_call=hit)
+            return {"hit": hit, "cfi_target": lookup_rd.data.target}
+
+        # Updates read the entry first, then write it back in the next cycle.
+        m.submodules.update_pipe = update_pipe = Pipe(self.update.layout_in)
+
+        @def_method(m, self.update)
+        def _(arg):
+            m.d.comb += update_rd.addr.eq(index(arg.fb_addr, arg.ghist))
+            m.d.comb += update_rd.en.eq(1)
+            update_pipe.write(m, arg)
+
+        with Transaction(name="Indirect_Update").body(m):
+            upd = update_pipe.read(m)
+            entry = update_rd.data
+
+            hit = Signal()
+            m.d.av_comb += hit.eq(entry.valid & (entry.tag == tag(upd.fb_addr)))
+            correct = Signal()
+            m.d.av_comb += correct.eq(hit & (entry.target == upd.cfi_target))
+
+            new_entry = Signal(self.entry_layout)
+            m.d.av_comb += new_entry.eq(entry)
+
+            with m.If(correct | (hit & (entry.confidence != 0))):
+                m.d.av_comb += new_entry.confidence.eq(counter_update(entry.confidence, correct))
+            with m.Else():
+                self.perf_replacements.incr(m)
+                m.d.av_comb += [
+                    new_entry.valid.eq(1),
+                    new_entry.tag.eq(tag(upd.fb_addr)),
+                    new_entry.target.eq(upd.cfi_target),
+                    new_entry.confidence.eq(0),
+                ]
+
+            m.d.comb += [
+                wr.addr.eq(index(upd.fb_addr, upd.ghist)),
+                wr.data.eq(new_entry),
+                wr.en.eq(1),
+            ]
+
+        return m
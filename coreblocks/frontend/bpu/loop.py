@@ -0,0 +1,179 @@
+from amaranth import *
+
+from transactron import *
+from transactron.lib import HwCounter
+from transactron.utils.transactron_helpers import make_layout
+
+from coreblocks.params import GenParams
+from coreblocks.frontend import FrontendParams
+from coreblocks.interface.layouts import BranchPredictionLayouts, CommonLayoutFields
+
+__all__ = ["LoopPredictor"]
+
+
+class LoopPredictor(Elaboratable):
+    """Loop predictor.
+
+    Learns the trip counts of backward conditional branches - the number of times
+    a branch is taken before it falls through. Once the same trip count is seen
+    a few times in a row, the entry becomes confident and the BPU uses it instead
+    of the direction predictor, so that the loop exits are predicted correctly.
+
+    The table is trained with resolved branches. The iteration counts used for
+    predictions are kept separately and updated speculatively with every
+    prediction of a loop branch. After a redirect, the count of the most
+    recently predicted loop is restored.
+    """
+
+    lookup: Provided[Method]
+    """Starts a lookup of the given fetch block. The result is available in the next cycle."""
+
+    read: Provided[Method]
+    """Returns the result of the last lookup and the most recently predicted loop. Nonexclusive."""
+
+    speculate: Provided[Method]
+    """Advances the iteration count of a loop with a predicted outcome of its branch."""
+
+    restore: Provided[Method]
+    """Sets the iteration count of a loop. Has priority over speculate."""
+
+    update: Provided[Method]
+    """Trains the predictor with the outcome of a conditional branch."""
+
+    def __init__(self, gen_params: GenParams):
+        self.gen_params = gen_params
+        self.entries_log = gen_params.loop_predictor_entries_log
+        self.iter_bits = gen_params.loop_predictor_iter_bits
+
+        fields = gen_params.get(CommonLayoutFields)
+        layouts = gen_params.get(BranchPredictionLayouts)
+
+        self.lookup = Method(i=make_layout(fields.fb_addr))
+        self.read = Method(
+            o=make_layout(
+                ("hit", 1),
+                fields.cfi_idx,
+                ("confident", 1),
+                layouts.taken,
+                layouts.loop_idx,
+                layouts.loop_iter,
+                ("last_idx", self.entries_log),
+                ("last_iter", self.iter_bits),
+            )
+        )
+        self.speculate = Method(i=make_layout(layouts.loop_idx, layouts.taken))
+        self.restore = Method(i=make_layout(layouts.loop_idx, layouts.loop_iter))
+        self.update = Method(i=make_layout(fields.fb_addr, fields.cfi_idx, fields.cfi_target, layouts.taken))
+
+        self.perf_hits = HwCounter("frontend.bpu.loop.hits", "Number of predicted branches found in the loop predictor")
+        self.perf_overrides = HwCounter(
+            "frontend.bpu.loop.overrides",
+            "Number of predictions made by confident entries instead of the direction predictor",
+        )
+        self.perf_correct = HwCounter(
+            "frontend.bpu.loop.correct", "Number of resolved branches predicted correctly by confident entries"
+        )
+
+    def elaborate(self, platform):
+        m = TModule()
+
+        m.submodules += [self.perf_hits, self.perf_overrides, self.perf_correct]
+
+        fparams = self.gen_params.get(FrontendParams)
+
+        entries = 2**self.entries_log
+        tag_bits = self.gen_params.isa.xlen - self.gen_params.fetch_block_bytes_log - self.entries_log
+
+        def index(fb_addr: Value) -> Value:
+            return fb_addr[: self.entries_log]
+
+        def tag(fb_addr: Value) -> Value:
+            return fb_addr[self.entries_log :]
+
+        # Trained state
+        valid = Array(Signal(name=f"valid_{i}") for i in range(entries))
+        tags = Array(Signal(tag_bits, name=f"tag_{i}") for i in range(entries))
+        cfi_idxs = Array(Signal(self.gen_params.fetch_width_log, name=f"cfi_idx_{i}") for i in range(entries))
+        trip_counts = Array(Signal(self.iter_bits, name=f"trip_count_{i}") for i in range(entries))
+        confidence = Array(Signal(2, name=f"confidence_{i}") for i in range(entries))
+        resolved_iters = Array(Signal(self.iter_bits, name=f"resolved_iter_{i}") for i in range(entries))
+
+        # Speculative state
+        spec_iters = Array(Signal(self.iter_bits, name=f"spec_iter_{i}") for i in range(entries))
+        last_idx = Signal(self.entries_log)
+
+        def confident(idx: Value) -> Value:
+            return confidence[idx] == 3
+
+        lookup_fb_addr = Signal.like(self.lookup.data_in.fb_addr)
+
+        @def_method(m, self.lookup)
+        def _(fb_addr):
+            m.d.sync += lookup_fb_addr.eq(fb_addr)
+
+        @def_method(m, self.read, nonexclusive=True)
+        def _():
+            idx = index(lookup_fb_addr)
+            return {
+                "hit": valid[idx] & (tags[idx] == tag(lookup_fb_addr)),
+                "cfi_idx": cfi_idxs[idx],
+                "confident": confident(idx),
+                "taken": spec_iters[idx] != trip_counts[idx],
+                "loop_idx": idx,
+                "loop_iter": spec_iters[idx],
+                "last_idx": last_idx,
+                "last_iter": spec_iters[last_idx],
+            }
+
+        @def_method(m, self.speculate)
+        def _(loop_idx, taken):
+            self.perf_hits.incr(m)
+            self.perf_overrides.incr(m, enable_call=confident(loop_idx))
+            m.d.sync += spec_iters[loop_idx].eq(Mux(taken, spec_iters[loop_idx] + 1, 0))
+            m.d.sync += last_idx.eq(loop_idx)
+
+        # Defined after speculate, so that it overrides it in the same cycle.
+        @def_method(m, self.restore)
+        def _(loop_idx, loop_iter):
+            m.d.sync += spec_iters[loop_idx].eq(loop_iter)
+            m.d.sync += last_idx.eq(loop_idx)
+
+        @def_method(m, self.update)
+        def _(fb_addr, cfi_idx, cfi_target, taken):
+            idx = index(fb_addr)
+            resolved_iter = resolved_iters[idx]
+            backward = cfi_target < fparams.pc_from_fb(fb_addr, cfi_idx)
+
+            hit = Signal()
+            m.d.av_comb += hit.eq(valid[idx] & (tags[idx] == tag(fb_addr)) & (cfi_idxs[idx] == cfi_idx))
+
+            self.perf_correct.incr(m, enable_call=hit & confident(idx) & ((resolved_iter != trip_counts[idx]) == taken))
+
+            with m.If(hit & taken):
+                with m.If(resolved_iter == 2**self.iter_bits - 1):
+                    # The loop is too long to be predicted.
+                    m.d.sync += valid[idx].eq(0)
+                    m.d.sync += confidence[idx].eq(0)
+                with m.Else():
+                    m.d.sync += resolved_iter.eq(resolved_iter + 1)
+            with m.Elif(hit):
+                with m.If(resolved_iter == trip_counts[idx]):
+                    with m.If(~confident(idx)):
+                        m.d.sync += confidence[idx].eq(confidence[idx] + 1)
+                with m.Else():
+                    m.d.sync += trip_counts[idx].eq(resolved_iter)
+                    m.d.sync += confidence[idx].eq(0)
+                m.d.sync += resolved_iter.eq(0)
+            with m.Elif(~taken & backward & ~confident(idx)):
+                # A loop exit - the counting starts from the next iteration. Confident entries
+                # are not replaced, they lose their confidence only when mispredicting.
+                m.d.sync += [
+                    valid[idx].eq(1),
+                    tags[idx].eq(tag(fb_addr)),
+                    cfi_idxs[idx].eq(cfi_idx),
+                    trip_counts[idx].eq(0),
+                    confidence[idx].eq(0),
+                    resolved_iter.eq(0),
+                ]
+
+        return m
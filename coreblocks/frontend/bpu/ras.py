@@ -0,0 +1,94 @@
+from amaranth import *
+
+from transactron import *
+from transactron.lib import HwCounter
+from transactron.utils.transactron_helpers import make_layout
+
+from coreblocks.params import GenParams
+from coreblocks.interface.layouts import BranchPredictionLayouts
+
+__all__ = ["ReturnAddressStack"]
+
+
+class ReturnAddressStack(Elaboratable):
+    """Speculative return address stack.
+
+    The stack is a circular buffer - on overflow, the oldest entries are overwritten.
+    It is updated speculatively by the predictions of the BPU. Only the top pointer
+    is checkpointed, so after a redirect the pointer is restored, but the entries
+    overwritten on the wrong path are not.
+    """
+
+    read: Provided[Method]
+    """Returns the top pointer and the address on top of the stack. Nonexclusive."""
+
+    push: Provided[Method]
+    """Pushes a return address."""
+
+    pop: Provided[Method]
+    """Pops the top return address."""
+
+    restore: Provided[Method]
+    """Restores the top pointer, optionally pushing a return address. Has priority over push and pop."""
+
+    def __init__(self, gen_params: GenParams):
+        self.gen_params = gen_params
+
+        layouts = gen_params.get(BranchPredictionLayouts)
+
+        self.read = Method(o=make_layout(layouts.ras_ptr, layouts.ret_addr))
+        self.push = Method(i=make_layout(layouts.ret_addr))
+        self.pop = Method()
+        self.restore = Method(i=make_layout(layouts.ras_ptr, layouts.ras_push, layouts.ret_addr))
+
+        self.perf_pushes = HwCounter("frontend.bpu.ras.pushes", "Number of return addresses pushed")
+        self.perf_pops = HwCounter("frontend.bpu.ras.pops", "Number of return addresses popped")
+
+    def elaborate(self, platform):
+        m = TModule()
+
+        m.submodules += [self.perf_pushes, self.perf_pops]
+
+        entries = Array(Signal(self.gen_params.isa.xlen) for _ in range(self.gen_params.ras_size))
+
+        top = Signal(self.gen_params.ras_size_log)
+        top_next = Signal.like(top)
+        m.d.comb += top_next.eq(top)
+        m.d.sync += top.eq(top_next)
+
+        write = Signal()
+        write_addr = Signal.like(top)
+        write_data = Signal(self.gen_params.isa.xlen)
+        with m.If(write):
+            m.d.sync += entries[write_addr].eq(write_data)
+
+        @def_method(m, self.read, nonexclusive=True)
+        def _():
+            return {"ras_ptr": top, "ret_addr": entries[top]}
+
+        @def_method(m, self.push)
+        def _(ret_addr):
+            self.perf_pushes.incr(m)
+            m.d.comb += [
+                top_next.eq(top + 1),
+                write.eq(1),
+                write_addr.eq(top + 1),
+                write_data.eq(ret_addr),
+            ]
+
+        @def_method(m, self.pop)
+        def _():
+            self.perf_pops.incr(m)
+            m.d.comb += top_next.eq(top - 1)
+
+        # Defined last, so that it overrides a push or a pop in the same cycle.
+        @def_method(m, self.restore)
+        def _(ras_ptr, ras_push, ret_addr):
+            m.d.comb += [
+                top_next.eq(ras_ptr + ras_push),
+                write.eq(ras_push),
+                write_addr.eq(ras_ptr + 1),
+                write_data.eq(ret_addr),
+            ]
+
+        return m
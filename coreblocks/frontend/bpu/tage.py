@@ -0,0 +1,275 @@
+from amaranth import *
+from amaranth.lib.data import StructLayout
+import amaranth.lib.memory as memory
+
+from transactron import *
+from transactron.lib import Pipe, HwCounter
+from transactron.utils.amaranth_ext.coding import PriorityEncoder
+
+from coreblocks.params import GenParams
+from coreblocks.interface.layouts import BranchPredictionLayouts
+from coreblocks.frontend.bpu.counters import counter_update, counter_taken
+
+__all__ = ["TAGEPredictor"]
+
+
+class TAGEEntry(StructLayout):
+    def __init__(self, tag_bits: int):
+        super().__init__({"ctr": 3, "tag": tag_bits, "useful": 2})
+
+
+def fold_history(ghist: Value, length: int, width: int) -> Value:
+    """Compresses the `length` most recent bits of the history to `width` bits by XOR-ing its chunks."""
+    folded = C(0, width)
+    for start in range(0, length, width):
+        folded = folded ^ ghist[start : min(start + width, length)]
+    return folded
+
+
+class TAGEPredictor(Elaboratable):
+    """TAGE conditional branch direction predictor.
+
+    The predictor consists of a base bimodal table and a number of tagged tables
+    indexed by hashes of the fetch block address and global histories of geometrically
+    increasing lengths. The prediction comes from the hitting table with the longest
+    history (the provider) - the alternate prediction is given by the next hitting table
+    or by the base table.
+
+    On a misprediction, an entry is allocated in a table with a longer history than
+    the provider. Only entries which are not useful can be replaced - if there is none,
+    the useful counters of the candidates are decremented, so that they age.
+
+    Like the other direction predictors, it makes one prediction per fetch block.
+    The tables are read again on update. The provider of the prediction is kept
+    in the FTQ, so that new entries are never allocated in tables with a shorter
+    history than it, even if its entry was replaced in the meantime.
+    """
+
+    lookup: Provided[Method]
+    """Starts a lookup of the given fetch block. The result is available in the next cycle."""
+
+    read: Provided[Method]
+    """Returns the direction predicted by the last lookup. Nonexclusive."""
+
+    update: Provided[Method]
+    """Trains the predictor with the outcome of a conditional branch."""
+
+    def __init__(self, gen_params: GenParams):
+        self.gen_params = gen_params
+        self.config = gen_params.tage_config
+        self.tables = len(self.config.history_lengths)
+
+        layouts = gen_params.get(BranchPredictionLayouts)
+
+        self.lookup = Method(i=layouts.direction_lookup)
+        self.read = Method(o=layouts.direction_read)
+        self.update = Method(i=layouts.direction_update)
+
+        self.entry_layout = TAGEEntry(self.config.tag_bits)
+
+        self.perf_hits = [
+            HwCounter(f"frontend.bpu.tage.t{i}.hits", f"Number of hits in the tagged table {i}")
+            for i in range(self.tables)
+        ]
+        self.perf_provider = [
+            HwCounter(f"frontend.bpu.tage.t{i}.provider", f"Number of predictions provided by the tagged table {i}")
+            for i in range(self.tables)
+        ]
+        self.perf_alt_provider = [
+            HwCounter(
+                f"frontend.bpu.tage.t{i}.alt_provider",
+                f"Number of alternate predictions provided by the tagged table {i}",
+            )
+            for i in range(self.tables)
+        ]
+        self.perf_allocs = HwCounter("frontend.bpu.tage.allocs", "Number of entries allocated on mispredictions")
+        self.perf_alloc_failures = HwCounter(
+            "frontend.bpu.tage.alloc_failures", "Number of mispredictions without a free entry to allocate"
+        )
+
+    def index(self, table: int, fb_addr: Value, ghist: Value) -> Value:
+        bits = self.config.table_bits
+        length = self.config.history_lengths[table]
+        return (fb_addr[:bits] ^ fb_addr[bits : 2 * bits] ^ fold_history(ghist, length, bits))[:bits]
+
+    def tag(self, table: int, fb_addr: Value, ghist: Value) -> Value:
+        bits = self.config.tag_bits
+        length = self.config.history_lengths[table]
+        # Two differently folded histories, so that the tag is not the same function of the history as the index.
+        folded = fold_history(ghist, length, bits) ^ (fold_history(ghist, length, bits - 1) << 1)
+        return (fb_addr[:bits] ^ folded)[:bits]
+
+    def elaborate(self, platform):
+        m = TModule()
+
+        m.submodules += [
+            *self.perf_hits,
+            *self.perf_provider,
+            *self.perf_alt_provider,
+            self.perf_allocs,
+            self.perf_alloc_failures,
+        ]
+
+        base_bits = self.gen_params.bpu_table_bits
+
+        def base_index(fb_addr: Value) -> Value:
+            return fb_addr[:base_bits]
+
+        # Branches are allocated in the BTB only when taken, so base counters start weakly taken.
+        m.submodules.base = base = memory.Memory(shape=2, depth=2**base_bits, init=[2] * 2**base_bits)
+        base_wr = base.write_port()
+        base_rd = base.read_port(transparent_for=[base_wr])
+        base_upd = base.read_port(transparent_for=[base_wr])
+
+        tables = []
+        for i in range(self.tables):
+            table = memory.Memory(shape=self.entry_layout, depth=2**self.config.table_bits, init=[])
+            m.submodules[f"table_{i}"] = table
+            tables.append(table)
+
+        write_ports = [table.write_port() for table in tables]
+        lookup_ports = [table.read_port(transparent_for=[wr]) for table, wr in zip(tables, write_ports)]
+        update_ports = [table.read_port(transparent_for=[wr]) for table, wr in zip(tables, write_ports)]
+
+        def find_provider(name: str, ports, tags: list[Value], base_taken: Value):
+            """Returns hit mask, provider and alternate predictions for the given table outputs."""
+            hits = Signal(self.tables, name=f"{name}_hits")
+            for i in range(self.tables):
+                m.d.av_comb += hits[i].eq(ports[i].data.tag == tags[i])
+
+            # The provider is the hitting table with the longest history.
+            provider_hit = Signal(name=f"{name}_provider_hit")
+            provider = Signal(range(self.tables), name=f"{name}_provider")
+            alt_hit = Signal(name=f"{name}_alt_hit")
+            alt = Signal(range(self.tables), name=f"{name}_alt")
+            for i in range(self.tables):
+                with m.If(hits[i]):
+                    m.d.av_comb += [provider_hit.eq(1), provider.eq(i)]
+                    for j in range(i):
+                        with m.If(hits[j]):
+                            m.d.av_comb += [alt_hit.eq(1), alt.eq(j)]
+
+            ctrs = Array(ports[i].data.ctr for i in range(self.tables))
+            alt_taken = Signal(name=f"{name}_alt_taken")
+            taken = Signal(name=f"{name}_taken")
+            m.d.av_comb += alt_taken.eq(Mux(alt_hit, counter_taken(ctrs[alt]), base_taken))
+            m.d.av_comb += taken.eq(Mux(provider_hit, counter_taken(ctrs[provider]), alt_taken))
+
+            return hits, provider_hit, provider, alt_hit, alt, alt_taken, taken
+
+        # Tags of the last lookup, compared with the table outputs in the next cycle.
+        lookup_tags = [Signal(self.config.tag_bits, name=f"lookup_tag_{i}") for i in range(self.tables)]
+
+        @def_method(m, self.lookup)
+        def _(fb_addr, ghist):
+            m.d.comb += base_rd.addr.eq(base_index(fb_addr))
+            m.d.comb += base_rd.en.eq(1)
+            for i in range(self.tables):
+                m.d.comb += lookup_ports[i].addr.eq(self.index(i, fb_addr, ghist))
+                m.d.comb += lookup_ports[i].en.eq(1)
+                m.d.sync += lookup_tags[i].eq(self.tag(i, fb_addr, ghist))
+
+        @def_method(m, self.read, nonexclusive=True)
+        def _():
+            hits, provider_hit, provider, alt_hit, alt, _, taken = find_provider(
+                "lookup", lookup_ports, lookup_tags, counter_taken(base_rd.data)
+            )
+
+            for i in range(self.tables):
+                self.perf_hits[i].incr(m, enable_call=hits[i])
+                self.perf_provider[i].incr(m, enable_call=provider_hit & (provider == i))
+                self.perf_alt_provider[i].incr(m, enable_call=alt_hit & (alt == i))
+
+            return {"taken": taken, "provider": Mux(provider_hit, provider + 1, 0)}
+
+        # Updates read the tables first, then write back the new entries in the next cycle.
+        m.submodules.update_pipe = update_pipe = Pipe(self.update.layout_in)
+
+        @def_method(m, self.update)
+        def _(arg):
+            m.d.comb += base_upd.addr.eq(base_index(arg.fb_addr))
+            m.d.comb += base_upd.en.eq(1)
+            for i in range(self.tables):
+                m.d.comb += update_ports[i].addr.eq(self.index(i, arg.fb_addr, arg.ghist))
+                m.d.comb += update_ports[i].en.eq(1)
+            update_pipe.write(m, arg)
+
+        # Pseudo-random choice between allocation candidates, so that entries don't fight for a single table.
+        lfsr = Signal(self.tables, init=1)
+
+        with Transaction(name="TAGE_Update").body(m):
+            upd = update_pipe.read(m)
+
+            update_tags = [self.tag(i, upd.fb_addr, upd.ghist) for i in range(self.tables)]
+            _, provider_hit, provider, _, _, alt_taken, taken = find_provider(
+                "update", update_ports, update_tags, counter_taken(base_upd.data)
+            )
+
+            mispredicted = taken != upd.taken
+
+            with m.If(~provider_hit):
+                m.d.comb += [
+                    base_wr.addr.eq(base_index(upd.fb_addr)),
+                    base_wr.data.eq(counter_update(base_upd.data, upd.taken)),
+                    base_wr.en.eq(1),
+                ]
+
+            # Tables with a longer history than the provider - both the current one and the one
+            # recorded when the prediction was made - can get a new entry.
+            longer_history = Signal(self.tables)
+            for i in range(self.tables):
+                m.d.av_comb += longer_history[i].eq((~provider_hit | (provider < i)) & (upd.provider <= i))
+
+            alloc_candidates = Signal(self.tables)
+            for i in range(self.tables):
+                m.d.av_comb += alloc_candidates[i].eq(
+                    mispredicted & longer_history[i] & (update_ports[i].data.useful == 0)
+                )
+
+            # Prefer the shortest history, but sometimes skip to the next candidate.
+            other_candidates = Signal(self.tables)
+            m.d.av_comb += other_candidates.eq(alloc_candidates & (alloc_candidates - 1))
+            m.submodules.alloc_enc = alloc_enc = PriorityEncoder(self.tables)
+            m.d.av_comb += alloc_enc.i.eq(Mux(lfsr[0] & other_candidates.any(), other_candidates, alloc_candidates))
+
+            alloc_failure = Signal()
+            m.d.av_comb += alloc_failure.eq(mispredicted & alloc_enc.n & longer_history.any())
+
+            self.perf_allocs.incr(m, enable_call=~alloc_enc.n)
+            self.perf_alloc_failures.incr(m, enable_call=alloc_failure)
+
+            with m.If(mispredicted):
+                m.d.sync += lfsr.eq(Cat(lfsr[1:], lfsr[0] ^ lfsr[-1]))
+
+            for i in range(self.tables):
+                entry = update_ports[i].data
+                new_entry = Signal(self.entry_layout, name=f"new_entry_{i}")
+                write = Signal(name=f"write_{i}")
+                m.d.av_comb += new_entry.eq(entry)
+
+                with m.If(provider_hit & (provider == i)):
+                    m.d.av_comb += write.eq(1)
+                    m.d.av_comb += new_entry.ctr.eq(counter_update(entry.ctr, upd.taken))
+                    # The usefulness changes only if the alternate prediction was different.
+                    with m.If(counter_taken(entry.ctr) != alt_taken):
+                        m.d.av_comb += new_entry.useful.eq(
+                            counter_update(entry.useful, counter_taken(entry.ctr) == upd.taken)
+                        )
+                with m.Elif(~alloc_enc.n & (alloc_enc.o == i)):
+                    m.d.av_comb += write.eq(1)
+                    m.d.av_comb += [
+                        new_entry.tag.eq(update_tags[i]),
+                        new_entry.ctr.eq(Mux(upd.taken, 4, 3)),
+                        new_entry.useful.eq(0),
+                    ]
+                with m.Elif(alloc_failure & longer_history[i]):
+                    m.d.av_comb += write.eq(1)
+                    m.d.av_comb += new_entry.useful.eq(entry.useful - 1)
+
+                m.d.comb += [
+                    write_ports[i].addr.eq(self.index(i, upd.fb_addr, upd.ghist)),
+                    write_ports[i].data.eq(new_entry),
+                    write_ports[i].en.eq(write),
+                ]
+
+        return m
@@ -51,6 +51,7 @@ class Decode(Elaboratable):
             jb_funct7 = Signal(from_method_layout(self.gen_params.get(JumpBranchLayouts).funct7_info))
             m.d.av_comb += [
                 jb_funct7.rvc.eq(rvc),
+                jb_funct7.cfi_type.eq(cfi_type),
             ]
 
             exception_override = Signal()
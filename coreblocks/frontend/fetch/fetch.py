@@ -13,6 +13,7 @@ from transactron.evlog import EventSource
 from coreblocks.cache.iface import CacheInterface
 from coreblocks.frontend.decoder.rvc import InstrDecompress, is_instr_compressed
 from coreblocks.priv.pmp import PMPChecker, PMPOperationMode
+from coreblocks.func_blocks.fu.lsu.pma import PMAChecker
 
 from coreblocks.arch import *
 from coreblocks.params import *
@@ -41,6 +42,10 @@ class FetchUnit(Elaboratable):
     fetch_request: Provided[Method]
     """Requests a fetch of the instruction block at the given PC."""
 
+    prefetch: Provided[Method]
+    """Hints the instruction cache to prefetch the fetch block at the given PC. Only blocks in the same page
+    as the last fetched block are prefetched, using its translation. Blocks in MMIO regions are skipped."""
+
     fetch_writeback: Required[Method]
     """Invoked to write back the status of the requested fetch block."""
 
@@ -71,6 +76,7 @@ class FetchUnit(Elaboratable):
 
         self.cont = Method(i=self.layouts.fetch_result)
         self.fetch_request = Method(i=self.layouts.fetch_request)
+        self.prefetch = Method(i=self.layouts.prefetch_request)
         self.fetch_writeback = Method(i=self.layouts.fetch_writeback)
 
         self.flush = Method()
@@ -108,9 +114,11 @@ class FetchUnit(Elaboratable):
         with Transaction(name="cont").body(m):
             peek_result = serializer.peek(m)
             count = Signal(range(self.gen_params.frontend_superscalarity + 1))
-            # we want at most one branch insn in scheduling group, and only at the end (for simplicity)
+            # we want at most one branch or JALR insn in scheduling group, and only at the end (for simplicity)
             # some insts in peek_result.data might not be valid, but this is still correct
-            which_is_branch = [0] + [instr.cfi_type == CfiType.BRANCH for instr in peek_result.data][:-1]
+            which_is_branch = [0] + [
+                CfiType.is_branch(instr.cfi_type) | CfiType.is_jalr(instr.cfi_type) for instr in peek_result.data
+            ][:-1]
             m.d.comb += count.eq(count_trailing_zeros(Cat(which_is_branch)))
             result = serializer.read(m, count=count)
             for i in range(self.gen_params.frontend_superscalarity):
@@ -124,7 +132,13 @@ class FetchUnit(Elaboratable):
             self.cont(m, result)
 
         m.submodules.fetch_requests = fetch_requests = BasicFifo(
-            make_layout(fields.pc, ("access_fault", 1), ("page_fault", 1), fields.ftq_ptr),
+            make_layout(
+                fields.pc,
+                ("access_fault", 1),
+                ("page_fault", 1),
+                fields.ftq_ptr,
+                ("prediction", self.layouts.bpu_prediction),
+            ),
             depth=2,
         )
 
@@ -156,19 +170,26 @@ class FetchUnit(Elaboratable):
         )
         m.submodules += ConnectTrans.create(self.addr_translator.accept, addr_translator_accept_pipe.write)
 
-        m.submodules.ftq_ptr_pipe = ftq_ptr_pipe = Pipe(make_layout(fields.ftq_ptr))
+        m.submodules.request_pipe = request_pipe = Pipe(
+            make_layout(fields.ftq_ptr, ("prediction", self.layouts.bpu_prediction))
+        )
 
         @def_method(m, self.fetch_request)
-        def _(pc, ftq_ptr):
+        def _(pc, ftq_ptr, prediction):
             log.info(m, True, "[IFU] request pc=0x{:x}", pc)
             req_counter.acquire(m)
 
             self.addr_translator.request(m, addr=pc, is_store=0)
-            ftq_ptr_pipe.write(m, ftq_ptr=ftq_ptr)
+            request_pipe.write(m, ftq_ptr=ftq_ptr, prediction=prediction)
+
+        # The translation of the page of the last fetched block, used for prefetching.
+        last_page_valid = Signal()
+        last_vpn = Signal(self.gen_params.isa.xlen - PAGE_SIZE_LOG)
+        last_ppn = Signal(self.gen_params.phys_addr_bits - PAGE_SIZE_LOG)
 
         with Transaction().body(m):
             translated = addr_translator_accept_pipe.read(m)
-            ftq_ptr = ftq_ptr_pipe.read(m).ftq_ptr
+            request = request_pipe.read(m)
             access_fault = Signal()
 
             m.d.av_comb += pmp_checker.paddr.eq(translated.paddr)
@@ -176,13 +197,19 @@ class FetchUnit(Elaboratable):
 
             with m.If(~translated.page_fault & ~access_fault):
                 self.icache.issue_req(m, paddr=translated.paddr)
+                m.d.sync += [
+                    last_page_valid.eq(1),
+                    last_vpn.eq(translated.vaddr[PAGE_SIZE_LOG:]),
+                    last_ppn.eq(translated.paddr[PAGE_SIZE_LOG:]),
+                ]
 
             fetch_requests.write(
                 m,
                 pc=translated.vaddr,
                 access_fault=access_fault,
                 page_fault=translated.page_fault,
-                ftq_ptr=ftq_ptr,
+                ftq_ptr=request.ftq_ptr,
+                prediction=request.prediction,
             )
 
         #
@@ -197,6 +224,8 @@ class FetchUnit(Elaboratable):
                 ("rvc", fetch_width),
                 ("instrs", ArrayLayout(self.gen_params.isa.ilen, fetch_width)),
                 ("instr_block_cross", 1),
+                ("instr_block_end_half", 1),
+                ("prediction", self.layouts.bpu_prediction),
             ]
         )
 
@@ -288,11 +317,17 @@ class FetchUnit(Elaboratable):
                 else:
                     m.d.av_comb += instr_start[i].eq(fetch_block_offset <= i)
 
+            # Whether the fetch block ends with the first half of an instruction
+            instr_block_end_half = Signal()
+
             if Extension.ZCA in self.gen_params.isa.extensions:
                 instr_position_mask = Cat(instr_start[:-1], instr_start[-1] & is_rvc[-1])
 
+                m.d.av_comb += instr_block_end_half.eq(~access_fault.any() & ~is_rvc[-1] & instr_start[-1])
+
+                # If a CFI was predicted in this block, the next fetched block is not the sequential one.
                 m.d.sync += prev_half_v.eq(
-                    (flushing_counter <= 1) & ~access_fault.any() & ~is_rvc[-1] & instr_start[-1]
+                    (flushing_counter <= 1) & instr_block_end_half & ~CfiType.valid(fetch_request.prediction.cfi_type)
                 )
                 m.d.sync += prev_half.eq(cache_resp.fetch_block[-16:])
                 m.d.sync += prev_half_addr.eq(fetch_block_addr)
@@ -311,6 +346,8 @@ class FetchUnit(Elaboratable):
                 ftq_ptr=fetch_request.ftq_ptr,
                 instrs=expanded_instr,
                 instr_block_cross=instr_block_cross,
+                instr_block_end_half=instr_block_end_half,
+                prediction=fetch_request.prediction,
             )
 
         # Make sure to clean the state
@@ -348,8 +385,7 @@ class FetchUnit(Elaboratable):
             # Predecode instructions
             predecoded_instr = [predecoders[i].predecode(m, instrs[i]) for i in range(fetch_width)]
 
-            # No prediction for now
-            prediction = Signal(self.layouts.bpu_prediction)
+            prediction = s1_data.prediction
 
             # The method is guarded by the If to make sure that the metrics
             # are updated only if not flushing.
@@ -381,8 +417,16 @@ class FetchUnit(Elaboratable):
 
             redirect = Signal()
             unsafe_stall = Signal()
+            follow_prediction = Signal()
             redirect_or_unsafe_idx = Signal(range(fetch_width))
 
+            # A correctly predicted CFI - the fetch already continues from its target.
+            predicted_cfi = Signal()
+            m.d.av_comb += predicted_cfi.eq(~predcheck_res.mispredicted & CfiType.valid(predcheck_res.cfi_type))
+
+            redirect_target = Signal(self.gen_params.isa.xlen)
+            m.d.av_comb += redirect_target.eq(predcheck_res.cfi_target)
+
             with m.If(predcheck_res.mispredicted & (~has_unsafe | redirect_before_unsafe)):
                 # A JALR's target cannot be computed from predecode, so instead of redirecting
                 # we stall until the backend executes it. Any other mispredict (including a
@@ -392,6 +436,16 @@ class FetchUnit(Elaboratable):
                     unsafe_stall.eq(CfiType.is_jalr(predcheck_res.cfi_type)),
                     redirect_or_unsafe_idx.eq(predcheck_res.cfi_idx),
                 ]
+                if Extension.ZCA in self.gen_params.isa.extensions:
+                    # A fall-through resteer must not lose the first half of an instruction
+                    # crossing into the next block, so the block is refetched from that half.
+                    with m.If(~CfiType.valid(predcheck_res.cfi_type) & s1_data.instr_block_end_half):
+                        m.d.av_comb += redirect_target.eq(params.pc_from_fb(fetch_block_addr, fetch_width - 1))
+            with m.Elif(predicted_cfi & (~has_unsafe | redirect_before_unsafe)):
+                m.d.av_comb += [
+                    follow_prediction.eq(1),
+                    redirect_or_unsafe_idx.eq(predcheck_res.cfi_idx),
+                ]
             with m.Elif(has_unsafe):
                 m.d.av_comb += [
                     unsafe_stall.eq(1),
@@ -400,7 +454,7 @@ class FetchUnit(Elaboratable):
 
             # This mask denotes what prefix of instructions we should enqueue.
             valid_instr_prefix = Signal(fetch_width)
-            with m.If(redirect | unsafe_stall):
+            with m.If(redirect | unsafe_stall | follow_prediction):
                 # If there is an instruction that redirects or stalls the frontend, enqueue
                 # instructions only up to that instruction.
                 m.d.av_comb += valid_instr_prefix.eq((1 << (redirect_or_unsafe_idx + 1)) - 1)
@@ -434,6 +488,11 @@ class FetchUnit(Elaboratable):
                             s1_data.access_fault | FetchLayouts.FaultFlag.EXCEPTION_ON_SECOND_HALF
                         )
 
+            # The address following the CFI - the return address of a call.
+            ret_addr = Signal(self.gen_params.isa.xlen)
+            cfi_instr = raw_instrs[predcheck_res.cfi_idx]
+            m.d.av_comb += ret_addr.eq(cfi_instr.pc + Mux(cfi_instr.rvc, 2, 4))
+
             with condition(m) as branch:
                 with branch(flushing_counter == 0):
                     with m.If(fault_any | unsafe_stall):
@@ -449,7 +508,8 @@ class FetchUnit(Elaboratable):
                         stall=fault_any | unsafe_stall,
                         cfi_idx=predcheck_res.cfi_idx,
                         cfi_type=predcheck_res.cfi_type,
-                        cfi_target=predcheck_res.cfi_target,
+                        cfi_target=redirect_target,
+                        ret_addr=ret_addr,
                     )
 
                     self.perf_fetch_utilization.incr(m, popcount(fetch_mask))
@@ -475,10 +535,22 @@ class FetchUnit(Elaboratable):
         with m.If(flush_now):
             m.d.sync += flushing_counter.eq(req_counter.count_next)
 
+        m.submodules.prefetch_pma_checker = prefetch_pma_checker = PMAChecker(self.gen_params)
+
+        @def_method(m, self.prefetch)
+        def _(pc):
+            paddr = Cat(pc[:PAGE_SIZE_LOG], last_ppn)
+            m.d.av_comb += prefetch_pma_checker.paddr.eq(paddr)
+
+            with m.If(last_page_valid & (pc[PAGE_SIZE_LOG:] == last_vpn) & ~prefetch_pma_checker.result.mmio):
+                self.icache.prefetch(m, paddr=paddr)
+
         @def_method(m, self.flush)
         def _():
             flush()
             serializer.clear(m)
+            # The translation might change after the frontend is flushed.
+            m.d.sync += last_page_valid.eq(0)
 
         return m
 
@@ -518,6 +590,9 @@ class Predecoder(Elaboratable):
             rd = instr[7:12]
             rs1 = instr[15:20]
 
+            rd_link = (rd == Registers.X1) | (rd == Registers.X5)
+            rs1_link = (rs1 == Registers.X1) | (rs1 == Registers.X5)
+
             bimm = Signal(signed(13))
             jimm = Signal(signed(21))
             iimm = Signal(signed(12))
@@ -535,13 +610,13 @@ class Predecoder(Elaboratable):
                     m.d.av_comb += ret.cfi_type.eq(CfiType.BRANCH)
                     m.d.av_comb += ret.cfi_offset.eq(bimm)
                 with m.Case(Opcode.JAL):
-                    m.d.av_comb += ret.cfi_type.eq(
-                        Mux((rd == Registers.X1) | (rd == Registers.X5), CfiType.CALL, CfiType.JAL)
-                    )
+                    m.d.av_comb += ret.cfi_type.eq(Mux(rd_link, CfiType.CALL, CfiType.JAL))
                     m.d.av_comb += ret.cfi_offset.eq(jimm)
                 with m.Case(Opcode.JALR):
+                    # A JALR linking to x1/x5 is a call, even if it jumps to x1/x5 - see
+                    # the return address stack hints in the RISC-V specification.
                     m.d.av_comb += ret.cfi_type.eq(
-                        Mux((rs1 == Registers.X1) | (rs1 == Registers.X5), CfiType.RET, CfiType.JALR)
+                        Mux(rd_link, CfiType.CALL_INDIRECT, Mux(rs1_link, CfiType.RET, CfiType.JALR))
                     )
                     m.d.av_comb += ret.cfi_offset.eq(iimm)
                 with m.Default():
@@ -658,8 +733,12 @@ class PredictionChecker(Elaboratable):
                 | ~CfiType.valid(prediction.cfi_type)
             )
 
+            # Only the main CFI type is compared - the branch prediction unit may not know
+            # whether a JAL/JALR is a call or a return. A prediction pointing at a position
+            # where no instruction starts is always wrong.
             mispredicted_cfi_type = CfiType.valid(prediction.cfi_type) & (
-                prediction.cfi_type != decoded_cfi_types[prediction.cfi_idx]
+                (prediction.cfi_type[0:2] != decoded_cfi_types[prediction.cfi_idx][0:2])
+                | ~instr_valid.bit_select(prediction.cfi_idx, 1)
             )
 
             mispredicted_cfi_target = (CfiType.is_branch(prediction.cfi_type) | CfiType.is_jal(prediction.cfi_type)) & (
@@ -708,7 +787,9 @@ class PredictionChecker(Elaboratable):
                     {
                         "mispredicted": 0,
                         "cfi_idx": prediction.cfi_idx,
-                        "cfi_type": prediction.cfi_type,
+                        "cfi_type": Mux(
+                            CfiType.valid(prediction.cfi_type), decoded_cfi_types[prediction.cfi_idx], CfiType.INVALID
+                        ),
                         "cfi_target": prediction.cfi_target,
                     },
                 )
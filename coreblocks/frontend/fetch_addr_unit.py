@@ -32,7 +32,7 @@ class FetchAddressUnit(Elaboratable):
         fields = self.gen_params.get(CommonLayoutFields)
 
         self.write = Method(i=make_layout(fields.pc))
-        self.read = Method(o=layouts.fetch_request)
+        self.read = Method(o=make_layout(fields.pc))
         self.ifu_redirect = Method(i=layouts.redirect)
         self.backend_redirect = Method(i=layouts.redirect)
 
@@ -10,6 +10,7 @@ from coreblocks.params.genparams import GenParams
 from coreblocks.frontend.ftq import FetchTargetQueue
 from coreblocks.frontend.decoder.decode_stage import DecodeStage
 from coreblocks.frontend.fetch.fetch import FetchUnit
+from coreblocks.frontend.loop_buffer import LoopBuffer
 from coreblocks.frontend.stall_controller import StallController
 from coreblocks.frontend.bpu.bpu import BranchPredictionUnit
 from coreblocks.cache.icache import ICache, ICacheBypass
@@ -59,8 +60,10 @@ class RollbackTagger(Elaboratable):
             for i in range(self.gen_params.frontend_superscalarity):
                 # fetcher guarantees that if branch is present, it's the last insn
                 # but computing this for each insn is simpler
-                is_branch = instrs.data[i].exec_fn.op_type == OpType.BRANCH
-                # no need to make checkpoint at JALR, we currently stall the fetch on it
+                # JALRs with predicted targets are fetched speculatively too
+                is_branch = (instrs.data[i].exec_fn.op_type == OpType.BRANCH) | (
+                    instrs.data[i].exec_fn.op_type == OpType.JALR
+                )
 
                 m.d.av_comb += out.data[i].rollback_tag.eq(rollback_tag)
                 m.d.av_comb += out.data[i].rollback_tag_v.eq(rollback_tag_v)
@@ -118,6 +121,9 @@ class CoreFrontend(Elaboratable):
         self.bpu = BranchPredictionUnit(self.gen_params)
         self.ftq = FetchTargetQueue(self.gen_params)
 
+        if self.gen_params.loop_buffer_size > 0:
+            self.loop_buffer = LoopBuffer(self.gen_params)
+
         self.consume_instr = Method(o=self.gen_params.get(SchedulerLayouts).scheduler_in)
         self.resume_from_exception = self.stall_ctrl.resume_from_exception
         self.stall = Method()
@@ -139,15 +145,28 @@ class CoreFrontend(Elaboratable):
 
         self.ftq.bpu_request.provide(self.bpu.request)
         self.ftq.bpu_flush.provide(self.bpu.flush)
+        self.ftq.bpu_update.provide(self.bpu.update)
+        self.ftq.bpu_restore.provide(self.bpu.restore)
         self.ftq.stall_guard.provide(self.stall_ctrl.stall_guard)
         self.bpu.write_prediction.provide(self.ftq.bpu_response)
 
         self.ftq.ifu_request.provide(self.fetch.fetch_request)
+        self.ftq.ifu_prefetch.provide(self.fetch.prefetch)
         self.fetch.fetch_writeback.provide(self.ftq.ifu_writeback)
         self.stall_ctrl.redirect_frontend.provide(self.ftq.backend_redirect)
 
         m.submodules.decode = decode = DecodeStage(gen_params=self.gen_params)
-        decode.get_raw.provide(self.instr_buffer.read)
+        if self.gen_params.loop_buffer_size > 0:
+            m.submodules.loop_buffer = self.loop_buffer
+            self.loop_buffer.get_raw.provide(self.instr_buffer.read)
+            self.loop_buffer.peek_raw.provide(self.instr_buffer.peek)
+            self.loop_buffer.clear_raw.provide(self.instr_buffer.clear)
+            self.loop_buffer.fetch_flush.provide(self.fetch.flush)
+            self.loop_buffer.replay_start.provide(self.ftq.loop_replay_start)
+            self.loop_buffer.replay_alloc.provide(self.ftq.loop_replay_alloc)
+            decode.get_raw.provide(self.loop_buffer.read)
+        else:
+            decode.get_raw.provide(self.instr_buffer.read)
         decode.push_decoded.provide(self.decode_buff.write)
 
         m.submodules.decode_buff = self.decode_buff
@@ -165,6 +184,8 @@ class CoreFrontend(Elaboratable):
         def _():
             self.fetch.flush(m)
             self.instr_buffer.clear(m)
+            if self.gen_params.loop_buffer_size > 0:
+                self.loop_buffer.flush(m)
             self.output_pipe.clear(m)
             self.bpu.flush(m)
             self.stall_ctrl.stall_exception(m)
@@ -3,10 +3,11 @@ from amaranth.lib.data import Layout
 import amaranth.lib.memory as memory
 from transactron import *
 from transactron.evlog import EventSource
-from transactron.utils import make_layout, DependencyContext
+from transactron.utils import make_layout, assign, DependencyContext
 from transactron.utils import logging
 from transactron.lib.metrics import *
 from transactron.lib.storage import MemoryBank
+from transactron.lib.fifo import BasicFifo
 
 from coreblocks.params import GenParams
 from coreblocks.arch import *
@@ -19,6 +20,7 @@ from coreblocks.interface.layouts import (
     FetchTargetQueueLayouts,
 )
 from coreblocks.interface.keys import PredictedJumpTargetKey, BranchResolveKey, FTQCommitKey
+from coreblocks.frontend import FrontendParams
 from coreblocks.frontend.fetch_addr_unit import FetchAddressUnit
 from coreblocks.telemetry import FetchRequest, FTQAlloc, FTQCommit, FTQRollback
 
@@ -28,7 +30,29 @@ evlog = EventSource("frontend.ftq")
 
 
 class FTQMemoryWrapper(Elaboratable):
-    def __init__(self, gen_params: GenParams, layout: Layout):
+    """Memory holding a record for each FTQ entry.
+
+    The record at `read_ptr_next` is available in `read_data` in the next cycle.
+    Records of arbitrary entries can be read combinationally with the `read` methods.
+    """
+
+    write: Provided[Method]
+    """Writes the record of the given FTQ entry."""
+
+    read: Methods
+    """Return the record of the given FTQ entry in the same cycle."""
+
+    def __init__(self, gen_params: GenParams, layout: Layout, read_ports: int = 0):
+        """
+        Parameters
+        ----------
+        gen_params: GenParams
+            Core generation parameters.
+        layout: Layout
+            Layout of a record.
+        read_ports: int
+            Number of `read` methods.
+        """
         self.gen_params = gen_params
         self.layout = layout
         self.item_width = self.layout.as_shape().width
@@ -41,11 +65,12 @@ class FTQMemoryWrapper(Elaboratable):
         self.read_data = Signal(self.layout)
 
         self.write = Method(i=self.write_layout)
+        self.read = Methods(read_ports, i=make_layout(fields.ftq_ptr), o=make_layout(("data", self.layout)))
 
     def elaborate(self, platform):
         m = TModule()
 
-        m.submodules.mem = mem = memory.Memory(shape=self.layout.as_shape(), depth=self.gen_params.ftq_size, init=[])
+        m.submodules.mem = mem = memory.Memory(shape=self.layout, depth=self.gen_params.ftq_size, init=[])
         wrport = mem.write_port()
         rdport = mem.read_port(transparent_for=[wrport])
 
@@ -58,6 +83,13 @@ class FTQMemoryWrapper(Elaboratable):
             m.d.comb += wrport.data.eq(data)
             m.d.comb += wrport.en.eq(1)
 
+        async_rdports = [mem.read_port(domain="comb") for _ in self.read]
+
+        @def_methods(m, self.read)
+        def _(k: int, ftq_ptr):
+            m.d.comb += async_rdports[k].addr.eq(ftq_ptr.ptr)
+            return {"data": async_rdports[k].data}
+
         return m
 
 
@@ -73,10 +105,16 @@ class FetchTargetQueue(Elaboratable):
     """Blocks only while the pipeline is stalled (e.g. during a flush)."""
     ifu_request: Required[Method]
     """Issue a fetch request to the instruction fetch unit for the given PC and FTQ pointer."""
+    ifu_prefetch: Required[Method]
+    """Hint the instruction fetch unit that the fetch block at the given PC will be requested soon."""
     bpu_request: Required[Method]
     """Request a branch prediction for the given PC and FTQ pointer."""
     bpu_flush: Required[Method]
     """Flush pending branch prediction requests (called on any redirect)."""
+    bpu_update: Required[Method]
+    """Train the branch prediction unit with a resolved control flow instruction. Called from a queue."""
+    bpu_restore: Required[Method]
+    """Restore the speculative global history and return address stack of the branch prediction unit."""
 
     ifu_writeback: Provided[Method]
     """
@@ -84,17 +122,27 @@ class FetchTargetQueue(Elaboratable):
     redirect fetch to a new PC.
     """
     bpu_response: Provided[Method]
-    """Accept a branch prediction result and supply the predicted next PC to the FAU."""
+    """
+    Accept a branch prediction result: store it and its metadata in the FTQ entry and supply the predicted
+    next PC to the FAU.
+    """
     jump_target_req: Provided[Method]
-    """Request the predicted jump target for a given FTQ entry (stub)."""
+    """Request the CFI followed by the fetch unit in a given FTQ entry."""
     jump_target_resp: Provided[Method]
-    """Return the predicted jump target for a given FTQ entry (stub)."""
+    """Return the CFI followed by the fetch unit, requested in the previous cycle."""
     commit: Provided[Method]
     """Retire an FTQ entry, advancing the commit pointer and freeing the slot."""
     resolve: Provided[Method]
-    """Record branch resolution information for a committed FTQ entry (stub)."""
+    """Record branch resolution information and queue an update of the branch prediction unit."""
     backend_redirect: Provided[Method]
     """Handle a backend misprediction: reset alloc/fetch pointers to commit+1 and redirect the FAU."""
+    loop_replay_start: Provided[Method]
+    """
+    Start replaying a loop from the loop buffer: roll back to the entry after the given one and stop
+    fetching until the next backend redirect.
+    """
+    loop_replay_alloc: Provided[Method]
+    """Allocate an entry for a fetch block replayed by the loop buffer."""
 
     def __init__(
         self,
@@ -108,12 +156,15 @@ class FetchTargetQueue(Elaboratable):
 
         ifu_layouts = self.gen_params.get(FetchLayouts)
         self.ifu_request = Method(i=ifu_layouts.fetch_request)
+        self.ifu_prefetch = Method(i=ifu_layouts.prefetch_request)
         self.ifu_writeback = Method(i=ifu_layouts.fetch_writeback)
 
         bpu_layouts = self.gen_params.get(BranchPredictionLayouts)
         self.bpu_request = Method(i=bpu_layouts.request)
         self.bpu_response = Method(i=bpu_layouts.write_prediction)
         self.bpu_flush = Method()
+        self.bpu_update = Method(i=bpu_layouts.update)
+        self.bpu_restore = Method(i=bpu_layouts.restore)
 
         jb_layouts = self.gen_params.get(JumpBranchLayouts)
         self.jump_target_req = Method(i=jb_layouts.predicted_jump_target_req)
@@ -124,6 +175,8 @@ class FetchTargetQueue(Elaboratable):
         self.commit = Method(i=ftq_layouts.commit)
         self.resolve = Method(i=ftq_layouts.branch_resolve)
         self.backend_redirect = Method(i=ifu_layouts.backend_redirect)
+        self.loop_replay_start = Method(i=ftq_layouts.loop_replay_start)
+        self.loop_replay_alloc = Method(i=ftq_layouts.loop_replay_alloc_in, o=ftq_layouts.loop_replay_alloc_out)
 
         self.dep_manager.add_dependency(BranchResolveKey(), self.resolve)
         self.dep_manager.add_dependency(FTQCommitKey(), self.commit)
@@ -135,13 +188,34 @@ class FetchTargetQueue(Elaboratable):
 
         m.submodules.fetch_address_unit = fetch_address_unit = FetchAddressUnit(self.gen_params)
 
-        m.submodules.pc_mem = pc_mem = FTQMemoryWrapper(gen_params=self.gen_params, layout=make_layout(fields.pc))
+        prefetch_enable = self.gen_params.icache_prefetch_distance > 0
+
+        m.submodules.pc_mem = pc_mem = FTQMemoryWrapper(
+            gen_params=self.gen_params, layout=make_layout(fields.pc), read_ports=1 if prefetch_enable else 0
+        )
+        m.submodules.prediction_mem = prediction_mem = FTQMemoryWrapper(
+            gen_params=self.gen_params, layout=self.gen_params.get(FetchLayouts).bpu_prediction
+        )
         m.submodules.jb_unit_prediction_mem = jb_unit_prediction_mem = MemoryBank(
             shape=self.jump_target_resp.data_out.shape(), depth=self.gen_params.ftq_size
         )
 
-        # Three pointers in the queue.
+        # The state of the BPU each entry was predicted with. It is needed to repair the state
+        # of the BPU on redirects and to train the BPU on resolve. There is a read port for
+        # each of ifu_writeback, backend_redirect, resolve and loop_replay_alloc.
+        bpu_layouts = self.gen_params.get(BranchPredictionLayouts)
+        m.submodules.meta_mem = meta_mem = FTQMemoryWrapper(
+            gen_params=self.gen_params, layout=bpu_layouts.meta[1], read_ports=4
+        )
+        meta_ifu_read, meta_redirect_read, meta_resolve_read, meta_replay_read = meta_mem.read
+
+        # Resolved CFIs wait here for the BPU, so that the jump-branch unit is not blocked by training.
+        m.submodules.bpu_update_queue = bpu_update_queue = BasicFifo(bpu_layouts.update, 2)
+
+        # Four pointers in the queue. Entries between fetch_ptr and pred_ptr have their
+        # predictions ready and can be sent to the IFU.
         alloc_ptr = FTQPtr(gen_params=self.gen_params)
+        pred_ptr = FTQPtr(gen_params=self.gen_params)
         fetch_ptr = FTQPtr(gen_params=self.gen_params)
         commit_ptr = FTQPtr(gen_params=self.gen_params)
 
@@ -149,12 +223,35 @@ class FetchTargetQueue(Elaboratable):
         m.d.sync += fetch_ptr.eq(fetch_ptr_next)
         m.d.comb += fetch_ptr_next.eq(fetch_ptr)
         m.d.comb += pc_mem.read_ptr_next.eq(fetch_ptr_next)
+        m.d.comb += prediction_mem.read_ptr_next.eq(fetch_ptr_next)
+
+        def ghist_after_branch(ghist: Value, taken: Value) -> Value:
+            return Cat(taken, ghist)[: len(ghist)]
+
+        def ras_ptr_after_cfi(ras_ptr: Value, cfi_type: Value) -> Value:
+            # A call pushes its return address on top of the stack restored to this pointer.
+            return Mux(CfiType.is_ret(cfi_type), ras_ptr - 1, ras_ptr)[: len(ras_ptr)]
+
+        def loop_iter_after_cfi(meta: Value, cfi_idx: Value, cfi_type: Value, taken: Value) -> Value:
+            # Only the loop branch itself advances the iteration count - other CFIs leave the block before it.
+            loop_branch = meta.loop_hit & CfiType.is_branch(cfi_type) & (cfi_idx == meta.loop_cfi_idx)
+            return Mux(loop_branch, Mux(taken, meta.loop_iter + 1, 0), meta.loop_iter)[: len(meta.loop_iter)]
+
+        # The state after the oldest resolved misprediction, used when the backend redirects
+        # the frontend after the mispredicted CFI.
+        mispredict_valid = Signal()
+        mispredict_ftq_ptr = FTQPtr(gen_params=self.gen_params)
+        mispredict_cfi_idx = Signal(self.gen_params.fetch_width_log)
+        mispredict_restore = Signal(bpu_layouts.restore)
+
+        # While the loop buffer replays a loop, it allocates the entries instead of FTQ_Alloc and
+        # nothing is fetched. The replay ends with a backend redirect.
+        loop_replay = Signal()
 
         # FTQ_Alloc takes the next speculative PC, allocates an FTQ entry, and sends
         # a request back to BPU
-        alloc_fetch_bypass = Signal(make_layout(fields.pc))
         with Transaction(name="FTQ_Alloc").body(
-            m, ready=~FTQPtr.queue_full(alloc_ptr, commit_ptr)
+            m, ready=~FTQPtr.queue_full(alloc_ptr, commit_ptr) & ~loop_replay
         ) as ftq_alloc_transaction:
             self.stall_guard(m)
 
@@ -165,30 +262,61 @@ class FetchTargetQueue(Elaboratable):
 
             evlog.emit(m, FTQAlloc.hw(ftq_ptr=alloc_ptr, pc=ret.pc))
 
-            m.d.av_comb += alloc_fetch_bypass.eq(ret)
             m.d.sync += alloc_ptr.eq(alloc_ptr + 1)
 
-        # FTQ_Send_Fetch_Requests follows fetch_ptr and sends requests to IFU. It has its data
-        # bypassed from FTQ_Alloc.
+        # The prediction for the entry pointed by fetch_ptr can be bypassed from the BPU response.
+        prediction_bypass = Signal(self.gen_params.get(FetchLayouts).bpu_prediction)
         early_fetch = Signal()
-        m.d.comb += early_fetch.eq((fetch_ptr == alloc_ptr) & ftq_alloc_transaction.run)
+
+        @def_method(m, self.bpu_response)
+        def _(pc, ftq_ptr, prediction, meta):
+            fetch_address_unit.write(m, pc=pc)
+            prediction_mem.write(m, ftq_ptr=ftq_ptr, data=prediction)
+            meta_mem.write(m, ftq_ptr=ftq_ptr, data=meta)
+
+            m.d.av_comb += prediction_bypass.eq(prediction)
+            m.d.comb += early_fetch.eq(fetch_ptr == pred_ptr)
+            m.d.sync += pred_ptr.eq(pred_ptr + 1)
+
+        # FTQ_Send_Fetch_Requests follows fetch_ptr and sends requests to IFU, once
+        # the prediction for the entry is known. The prediction can be bypassed from the BPU.
         with Transaction(name="FTQ_Send_Fetch_Requests").body(
-            m, ready=early_fetch | (fetch_ptr < alloc_ptr)
+            m, ready=(early_fetch | (fetch_ptr < pred_ptr)) & ~loop_replay
         ) as send_fetch_req_transaction:
             self.stall_guard(m)
 
-            fetch_pc = Signal(self.gen_params.isa.xlen)
-            m.d.av_comb += fetch_pc.eq(Mux(early_fetch, alloc_fetch_bypass, pc_mem.read_data))
+            fetch_prediction = Signal(self.gen_params.get(FetchLayouts).bpu_prediction)
+            m.d.av_comb += fetch_prediction.eq(Mux(early_fetch, prediction_bypass, prediction_mem.read_data))
 
-            self.ifu_request(m, ftq_ptr=fetch_ptr, pc=fetch_pc)
-            evlog.emit(m, FetchRequest.hw(ftq_ptr=fetch_ptr, pc=fetch_pc))
+            self.ifu_request(m, ftq_ptr=fetch_ptr, pc=pc_mem.read_data, prediction=fetch_prediction)
+            evlog.emit(m, FetchRequest.hw(ftq_ptr=fetch_ptr, pc=pc_mem.read_data))
             m.d.comb += fetch_ptr_next.eq(fetch_ptr + 1)
 
         ftq_alloc_transaction.schedule_before(send_fetch_req_transaction)
 
-        @def_method(m, self.bpu_response)
-        def _(pc, ftq_ptr):
-            fetch_address_unit.write(m, pc=pc)
+        # FTQ_Prefetch follows prefetch_ptr, which walks the entries not yet sent to the IFU, up to
+        # a distance from fetch_ptr, so that the instruction cache can refill their lines in advance.
+        # After a rollback, the pointer can be left behind fetch_ptr or ahead of alloc_ptr - then it
+        # starts again from fetch_ptr.
+        if prefetch_enable:
+            prefetch_ptr = FTQPtr(gen_params=self.gen_params)
+            prefetch_ptr_valid = FTQPtr(gen_params=self.gen_params)
+            m.d.comb += prefetch_ptr_valid.eq(
+                Mux((prefetch_ptr < fetch_ptr) | (alloc_ptr < prefetch_ptr), fetch_ptr, prefetch_ptr)
+            )
+            m.d.sync += prefetch_ptr.eq(prefetch_ptr_valid)
+
+            with Transaction(name="FTQ_Prefetch").body(
+                m,
+                ready=(prefetch_ptr_valid < alloc_ptr)
+                & (FTQPtr.queue_size(prefetch_ptr_valid, fetch_ptr) < self.gen_params.icache_prefetch_distance)
+                & ~loop_replay,
+            ):
+                self.stall_guard(m)
+
+                self.ifu_prefetch(m, pc=pc_mem.read[0](m, ftq_ptr=prefetch_ptr_valid).data.pc)
+                m.d.sync += prefetch_ptr.eq(prefetch_ptr_valid + 1)
+        self.bpu_response.schedule_before(send_fetch_req_transaction)
 
         @def_method(m, self.ifu_writeback)
         def _(
@@ -198,6 +326,7 @@ class FetchTargetQueue(Elaboratable):
             cfi_idx,
             cfi_type,
             cfi_target,
+            ret_addr,
         ):
             ftq_ptr_plus_one = FTQPtr(gen_params=self.gen_params)
             m.d.av_comb += ftq_ptr_plus_one.eq(FTQPtr(ftq_ptr, gen_params=self.gen_params) + 1)
@@ -218,7 +347,24 @@ class FetchTargetQueue(Elaboratable):
 
             with m.If(redirect | stall):
                 self.bpu_flush(m)
+                meta = meta_ifu_read(m, ftq_ptr=ftq_ptr).data
+                # Only a taken branch can redirect the fetch unit. A stalling CFI
+                # will be resolved by the backend, which then restores the state.
+                self.bpu_restore(
+                    m,
+                    ghist=Mux(
+                        redirect & CfiType.is_branch(cfi_type),
+                        ghist_after_branch(meta.ghist, 1),
+                        meta.ghist,
+                    ),
+                    ras_ptr=Mux(redirect, ras_ptr_after_cfi(meta.ras_ptr, cfi_type), meta.ras_ptr),
+                    ras_push=redirect & CfiType.is_call(cfi_type),
+                    ret_addr=ret_addr,
+                    loop_idx=meta.loop_idx,
+                    loop_iter=Mux(redirect, loop_iter_after_cfi(meta, cfi_idx, cfi_type, 1), meta.loop_iter),
+                )
                 m.d.sync += alloc_ptr.eq(ftq_ptr_plus_one)
+                m.d.sync += pred_ptr.eq(ftq_ptr_plus_one)
                 m.d.comb += fetch_ptr_next.eq(ftq_ptr_plus_one)
 
                 evlog.emit(m, FTQRollback.hw(ftq_ptr=ftq_ptr_plus_one, cause="ifu_writeback"))
@@ -248,10 +394,71 @@ class FetchTargetQueue(Elaboratable):
 
             fetch_address_unit.backend_redirect(m, pc=pc)
 
+            # The frontend is redirected after the FTQ entry of the mispredicted CFI,
+            # other redirects (e.g. exceptions) restore the history of the entry.
+            with m.If(mispredict_valid & (mispredict_ftq_ptr == FTQPtr(ftq_ptr, gen_params=self.gen_params))):
+                self.bpu_restore(m, mispredict_restore)
+            with m.Else():
+                meta = meta_redirect_read(m, ftq_ptr=ftq_ptr).data
+                self.bpu_restore(
+                    m,
+                    ghist=meta.ghist,
+                    ras_ptr=meta.ras_ptr,
+                    ras_push=0,
+                    ret_addr=0,
+                    loop_idx=meta.loop_idx,
+                    loop_iter=meta.loop_iter,
+                )
+            m.d.sync += mispredict_valid.eq(0)
+            m.d.sync += loop_replay.eq(0)
+
             evlog.emit(m, FTQRollback.hw(ftq_ptr=ftq_ptr_plus_one, cause="backend_redirect"))
             m.d.sync += alloc_ptr.eq(ftq_ptr_plus_one)
+            m.d.sync += pred_ptr.eq(ftq_ptr_plus_one)
             m.d.sync += fetch_ptr.eq(ftq_ptr_plus_one)
 
+        @def_method(m, self.loop_replay_start)
+        def _(ftq_ptr):
+            ftq_ptr_plus_one = FTQPtr(gen_params=self.gen_params)
+            m.d.av_comb += ftq_ptr_plus_one.eq(FTQPtr(ftq_ptr, gen_params=self.gen_params) + 1)
+
+            # The replayed loop ends with a misprediction, which restores the state of the BPU.
+            self.bpu_flush(m)
+            m.d.sync += loop_replay.eq(1)
+
+            m.d.sync += alloc_ptr.eq(ftq_ptr_plus_one)
+            m.d.sync += pred_ptr.eq(ftq_ptr_plus_one)
+            m.d.comb += fetch_ptr_next.eq(ftq_ptr_plus_one)
+
+            evlog.emit(m, FTQRollback.hw(ftq_ptr=ftq_ptr_plus_one, cause="loop_replay"))
+
+        @def_method(m, self.loop_replay_alloc, ready=loop_replay & ~FTQPtr.queue_full(alloc_ptr, commit_ptr))
+        def _(pc, distance, taken, cfi_idx, cfi_target):
+            # The entry holding the same fetch block in the previous iteration of the loop.
+            # The BPU state is copied from it to train the BPU and to restore it on a redirect.
+            prev_iter_ptr = FTQPtr(gen_params=self.gen_params)
+            m.d.av_comb += prev_iter_ptr.eq(Cat(alloc_ptr.ptr, alloc_ptr.parity) - distance)
+
+            pc_mem.write(m, ftq_ptr=alloc_ptr, data=pc)
+            meta_mem.write(m, ftq_ptr=alloc_ptr, data=meta_replay_read(m, ftq_ptr=prev_iter_ptr).data)
+            jb_unit_prediction_mem.write(
+                m,
+                addr=alloc_ptr.ptr,
+                data={
+                    "valid": taken,
+                    "cfi_idx": cfi_idx,
+                    "cfi_target": cfi_target,
+                },
+            )
+
+            evlog.emit(m, FTQAlloc.hw(ftq_ptr=alloc_ptr, pc=pc))
+
+            m.d.sync += alloc_ptr.eq(alloc_ptr + 1)
+            m.d.sync += pred_ptr.eq(alloc_ptr + 1)
+            m.d.comb += fetch_ptr_next.eq(alloc_ptr + 1)
+
+            return {"ftq_ptr": alloc_ptr}
+
         @def_method(m, self.jump_target_req)
         def _(ftq_ptr):
             jb_unit_prediction_mem.read_req(m, addr=ftq_ptr.ptr)
@@ -261,7 +468,59 @@ class FetchTargetQueue(Elaboratable):
             return jb_unit_prediction_mem.read_resp(m).data
 
         @def_method(m, self.resolve)
-        def _(from_pc, misprediction, taken, cfi_idx, cfi_type, cfi_target):
-            pass
+        def _(ftq_ptr, from_pc, misprediction, taken, cfi_idx, cfi_type, cfi_target, rvc):
+            fparams = self.gen_params.get(FrontendParams)
+
+            # An instruction crossing a fetch block boundary belongs to the block it ends in.
+            block_cross = fparams.fb_instr_idx(from_pc) != cfi_idx
+            fb_addr = fparams.fb_addr(from_pc) + block_cross
+
+            meta = meta_resolve_read(m, ftq_ptr=ftq_ptr).data
+
+            # CFIs are resolved out of order - only the oldest misprediction matters.
+            ftq_ptr_casted = FTQPtr(ftq_ptr, gen_params=self.gen_params)
+            older = Signal()
+            m.d.av_comb += older.eq(
+                ~mispredict_valid
+                | (ftq_ptr_casted < mispredict_ftq_ptr)
+                | ((ftq_ptr_casted == mispredict_ftq_ptr) & (cfi_idx < mispredict_cfi_idx))
+            )
+
+            # CFIs younger than a misprediction are on the wrong path - they don't train the BPU.
+            with m.If(older):
+                bpu_update_queue.write(
+                    m,
+                    fb_addr=fb_addr,
+                    taken=taken,
+                    cfi_idx=cfi_idx,
+                    cfi_type=cfi_type,
+                    cfi_target=cfi_target,
+                    cfi_short=rvc | block_cross,
+                    ghist=meta.ghist,
+                    provider=meta.provider,
+                )
+
+            with m.If(misprediction & older):
+                m.d.sync += [
+                    mispredict_valid.eq(1),
+                    mispredict_ftq_ptr.eq(ftq_ptr_casted),
+                    mispredict_cfi_idx.eq(cfi_idx),
+                    assign(
+                        mispredict_restore,
+                        {
+                            "ghist": Mux(
+                                CfiType.is_branch(cfi_type), ghist_after_branch(meta.ghist, taken), meta.ghist
+                            ),
+                            "ras_ptr": ras_ptr_after_cfi(meta.ras_ptr, cfi_type),
+                            "ras_push": CfiType.is_call(cfi_type),
+                            "ret_addr": from_pc + Mux(rvc, 2, 4),
+                            "loop_idx": meta.loop_idx,
+                            "loop_iter": loop_iter_after_cfi(meta, cfi_idx, cfi_type, taken),
+                        },
+                    ),
+                ]
+
+        with Transaction(name="FTQ_BPU_Update").body(m):
+            self.bpu_update(m, bpu_update_queue.read(m))
 
         return m
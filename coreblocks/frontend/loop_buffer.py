@@ -0,0 +1,269 @@
+from amaranth import *
+import amaranth.lib.memory as memory
+
+from transactron import *
+from transactron.lib.metrics import *
+from transactron.lib.simultaneous import condition
+from transactron.utils import assign, make_layout
+
+from coreblocks.arch import CfiType, Funct3, Opcode
+from coreblocks.interface.layouts import FetchLayouts, FetchTargetQueueLayouts, FTQPtr
+from coreblocks.params import GenParams
+
+__all__ = ["LoopBuffer"]
+
+
+class LoopBuffer(Elaboratable):
+    """Loop stream buffer in front of the decoder.
+
+    Replays short loops from a buffer of fetched (expanded) instructions, so that
+    the instruction cache, the branch prediction unit and the fetch unit can idle.
+
+    A loop is detected when a backward conditional branch passes the buffer. The next iteration
+    of the loop is captured if it is a run of consecutive instructions ending with the same branch
+    - so other CFIs in the loop body have to be not taken - without unsafe instructions or
+    fetch faults, and fits in the buffer. If the iteration after the captured one starts again
+    at the target of the branch, the fetched instructions are dropped and the captured iteration
+    is replayed, with the loop branch predicted taken. The FTQ allocates the entries of the replayed
+    fetch blocks, copying the state of the BPU from the captured ones.
+
+    The replay lasts until the frontend is flushed - usually by the misprediction of the loop
+    branch when the loop exits.
+    """
+
+    read: Provided[Method]
+    """Returns the next group of instructions for the decoder."""
+    flush: Provided[Method]
+    """Stops capturing or replaying a loop. Called when the frontend is flushed."""
+
+    get_raw: Required[Method]
+    """Reads the next group of fetched instructions."""
+    peek_raw: Required[Method]
+    """Returns the next group of fetched instructions without reading it."""
+    clear_raw: Required[Method]
+    """Drops all fetched instructions."""
+    fetch_flush: Required[Method]
+    """Flushes the fetch unit."""
+    replay_start: Required[Method]
+    """Rolls the FTQ back after the given entry and stops fetching."""
+    replay_alloc: Required[Method]
+    """Allocates an FTQ entry for a replayed fetch block."""
+
+    def __init__(self, gen_params: GenParams):
+        self.gen_params = gen_params
+        self.size = gen_params.loop_buffer_size
+
+        fetch_layouts = gen_params.get(FetchLayouts)
+        ftq_layouts = gen_params.get(FetchTargetQueueLayouts)
+
+        self.read = Method(o=fetch_layouts.fetch_result)
+        self.flush = Method()
+
+        self.get_raw = Method(o=fetch_layouts.fetch_result)
+        self.peek_raw = Method(o=fetch_layouts.fetch_result)
+        self.clear_raw = Method()
+        self.fetch_flush = Method()
+        self.replay_start = Method(i=ftq_layouts.loop_replay_start)
+        self.replay_alloc = Method(i=ftq_layouts.loop_replay_alloc_in, o=ftq_layouts.loop_replay_alloc_out)
+
+        self.perf_captures = HwCounter("frontend.loop_buffer.captures", "Number of loops captured by the loop buffer")
+        self.perf_replays = HwCounter("frontend.loop_buffer.replays", "Number of loops replayed by the loop buffer")
+        self.perf_exits = HwCounter("frontend.loop_buffer.exits", "Number of loop replays ended by a flush")
+
+    def elaborate(self, platform):
+        m = TModule()
+
+        m.submodules += [self.perf_captures, self.perf_replays, self.perf_exits]
+
+        width = self.gen_params.frontend_superscalarity
+        fetch_layouts = self.gen_params.get(FetchLayouts)
+
+        # An instruction of the captured iteration, with the index of its fetch block (FTQ entry)
+        # within the iteration.
+        slot_layout = make_layout(
+            ("instr", fetch_layouts.raw_instr),
+            ("block", range(self.size)),
+            ("block_start", 1),
+        )
+
+        m.submodules.mem = mem = memory.Memory(shape=slot_layout, depth=self.size, init=[])
+        wrports = [mem.write_port() for _ in range(width)]
+        rdports = [mem.read_port(domain="comb") for _ in range(width)]
+
+        capturing = Signal()
+        armed = Signal()
+        replaying = Signal()
+
+        # The loop branch and its target.
+        loop_pc = Signal(self.gen_params.isa.xlen)
+        loop_target = Signal(self.gen_params.isa.xlen)
+        loop_cfi_idx = Signal(self.gen_params.fetch_width_log)
+        loop_ftq_ptr = FTQPtr(gen_params=self.gen_params)
+
+        # The captured iteration: number of instructions and fetch blocks, and the
+        # expected PC and the FTQ entry of the last captured instruction.
+        count = Signal(range(self.size + 1))
+        blocks = Signal(range(self.gen_params.ftq_size + 1))
+        next_pc = Signal(self.gen_params.isa.xlen)
+        last_ftq_ptr = FTQPtr(gen_params=self.gen_params)
+
+        # The position of the next replayed instruction and the FTQ entry of its fetch block.
+        replay_idx = Signal(range(self.size))
+        replay_ftq_ptr = FTQPtr(gen_params=self.gen_params)
+
+        result = Signal(fetch_layouts.fetch_result)
+
+        @def_method(m, self.read, ready=~armed)
+        def _():
+            with condition(m) as branch:
+                with branch(replaying):
+                    # A group holds instructions of a single fetch block and ends after a CFI,
+                    # so that a single FTQ entry is allocated per group.
+                    slots = [Signal(slot_layout) for _ in range(width)]
+                    in_group = [Signal() for _ in range(width)]
+                    for i in range(width):
+                        m.d.av_comb += rdports[i].addr.eq(replay_idx + i)
+                        m.d.av_comb += slots[i].eq(rdports[i].data)
+                    m.d.av_comb += in_group[0].eq(1)
+                    for i in range(1, width):
+                        m.d.av_comb += in_group[i].eq(
+                            in_group[i - 1] & ~CfiType.valid(slots[i - 1].instr.cfi_type) & ~slots[i].block_start
+                        )
+
+                    group_count = Signal(range(width + 1))
+                    m.d.av_comb += group_count.eq(sum(in_group))
+
+                    group_ftq_ptr = FTQPtr(gen_params=self.gen_params)
+                    m.d.av_comb += group_ftq_ptr.eq(replay_ftq_ptr)
+                    with m.If(slots[0].block_start):
+                        alloc = self.replay_alloc(
+                            m,
+                            pc=slots[0].instr.pc,
+                            distance=blocks,
+                            taken=slots[0].block == blocks - 1,
+                            cfi_idx=loop_cfi_idx,
+                            cfi_target=loop_target,
+                        )
+                        m.d.av_comb += group_ftq_ptr.eq(alloc.ftq_ptr)
+                    m.d.sync += replay_ftq_ptr.eq(group_ftq_ptr)
+
+                    m.d.comb += result.count.eq(group_count)
+                    for i in range(width):
+                        m.d.comb += assign(result.data[i], slots[i].instr)
+                        m.d.comb += result.data[i].ftq_ptr.eq(group_ftq_ptr)
+
+                    with m.If(replay_idx + group_count == count):
+                        m.d.sync += replay_idx.eq(0)
+                    with m.Else():
+                        m.d.sync += replay_idx.eq(replay_idx + group_count)
+
+                with branch():
+                    group = self.get_raw(m)
+                    m.d.comb += result.eq(group)
+
+                    # Capture the instructions, checking that the iteration can be replayed.
+                    valid = Signal()
+                    complete = Signal()
+                    pc = next_pc
+                    ftq_ptr = last_ftq_ptr
+                    block = blocks - 1
+                    checks = []
+                    for i in range(width):
+                        instr = group.data[i]
+                        instr_valid = i < group.count
+                        first = count == 0 if i == 0 else C(0)
+                        opcode = instr.instr[2:7]
+                        funct3 = instr.instr[12:15]
+
+                        new_block = Signal()
+                        m.d.av_comb += new_block.eq(first | (instr.ftq_ptr.as_value() != ftq_ptr.as_value()))
+                        next_ftq_ptr = FTQPtr(gen_params=self.gen_params)
+                        m.d.av_comb += next_ftq_ptr.eq(ftq_ptr + 1)
+
+                        instr_ok = (
+                            (instr.pc == pc)
+                            & (first | ~new_block | (instr.ftq_ptr.as_value() == next_ftq_ptr.as_value()))
+                            & (~CfiType.valid(instr.cfi_type) | CfiType.is_branch(instr.cfi_type))
+                            & (opcode != Opcode.SYSTEM)
+                            & ~((opcode == Opcode.MISC_MEM) & (funct3 == Funct3.FENCEI))
+                            & ~instr.access_fault.any()
+                            & (count + i < self.size)
+                        )
+                        checks.append(~instr_valid | instr_ok)
+
+                        instr_block = Signal(range(self.size))
+                        m.d.av_comb += instr_block.eq(block + new_block)
+
+                        m.d.comb += wrports[i].addr.eq(count + i)
+                        m.d.comb += assign(
+                            wrports[i].data, {"instr": instr, "block": instr_block, "block_start": new_block}
+                        )
+                        m.d.comb += wrports[i].en.eq(capturing & instr_valid)
+
+                        with m.If(instr_valid & (instr.pc == loop_pc)):
+                            m.d.av_comb += complete.eq(1)
+                            m.d.sync += loop_ftq_ptr.eq(instr.ftq_ptr)
+                            m.d.sync += loop_cfi_idx.eq(instr.ftq_offset)
+
+                        pc = Mux(instr_valid, instr.pc + Mux(instr.rvc, 2, 4), pc)
+                        ftq_ptr = FTQPtr(
+                            Mux(instr_valid, instr.ftq_ptr.as_value(), ftq_ptr.as_value()), gen_params=self.gen_params
+                        )
+                        block = Mux(instr_valid, instr_block, block)
+
+                    m.d.av_comb += valid.eq(Cat(checks).all())
+
+                    with m.If(capturing & valid):
+                        m.d.sync += count.eq(count + group.count)
+                        m.d.sync += blocks.eq(block + 1)
+                        m.d.sync += next_pc.eq(pc)
+                        m.d.sync += last_ftq_ptr.eq(ftq_ptr)
+
+                        with m.If(complete):
+                            self.perf_captures.incr(m)
+                            m.d.sync += capturing.eq(0)
+                            m.d.sync += armed.eq(1)
+                    with m.Else():
+                        m.d.sync += capturing.eq(0)
+
+                        # A backward conditional branch ends the group - start capturing the loop.
+                        last = Signal(fetch_layouts.raw_instr)
+                        m.d.av_comb += last.eq(group.data[(group.count - 1).as_unsigned()])
+                        offset = Cat(
+                            C(0, 1), last.instr[8:12], last.instr[25:31], last.instr[7], last.instr[31]
+                        ).as_signed()
+                        with m.If(
+                            (group.count != 0)
+                            & CfiType.is_branch(last.cfi_type)
+                            & (offset < 0)
+                            & (-offset <= 4 * self.size)
+                        ):
+                            m.d.sync += capturing.eq(1)
+                            m.d.sync += loop_pc.eq(last.pc)
+                            m.d.sync += loop_target.eq(last.pc + offset)
+                            m.d.sync += count.eq(0)
+                            m.d.sync += blocks.eq(0)
+                            m.d.sync += next_pc.eq(last.pc + offset)
+
+            return result
+
+        # Start the replay if the next iteration is fetched. The fetched instructions are dropped.
+        with Transaction(name="LoopBuffer_Start").body(m, ready=armed):
+            group = self.peek_raw(m)
+            with m.If(group.data[0].pc == loop_target):
+                self.perf_replays.incr(m)
+                self.clear_raw(m)
+                self.fetch_flush(m)
+                self.replay_start(m, ftq_ptr=loop_ftq_ptr)
+                m.d.sync += replaying.eq(1)
+                m.d.sync += replay_idx.eq(0)
+            m.d.sync += armed.eq(0)
+
+        @def_method(m, self.flush)
+        def _():
+            self.perf_exits.incr(m, enable_call=replaying)
+            m.d.sync += capturing.eq(0)
+            m.d.sync += armed.eq(0)
+            m.d.sync += replaying.eq(0)
+
+        return m
@@ -1,4 +1,3 @@
-from .fifo_rs import *  # noqa: F401
 from .fu_decoder import *  # noqa: F401
 from .func_base import *  # noqa: F401
 from .rs import *  # noqa: F401
@@ -144,6 +144,9 @@ class JumpBranchFuncUnit(FuncUnitBase[JumpBranchFn]):
             ("reg_res", self.gen_params.isa.xlen),
             ("taken", 1),
             fields.cfi_idx,
+            fields.cfi_type,
+            fields.rvc,
+            fields.ftq_ptr,
             fields.tag,
         )
         m.submodules.instr_fifo = instr_fifo = BasicFifo(instr_fifo_layout, 2)
@@ -204,22 +207,30 @@ class JumpBranchFuncUnit(FuncUnitBase[JumpBranchFn]):
                     m, rob_id=instr.rob_id, cause=ExceptionCause._COREBLOCKS_MISPREDICTION, pc=jump_result, mtval=0
                 )
 
-            cfi_type = Signal(CfiType)
-            m.d.av_comb += cfi_type.eq(CfiType.BRANCH)
+            executed_cfi_type = Signal(CfiType)
+            m.d.av_comb += executed_cfi_type.eq(CfiType.BRANCH)
             with m.If(instr.type == JumpBranchFn.Fn.JAL):
-                m.d.av_comb += cfi_type.eq(CfiType.JAL)
+                m.d.av_comb += executed_cfi_type.eq(CfiType.JAL)
             with m.Elif(instr.type == JumpBranchFn.Fn.JALR):
-                m.d.av_comb += cfi_type.eq(CfiType.JALR)
+                m.d.av_comb += executed_cfi_type.eq(CfiType.JALR)
+
+            # The type predecoded by the frontend also tells calls and returns apart.
+            cfi_type = Signal(CfiType)
+            m.d.av_comb += cfi_type.eq(executed_cfi_type)
+            with m.If(instr.cfi_type[0:2] == executed_cfi_type[0:2]):
+                m.d.av_comb += cfi_type.eq(instr.cfi_type)
 
             with m.If(~is_auipc):
                 resolve_branch(
                     m,
+                    ftq_ptr=instr.ftq_ptr,
                     from_pc=instr.pc,
                     misprediction=misprediction,
                     taken=instr.taken,
                     cfi_idx=instr.cfi_idx,
                     cfi_type=cfi_type,
                     cfi_target=instr.jmp_addr,
+                    rvc=instr.rvc,
                 )
                 log.debug(
                     m,
@@ -274,6 +285,9 @@ class JumpBranchFuncUnit(FuncUnitBase[JumpBranchFn]):
                 reg_res=jb.reg_res,
                 taken=jb.taken,
                 cfi_idx=cfi_idx,
+                cfi_type=funct7_info.cfi_type,
+                rvc=funct7_info.rvc,
+                ftq_ptr=arg.ftq_ptr,
                 tag=arg.tag,
             )
 
@@ -1,21 +1,27 @@
 from dataclasses import dataclass
+from typing import Optional
 
 from amaranth import *
 from transactron import Method, TModule, Transaction, def_method
 from transactron.lib.connectors import FIFO, ConnectTrans, Pipe
+from transactron.lib.metrics import HwCounter
 from transactron.utils import logging
 from transactron.lib.simultaneous import condition
 from transactron.utils import DependencyContext
 
 from coreblocks.arch import OpType
-from coreblocks.arch.isa_consts import ExceptionCause
+from coreblocks.arch.isa_consts import ExceptionCause, FenceTarget
+from coreblocks.func_blocks.fu.lsu.load_queue import LoadQueue
 from coreblocks.func_blocks.fu.lsu.lsu_requester import LSURequester
+from coreblocks.func_blocks.fu.lsu.mem_dep_predictor import MemoryDependencePredictor
 from coreblocks.func_blocks.fu.lsu.pma import PMAChecker
+from coreblocks.func_blocks.fu.lsu.store_buffer import StoreBuffer
 from coreblocks.priv.pmp import PMPChecker, PMPOperationMode
 from coreblocks.func_blocks.interface.func_protocols import FuncUnit
 from coreblocks.interface.keys import (
     CommonBusDataKey,
     CoreStateKey,
+    DCacheWritebackKey,
     ExceptionReportKey,
     SideFxGuardKey,
 )
@@ -29,9 +35,30 @@ __all__ = ["LSUDummy", "LSUComponent"]
 
 class LSUDummy(FuncUnit, Elaboratable):
     """
-    Very simple LSU, which serializes all stores and loads.
+    Simple LSU, which handles the operations in the order they are issued.
     It isn't fully compliant with RiscV spec. Doesn't support checking if
     address is in correct range. Addresses have to be aligned.
+
+    The loads can be issued out of the program order, but not before the older
+    stores (see `LSURS`). A load which would have to wait for an older
+    instruction is executed again when the core is flushed before it, because
+    the older memory operations can't pass it in the LSU.
+
+    With `speculative_loads` enabled, the loads predicted independent by the
+    `MemoryDependencePredictor` can be issued before the older stores. They are
+    kept in the `LoadQueue` until they are committed. When a store finds a younger
+    load which read the bytes it writes, the store is executed again after a flush
+    and the predictor is trained.
+
+    Stores to memory are completed once their address is translated and checked.
+    They wait in the `StoreBuffer` until they are committed, and then they are
+    written to memory in order. Loads take their data from the store buffer,
+    if the youngest store to the word writes all the loaded bytes.
+
+    MMIO accesses and fences ordering the writes are executed when they reach
+    the head of the ROB, after the store buffer is drained. If there is a data
+    cache, a `FENCE` ordering memory writes before device accesses also writes
+    back all the dirty lines.
     """
 
     def __init__(self, gen_params: GenParams, bus: BusMasterInterface) -> None:
@@ -61,6 +88,31 @@ class LSUDummy(FuncUnit, Elaboratable):
 
         self.addr_translator = AddressTranslator(self.gen_params, mode=AddressTranslatorMode.LSU)
 
+        self.dcache_writeback = self.dependency_manager.get_optional_dependency(DCacheWritebackKey())
+
+        self.store_buffer = StoreBuffer(self.gen_params, self.bus, self.gen_params.store_buffer_size)
+
+        self.mem_dep_predictor: Optional[MemoryDependencePredictor] = None
+        self.load_queue: Optional[LoadQueue] = None
+        if self.gen_params.speculative_loads:
+            self.mem_dep_predictor = MemoryDependencePredictor(self.gen_params)
+            self.load_queue = LoadQueue(self.gen_params, self.gen_params.load_queue_size)
+
+        self.perf_forwarded_loads = HwCounter(
+            "backend.lsu.forwarded_loads", "Number of loads which got their data from the store buffer"
+        )
+        self.perf_replays = HwCounter("backend.lsu.replays", "Number of loads executed again after a flush")
+        self.perf_speculative_loads = HwCounter(
+            "backend.lsu.speculative_loads", "Number of loads issued before an older store"
+        )
+        self.perf_violations = HwCounter(
+            "backend.lsu.ordering_violations", "Number of stores which wrote bytes already read by a younger load"
+        )
+        self.perf_false_dependencies = HwCounter(
+            "backend.lsu.false_dependencies",
+            "Number of loads delayed by the dependence prediction which didn't read bytes of a buffered store",
+        )
+
     def elaborate(self, platform):
         m = TModule()
         flush = Signal()  # exception handling, requests are not issued
@@ -74,18 +126,35 @@ class LSUDummy(FuncUnit, Elaboratable):
         request_rob_id = Signal(self.gen_params.rob_entries_bits)
         rob_id_match = Signal()
         is_load = Signal()
+        load_sel = Signal(self.gen_params.isa.xlen // 8)
 
+        m.submodules += [self.perf_forwarded_loads, self.perf_replays, self.perf_speculative_loads]
+        m.submodules += [self.perf_violations, self.perf_false_dependencies]
         m.submodules.addr_translator = self.addr_translator
         m.submodules.pma_checker = pma_checker = PMAChecker(self.gen_params)
         m.submodules.pmp_checker = pmp_checker = PMPChecker(self.gen_params, mode=PMPOperationMode.LSU)
-        m.submodules.requester = requester = LSURequester(self.gen_params, self.bus)
-
-        m.submodules.requests = requests = FIFO(self.fu_layouts.issue, 2)
+        m.submodules.store_buffer = store_buffer = self.store_buffer
+        predictor = self.mem_dep_predictor
+        load_queue = self.load_queue
+        if predictor is not None and load_queue is not None:
+            m.submodules.mem_dep_predictor = predictor
+            m.submodules.load_queue = load_queue
+            m.d.comb += predictor.speculate_ready.eq(~load_queue.full)
+        if self.gen_params.dcache_params.enable:
+            # With a non-blocking data cache, the latencies of independent requests overlap.
+            max_requests = self.gen_params.dcache_params.max_pending_requests
+            m.submodules.requester = requester = LSURequester(self.gen_params, self.bus, depth=max_requests)
+        else:
+            max_requests = 2
+            m.submodules.requester = requester = LSURequester(self.gen_params, self.bus)
+
+        m.submodules.requests = requests = FIFO(self.lsu_layouts.request, 2)
         m.submodules.translator_in = translator_in = Pipe(self.translator_layouts.request)
         m.submodules.translated = translated = FIFO(self.translator_layouts.accept, 2)
         m.submodules.results_noop = results_noop = FIFO(self.lsu_layouts.accept, 2)
-        m.submodules.issued = issued = FIFO(self.fu_layouts.issue, 2)
+        m.submodules.issued = issued = FIFO(self.fu_layouts.issue, max_requests)
         m.submodules.issued_noop = issued_noop = FIFO(self.fu_layouts.issue, 2)
+        m.submodules.fences = fences = FIFO(self.fu_layouts.issue, 2)
 
         @def_method(m, self.issue)
         def _(arg):
@@ -93,37 +162,60 @@ class LSUDummy(FuncUnit, Elaboratable):
                 m, 1, "issue rob_id={} funct3={} op_type={}", arg.rob_id, arg.exec_fn.funct3, arg.exec_fn.op_type
             )
             is_fence = arg.exec_fn.op_type == OpType.FENCE
+            fence_pred = arg.imm[4:8]
             addr = Signal(self.gen_params.isa.xlen)
             m.d.av_comb += addr.eq(arg.s1_val + arg.imm)
 
             with m.If(~is_fence):
                 translator_in.write(m, addr=addr, is_store=arg.exec_fn.op_type == OpType.STORE)
-                requests.write(m, arg)
+                requests.write(m, instr=arg, waited=predictor.take_waited if predictor is not None else 0)
+            with m.Elif((fence_pred & (FenceTarget.MEM_W | FenceTarget.DEV_O)).any()):
+                # Fences ordering the writes wait until the store buffer is drained.
+                fences.write(m, arg)
             with m.Else():
                 results_noop.write(m, data=0, exception=0, cause=0, addr=0)
                 issued_noop.write(m, arg)
 
+            if predictor is not None and load_queue is not None:
+                # Loads are taken before the older stores only when the load queue is not full.
+                self.perf_speculative_loads.incr(m, enable_call=predictor.take_speculative)
+                with m.If(predictor.take_speculative):
+                    load_queue.alloc(m, rob_id=arg.rob_id, pc=arg.pc)
+
         m.submodules += ConnectTrans.create(translator_in.read, self.addr_translator.request)
         m.submodules += ConnectTrans.create(self.addr_translator.accept, translated.write)
 
-        # Issues load/store requests when the instruction is known, is a LOAD/STORE, and just before commit.
-        # Memory loads can be issued speculatively.
+        # Loads and stores to memory are issued as soon as the address is known. The stores are completed
+        # when they are inserted into the store buffer, they are written to memory after they are committed.
+        # MMIO accesses are issued just before commit, when the store buffer is empty. A load waits
+        # if it reads some bytes written by a store in the store buffer, but not all of them.
+        # Only the oldest instruction can wait here, because the older loads could be stuck behind it,
+        # so the other loads are replayed.
         pmas = pma_checker.result
-        can_reorder = is_load & ~pmas["mmio"]
-        want_issue = rob_id_match | can_reorder
+        replay = Signal()
+        m.d.comb += replay.eq(is_load & ~rob_id_match & (pmas["mmio"] | store_buffer.forward_conflict))
+        want_issue = replay | Mux(
+            pmas["mmio"], rob_id_match & store_buffer.empty, ~(is_load & store_buffer.forward_conflict)
+        )
 
         do_issue = ~flush & want_issue
         with Transaction().body(m, ready=do_issue):
-            arg = requests.read(m)
+            req = requests.read(m)
+            arg = req.instr
             translated_req = translated.read(m)
             paddr = translated_req.paddr
             addr = translated_req.vaddr
+            funct3 = arg.exec_fn.funct3
 
             m.d.av_comb += pma_checker.paddr.eq(paddr)
             m.d.av_comb += pmp_checker.paddr.eq(paddr)
             m.d.av_comb += is_load.eq(arg.exec_fn.op_type == OpType.LOAD)
             m.d.av_comb += request_rob_id.eq(arg.rob_id)
 
+            m.d.av_comb += load_sel.eq(requester.prepare_bytes_mask(m, funct3, paddr))
+            m.d.av_comb += store_buffer.forward_paddr.eq(paddr)
+            m.d.av_comb += store_buffer.forward_sel.eq(load_sel)
+
             exception = Signal()
             cause = Signal(ExceptionCause)
 
@@ -142,31 +234,121 @@ class LSUDummy(FuncUnit, Elaboratable):
                 m.d.av_comb += exception.eq(1)
                 m.d.av_comb += cause.eq(ExceptionCause.STORE_ACCESS_FAULT)
 
-            with m.If(~exception):
-                res = requester.issue(
+            buffered = ~exception & ~pmas["mmio"] & requester.check_align(m, funct3, paddr)
+
+            violation = C(0)
+            if predictor is not None and load_queue is not None:
+                m.d.av_comb += load_queue.check_rob_id.eq(arg.rob_id)
+                m.d.av_comb += load_queue.check_paddr.eq(paddr)
+                m.d.av_comb += load_queue.check_sel.eq(load_sel)
+                violation = load_queue.violation
+
+                with m.If(is_load):
+                    load_queue.execute(m, rob_id=arg.rob_id, paddr=paddr, sel=load_sel)
+
+                self.perf_false_dependencies.incr(
                     m,
-                    paddr=paddr,
-                    vaddr=addr,
-                    data=arg.s2_val,
-                    funct3=arg.exec_fn.funct3,
-                    store=~is_load,
+                    enable_call=req.waited
+                    & buffered
+                    & is_load
+                    & ~store_buffer.forward_hit
+                    & ~store_buffer.forward_conflict,
                 )
-                with m.If(res["exception"]):
+
+            with condition(m) as branch:
+                with branch(exception):
                     issued_noop.write(m, arg)
-                    results_noop.write(m, data=0, exception=1, cause=res["cause"], addr=addr)
-                with m.Else():
-                    issued.write(m, arg)
-            with m.Else():
-                issued_noop.write(m, arg)
-                results_noop.write(m, data=0, exception=1, cause=cause, addr=addr)
+                    results_noop.write(m, data=0, exception=1, cause=cause, addr=addr)
+                with branch(replay):
+                    self.perf_replays.incr(m)
+                    issued_noop.write(m, arg)
+                    results_noop.write(m, data=0, exception=1, cause=ExceptionCause._COREBLOCKS_REPLAY, addr=addr)
+                with branch(buffered & is_load & store_buffer.forward_hit):
+                    self.perf_forwarded_loads.incr(m)
+                    data = requester.postprocess_load_data(m, funct3, store_buffer.forward_data, paddr)
+                    issued_noop.write(m, arg)
+                    results_noop.write(m, data=data, exception=0, cause=0, addr=addr)
+                if predictor is not None and load_queue is not None:
+                    with branch(buffered & ~is_load & violation):
+                        # The store and the following instructions are executed again.
+                        self.perf_violations.incr(m)
+                        predictor.train(m, pc=load_queue.violation_pc)
+                        issued_noop.write(m, arg)
+                        results_noop.write(m, data=0, exception=1, cause=ExceptionCause._COREBLOCKS_REPLAY, addr=addr)
+                with branch(buffered & ~is_load & ~violation):
+                    store_buffer.insert(
+                        m,
+                        paddr=paddr,
+                        data=requester.prepare_data_to_save(m, funct3, arg.s2_val, paddr),
+                        sel=load_sel,
+                        rob_id=arg.rob_id,
+                    )
+                    issued_noop.write(m, arg)
+                    results_noop.write(m, data=0, exception=0, cause=0, addr=addr)
+                with branch():
+                    res = requester.issue(
+                        m,
+                        paddr=paddr,
+                        vaddr=addr,
+                        data=arg.s2_val,
+                        funct3=funct3,
+                        store=~is_load,
+                    )
+                    with m.If(res["exception"]):
+                        issued_noop.write(m, arg)
+                        results_noop.write(m, data=0, exception=1, cause=res["cause"], addr=addr)
+                    with m.Else():
+                        issued.write(m, arg)
 
         # Handles flushed instructions as a no-op.
         with Transaction().body(m, ready=flush):
-            arg = requests.read(m)
+            arg = requests.read(m).instr
             translated.read(m)
             results_noop.write(m, data=0, exception=0, cause=0, addr=0)
             issued_noop.write(m, arg)
 
+        with Transaction().body(m, ready=flush):
+            store_buffer.flush(m)
+            if load_queue is not None:
+                load_queue.flush(m)
+
+        fence_started = Signal()
+        fence_arg = Signal(self.fu_layouts.issue)
+
+        # All the stores before the fence are committed when it reaches the head of the ROB.
+        with Transaction().body(m, ready=~flush & ~fence_started & store_buffer.empty):
+            arg = fences.read(m)
+            side_fx_guard = self.dependency_manager.get_dependency(SideFxGuardKey())
+            side_fx_guard(m, rob_id=arg.rob_id, require_done=0)
+
+            # Writes to memory must be visible to the devices accessed after the fence.
+            fence_succ = arg.imm[0:4]
+            fence_pred = arg.imm[4:8]
+            writeback = (fence_pred & FenceTarget.MEM_W).any() & (
+                fence_succ & (FenceTarget.DEV_I | FenceTarget.DEV_O)
+            ).any()
+
+            with condition(m) as branch:
+                if self.dcache_writeback is not None:
+                    with branch(writeback):
+                        self.dcache_writeback[0](m)
+                        m.d.sync += [fence_started.eq(1), fence_arg.eq(arg)]
+                with branch():
+                    results_noop.write(m, data=0, exception=0, cause=0, addr=0)
+                    issued_noop.write(m, arg)
+
+        if self.dcache_writeback is not None:
+            with Transaction().body(m, ready=fence_started):
+                self.dcache_writeback[1](m)
+                results_noop.write(m, data=0, exception=0, cause=0, addr=0)
+                issued_noop.write(m, fence_arg)
+                m.d.sync += fence_started.eq(0)
+
+        with Transaction().body(m, ready=flush):
+            arg = fences.read(m)
+            results_noop.write(m, data=0, exception=0, cause=0, addr=0)
+            issued_noop.write(m, arg)
+
         with Transaction().body(m):
             arg = Signal(self.fu_layouts.issue)
             res = Signal(self.lsu_layouts.accept)
@@ -0,0 +1,146 @@
+from amaranth import *
+
+from transactron import Method, Transaction, TModule, def_method
+from transactron.utils import DependencyContext
+from transactron.utils.amaranth_ext.coding import PriorityEncoder
+
+from coreblocks.params import GenParams
+from coreblocks.interface.keys import InstructionCommitKey, ROBIndicesKey
+from coreblocks.interface.layouts import LSULayouts, RetirementLayouts
+
+__all__ = ["LoadQueue"]
+
+
+class LoadQueue(Elaboratable):
+    """
+    Load queue of the load/store unit.
+
+    Holds the loads which were taken from `LSURS` before an older store, until they are
+    committed. When a store is inserted into the store buffer, it is checked against
+    the younger loads in the queue which have already read the memory. If one of them
+    read a byte written by the store, the memory ordering was violated.
+
+    Attributes
+    ----------
+    alloc : Method
+        Allocates an entry for a load. Must not be called when the queue is full.
+        Layout: `LSULayouts.load_queue_alloc`.
+    execute : Method
+        Records the address read by a load. Loads without an entry are ignored.
+        Layout: `LSULayouts.load_queue_execute`.
+    commit : Method
+        Frees the entries of committed instructions. Registered to `InstructionCommitKey`.
+    flush : Method
+        Frees all the entries.
+    full : Signal, out
+        There are no free entries.
+    check_rob_id : Signal, in
+        ROB index of a store checked for ordering violations.
+    check_paddr : Signal, in
+        Physical address of the store.
+    check_sel : Signal, in
+        Bytes of the word written by the store.
+    violation : Signal, out
+        A younger load read a byte written by the store.
+    violation_pc : Signal, out
+        Address of the load.
+    """
+
+    def __init__(self, gen_params: GenParams, size: int) -> None:
+        """
+        Parameters
+        ----------
+        gen_params : GenParams
+            Parameters to be used during processor generation.
+        size : int
+            Number of loads which can be held in the queue.
+        """
+        self.gen_params = gen_params
+        self.size = size
+
+        self.layouts = gen_params.get(LSULayouts)
+
+        self.alloc = Method(i=self.layouts.load_queue_alloc)
+        self.execute = Method(i=self.layouts.load_queue_execute)
+        self.commit = Method(i=gen_params.get(RetirementLayouts).commit)
+        self.flush = Method()
+
+        self.full = Signal()
+        self.check_rob_id = Signal(gen_params.rob_entries_bits)
+        self.check_paddr = Signal(gen_params.phys_addr_bits)
+        self.check_sel = Signal(gen_params.isa.xlen // 8)
+        self.violation = Signal()
+        self.violation_pc = Signal(gen_params.isa.xlen)
+
+        DependencyContext.get().add_dependency(InstructionCommitKey(), self.commit)
+
+    def elaborate(self, platform):
+        m = TModule()
+
+        valid = Signal(self.size)
+        executed = Signal(self.size)
+        rob_ids = Array(Signal(self.gen_params.rob_entries_bits, name=f"rob_id_{i}") for i in range(self.size))
+        pcs = Array(Signal(self.gen_params.isa.xlen, name=f"pc_{i}") for i in range(self.size))
+        paddrs = Array(Signal(self.gen_params.phys_addr_bits, name=f"paddr_{i}") for i in range(self.size))
+        sels = Array(Signal(self.gen_params.isa.xlen // 8, name=f"sel_{i}") for i in range(self.size))
+
+        m.submodules.free_enc = free_enc = PriorityEncoder(self.size)
+        m.d.comb += free_enc.i.eq(~valid)
+        m.d.comb += self.full.eq(free_enc.n)
+
+        allocating = Signal(self.size)
+        executing = Signal(self.size)
+        freeing = Signal(self.size)
+
+        @def_method(m, self.alloc)
+        def _(rob_id, pc):
+            m.d.comb += allocating.eq(1 << free_enc.o)
+            m.d.sync += rob_ids[free_enc.o].eq(rob_id)
+            m.d.sync += pcs[free_enc.o].eq(pc)
+
+        @def_method(m, self.execute)
+        def _(rob_id, paddr, sel):
+            for i in range(self.size):
+                with m.If(valid[i] & (rob_ids[i] == rob_id)):
+                    m.d.comb += executing[i].eq(1)
+                    m.d.sync += paddrs[i].eq(paddr)
+                    m.d.sync += sels[i].eq(sel)
+
+        @def_method(m, self.commit)
+        def _(rob_id: Value, count: Value):
+            for i in range(self.size):
+                rob_offset = (rob_ids[i] - rob_id)[: self.gen_params.rob_entries_bits]
+                m.d.comb += freeing[i].eq(rob_offset < count)
+
+        @def_method(m, self.flush)
+        def _():
+            m.d.comb += freeing.eq(-1)
+
+        m.d.sync += valid.eq((valid | allocating) & ~freeing)
+        m.d.sync += executed.eq((executed | executing) & ~allocating)
+
+        rob_start = Signal(self.gen_params.rob_entries_bits)
+        with Transaction().body(m):
+            rob_get_indices = DependencyContext.get().get_dependency(ROBIndicesKey())
+            m.d.comb += rob_start.eq(rob_get_indices(m).start)
+
+        def rob_age(rob_id: Value) -> Value:
+            return (rob_id - rob_start)[: self.gen_params.rob_entries_bits]
+
+        m.submodules.violation_enc = violation_enc = PriorityEncoder(self.size)
+        m.d.comb += violation_enc.i.eq(
+            Cat(
+                valid[i]
+                & executed[i]
+                & (rob_age(rob_ids[i]) > rob_age(self.check_rob_id))
+                & (paddrs[i] >> 2 == self.check_paddr >> 2)
+                & (sels[i] & self.check_sel).any()
+                for i in range(self.size)
+            )
+        )
+        m.d.comb += [
+            self.violation.eq(~violation_enc.n),
+            self.violation_pc.eq(pcs[violation_enc.o]),
+        ]
+
+        return m
@@ -0,0 +1,83 @@
+from amaranth import *
+from transactron import TModule, Transaction
+from transactron.lib.allocators import PreservedOrderAllocator
+from transactron.utils import DependencyContext
+from coreblocks.arch import OpType
+from coreblocks.func_blocks.fu.common.rs import RSBase
+from coreblocks.interface.keys import MemoryDependencePredictorKey
+
+__all__ = ["LSURS"]
+
+
+class LSURS(RSBase):
+    """
+    Reservation station of the load/store unit.
+
+    Loads can be taken out of the program order, but not before an older store, fence
+    or atomic operation. Because of this, the addresses of all the older stores are known
+    when a load reaches the LSU. The other operations are taken in the program order,
+    after all the older memory operations, so the stores are inserted into the store buffer
+    in order and only the loads taken later can read from them.
+
+    If the LSU has a `MemoryDependencePredictor`, the loads predicted independent can be
+    taken before the older stores. The LSU then checks if the memory ordering was violated.
+    """
+
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.predictor = DependencyContext.get().get_optional_dependency(MemoryDependencePredictorKey())
+
+    def elaborate(self, platform):
+        m = TModule()
+
+        m.submodules.allocator = allocator = PreservedOrderAllocator(self.rs_entries)
+
+        takeable_mask = Signal(self.rs_entries)
+
+        self._elaborate(m, takeable_mask, allocator.alloc, allocator.free_idx, allocator.order)
+
+        # The loads predicted dependent wait for the older stores
+        wait = Signal(self.rs_entries)
+        # The loads which could be taken, if they weren't predicted dependent
+        waited = Signal(self.rs_entries)
+        # The loads which can be taken only before an older store, by position
+        speculative = Signal(self.rs_entries)
+
+        if self.predictor is not None:
+            predictor = self.predictor
+            with Transaction().body(m):
+                predicted_wait = predictor.predict(m, pc=self.insert.data_in.rs_data.pc).wait
+            with m.If(self.insert.run):
+                m.d.sync += wait.bit_select(self.insert.data_in.rs_entry_id, 1).eq(predicted_wait)
+                m.d.sync += waited.bit_select(self.insert.data_in.rs_entry_id, 1).eq(0)
+            speculate_ready = predictor.speculate_ready
+        else:
+            m.d.comb += wait.eq(-1)
+            speculate_ready = C(0)
+
+        older_full = C(0)
+        older_store = C(0)
+        older_other = C(0)
+        for i in range(self.rs_entries):
+            idx = self.order[i]
+            record = self.data[idx]
+            is_load = record.rs_data.exec_fn.op_type == OpType.LOAD
+            is_store = record.rs_data.exec_fn.op_type == OpType.STORE
+            may_speculate = ~wait.bit_select(idx, 1) & speculate_ready
+            with m.If(Mux(is_load, ~older_other & (~older_store | may_speculate), ~older_full)):
+                m.d.comb += takeable_mask.bit_select(idx, 1).eq(1)
+            with m.If(self.data_ready.bit_select(idx, 1) & is_load & ~older_other & older_store & ~may_speculate):
+                m.d.sync += waited.bit_select(idx, 1).eq(wait.bit_select(idx, 1))
+            m.d.comb += speculative[i].eq(is_load & older_store)
+            older_full = older_full | record.rec_full
+            older_store = older_store | (record.rec_full & is_store)
+            older_other = older_other | (record.rec_full & ~is_load & ~is_store)
+
+        if self.predictor is not None:
+            take_idx = self.take.data_in.rs_entry_id
+            m.d.comb += [
+                self.predictor.take_speculative.eq(self.take.run & speculative.bit_select(take_idx, 1)),
+                self.predictor.take_waited.eq(self.take.run & waited.bit_select(self.order[take_idx], 1)),
+            ]
+
+        return m
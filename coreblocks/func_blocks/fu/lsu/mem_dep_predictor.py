@@ -0,0 +1,93 @@
+from amaranth import *
+
+from transactron import Method, TModule, def_method
+from transactron.lib.metrics import HwCounter
+from transactron.utils import DependencyContext
+
+from coreblocks.params import GenParams
+from coreblocks.interface.keys import MemoryDependencePredictorKey
+from coreblocks.interface.layouts import LSULayouts
+
+__all__ = ["MemoryDependencePredictor"]
+
+
+class MemoryDependencePredictor(Elaboratable):
+    """
+    Load-wait table predicting which loads depend on the older stores.
+
+    The loads predicted independent can be taken from `LSURS` before the older stores,
+    whose addresses are not known yet. If such a store writes a byte already read
+    by a younger load, the store is replayed and the table is trained with the address
+    of the load, so that the next executions of the load wait for the older stores.
+    The table is cleared periodically, so that the loads which no longer depend
+    on the stores are speculated again.
+
+    The predictor also passes the information about the loads taken before the older
+    stores from `LSURS` to the load queue of the LSU. It is registered to
+    `MemoryDependencePredictorKey`.
+
+    Attributes
+    ----------
+    predict : Method
+        Returns if the load at the given address should wait for the older stores.
+    train : Method
+        Marks the load at the given address as dependent on the older stores.
+    speculate_ready : Signal, in
+        A load can be taken before the older stores. Driven by the LSU.
+    take_speculative : Signal, out
+        The load taken from `LSURS` in this cycle passes an older store. Driven by `LSURS`.
+    take_waited : Signal, out
+        The load taken from `LSURS` in this cycle was delayed by the prediction. Driven by `LSURS`.
+    """
+
+    def __init__(self, gen_params: GenParams):
+        """
+        Parameters
+        ----------
+        gen_params : GenParams
+            Parameters to be used during processor generation.
+        """
+        self.gen_params = gen_params
+        self.entries_log = gen_params.load_wait_table_entries_log
+        self.clear_period_log = gen_params.load_wait_table_clear_period_log
+
+        layouts = gen_params.get(LSULayouts)
+
+        self.predict = Method(i=layouts.predict_in, o=layouts.predict_out)
+        self.train = Method(i=layouts.train)
+
+        self.speculate_ready = Signal()
+        self.take_speculative = Signal()
+        self.take_waited = Signal()
+
+        DependencyContext.get().add_dependency(MemoryDependencePredictorKey(), self)
+
+        self.perf_trained = HwCounter(
+            "backend.lsu.mem_dep_predictor.trained", "Number of loads marked as dependent on the older stores"
+        )
+
+    def elaborate(self, platform):
+        m = TModule()
+
+        m.submodules += [self.perf_trained]
+
+        table = Signal(2**self.entries_log)
+        clear_counter = Signal(self.clear_period_log)
+
+        def index(pc: Value) -> Value:
+            return (pc >> self.gen_params.min_instr_width_bytes_log)[: self.entries_log]
+
+        @def_method(m, self.predict)
+        def _(pc):
+            return {"wait": table.bit_select(index(pc), 1)}
+
+        @def_method(m, self.train)
+        def _(pc):
+            self.perf_trained.incr(m)
+            m.d.sync += table.bit_select(index(pc), 1).eq(1)
+
+        m.d.sync += clear_counter.eq(clear_counter + 1)
+        with m.If(clear_counter.all()):
+            m.d.sync += table.eq(0)
+
+        return m
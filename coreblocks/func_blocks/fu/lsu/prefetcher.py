@@ -0,0 +1,306 @@
+from dataclasses import dataclass
+
+from amaranth import *
+
+from transactron import Method, Transaction, TModule, def_method
+from transactron.lib import FIFO, HwCounter
+from transactron.lib.simultaneous import condition
+from transactron.utils.transactron_helpers import make_layout
+
+from coreblocks.arch.isa_consts import PAGE_SIZE_LOG
+from coreblocks.params import GenParams
+from coreblocks.func_blocks.fu.lsu.pma import PMAChecker
+from coreblocks.interface.layouts import LSULayouts
+from coreblocks.peripherals.bus_adapter import BusMasterInterface, BusParametersInterface, CommonBusMasterMethodLayout
+from coreblocks.priv.pmp import PMPChecker, PMPOperationMode
+
+__all__ = ["StridePrefetcher"]
+
+
+class StridePrefetcher(Elaboratable):
+    """
+    Stride prefetcher of the load/store unit.
+
+    The addresses of the loads are recorded in a table indexed by the load address. When a load
+    accesses memory with the same stride twice in a row, the block `2**prefetch_distance_log` strides
+    ahead is read using a separate bus port. Only the blocks on the same page as the load, outside
+    of MMIO regions and readable according to PMP, are prefetched. A newer prefetch candidate
+    replaces the one waiting for the bus.
+
+    With the data cache, the prefetch port is a port of the cache and the blocks are the cache lines,
+    so the prefetched lines are refilled into the cache. Without the data cache, the prefetched words
+    are kept in a small buffer. The LSU then uses the `bus` of the prefetcher, which returns the
+    buffered words without accessing the data bus. The buffered words are invalidated by the writes.
+
+    The addresses of the last prefetched blocks are kept, so that the prefetches can be evaluated.
+    A prefetch is useful if a load accesses the block after it was read, and late if a load accesses
+    the block while it is being read. The accuracy is the ratio of the useful prefetches to the issued
+    ones. The coverage is the ratio of the useful prefetches to the sum of them and the misses.
+
+    Attributes
+    ----------
+    bus : BusMasterInterface
+        The bus to be used by the LSU.
+    observe : Method
+        Trains the prefetcher with the address of a load. Layout: `LSULayouts.prefetcher_observe`.
+    """
+
+    def __init__(
+        self, gen_params: GenParams, bus: BusMasterInterface, prefetch_bus: BusMasterInterface, buffered: bool
+    ) -> None:
+        """
+        Parameters
+        ----------
+        gen_params : GenParams
+            Parameters to be used during processor generation.
+        bus : BusMasterInterface
+            The bus of the LSU.
+        prefetch_bus : BusMasterInterface
+            The bus used for prefetching.
+        buffered : bool
+            Keep the prefetched words in a buffer. Used when there is no data cache.
+        """
+        self.gen_params = gen_params
+        self.lsu_bus = bus
+        self.prefetch_bus = prefetch_bus
+        self.buffered = buffered
+
+        self.entries_log = gen_params.prefetcher_entries_log
+        self.distance_log = gen_params.prefetch_distance_log
+        self.buffer_size = gen_params.prefetch_buffer_size
+
+        # Blocks are the words accessed by the bus or the cache lines, counted in bus words.
+        self.block_words_log = 0 if buffered else gen_params.dcache_params.offset_bits - 2
+
+        self.layouts = gen_params.get(LSULayouts)
+        self.observe = Method(i=self.layouts.prefetcher_observe)
+
+        self.method_layouts = CommonBusMasterMethodLayout(bus.params)
+        if buffered:
+
+            @dataclass(frozen=True)
+            class _Bus(BusMasterInterface):
+                params: BusParametersInterface
+                request_read: Method
+                request_write: Method
+                get_read_response: Method
+                get_write_response: Method
+
+            self.bus: BusMasterInterface = _Bus(
+                params=bus.params,
+                request_read=Method(i=self.method_layouts.request_read_layout),
+                request_write=Method(i=self.method_layouts.request_write_layout),
+                get_read_response=Method(o=self.method_layouts.read_response_layout),
+                get_write_response=Method(o=self.method_layouts.write_response_layout),
+            )
+        else:
+            self.bus = bus
+
+        self.perf_issued = HwCounter("backend.lsu.prefetcher.issued", "Number of prefetch requests sent to the bus")
+        self.perf_useful = HwCounter(
+            "backend.lsu.prefetcher.useful", "Number of prefetched blocks accessed by a load after they were read"
+        )
+        self.perf_late = HwCounter(
+            "backend.lsu.prefetcher.late", "Number of prefetched blocks accessed by a load while they were being read"
+        )
+        self.perf_dropped = HwCounter(
+            "backend.lsu.prefetcher.dropped",
+            "Number of prefetch candidates not sent because of the page boundary, PMA or PMP",
+        )
+
+    def elaborate(self, platform):
+        m = TModule()
+
+        m.submodules += [self.perf_issued, self.perf_useful, self.perf_late, self.perf_dropped]
+
+        gp = self.gen_params
+        word_bits = gp.phys_addr_bits - 2
+        block_bits = word_bits - self.block_words_log
+        table_size = 2**self.entries_log
+        tag_bits = 8
+        # Strides longer than a page can't be used to prefetch on the same page.
+        stride_bits = PAGE_SIZE_LOG + 1
+        sel_width = self.lsu_bus.params.data_width // self.lsu_bus.params.granularity
+
+        def block(word_addr: Value) -> Value:
+            return word_addr[self.block_words_log :]
+
+        # Reference prediction table
+        table_layout = make_layout(
+            ("valid", 1),
+            ("tag", tag_bits),
+            ("last_addr", gp.phys_addr_bits),
+            ("stride", signed(stride_bits)),
+            ("confidence", 2),
+        )
+        table = [Signal(table_layout, name=f"table_{i}") for i in range(table_size)]
+        table_array = Array(entry.as_value() for entry in table)
+
+        # The last prefetched blocks, and the buffered words without the data cache
+        buffer_layout = make_layout(
+            ("valid", 1),
+            ("arrived", 1),
+            ("used", 1),
+            ("block", block_bits),
+            ("data", self.lsu_bus.params.data_width),
+        )
+        buffer = [Signal(buffer_layout, name=f"buffer_{i}") for i in range(self.buffer_size)]
+        alloc_idx = Signal(range(self.buffer_size))
+
+        # The prefetch candidate waiting for the bus
+        pending = Signal()
+        pending_addr = Signal(word_bits)
+
+        # The prefetch request being read
+        inflight = Signal()
+        inflight_idx = Signal(range(self.buffer_size))
+
+        # Updates of the buffer in this cycle
+        issuing = Signal()
+        issue_block = Signal(block_bits)
+        responding = Signal()
+        response_err = Signal()
+        response_data = Signal(self.lsu_bus.params.data_width)
+        used = Signal(self.buffer_size)
+        writing = Signal()
+        write_addr = Signal(word_bits)
+
+        for i, entry in enumerate(buffer):
+            invalidated = writing & (block(write_addr) == entry.block)
+            with m.If(issuing & (alloc_idx == i)):
+                m.d.sync += [
+                    entry.valid.eq(~(writing & (block(write_addr) == issue_block))),
+                    entry.arrived.eq(0),
+                    entry.used.eq(0),
+                    entry.block.eq(issue_block),
+                ]
+            with m.Else():
+                with m.If(invalidated | (responding & response_err & (inflight_idx == i))):
+                    m.d.sync += entry.valid.eq(0)
+                with m.If(responding & (inflight_idx == i)):
+                    m.d.sync += [entry.arrived.eq(1), entry.data.eq(response_data)]
+                with m.If(used[i]):
+                    m.d.sync += entry.used.eq(1)
+
+        # Training
+        m.submodules.pma_checker = pma_checker = PMAChecker(gp)
+        m.submodules.pmp_checker = pmp_checker = PMPChecker(gp, mode=PMPOperationMode.LSU)
+        candidate = Signal(gp.phys_addr_bits)
+        m.d.comb += [pma_checker.paddr.eq(candidate), pmp_checker.paddr.eq(candidate)]
+
+        @def_method(m, self.observe)
+        def _(pc: Value, paddr: Value):
+            pc_word = pc >> gp.min_instr_width_bytes_log
+            index = pc_word[: self.entries_log]
+            tag = pc_word[self.entries_log : self.entries_log + tag_bits]
+            entry = Signal(table_layout)
+            m.d.av_comb += entry.eq(table_array[index])
+            new_entry = Signal(table_layout)
+            load_block = block(paddr[2:])
+
+            for i, buffered in enumerate(buffer):
+                with m.If(buffered.valid & ~buffered.used & (buffered.block == load_block)):
+                    m.d.comb += used[i].eq(1)
+            useful = Cat(used[i] & buffer[i].arrived for i in range(self.buffer_size)).any()
+            late = Cat(used[i] & ~buffer[i].arrived for i in range(self.buffer_size)).any()
+            self.perf_useful.incr(m, enable_call=useful)
+            self.perf_late.incr(m, enable_call=late)
+
+            stride = Signal(signed(gp.phys_addr_bits + 1))
+            m.d.av_comb += stride.eq(paddr - entry.last_addr)
+            stride_fits = (stride >= -(2 ** (stride_bits - 1))) & (stride < 2 ** (stride_bits - 1))
+            hit = entry.valid & (entry.tag == tag)
+            confirmed = hit & (stride == entry.stride) & (stride != 0)
+
+            m.d.av_comb += candidate.eq(paddr + (entry.stride << self.distance_log))
+            prefetch = confirmed & (entry.confidence != 0)
+            allowed = (
+                (candidate[PAGE_SIZE_LOG:] == paddr[PAGE_SIZE_LOG:])
+                & ~pma_checker.result["mmio"]
+                & pmp_checker.result.r
+                & (block(candidate[2:]) != load_block)
+            )
+            with m.If(prefetch & allowed):
+                m.d.sync += [pending.eq(1), pending_addr.eq(candidate[2:])]
+            self.perf_dropped.incr(m, enable_call=prefetch & ~allowed)
+
+            m.d.av_comb += [
+                new_entry.valid.eq(1),
+                new_entry.tag.eq(tag),
+                new_entry.last_addr.eq(paddr),
+                new_entry.stride.eq(Mux(confirmed, entry.stride, Mux(hit & stride_fits, stride, 0))),
+                new_entry.confidence.eq(Mux(confirmed, entry.confidence + (entry.confidence != 3), 0)),
+            ]
+            for i, table_entry in enumerate(table):
+                with m.If(index == i):
+                    m.d.sync += table_entry.eq(new_entry)
+
+        # Prefetching
+        pending_block = block(pending_addr)
+        already_prefetched = Cat(entry.valid & (entry.block == pending_block) for entry in buffer).any()
+
+        with Transaction().body(m, ready=pending & ~inflight):
+            with m.If(~already_prefetched):
+                self.perf_issued.incr(m)
+                self.prefetch_bus.request_read(m, addr=pending_addr, sel=C(1).replicate(sel_width))
+                m.d.comb += [issuing.eq(1), issue_block.eq(pending_block)]
+                m.d.sync += [
+                    inflight.eq(1),
+                    inflight_idx.eq(alloc_idx),
+                    alloc_idx.eq(Mux(alloc_idx == self.buffer_size - 1, 0, alloc_idx + 1)),
+                ]
+            # A newer candidate is kept.
+            with m.If(~self.observe.run):
+                m.d.sync += pending.eq(0)
+
+        with Transaction().body(m, ready=inflight):
+            response = self.prefetch_bus.get_read_response(m)
+            m.d.comb += [responding.eq(1), response_err.eq(response.err), response_data.eq(response.data)]
+            m.d.sync += inflight.eq(0)
+
+        if not self.buffered:
+            return m
+
+        # The bus of the LSU. The reads of the arrived words are responded from the buffer,
+        # in order with the reads sent to the bus.
+        read_results = FIFO(make_layout(("hit", 1), ("data", self.lsu_bus.params.data_width)), 4)
+        m.submodules.read_results = read_results
+
+        @def_method(m, self.bus.request_read)
+        def _(addr: Value, sel: Value):
+            hits = Cat(entry.valid & entry.arrived & (entry.block == addr) for entry in buffer)
+            hits = hits & ~Mux(writing & (write_addr == addr), -1, 0)
+            data = Signal(self.lsu_bus.params.data_width)
+            for i, entry in enumerate(buffer):
+                with m.If(hits[i]):
+                    m.d.av_comb += data.eq(entry.data)
+            with condition(m) as branch:
+                with branch(hits.any()):
+                    read_results.write(m, hit=1, data=data)
+                with branch():
+                    self.lsu_bus.request_read(m, addr=addr, sel=sel)
+                    read_results.write(m, hit=0, data=0)
+
+        @def_method(m, self.bus.get_read_response)
+        def _():
+            result = read_results.read(m)
+            data = Signal(self.lsu_bus.params.data_width)
+            err = Signal()
+            with condition(m) as branch:
+                with branch(result.hit):
+                    m.d.av_comb += data.eq(result.data)
+                with branch():
+                    response = self.lsu_bus.get_read_response(m)
+                    m.d.av_comb += [data.eq(response.data), err.eq(response.err)]
+            return {"data": data, "err": err}
+
+        @def_method(m, self.bus.request_write)
+        def _(addr: Value, data: Value, sel: Value):
+            m.d.comb += [writing.eq(1), write_addr.eq(addr)]
+            self.lsu_bus.request_write(m, addr=addr, data=data, sel=sel)
+
+        @def_method(m, self.bus.get_write_response)
+        def _():
+            return self.lsu_bus.get_write_response(m)
+
+        return m
@@ -0,0 +1,199 @@
+from amaranth import *
+from amaranth.utils import exact_log2
+
+from transactron import Method, Transaction, TModule, def_method
+from transactron.lib.metrics import HwCounter
+from transactron.utils import DependencyContext, logging, popcount
+from transactron.utils.amaranth_ext.coding import PriorityEncoder
+
+from coreblocks.params import GenParams
+from coreblocks.peripherals.bus_adapter import BusMasterInterface
+from coreblocks.interface.keys import InstructionCommitKey, StoreBufferDrainedKey
+from coreblocks.interface.layouts import LSULayouts, RetirementLayouts
+
+__all__ = ["StoreBuffer"]
+
+
+log = logging.HardwareLogger("backend.lsu.store_buffer")
+
+
+class StoreBuffer(Elaboratable):
+    """
+    Post-commit store buffer of the load/store unit.
+
+    Stores are inserted in the program order, after their address is translated and checked.
+    They are committed when the retirement reports the commit of their instructions, and then
+    they are written to memory in order. The stores which are not committed are discarded
+    when the core is flushed.
+
+    A load can take its data from the youngest store to the same word, if the store writes
+    all the loaded bytes. If it writes only some of them, the load has to wait until the store
+    is written to memory.
+
+    Attributes
+    ----------
+    insert : Method
+        Inserts a store which is not committed yet. Layout: `LSULayouts.store_buffer_insert`.
+    commit : Method
+        Commits the stores of committed instructions. Registered to `InstructionCommitKey`.
+    flush : Method
+        Discards the stores which are not committed.
+    drained : Method
+        Ready when all the committed stores are written to memory. Registered to `StoreBufferDrainedKey`.
+    empty : Signal, out
+        There are no stores in the buffer and no writes to memory are pending.
+    forward_paddr : Signal, in
+        Physical address of a load checked for forwarding.
+    forward_sel : Signal, in
+        Bytes of the word read by the load.
+    forward_hit : Signal, out
+        The youngest store to the word writes all the bytes read by the load.
+    forward_conflict : Signal, out
+        The youngest store to the word writes only some of the bytes read by the load.
+    forward_data : Signal, out
+        Data written by the youngest store to the word.
+    """
+
+    def __init__(self, gen_params: GenParams, bus: BusMasterInterface, size: int) -> None:
+        """
+        Parameters
+        ----------
+        gen_params : GenParams
+            Parameters to be used during processor generation.
+        bus : BusMasterInterface
+            An instance of the bus master for interfacing with the data bus.
+        size : int
+            Number of stores which can be held in the buffer. Must be a power of two.
+        """
+        self.gen_params = gen_params
+        self.bus = bus
+        self.size = size
+        self.size_log = exact_log2(size)
+
+        self.layouts = gen_params.get(LSULayouts)
+
+        self.insert = Method(i=self.layouts.store_buffer_insert)
+        self.commit = Method(i=gen_params.get(RetirementLayouts).commit)
+        self.flush = Method()
+        self.drained = Method()
+
+        self.empty = Signal()
+        self.forward_paddr = Signal(gen_params.phys_addr_bits)
+        self.forward_sel = Signal(gen_params.isa.xlen // 8)
+        self.forward_hit = Signal()
+        self.forward_conflict = Signal()
+        self.forward_data = Signal(gen_params.isa.xlen)
+
+        dm = DependencyContext.get()
+        dm.add_dependency(InstructionCommitKey(), self.commit)
+        dm.add_dependency(StoreBufferDrainedKey(), self.drained)
+
+        self.perf_stores = HwCounter(
+            "backend.lsu.store_buffer.stores", "Number of stores written to memory from the store buffer"
+        )
+        self.perf_errors = HwCounter(
+            "backend.lsu.store_buffer.bus_errors", "Number of committed stores which caused a bus error"
+        )
+
+    def elaborate(self, platform):
+        m = TModule()
+
+        m.submodules += [self.perf_stores, self.perf_errors]
+
+        entries = [Signal(self.layouts.store_buffer_insert, name=f"entry_{i}") for i in range(self.size)]
+        entries_array = Array(entry.as_value() for entry in entries)
+
+        # Committed stores are at the front of the buffer, followed by the stores which are not committed.
+        head = Signal(self.size_log)
+        stored = Signal(range(self.size + 1))
+        committed = Signal(range(self.size + 1))
+        pending_writes = Signal(range(self.size + 1))
+
+        inserting = Signal()
+        committing = Signal(range(self.gen_params.retirement_superscalarity + 1))
+        flushing = Signal()
+        writing = Signal()
+        written = Signal()
+
+        def entry_idx(offset: Value) -> Value:
+            return (head + offset)[: self.size_log]
+
+        def read_entry(offset: Value) -> Signal:
+            entry = Signal(self.layouts.store_buffer_insert)
+            m.d.comb += entry.eq(entries_array[entry_idx(offset)])
+            return entry
+
+        m.d.comb += self.empty.eq((stored == 0) & (pending_writes == 0))
+
+        @def_method(m, self.insert, ready=stored != self.size)
+        def _(arg):
+            m.d.comb += inserting.eq(1)
+            for i, entry in enumerate(entries):
+                with m.If(entry_idx(stored) == i):
+                    m.d.sync += entry.eq(arg)
+
+        # The committed instructions are in the program order, so are their stores.
+        commit_candidates = [read_entry(committed + i) for i in range(self.gen_params.retirement_superscalarity)]
+
+        @def_method(m, self.commit)
+        def _(rob_id: Value, count: Value):
+            in_order = 1
+            committed_stores = []
+            for i, entry in enumerate(commit_candidates):
+                rob_offset = (entry.rob_id - rob_id)[: self.gen_params.rob_entries_bits]
+                in_order = in_order & (committed + i < stored) & (rob_offset < count)
+                committed_stores.append(in_order)
+            m.d.comb += committing.eq(popcount(Cat(committed_stores)))
+
+        @def_method(m, self.flush)
+        def _():
+            m.d.comb += flushing.eq(1)
+
+        @def_method(m, self.drained, ready=(committed == 0) & (pending_writes == 0), nonexclusive=True)
+        def _():
+            pass
+
+        oldest = read_entry(C(0))
+
+        with Transaction(name="StoreBufferWrite").body(m, ready=(committed != 0) & (pending_writes != self.size)):
+            self.bus.request_write(m, addr=oldest.paddr >> 2, data=oldest.data, sel=oldest.sel)
+            self.perf_stores.incr(m)
+            m.d.comb += writing.eq(1)
+
+        with Transaction(name="StoreBufferWriteResponse").body(m, ready=pending_writes != 0):
+            err = self.bus.get_write_response(m).err
+            self.perf_errors.incr(m, enable_call=err)
+            log.error(m, err, "Bus error while writing a committed store")
+            m.d.comb += written.eq(1)
+
+        committed_next = committed + committing - writing
+        m.d.sync += [
+            committed.eq(committed_next),
+            pending_writes.eq(pending_writes + writing - written),
+        ]
+        with m.If(writing):
+            m.d.sync += head.eq(head + 1)
+        with m.If(flushing):
+            m.d.sync += stored.eq(committed_next)
+        with m.Else():
+            m.d.sync += stored.eq(stored + inserting - writing)
+
+        # Forwarding from the youngest store to the word
+        m.submodules.forward_enc = forward_enc = PriorityEncoder(self.size)
+        youngest_first = [read_entry(stored - 1 - i) for i in range(self.size)]
+        m.d.comb += forward_enc.i.eq(
+            Cat(
+                (i < stored) & (entry.paddr >> 2 == self.forward_paddr >> 2) & (entry.sel & self.forward_sel).any()
+                for i, entry in enumerate(youngest_first)
+            )
+        )
+        forwarded = Signal(self.layouts.store_buffer_insert)
+        m.d.comb += forwarded.eq(Array(entry.as_value() for entry in youngest_first)[forward_enc.o])
+        covered = (forwarded.sel & self.forward_sel) == self.forward_sel
+        m.d.comb += [
+            self.forward_hit.eq(~forward_enc.n & covered),
+            self.forward_conflict.eq(~forward_enc.n & ~covered),
+            self.forward_data.eq(forwarded.data),
+        ]
+
+        return m
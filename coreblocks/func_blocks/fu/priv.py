@@ -27,6 +27,9 @@ from coreblocks.interface.keys import (
     SideFxGuardKey,
     UnsafeInstructionResolvedKey,
     FlushICacheKey,
+    DCacheWritebackKey,
+    StoreBufferDrainedKey,
+    ROBIndicesKey,
     WaitForInterruptResumeKey,
     SFenceVMAKey,
 )
@@ -100,12 +103,30 @@ class PrivilegedFuncUnit(FuncUnitBase[PrivilegedFn]):
         csr = self.dm.get_dependency(CSRInstancesKey())
         priv_mode = csr.m_mode.priv_mode
         flush_icache = self.dm.get_dependency(FlushICacheKey())
+        dcache_writeback = self.dm.get_optional_dependency(DCacheWritebackKey())
         sfence_vma = self.dm.get_optional_dependency(SFenceVMAKey())
+        store_buffer_drained = self.dm.get_optional_dependency(StoreBufferDrainedKey())
         resume_core = self.dm.get_dependency(UnsafeInstructionResolvedKey())
 
         if sfence_vma is not None:
             m.submodules += sfence_vma[1]
 
+        # The stores committed before FENCE.I and SFENCE.VMA must reach memory before the instruction cache
+        # and the TLBs are refilled. The instruction waits at the head of the ROB, so that all of them are committed.
+        stores_written = Signal()
+        if store_buffer_drained is not None:
+            rob_get_indices = self.dm.get_dependency(ROBIndicesKey())
+            needs_drain = (instr_fn == PrivilegedFn.Fn.FENCEI) | (instr_fn == PrivilegedFn.Fn.SFENCEVMA)
+
+            with Transaction().body(m):
+                with condition(m, nonblocking=True) as branch:
+                    with branch(needs_drain):
+                        store_buffer_drained(m)
+                rob_head = rob_get_indices(m).start
+                m.d.comb += stores_written.eq(~needs_drain | (rob_head == instr_rob))
+        else:
+            m.d.comb += stores_written.eq(1)
+
         @def_method(m, self.issue_decoded, ready=~instr_valid)
         def _(arg):
             m.d.sync += [
@@ -119,7 +140,11 @@ class PrivilegedFuncUnit(FuncUnitBase[PrivilegedFn]):
                 ftq_ptr.eq(arg.ftq_ptr),
             ]
 
-        with Transaction().body(m, ready=instr_valid & ~finished):
+        # FENCE.I has to write back the data cache before the instruction cache is flushed.
+        writeback_pending = Signal()
+        writeback_started = Signal()
+
+        with Transaction().body(m, ready=instr_valid & ~finished & ~writeback_pending & stores_written):
             side_fx_guard = self.dm.get_dependency(SideFxGuardKey())
             side_fx_guard(m, rob_id=instr_rob, require_done=0)
             m.d.sync += finished.eq(1)
@@ -181,8 +206,12 @@ class PrivilegedFuncUnit(FuncUnitBase[PrivilegedFn]):
                             # - by the TLB construction, all translations are linearized after the flushes,
                             #   so all later translations will see the flushes.
 
-                with branch((instr_fn == PrivilegedFn.Fn.FENCEI)):
-                    flush_icache(m)
+                if dcache_writeback is None:
+                    with branch((instr_fn == PrivilegedFn.Fn.FENCEI)):
+                        flush_icache(m)
+                else:
+                    with branch((instr_fn == PrivilegedFn.Fn.FENCEI)):
+                        m.d.sync += [finished.eq(0), writeback_pending.eq(1)]
                 with branch((instr_fn == PrivilegedFn.Fn.WFI) & ~illegal_wfi):
                     # async_interrupt_active implies wfi_resume. WFI should continue normal execution
                     # when interrupt is enabled in xie, but disabled via global mstatus.xIE
@@ -190,12 +219,25 @@ class PrivilegedFuncUnit(FuncUnitBase[PrivilegedFn]):
 
             m.d.sync += illegal_instruction.eq(illegal_wfi | illegal_mret | illegal_sret | illegal_sfencevma)
 
+        if dcache_writeback is not None:
+            writeback_req, writeback_resp = dcache_writeback
+
+            with Transaction().body(m, ready=instr_valid & writeback_pending & ~writeback_started):
+                writeback_req(m)
+                m.d.sync += writeback_started.eq(1)
+
+            with Transaction().body(m, ready=writeback_started):
+                writeback_resp(m)
+                flush_icache(m)
+                m.d.sync += [finished.eq(1), writeback_pending.eq(0), writeback_started.eq(0)]
+
         with Transaction().body(m):
             core_state = self.dm.get_dependency(CoreStateKey())(m)
 
-        with Transaction().body(m, ready=instr_valid & (finished | core_state.flushing)):
+        with Transaction().body(m, ready=instr_valid & (finished | core_state.flushing) & ~writeback_started):
             m.d.sync += instr_valid.eq(0)
             m.d.sync += finished.eq(0)
+            m.d.sync += writeback_pending.eq(0)
 
             ret_pc = Signal(self.gen_params.isa.xlen)
 
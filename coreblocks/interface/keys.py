@@ -11,6 +11,7 @@ from amaranth import Signal
 
 if TYPE_CHECKING:
     from coreblocks.priv.csr.csr_instances import CSRInstances  # noqa: F401
+    from coreblocks.func_blocks.fu.lsu.mem_dep_predictor import MemoryDependencePredictor  # noqa: F401
     from coreblocks.priv.vmem.iface import TLBBackingDevice  # noqa: F401
 
 __all__ = [
@@ -28,10 +29,15 @@ __all__ = [
     "CoreStateKey",
     "CSRListKey",
     "FlushICacheKey",
+    "DCacheWritebackKey",
+    "StoreBufferDrainedKey",
+    "MemoryDependencePredictorKey",
     "SFenceVMAKey",
     "InstructionAddressTranslatorBackingDeviceKey",
     "DataAddressTranslatorBackingDeviceKey",
     "FTQCommitKey",
+    "InstructionCommitKey",
+    "ROBIndicesKey",
     "RollbackKey",
     "InstructionTaggedCounterKey",
 ]
@@ -122,6 +128,35 @@ class FlushICacheKey(SimpleKey[Method]):
     pass
 
 
+@dataclass(frozen=True)
+class DCacheWritebackKey(SimpleKey[tuple[Method, Method]]):
+    """
+    Methods writing back all dirty lines of the data cache: the first one starts
+    the write back, the second one is ready when it is finished.
+    """
+
+    pass
+
+
+@dataclass(frozen=True)
+class StoreBufferDrainedKey(SimpleKey[Method]):
+    """
+    Method ready when all the committed stores held in the store buffer are written to memory.
+    """
+
+    pass
+
+
+@dataclass(frozen=True)
+class MemoryDependencePredictorKey(SimpleKey["MemoryDependencePredictor"]):
+    """
+    The memory dependence predictor of the LSU, used by `LSURS` to take the loads
+    predicted independent before the older stores.
+    """
+
+    pass
+
+
 @dataclass(frozen=True)
 class SFenceVMAKey(UnifierKey, unifier=MethodProduct.create):
     """
@@ -147,6 +182,26 @@ class FTQCommitKey(SimpleKey[Method]):
     """Method called when the retirement unit commits an instruction."""
 
 
+@dataclass(frozen=True)
+class InstructionCommitKey(UnifierKey, unifier=MethodProduct.create):
+    """
+    Collects methods notified about instructions committed by the retirement unit.
+    Expected layout is `RetirementLayouts.commit`.
+    """
+
+    pass
+
+
+@dataclass(frozen=True)
+class ROBIndicesKey(SimpleKey[Method]):
+    """
+    Method returning the indices of the oldest entry and of the entry following the latest one
+    in the reorder buffer. Expected layout is `ROBLayouts.get_indices`.
+    """
+
+    pass
+
+
 @dataclass(frozen=True)
 class RollbackKey(UnifierKey, unifier=MethodProduct.create):
     """
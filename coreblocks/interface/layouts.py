@@ -1,7 +1,7 @@
 from amaranth import signed
 from amaranth.lib.data import ArrayLayout
 from amaranth.lib.enum import IntFlag, IntEnum, auto
-from coreblocks.params import GenParams
+from coreblocks.params import GenParams, BPUType
 from coreblocks.arch import *
 from coreblocks.interface.views import CircularBufferPointer
 from transactron.utils import LayoutList, LayoutListField, layout_subset
@@ -572,6 +572,11 @@ class RetirementLayouts:
 
         self.core_state: LayoutList = [self.flushing]
 
+        self.commit_count: LayoutListField = ("count", range(gen_params.retirement_superscalarity + 1))
+        """Number of instructions committed, starting from `rob_id`."""
+
+        self.commit = make_layout(fields.rob_id, self.commit_count)
+
 
 class RSLayouts:
     """Layouts used in the reservation station."""
@@ -652,8 +657,84 @@ class BranchPredictionLayouts:
     def __init__(self, gen_params: GenParams):
         fields = gen_params.get(CommonLayoutFields)
 
+        self.prediction: LayoutListField = ("prediction", gen_params.get(FetchLayouts).bpu_prediction)
+        """Prediction made by the BPU for a fetch block."""
+
+        self.ghist: LayoutListField = ("ghist", gen_params.bpu_history_len)
+        """Global branch history - outcomes of the most recent conditional branches."""
+
+        self.taken: LayoutListField = ("taken", 1)
+
+        self.ras_ptr: LayoutListField = ("ras_ptr", gen_params.ras_size_log)
+        """Top pointer of the return address stack."""
+
+        self.ras_push: LayoutListField = ("ras_push", 1)
+
+        self.ret_addr: LayoutListField = ("ret_addr", gen_params.isa.xlen)
+        """Return address of a call - the address of the instruction following it."""
+
+        # TAGE: 0 is the base table, i + 1 is the tagged table i. Gshare: 1 if the gshare table was chosen.
+        provider_bits = (
+            len(gen_params.tage_config.history_lengths).bit_length() if gen_params.bpu_type == BPUType.TAGE else 1
+        )
+        self.provider: LayoutListField = ("provider", provider_bits)
+        """Table of the direction predictor which provided the prediction."""
+
+        self.loop_idx: LayoutListField = ("loop_idx", gen_params.loop_predictor_entries_log)
+        """Entry of the loop predictor."""
+
+        self.loop_iter: LayoutListField = ("loop_iter", gen_params.loop_predictor_iter_bits)
+        """Speculative iteration count of a loop."""
+
+        self.meta: LayoutListField = (
+            "meta",
+            make_layout(
+                self.ghist,
+                self.ras_ptr,
+                self.provider,
+                ("loop_hit", 1),
+                self.loop_idx,
+                self.loop_iter,
+                ("loop_cfi_idx", gen_params.fetch_width_log),
+            ),
+        )
+        """State of the predictor components a prediction was made with. Stored in the FTQ
+        to repair the speculative state after redirects and to train the predictor.
+        loop_idx, loop_iter - the most recently predicted loop and its iteration count before the prediction.
+        loop_hit, loop_cfi_idx - the prediction of the branch at loop_cfi_idx was made for the loop."""
+
         self.request = make_layout(fields.pc, fields.ftq_ptr)
-        self.write_prediction = make_layout(fields.pc, fields.ftq_ptr)
+        self.write_prediction = make_layout(fields.pc, fields.ftq_ptr, self.prediction, self.meta)
+        """
+        pc - the predicted address of the next fetch block.
+        """
+
+        self.update = make_layout(
+            fields.fb_addr,
+            self.taken,
+            fields.cfi_idx,
+            fields.cfi_type,
+            fields.cfi_target,
+            ("cfi_short", 1),
+            self.ghist,
+            self.provider,
+        )
+        """
+        fb_addr - the address of the fetch block the resolved CFI belongs to.
+        cfi_short - only two bytes of the CFI start at its index (it is compressed or it crosses
+        the fetch block boundary), so the next instruction starts two bytes after it.
+        """
+
+        self.restore = make_layout(
+            self.ghist, self.ras_ptr, self.ras_push, self.ret_addr, self.loop_idx, self.loop_iter
+        )
+        """The speculative state after a redirect. If ras_push is set, ret_addr is pushed
+        on the return address stack restored to ras_ptr. The iteration count of the loop
+        at loop_idx is set to loop_iter."""
+
+        self.direction_lookup = make_layout(fields.fb_addr, self.ghist)
+        self.direction_read = make_layout(self.taken, self.provider)
+        self.direction_update = make_layout(fields.fb_addr, self.ghist, self.provider, self.taken)
 
 
 class FetchTargetQueueLayouts:
@@ -661,16 +742,33 @@ class FetchTargetQueueLayouts:
         fields = gen_params.get(CommonLayoutFields)
 
         self.branch_resolve = make_layout(
+            fields.ftq_ptr,
             ("from_pc", gen_params.isa.xlen),
             ("misprediction", 1),
             ("taken", 1),
             fields.cfi_idx,
             fields.cfi_type,
             fields.cfi_target,
+            fields.rvc,
         )
 
         self.commit = make_layout(fields.ftq_ptr)
 
+        self.loop_replay_start = make_layout(fields.ftq_ptr)
+
+        self.loop_replay_alloc_in = make_layout(
+            fields.pc,
+            ("distance", range(gen_params.ftq_size + 1)),
+            ("taken", 1),
+            fields.cfi_idx,
+            fields.cfi_target,
+        )
+        """Parameters of an FTQ entry allocated for a replayed fetch block. The state of the
+        branch prediction unit is copied from the entry `distance` entries back. If `taken`
+        is set, the CFI at `cfi_idx` is predicted to be taken to `cfi_target`."""
+
+        self.loop_replay_alloc_out = make_layout(fields.ftq_ptr)
+
 
 class FetchLayouts:
     """Layouts used in the fetcher."""
@@ -708,12 +806,25 @@ class FetchLayouts:
             ("data", ArrayLayout(self.raw_instr, gen_params.frontend_superscalarity)),
         )
 
-        self.fetch_request = make_layout(fields.pc, fields.ftq_ptr)
+        self.bpu_prediction = make_layout(
+            fields.branch_mask, fields.cfi_idx, fields.cfi_type, fields.cfi_target, ("cfi_target_valid", 1)
+        )
+
+        self.fetch_request = make_layout(fields.pc, fields.ftq_ptr, ("prediction", self.bpu_prediction))
+        """prediction - the BPU prediction for the fetch block, which the fetch unit verifies."""
+        self.prefetch_request = make_layout(fields.pc)
         self.fetch_writeback = make_layout(
-            fields.ftq_ptr, ("redirect", 1), ("stall", 1), fields.cfi_idx, fields.cfi_type, fields.cfi_target
+            fields.ftq_ptr,
+            ("redirect", 1),
+            ("stall", 1),
+            fields.cfi_idx,
+            fields.cfi_type,
+            fields.cfi_target,
+            ("ret_addr", gen_params.isa.xlen),
         )
         """redirect - steer fetch to cfi_target; stall - rewind, but wait for the backend
-        to resume (fault or unsafe instruction). Both drop the FTQ entries after ftq_ptr."""
+        to resume (fault or unsafe instruction). Both drop the FTQ entries after ftq_ptr.
+        ret_addr - the address of the instruction following the CFI."""
         self.redirect = make_layout(fields.pc)
 
         # The ftq_ptr points to an FTQ entry such that no newer entries contain instructions that will be
@@ -722,10 +833,6 @@ class FetchLayouts:
 
         self.predecoded_instr = make_layout(fields.cfi_type, ("cfi_offset", signed(21)), ("unsafe", 1))
 
-        self.bpu_prediction = make_layout(
-            fields.branch_mask, fields.cfi_idx, fields.cfi_type, fields.cfi_target, ("cfi_target_valid", 1)
-        )
-
         self.pred_checker_i = make_layout(
             fields.fb_addr,
             ("instr_block_cross", 1),
@@ -849,6 +956,7 @@ class JumpBranchLayouts:
 
         self.funct7_info = make_layout(
             fields.rvc,
+            fields.cfi_type,
         )
         """Information passed from the frontend to the jumpbranch unit. Encoded in the funct7 field."""
 
@@ -867,6 +975,29 @@ class LSULayouts:
 
         self.accept = make_layout(fields.data, fields.exception, fields.cause, fields.addr)
 
+        self.sel: LayoutListField = ("sel", gen_params.isa.xlen // 8)
+        """Bytes of the word written by a store."""
+
+        self.store_buffer_insert = make_layout(fields.paddr, fields.data, self.sel, fields.rob_id)
+
+        self.load_queue_alloc = make_layout(fields.rob_id, fields.pc)
+
+        self.load_queue_execute = make_layout(fields.rob_id, fields.paddr, self.sel)
+
+        self.wait: LayoutListField = ("wait", 1)
+        """The load should wait for the older stores."""
+
+        self.predict_in = make_layout(fields.pc)
+
+        self.predict_out = make_layout(self.wait)
+
+        self.train = make_layout(fields.pc)
+
+        self.waited: LayoutListField = ("waited", 1)
+        """The load was delayed because it was predicted dependent on an older store."""
+
+        self.request = make_layout(("instr", gen_params.get(FuncUnitLayouts).issue), self.waited)
+
 
 class CSRRegisterLayouts:
     """Layouts used in the control and status registers."""
@@ -1,5 +1,7 @@
 from .genparams import *  # noqa: F401
 from .fu_params import *  # noqa: F401
 from .icache_params import *  # noqa: F401
+from .dcache_params import *  # noqa: F401
 from .instr import *  # noqa: F401
 from .vmem_params import *  # noqa: F401
+from .bpu_params import *  # noqa: F401
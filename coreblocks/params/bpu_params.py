@@ -0,0 +1,29 @@
+from dataclasses import dataclass
+from enum import Enum, auto
+
+__all__ = [
+    "BPUType",
+    "TAGEConfiguration",
+]
+
+
+class BPUType(Enum):
+    """Conditional branch direction predictor used by the branch prediction unit."""
+
+    GSHARE = auto()
+    """Bimodal and gshare tables with a chooser."""
+
+    TAGE = auto()
+    """Base bimodal table with tagged tables using geometric history lengths."""
+
+
+@dataclass(frozen=True)
+class TAGEConfiguration:
+    history_lengths: tuple[int, ...] = (4, 8, 16, 32)
+    """Global history lengths of the tagged tables (must be increasing)"""
+
+    table_bits: int = 7
+    """Log of the number of entries in each tagged table"""
+
+    tag_bits: int = 8
+    """Width of the tags in the tagged tables"""
@@ -1,9 +1,11 @@
 from coreblocks.arch.isa import Extension
 from coreblocks.params.core_configuration import CoreConfiguration
 from coreblocks.arch.isa_consts import SatpMode
+from coreblocks.params.bpu_params import BPUType
+from coreblocks.params.icache_params import ICacheReplacementPolicy
 
 from coreblocks.func_blocks.fu.common.rs_func_block import RSBlockComponent
-from coreblocks.func_blocks.fu.common.fifo_rs import FifoRS
+from coreblocks.func_blocks.fu.lsu.lsu_rs import LSURS
 from coreblocks.func_blocks.fu.alu import ALUComponent
 from coreblocks.func_blocks.fu.shift_unit import ShiftUnitComponent
 from coreblocks.func_blocks.fu.jumpbranch import JumpComponent
@@ -36,7 +38,7 @@ tiny = CoreConfiguration(
         RSBlockComponent(
             [ALUComponent(), ShiftUnitComponent(), JumpComponent(), ExceptionUnitComponent()], rs_entries=2
         ),
-        RSBlockComponent([LSUComponent()], rs_entries=2, rs_type=FifoRS),
+        RSBlockComponent([LSUComponent()], rs_entries=2, rs_type=LSURS),
     ),
     phys_regs_bits=basic.phys_regs_bits - 1,
     rob_entries_bits=basic.rob_entries_bits - 1,
@@ -45,6 +47,7 @@ tiny = CoreConfiguration(
     supervisor_mode=False,
     supported_vm_schemes=(SatpMode.BARE,),
     pmp_grain_log=2,
+    speculative_loads=False,
 )
 
 # Basic core config with minimal additions required for Linux
@@ -67,10 +70,11 @@ small_linux = CoreConfiguration(
             ],
             rs_entries=2,
         ),
-        RSBlockComponent([LSUAtomicWrapperComponent(LSUComponent())], rs_entries=2, rs_type=FifoRS),
+        RSBlockComponent([LSUAtomicWrapperComponent(LSUComponent())], rs_entries=2, rs_type=LSURS),
         CSRBlockComponent(),
     ),
     interrupt_custom_count=15,
+    dcache_enable=True,
 )
 
 # Core configuration with all supported components
@@ -106,18 +110,23 @@ full = CoreConfiguration(
             ],
             rs_entries=2,
         ),
-        RSBlockComponent([LSUAtomicWrapperComponent(LSUComponent())], rs_entries=4, rs_type=FifoRS),
+        RSBlockComponent([LSUAtomicWrapperComponent(LSUComponent())], rs_entries=4, rs_type=LSURS),
         CSRBlockComponent(),
     ),
     compressed=True,
     zcb=True,
     fetch_block_bytes_log=4,
+    icache_prefetch_distance=4,
+    icache_replacement_policy=ICacheReplacementPolicy.PLRU,
     instr_buffer_size=16,
     pmp_register_count=16,
     frontend_superscalarity=2,
     announcement_superscalarity=2,
     retirement_superscalarity=2,
     interrupt_custom_count=15,
+    bpu_type=BPUType.TAGE,
+    bpu_history_len=32,
+    loop_predictor_enable=True,
 )
 
 # Core configuration used in internal testbenches
@@ -12,7 +12,7 @@ from coreblocks.arch.isa import Extension
 from coreblocks.params.fu_params import BlockComponentParams
 
 from coreblocks.func_blocks.fu.common.rs_func_block import RSBlockComponent
-from coreblocks.func_blocks.fu.common.fifo_rs import FifoRS
+from coreblocks.func_blocks.fu.lsu.lsu_rs import LSURS
 from coreblocks.func_blocks.fu.alu import ALUComponent
 from coreblocks.func_blocks.fu.shift_unit import ShiftUnitComponent
 from coreblocks.func_blocks.fu.jumpbranch import JumpComponent
@@ -25,6 +25,8 @@ from coreblocks.func_blocks.fu.lsu.pma import PMARegion
 from coreblocks.func_blocks.csr.csr_unit import CSRBlockComponent
 from coreblocks.arch.isa_consts import SatpMode
 from coreblocks.params.vmem_params import TLBCacheConfiguration
+from coreblocks.params.bpu_params import BPUType, TAGEConfiguration
+from coreblocks.params.icache_params import ICacheReplacementPolicy
 
 __all__ = [
     "CoreConfiguration",
@@ -48,7 +50,7 @@ basic_configuration: tuple[BlockComponentParams, ...] = (
         ],
         rs_entries=2,
     ),
-    RSBlockComponent([LSUComponent()], rs_entries=2, rs_type=FifoRS),
+    RSBlockComponent([LSUComponent()], rs_entries=2, rs_type=LSURS),
     CSRBlockComponent(),
 )
 
@@ -97,12 +99,78 @@ class _CoreConfigurationDataClass:
         Log of the number of sets of the instruction cache.
     icache_line_bytes_log: int
         Log of the cache line size (in bytes).
+    icache_fill_buffers: int
+        Number of line fill buffers of the instruction cache - the number of outstanding refills.
+    icache_replacement_policy: ICacheReplacementPolicy
+        Replacement policy of the instruction cache.
+    icache_way_prediction: bool
+        Read only the data memory of the predicted way of the instruction cache. Reduces the number of memory
+        reads in associative caches, at the cost of a cycle of delay on a misprediction.
+    icache_prefetch_distance: int
+        Number of fetch blocks ahead of the fetch unit, which are prefetched into the instruction cache.
+        Zero disables prefetching. Must not exceed the size of the Fetch Target Queue.
+    instr_bus_pipelined: bool
+        Use the pipelined mode of Wishbone on the instruction bus. Up to a cache line of requests can be in
+        flight, so that cache lines are refilled at one word per cycle. The slave has to support the pipelined mode.
+    dcache_enable: bool
+        Enable the write-back data cache. If disabled, loads and stores are sent directly to the bus.
+    dcache_ways: int
+        Associativity of the data cache.
+    dcache_sets_bits: int
+        Log of the number of sets of the data cache.
+    dcache_line_bytes_log: int
+        Log of the data cache line size (in bytes).
+    dcache_replacement_policy: ICacheReplacementPolicy
+        Replacement policy of the data cache.
+    dcache_mshrs: int
+        Number of miss status holding registers of the data cache - the number of lines which can be refilled
+        at the same time. The requests to other lines can hit the cache while the lines are being refilled.
+    store_buffer_size_log: int
+        Log of the number of entries in the store buffer of the LSU. Stores are completed when they are
+        inserted into the store buffer, and written to memory in order after they are committed.
+    speculative_loads: bool
+        Allow the loads predicted independent to leave the LSU reservation station before the older stores.
+        The predictions are made by a load-wait table, trained when the memory ordering is violated.
+    load_wait_table_entries_log: int
+        Log of the number of entries of the load-wait table.
+    load_wait_table_clear_period_log: int
+        Log of the number of cycles after which the load-wait table is cleared.
+    load_queue_size_log: int
+        Log of the number of loads which can be taken before the older stores and not committed yet.
     fetch_block_bytes_log: int
         Log of the size of the fetch block (in bytes).
     ftq_size_log: int
         Log of the number of entries in the Fetch Target Queue
+    btb_ways: int
+        Associativity of the branch target buffer.
+    btb_sets_bits: int
+        Log of the number of sets of the branch target buffer.
+    bpu_type: BPUType
+        Conditional branch direction predictor.
+    bpu_history_len: int
+        Length of the global branch history used by the direction predictor.
+    bpu_table_bits: int
+        Log of the number of entries in each table of the gshare predictor and of the TAGE base table.
+    tage_config: TAGEConfiguration
+        Configuration of the tagged tables of the TAGE predictor. The longest history length must not
+        exceed `bpu_history_len`.
+    ras_size_log: int
+        Log of the number of entries of the return address stack.
+    indirect_table_bits: int
+        Log of the number of entries of the indirect jump target predictor.
+    indirect_tag_bits: int
+        Width of the tags of the indirect jump target predictor.
+    loop_predictor_enable: bool
+        Enable the loop predictor, which predicts the exits of loops with a constant trip count.
+    loop_predictor_entries_log: int
+        Log of the number of entries of the loop predictor.
+    loop_predictor_iter_bits: int
+        Width of the iteration counters of the loop predictor. Longer loops are not predicted.
     instr_buffer_size: int
         Size of the instruction buffer.
+    loop_buffer_size: int
+        Number of instructions in the loop buffer, which replays short loops without fetching them.
+        Zero disables the loop buffer. Must not exceed the size of the Fetch Target Queue.
     interrupt_custom_count: int
         Number of custom/local async interrupts to support. First interrupt will be registered at id 16.
     interrupt_custom_edge_trig_mask: int
@@ -180,11 +248,47 @@ class _CoreConfigurationDataClass:
     icache_ways: int = 2
     icache_sets_bits: int = 7
     icache_line_bytes_log: int = 5
+    icache_fill_buffers: int = 2
+    icache_replacement_policy: ICacheReplacementPolicy = ICacheReplacementPolicy.ROUND_ROBIN
+    icache_way_prediction: bool = False
+    icache_prefetch_distance: int = 0
+    instr_bus_pipelined: bool = False
+
+    dcache_enable: bool = False
+    dcache_ways: int = 2
+    dcache_sets_bits: int = 7
+    dcache_line_bytes_log: int = 5
+    dcache_replacement_policy: ICacheReplacementPolicy = ICacheReplacementPolicy.ROUND_ROBIN
+    dcache_mshrs: int = 2
+
+    store_buffer_size_log: int = 2
+    speculative_loads: bool = True
+    load_wait_table_entries_log: int = 6
+    load_wait_table_clear_period_log: int = 14
+    load_queue_size_log: int = 2
 
     fetch_block_bytes_log: int = 2
     ftq_size_log: int = 4
 
+    btb_ways: int = 2
+    btb_sets_bits: int = 5
+
+    bpu_type: BPUType = BPUType.GSHARE
+    bpu_history_len: int = 8
+    bpu_table_bits: int = 9
+    tage_config: TAGEConfiguration = TAGEConfiguration()
+
+    ras_size_log: int = 3
+
+    indirect_table_bits: int = 6
+    indirect_tag_bits: int = 8
+
+    loop_predictor_enable: bool = False
+    loop_predictor_entries_log: int = 3
+    loop_predictor_iter_bits: int = 10
+
     instr_buffer_size: int = 4
+    loop_buffer_size: int = 0
 
     interrupt_custom_count: int = 16
     interrupt_custom_edge_trig_mask: int = 0
@@ -0,0 +1,80 @@
+from .icache_params import ICacheReplacementPolicy
+
+__all__ = ["DCacheParameters"]
+
+
+class DCacheParameters:
+    """Parameters of the Data Cache.
+
+    Parameters
+    ----------
+    addr_width : int
+        Length of addresses used in the cache (in bits).
+    word_width : int
+        Length of the machine word (in bits).
+    num_of_ways : int
+        Associativity of the cache.
+    num_of_sets_bits : int
+        Log of the number of cache sets.
+    line_bytes_log : int
+        Log of the size of a single cache line in bytes.
+    replacement_policy : ICacheReplacementPolicy
+        Policy selecting the way to be replaced.
+    num_of_mshrs : int
+        Number of miss status holding registers - the number of lines which can be
+        refilled at the same time.
+    enable : bool
+        Enable the data cache. If disabled, requests are sent directly to the bus.
+    """
+
+    def __init__(
+        self,
+        *,
+        addr_width,
+        word_width,
+        num_of_ways,
+        num_of_sets_bits,
+        line_bytes_log,
+        replacement_policy=ICacheReplacementPolicy.ROUND_ROBIN,
+        num_of_mshrs=2,
+        enable=True,
+    ):
+        self.addr_width = addr_width
+        self.word_width = word_width
+        self.num_of_ways = num_of_ways
+        self.num_of_sets_bits = num_of_sets_bits
+        self.line_bytes_log = line_bytes_log
+        self.replacement_policy = replacement_policy
+        self.num_of_mshrs = num_of_mshrs
+        self.enable = enable
+        self.num_of_sets = 2**num_of_sets_bits
+        self.line_size_bytes = 2**line_bytes_log
+
+        self.word_width_bytes = word_width // 8
+
+        self.offset_bits = line_bytes_log
+        self.index_bits = num_of_sets_bits
+        self.tag_bits = self.addr_width - self.offset_bits - self.index_bits
+
+        self.index_start_bit = self.offset_bits
+        self.index_end_bit = self.offset_bits + self.index_bits - 1
+
+        self.words_in_line = self.line_size_bytes // self.word_width_bytes
+
+        # Besides the misses waiting for the MSHRs, hits and secondary misses can be pending.
+        self.max_pending_requests = max(4, 2 * num_of_mshrs)
+
+        if not enable:
+            return
+
+        if self.line_size_bytes < self.word_width_bytes:
+            raise ValueError("The data cache line size must be not smaller than the machine word.")
+
+        if num_of_mshrs <= 0:
+            raise ValueError("The number of MSHRs must be positive.")
+
+        if replacement_policy == ICacheReplacementPolicy.PLRU and num_of_ways & (num_of_ways - 1) != 0:
+            raise ValueError("The PLRU replacement policy requires the number of ways to be a power of two.")
+
+        if replacement_policy == ICacheReplacementPolicy.LRU and num_of_ways > 8:
+            raise ValueError("The LRU replacement policy supports up to 8 ways.")
@@ -4,7 +4,9 @@ from amaranth.utils import ceil_log2, exact_log2
 
 from coreblocks.arch.isa import ISA
 from .icache_params import ICacheParameters
+from .dcache_params import DCacheParameters
 from .vmem_params import VirtualMemoryParameters
+from .bpu_params import BPUType
 from .fu_params import extensions_supported
 from ..peripherals.wishbone import WishboneParameters
 from transactron.utils import DependentCache
@@ -53,6 +55,7 @@ class GenParams(DependentCache):
             data_width=self.isa.xlen,
             addr_width=self.phys_addr_bits - bytes_in_word_log,
         )
+        self.instr_bus_pipelined = cfg.instr_bus_pipelined
 
         self.vmem_params = VirtualMemoryParameters(
             xlen=cfg.xlen,
@@ -68,9 +71,30 @@ class GenParams(DependentCache):
             num_of_ways=cfg.icache_ways,
             num_of_sets_bits=cfg.icache_sets_bits,
             line_bytes_log=cfg.icache_line_bytes_log,
+            num_of_fill_buffers=cfg.icache_fill_buffers,
+            replacement_policy=cfg.icache_replacement_policy,
+            way_prediction=cfg.icache_way_prediction,
             enable=cfg.icache_enable,
         )
 
+        self.dcache_params = DCacheParameters(
+            addr_width=self.phys_addr_bits,
+            word_width=self.isa.xlen,
+            num_of_ways=cfg.dcache_ways,
+            num_of_sets_bits=cfg.dcache_sets_bits,
+            line_bytes_log=cfg.dcache_line_bytes_log,
+            replacement_policy=cfg.dcache_replacement_policy,
+            num_of_mshrs=cfg.dcache_mshrs,
+            enable=cfg.dcache_enable,
+        )
+
+        self.store_buffer_size = 2**cfg.store_buffer_size_log
+
+        self.speculative_loads = cfg.speculative_loads
+        self.load_wait_table_entries_log = cfg.load_wait_table_entries_log
+        self.load_wait_table_clear_period_log = cfg.load_wait_table_clear_period_log
+        self.load_queue_size = 2**cfg.load_queue_size_log
+
         self.debug_signals_enabled = cfg.debug_signals
 
         # Verification temporally disabled
@@ -95,6 +119,41 @@ class GenParams(DependentCache):
         self.ftq_size_log = cfg.ftq_size_log
         self.ftq_size = 2**cfg.ftq_size_log
 
+        if not 0 <= cfg.icache_prefetch_distance <= self.ftq_size:
+            raise ValueError("Instruction prefetch distance must be between zero and the FTQ size")
+        self.icache_prefetch_distance = cfg.icache_prefetch_distance if cfg.icache_enable else 0
+
+        if cfg.btb_ways <= 0:
+            raise ValueError("BTB ways must be positive")
+        self.btb_ways = cfg.btb_ways
+        self.btb_sets_bits = cfg.btb_sets_bits
+
+        if cfg.bpu_history_len <= 0:
+            raise ValueError("BPU history length must be positive")
+        self.bpu_type = cfg.bpu_type
+        self.bpu_history_len = cfg.bpu_history_len
+        self.bpu_table_bits = cfg.bpu_table_bits
+
+        self.tage_config = cfg.tage_config
+        tage_history_lengths = self.tage_config.history_lengths
+        if self.bpu_type == BPUType.TAGE:
+            if not tage_history_lengths or tage_history_lengths[0] <= 0:
+                raise ValueError("TAGE history lengths must be positive")
+            if any(a >= b for a, b in zip(tage_history_lengths, tage_history_lengths[1:])):
+                raise ValueError("TAGE history lengths must be increasing")
+            if tage_history_lengths[-1] > self.bpu_history_len:
+                raise ValueError("TAGE history lengths must not exceed the BPU history length")
+
+        self.ras_size_log = cfg.ras_size_log
+        self.ras_size = 2**cfg.ras_size_log
+
+        self.indirect_table_bits = cfg.indirect_table_bits
+        self.indirect_tag_bits = cfg.indirect_tag_bits
+
+        self.loop_predictor_enable = cfg.loop_predictor_enable
+        self.loop_predictor_entries_log = cfg.loop_predictor_entries_log
+        self.loop_predictor_iter_bits = cfg.loop_predictor_iter_bits
+
         self.frontend_superscalarity = cfg.frontend_superscalarity
         self.announcement_superscalarity = cfg.announcement_superscalarity
         self.retirement_superscalarity = cfg.retirement_superscalarity
@@ -117,6 +176,11 @@ class GenParams(DependentCache):
         self.fetch_width_log = exact_log2(self.fetch_width)
 
         self.instr_buffer_size = cfg.instr_buffer_size
+
+        if not 0 <= cfg.loop_buffer_size <= self.ftq_size:
+            raise ValueError("Loop buffer size must be between zero and the FTQ size")
+        self.loop_buffer_size = cfg.loop_buffer_size
+
         self.extra_verification = cfg.extra_verification
 
         self.interrupt_custom_count = cfg.interrupt_custom_count
@@ -1,3 +1,24 @@
+from enum import Enum, auto
+
+__all__ = [
+    "ICacheParameters",
+    "ICacheReplacementPolicy",
+]
+
+
+class ICacheReplacementPolicy(Enum):
+    """Replacement policy of the instruction cache."""
+
+    ROUND_ROBIN = auto()
+    """A single global counter selecting the next way to be replaced."""
+
+    PLRU = auto()
+    """Tree pseudo-LRU. The number of ways must be a power of two."""
+
+    LRU = auto()
+    """True LRU. Supported for up to 8 ways."""
+
+
 class ICacheParameters:
     """Parameters of the Instruction Cache.
 
@@ -13,6 +34,13 @@ class ICacheParameters:
         Log of the number of cache sets.
     line_bytes_log : int
         Log of the size of a single cache line in bytes.
+    num_of_fill_buffers : int
+        Number of line fill buffers - the number of outstanding refills.
+    replacement_policy : ICacheReplacementPolicy
+        Policy selecting the way to be replaced.
+    way_prediction : bool
+        Read only the data memory of the predicted way - the most recently used way of the set.
+        A misprediction delays the response by one cycle.
     enable : bool
         Enable the instruction cache. If disabled, requests are bypassed to the bus.
     """
@@ -26,6 +54,9 @@ class ICacheParameters:
         num_of_ways,
         num_of_sets_bits,
         line_bytes_log,
+        num_of_fill_buffers=2,
+        replacement_policy=ICacheReplacementPolicy.ROUND_ROBIN,
+        way_prediction=False,
         enable=True,
     ):
         self.addr_width = addr_width
@@ -34,6 +65,9 @@ class ICacheParameters:
         self.num_of_ways = num_of_ways
         self.num_of_sets_bits = num_of_sets_bits
         self.line_bytes_log = line_bytes_log
+        self.num_of_fill_buffers = num_of_fill_buffers
+        self.replacement_policy = replacement_policy
+        self.way_prediction = way_prediction and num_of_ways > 1
         self.enable = enable
         self.fetch_block_bytes = 2**fetch_block_bytes_log
         self.num_of_sets = 2**num_of_sets_bits
@@ -57,3 +91,12 @@ class ICacheParameters:
 
         if line_bytes_log < self.fetch_block_bytes_log:
             raise ValueError("The instruction cache line size must be not smaller than the fetch block size.")
+
+        if num_of_fill_buffers < 1:
+            raise ValueError("The instruction cache must have at least one fill buffer.")
+
+        if replacement_policy == ICacheReplacementPolicy.PLRU and num_of_ways & (num_of_ways - 1) != 0:
+            raise ValueError("The PLRU replacement policy requires the number of ways to be a power of two.")
+
+        if replacement_policy == ICacheReplacementPolicy.LRU and num_of_ways > 8:
+            raise ValueError("The LRU replacement policy supports up to 8 ways.")
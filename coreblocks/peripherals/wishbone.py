@@ -473,6 +473,9 @@ class WishboneMemorySlave(Component):
     ----------
     wb_params: WishboneParameters
         Parameters for bus generation.
+    pipelined: bool
+        Use the pipelined mode - a request is accepted in every cycle and acknowledged
+        in the next one. Defaults to False.
     **kwargs: dict
         Keyword arguments for the underlying Amaranth's `Memory`. If `width` and `depth`
         are not specified, then they're inferred from `wb_params`: `data_width` becomes
@@ -486,8 +489,9 @@ class WishboneMemorySlave(Component):
 
     bus: WishboneInterface
 
-    def __init__(self, wb_params: WishboneParameters, **kwargs):
+    def __init__(self, wb_params: WishboneParameters, pipelined: bool = False, **kwargs):
         super().__init__({"bus": In(WishboneInterface(wb_params).signature)})
+        self.pipelined = pipelined
         if "shape" not in kwargs:
             kwargs["shape"] = wb_params.data_width
         if kwargs["shape"] not in (8, 16, 32, 64):
@@ -507,6 +511,28 @@ class WishboneMemorySlave(Component):
         wrport = self.mem.write_port(granularity=self.granularity)
         rdport = self.mem.read_port()
 
+        if self.pipelined:
+            request = self.bus.stb & self.bus.cyc
+            read_err = ~self.bus.we & (self.bus.adr >= self.mem.depth)
+
+            ack = Signal()
+            err = Signal()
+            m.d.sync += ack.eq(request & ~read_err)
+            m.d.sync += err.eq(request & read_err)
+
+            m.d.comb += rdport.addr.eq(self.bus.adr)
+            with m.If(request & self.bus.we):
+                m.d.comb += wrport.addr.eq(self.bus.adr)
+                m.d.comb += wrport.en.eq(self.bus.sel)
+                m.d.comb += wrport.data.eq(self.bus.dat_w)
+
+            m.d.comb += self.bus.dat_r.eq(rdport.data)
+            # responses are dropped when the master ends the cycle
+            m.d.comb += self.bus.ack.eq(ack & self.bus.cyc)
+            m.d.comb += self.bus.err.eq(err & self.bus.cyc)
+
+            return m
+
         with m.FSM():
             with m.State("Start"):
                 with m.If(self.bus.stb & self.bus.cyc):
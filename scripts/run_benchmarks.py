@@ -9,7 +9,7 @@ import sys
 import os
 import subprocess
 import tabulate
-from typing import Literal
+from typing import Literal, Optional
 from pathlib import Path
 
 topdir = Path(__file__).parent.parent
@@ -140,6 +140,77 @@ def build_result_table(results: dict[str, BenchmarkResult], tablefmt: str) -> st
     return tabulate.tabulate(rows, headers="firstrow", tablefmt=tablefmt)
 
 
+def icache_miss_rate(result: BenchmarkResult) -> Optional[float]:
+    misses = result.metric_values.get("frontend.icache.misses", {}).get("count")
+    loads = result.metric_values.get("frontend.icache.loads", {}).get("count")
+    if misses is None or not loads:
+        return None
+    return misses / loads
+
+
+def build_comparison_table(
+    results: dict[str, BenchmarkResult], baseline: dict[str, BenchmarkResult], tablefmt: str
+) -> str:
+    def fmt_delta(value: Optional[float], base: Optional[float], percent: bool) -> str:
+        if value is None or base is None:
+            return "-"
+        return f"{value - base:+.2%}" if percent else f"{value - base:+.3f}"
+
+    def fmt(value: Optional[float], percent: bool) -> str:
+        if value is None:
+            return "-"
+        return f"{value:.2%}" if percent else f"{value:.3f}"
+
+    header = [
+        "Testbench name",
+        "Baseline IPC",
+        "IPC",
+        "IPC delta",
+        "Baseline ICache miss rate",
+        "ICache miss rate",
+        "ICache miss rate delta",
+    ]
+
+    rows = [header]
+    for benchmark_name, result in results.items():
+        if benchmark_name not in baseline:
+            continue
+
+        base_result = baseline[benchmark_name]
+        ipc = result.instr / result.cycles
+        base_ipc = base_result.instr / base_result.cycles
+        miss_rate = icache_miss_rate(result)
+        base_miss_rate = icache_miss_rate(base_result)
+
+        rows.append(
+            [
+                benchmark_name,
+                fmt(base_ipc, False),
+                fmt(ipc, False),
+                fmt_delta(ipc, base_ipc, False),
+                fmt(base_miss_rate, True),
+                fmt(miss_rate, True),
+                fmt_delta(miss_rate, base_miss_rate, True),
+            ]
+        )
+
+    return tabulate.tabulate(rows, headers="firstrow", tablefmt=tablefmt)
+
+
+def load_results(results_dir: Path, benchmarks: list[str]) -> dict[str, BenchmarkResult]:
+    results: dict[str, BenchmarkResult] = {}
+
+    for name in benchmarks:
+        path = results_dir.joinpath(f"{name}.json")
+        if not path.exists():
+            continue
+
+        with open(path, "r") as f:
+            results[name] = BenchmarkResult.from_json(f.read())  # type: ignore
+
+    return results
+
+
 def main():
     parser = argparse.ArgumentParser()
     parser.add_argument("-l", "--list", action="store_true", help="List all benchmarks")
@@ -156,6 +227,13 @@ def main():
         help="Selects output file to write information to. Default: %(default)s",
     )
     parser.add_argument("--summary", default="", action="store", help="Write Markdown summary to this file")
+    parser.add_argument(
+        "--baseline",
+        default="",
+        action="store",
+        help="Compare the IPC and the ICache miss rate with the results of a previous run, stored in this directory "
+        + "(a copy of test/regression/benchmark_results), e.g. using a different ICache replacement policy",
+    )
     parser.add_argument("benchmark_name", nargs="?")
 
     args = parser.parse_args()
@@ -191,22 +269,23 @@ def main():
 
     ipcs = []
 
-    results: dict[str, BenchmarkResult] = {}
-
-    for name in benchmarks:
-        with open(f"{str(test.regression.benchmark.results_dir)}/{name}.json", "r") as f:
-            result = BenchmarkResult.from_json(f.read())  # type: ignore
-
-        results[name] = result
+    results = load_results(test.regression.benchmark.results_dir, benchmarks)
 
+    for name, result in results.items():
         ipc = result.instr / result.cycles
         ipcs.append({"name": name, "unit": "Instructions Per Cycle", "value": ipc})
 
     print(build_result_table(results, "simple_outline"))
 
+    baseline = load_results(Path(args.baseline), benchmarks) if args.baseline != "" else {}
+    if baseline:
+        print(build_comparison_table(results, baseline, "simple_outline"))
+
     if args.summary != "":
         with open(args.summary, "w") as summary_file:
             print(build_result_table(results, "github"), file=summary_file)
+            if baseline:
+                print(build_comparison_table(results, baseline, "github"), file=summary_file)
 
     with open(args.output, "w") as benchmark_file:
         json.dump(ipcs, benchmark_file, indent=4)
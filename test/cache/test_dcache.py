@@ -0,0 +1,359 @@
+from collections import deque
+from parameterized import parameterized_class
+import random
+
+from amaranth import Elaboratable, Module
+from amaranth.utils import exact_log2
+
+from transactron.lib import AdapterTrans
+from coreblocks.cache.dcache import DCache
+from coreblocks.params import GenParams, ICacheReplacementPolicy
+from coreblocks.params import configurations
+
+from transactron.testing import TestCaseWithSimulator, TestbenchIO, TestbenchContext
+from ..peripherals.bus_mock import BusMockParameters, MockMasterAdapter
+
+
+class DCacheTestCircuit(Elaboratable):
+    def __init__(self, gen_params: GenParams):
+        self.gen_params = gen_params
+
+    def elaborate(self, platform):
+        m = Module()
+
+        bus_mock_params = BusMockParameters(
+            data_width=self.gen_params.isa.xlen,
+            addr_width=self.gen_params.phys_addr_bits - exact_log2(self.gen_params.isa.xlen // 8),
+        )
+
+        m.submodules.bus_master_adapter = self.bus_master_adapter = MockMasterAdapter(bus_mock_params)
+        m.submodules.cache = self.cache = DCache(self.gen_params, self.bus_master_adapter)
+
+        port = self.cache.ports[0]
+        m.submodules.request_read = self.request_read = TestbenchIO(AdapterTrans.create(port.request_read))
+        m.submodules.request_write = self.request_write = TestbenchIO(AdapterTrans.create(port.request_write))
+        m.submodules.get_read_response = self.get_read_response = TestbenchIO(
+            AdapterTrans.create(port.get_read_response)
+        )
+        m.submodules.get_write_response = self.get_write_response = TestbenchIO(
+            AdapterTrans.create(port.get_write_response)
+        )
+        m.submodules.writeback_req = self.writeback_req = TestbenchIO(AdapterTrans.create(self.cache.writeback_req))
+        m.submodules.writeback_resp = self.writeback_resp = TestbenchIO(AdapterTrans.create(self.cache.writeback_resp))
+
+        return m
+
+
+@parameterized_class(
+    ("name", "isa_xlen", "ways", "line_size", "policy", "mshrs"),
+    [
+        ("1way_line16B_rv32i_1mshr", 32, 1, 4, ICacheReplacementPolicy.ROUND_ROBIN, 1),
+        ("2way_line16B_rv32i", 32, 2, 4, ICacheReplacementPolicy.ROUND_ROBIN, 2),
+        ("4way_line32B_rv32i_lru_4mshr", 32, 4, 5, ICacheReplacementPolicy.LRU, 4),
+        ("2way_line4B_rv32i", 32, 2, 2, ICacheReplacementPolicy.PLRU, 2),
+        ("2way_line32B_rv64i_3mshr", 64, 2, 5, ICacheReplacementPolicy.ROUND_ROBIN, 3),
+    ],
+)
+class TestDCache(TestCaseWithSimulator):
+    isa_xlen: int
+    ways: int
+    line_size: int
+    policy: ICacheReplacementPolicy
+    mshrs: int
+
+    mmio_base = 0xE0000000
+
+    def setup_method(self) -> None:
+        random.seed(42)
+
+        self.gen_params = GenParams(
+            configurations.test.replace(
+                xlen=self.isa_xlen,
+                fetch_block_bytes_log=exact_log2(self.isa_xlen // 8),
+                dcache_enable=True,
+                dcache_ways=self.ways,
+                dcache_sets_bits=2,
+                dcache_line_bytes_log=self.line_size,
+                dcache_replacement_policy=self.policy,
+                dcache_mshrs=self.mshrs,
+            )
+        )
+        self.cp = self.gen_params.dcache_params
+        self.word_bytes = self.cp.word_width_bytes
+        self.m = DCacheTestCircuit(self.gen_params)
+
+        # Memory as seen by the bus and by the cache user, in words
+        self.bus_mem: dict[int, int] = {}
+        self.ref_mem: dict[int, int] = {}
+        self.bad_addrs: set[int] = set()
+        self.hold_responses = False
+
+        self.read_queue: deque[int] = deque()
+        self.write_queue: deque[int] = deque()
+        self.bus_reads: list[int] = []
+        self.bus_writes: list[int] = []
+
+    def word(self, addr: int) -> int:
+        return addr >> exact_log2(self.word_bytes)
+
+    def load_bus_mem(self, addr: int) -> int:
+        if addr not in self.bus_mem:
+            self.bus_mem[addr] = random.randrange(2**self.isa_xlen)
+            self.ref_mem.setdefault(addr, self.bus_mem[addr])
+        return self.bus_mem[addr]
+
+    def apply_sel(self, old: int, new: int, sel: int) -> int:
+        for i in range(self.word_bytes):
+            if sel & (1 << i):
+                mask = 0xFF << (8 * i)
+                old = (old & ~mask) | (new & mask)
+        return old
+
+    async def bus_read_requests(self, sim: TestbenchContext):
+        while True:
+            req = await self.m.bus_master_adapter.request_read_mock.call(sim)
+            self.bus_reads.append(req.addr)
+            self.read_queue.append(req.addr)
+            await self.random_wait_geom(sim, 0.5)
+
+    async def bus_read_responses(self, sim: TestbenchContext):
+        while True:
+            while not self.read_queue or self.hold_responses:
+                await sim.tick()
+            addr = self.read_queue.popleft()
+            await self.m.bus_master_adapter.get_read_response_mock.call(
+                sim, data=self.load_bus_mem(addr), err=addr in self.bad_addrs
+            )
+            await self.random_wait_geom(sim, 0.5)
+
+    async def bus_write_requests(self, sim: TestbenchContext):
+        while True:
+            req = await self.m.bus_master_adapter.request_write_mock.call(sim)
+            self.bus_writes.append(req.addr)
+            self.bus_mem[req.addr] = self.apply_sel(self.load_bus_mem(req.addr), req.data, req.sel)
+            self.write_queue.append(req.addr)
+            await self.random_wait_geom(sim, 0.5)
+
+    async def bus_write_responses(self, sim: TestbenchContext):
+        while True:
+            while not self.write_queue:
+                await sim.tick()
+            self.write_queue.popleft()
+            await self.m.bus_master_adapter.get_write_response_mock.call(sim, err=0)
+            await self.random_wait_geom(sim, 0.5)
+
+    def start_bus(self, sim):
+        sim.add_testbench(self.bus_read_requests, background=True)
+        sim.add_testbench(self.bus_read_responses, background=True)
+        sim.add_testbench(self.bus_write_requests, background=True)
+        sim.add_testbench(self.bus_write_responses, background=True)
+
+    async def load(self, sim: TestbenchContext, addr: int, sel: int = -1):
+        sel = sel & (2**self.word_bytes - 1)
+        await self.m.request_read.call(sim, addr=addr, sel=sel)
+        return await self.m.get_read_response.call(sim)
+
+    async def store(self, sim: TestbenchContext, addr: int, data: int, sel: int = -1):
+        sel = sel & (2**self.word_bytes - 1)
+        await self.m.request_write.call(sim, addr=addr, data=data, sel=sel)
+        return await self.m.get_write_response.call(sim)
+
+    async def writeback(self, sim: TestbenchContext):
+        await self.m.writeback_req.call(sim)
+        await self.m.writeback_resp.call(sim)
+
+    def test_hits(self):
+        async def process(sim: TestbenchContext):
+            addr = self.word(0x1000)
+            resp = await self.load(sim, addr)
+            assert resp.data == self.bus_mem[addr] and not resp.err
+            reads = len(self.bus_reads)
+            assert reads == self.cp.words_in_line
+
+            # The whole line was refilled
+            for i in range(self.cp.words_in_line):
+                resp = await self.load(sim, addr + i)
+                assert resp.data == self.bus_mem[addr + i]
+            assert len(self.bus_reads) == reads
+
+            # Stores hitting the cache are not sent to the bus
+            await self.store(sim, addr, 0x12345678, sel=0b0011)
+            self.ref_mem[addr] = self.apply_sel(self.ref_mem[addr], 0x12345678, 0b0011)
+            assert not self.bus_writes
+            resp = await self.load(sim, addr)
+            assert resp.data == self.ref_mem[addr]
+
+            await self.writeback(sim)
+            assert self.bus_writes == [addr + i for i in range(self.cp.words_in_line)]
+            assert self.bus_mem[addr] == self.ref_mem[addr]
+
+            # A clean cache has nothing to write back
+            await self.writeback(sim)
+            assert len(self.bus_writes) == self.cp.words_in_line
+
+        with self.run_simulation(self.m) as sim:
+            self.start_bus(sim)
+            sim.add_testbench(process)
+
+    def test_mmio(self):
+        async def process(sim: TestbenchContext):
+            addr = self.word(self.mmio_base)
+            for _ in range(3):
+                resp = await self.load(sim, addr)
+                assert resp.data == self.bus_mem[addr]
+            assert self.bus_reads == [addr] * 3
+
+            await self.store(sim, addr + 1, 0xAB, sel=1)
+            assert self.bus_writes == [addr + 1]
+            assert self.bus_mem[addr + 1] & 0xFF == 0xAB
+
+        with self.run_simulation(self.m) as sim:
+            self.start_bus(sim)
+            sim.add_testbench(process)
+
+    def test_errors(self):
+        async def process(sim: TestbenchContext):
+            addr = self.word(0x2000)
+            self.bad_addrs.add(addr + self.cp.words_in_line - 1)
+
+            resp = await self.load(sim, addr)
+            assert resp.err
+
+            # The line is not cached after an error
+            reads = len(self.bus_reads)
+            resp = await self.store(sim, addr, 0)
+            assert resp.err
+            assert len(self.bus_reads) == reads + self.cp.words_in_line
+
+            self.bad_addrs.clear()
+            resp = await self.load(sim, addr)
+            assert not resp.err and resp.data == self.bus_mem[addr]
+
+        with self.run_simulation(self.m) as sim:
+            self.start_bus(sim)
+            sim.add_testbench(process)
+
+    def test_random(self):
+        cache_bytes = self.cp.num_of_ways * self.cp.num_of_sets * self.cp.line_size_bytes
+        addrs = [self.word(random.randrange(0x8000, 0x8000 + 4 * cache_bytes, self.word_bytes)) for _ in range(40)]
+        addrs += [self.word(self.mmio_base) + i for i in range(2)]
+
+        async def process(sim: TestbenchContext):
+            for _ in range(400):
+                addr = random.choice(addrs)
+                if random.random() < 0.5:
+                    data = random.randrange(2**self.isa_xlen)
+                    sel = random.randrange(1, 2**self.word_bytes)
+                    resp = await self.store(sim, addr, data, sel)
+                    assert not resp.err
+                    self.load_bus_mem(addr)
+                    self.ref_mem[addr] = self.apply_sel(self.ref_mem[addr], data, sel)
+                    if addr >= self.word(self.mmio_base):
+                        self.bus_mem[addr] = self.ref_mem[addr]
+                else:
+                    resp = await self.load(sim, addr)
+                    assert not resp.err
+                    self.load_bus_mem(addr)
+                    assert resp.data == self.ref_mem[addr]
+                await self.random_wait_geom(sim, 0.5)
+
+            await self.writeback(sim)
+            for addr, data in self.ref_mem.items():
+                assert self.bus_mem[addr] == data
+
+        with self.run_simulation(self.m) as sim:
+            self.start_bus(sim)
+            sim.add_testbench(process)
+
+    def test_overlapping_misses(self):
+        line_words = self.cp.words_in_line
+        set_words = self.cp.num_of_sets * line_words
+
+        async def process(sim: TestbenchContext):
+            addr = self.word(0x4000)
+            self.hold_responses = True
+
+            # Misses to the same line are merged, a miss in another set is refilled at the same time
+            # if there is a free MSHR.
+            await self.m.request_read.call(sim, addr=addr, sel=1)
+            await self.m.request_write.call(sim, addr=addr, data=0x55, sel=1)
+            await self.m.request_read.call(sim, addr=addr, sel=1)
+            await self.m.request_read.call(sim, addr=addr + line_words, sel=1)
+            await self.tick(sim, 16 * line_words)
+            overlapping = min(2, self.mshrs)
+            assert sorted(self.bus_reads) == list(range(addr, addr + overlapping * line_words))
+
+            self.hold_responses = False
+            resp = await self.m.get_read_response.call(sim)
+            assert resp.data == self.bus_mem[addr] and not resp.err
+            resp = await self.m.get_write_response.call(sim)
+            assert not resp.err
+            resp = await self.m.get_read_response.call(sim)
+            assert resp.data & 0xFF == 0x55
+            resp = await self.m.get_read_response.call(sim)
+            assert resp.data == self.bus_mem[addr + line_words]
+
+            # Hits are served while a line in another set is refilled. The line in the same set
+            # as the first one may evict it.
+            self.hold_responses = True
+            await self.m.request_read.call(sim, addr=addr + 2 * line_words, sel=1)
+            await self.m.request_read.call(sim, addr=addr + 1, sel=1)
+            await self.m.request_read.call(sim, addr=addr + set_words, sel=1)
+            await self.tick(sim, 16 * line_words)
+            assert len(self.bus_reads) == (2 + overlapping) * line_words
+
+            self.hold_responses = False
+            resp = await self.m.get_read_response.call(sim)
+            assert resp.data == self.bus_mem[addr + 2 * line_words]
+            resp = await self.m.get_read_response.call(sim)
+            assert resp.data == self.bus_mem[addr + 1]
+            resp = await self.m.get_read_response.call(sim)
+            assert resp.data == self.bus_mem[addr + set_words]
+
+        with self.run_simulation(self.m) as sim:
+            self.start_bus(sim)
+            sim.add_testbench(process)
+
+    def test_random_pipelined(self):
+        cache_bytes = self.cp.num_of_ways * self.cp.num_of_sets * self.cp.line_size_bytes
+        addrs = [self.word(random.randrange(0x8000, 0x8000 + 4 * cache_bytes, self.word_bytes)) for _ in range(40)]
+        addrs += [self.word(self.mmio_base) + i for i in range(2)]
+        expected: deque[tuple[bool, int]] = deque()
+        requests = 600
+
+        async def issue_process(sim: TestbenchContext):
+            for _ in range(requests):
+                addr = random.choice(addrs)
+                self.load_bus_mem(addr)
+                if random.random() < 0.5:
+                    data = random.randrange(2**self.isa_xlen)
+                    sel = random.randrange(1, 2**self.word_bytes)
+                    await self.m.request_write.call(sim, addr=addr, data=data, sel=sel)
+                    self.ref_mem[addr] = self.apply_sel(self.ref_mem[addr], data, sel)
+                    expected.append((True, 0))
+                else:
+                    await self.m.request_read.call(sim, addr=addr, sel=2**self.word_bytes - 1)
+                    expected.append((False, self.ref_mem[addr]))
+                await self.random_wait_geom(sim, 0.8)
+
+        async def response_process(sim: TestbenchContext):
+            for _ in range(requests):
+                while not expected:
+                    await sim.tick()
+                store, data = expected.popleft()
+                if store:
+                    resp = await self.m.get_write_response.call(sim)
+                else:
+                    resp = await self.m.get_read_response.call(sim)
+                    assert resp.data == data
+                assert not resp.err
+                await self.random_wait_geom(sim, 0.8)
+
+            await self.writeback(sim)
+            for addr, data in self.ref_mem.items():
+                assert self.bus_mem[addr] == data
+
+        with self.run_simulation(self.m) as sim:
+            self.start_bus(sim)
+            sim.add_testbench(issue_process)
+            sim.add_testbench(response_process)
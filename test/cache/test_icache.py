@@ -1,13 +1,14 @@
 from collections import deque
 from parameterized import parameterized_class
 import random
+from typing import Optional
 
 from amaranth import Elaboratable, Module
 from amaranth.utils import exact_log2
 
 from transactron.lib import AdapterTrans, Adapter
 from coreblocks.cache.icache import ICache, ICacheBypass, CacheRefillerInterface
-from coreblocks.params import GenParams
+from coreblocks.params import GenParams, ICacheReplacementPolicy
 from coreblocks.interface.layouts import ICacheLayouts
 from coreblocks.params import configurations
 from coreblocks.cache.refiller import SimpleCommonBusCacheRefiller
@@ -113,12 +114,15 @@ class TestSimpleCommonBusCacheRefiller(TestCaseWithSimulator):
     async def refiller_process(self, sim: TestbenchContext):
         while self.requests:
             req_addr = self.requests.pop()
-            await self.test_module.start_refill.call(sim, paddr=req_addr)
+            # The refill starts from the requested fetch block and wraps around the line
+            start_block = random.randrange(self.cp.fetch_blocks_in_line)
+            await self.test_module.start_refill.call(sim, paddr=req_addr + start_block * self.cp.fetch_block_bytes)
 
             for i in range(self.cp.fetch_blocks_in_line):
                 ret = await self.test_module.accept_refill.call(sim)
 
-                cur_addr = req_addr + i * self.cp.fetch_block_bytes
+                block = (start_block + i) % self.cp.fetch_blocks_in_line
+                cur_addr = req_addr + block * self.cp.fetch_block_bytes
 
                 assert ret["paddr"] == cur_addr
 
@@ -283,6 +287,7 @@ class ICacheTestCircuit(Elaboratable):
         m.submodules.issue_req = self.issue_req = TestbenchIO(AdapterTrans.create(self.cache.issue_req))
         m.submodules.accept_res = self.accept_res = TestbenchIO(AdapterTrans.create(self.cache.accept_res))
         m.submodules.flush_cache = self.flush_cache = TestbenchIO(AdapterTrans.create(self.cache.flush))
+        m.submodules.prefetch = self.prefetch = TestbenchIO(AdapterTrans.create(self.cache.prefetch))
 
         return m
 
@@ -306,7 +311,7 @@ class TestICache(TestCaseWithSimulator):
 
         self.mem = dict()
         self.bad_addrs = set()
-        self.bad_cache_lines = set()
+        self.bad_fetch_blocks = set()
         self.refill_requests = deque()
         self.refill_block_cnt = 0
         self.issued_requests = deque()
@@ -316,8 +321,10 @@ class TestICache(TestCaseWithSimulator):
         self.refill_in_fly = False
         self.refill_word_cnt = 0
         self.refill_addr = 0
+        # Number of blocks of a line returned by the refiller, before it stalls
+        self.refill_block_limit: Optional[int] = None
 
-    def init_module(self, ways, sets) -> None:
+    def init_module(self, ways, sets, policy=ICacheReplacementPolicy.ROUND_ROBIN, way_prediction=False) -> None:
         self.gen_params = GenParams(
             configurations.test.replace(
                 xlen=self.isa_xlen,
@@ -325,6 +332,8 @@ class TestICache(TestCaseWithSimulator):
                 icache_sets_bits=exact_log2(sets),
                 icache_line_bytes_log=self.line_size,
                 fetch_block_bytes_log=self.fetch_block,
+                icache_replacement_policy=policy,
+                icache_way_prediction=way_prediction,
             )
         )
         self.cp = self.gen_params.icache_params
@@ -332,6 +341,8 @@ class TestICache(TestCaseWithSimulator):
 
     @def_method_mock(lambda self: self.m.refiller.start_refill_mock, enable=lambda self: self.accept_refill_request)
     def start_refill_mock(self, paddr):
+        assert paddr % self.cp.fetch_block_bytes == 0
+
         @MethodMock.effect
         def eff():
             self.refill_requests.append(paddr)
@@ -340,11 +351,17 @@ class TestICache(TestCaseWithSimulator):
             self.refill_addr = paddr
 
     def enen(self):
-        return self.refill_in_fly
+        return self.refill_in_fly and (
+            self.refill_block_limit is None or self.refill_block_cnt < self.refill_block_limit
+        )
 
     @def_method_mock(lambda self: self.m.refiller.accept_refill_mock, enable=enen)
     def accept_refill_mock(self):
-        addr = self.refill_addr + self.refill_block_cnt * self.cp.fetch_block_bytes
+        # The refill starts from the requested fetch block and wraps around the line
+        line_addr = self.refill_addr & ~((1 << self.cp.offset_bits) - 1)
+        addr = line_addr + (self.refill_addr + self.refill_block_cnt * self.cp.fetch_block_bytes) % (
+            self.cp.line_size_bytes
+        )
 
         fetch_block = 0
         bad_addr = False
@@ -376,7 +393,7 @@ class TestICache(TestCaseWithSimulator):
 
     def add_bad_addr(self, addr: int):
         self.bad_addrs.add(addr)
-        self.bad_cache_lines.add(addr & ~((1 << self.cp.offset_bits) - 1))
+        self.bad_fetch_blocks.add(addr & ~(self.cp.fetch_block_bytes - 1))
 
     async def send_req(self, sim: TestbenchContext, addr: int):
         self.issued_requests.append(addr)
@@ -393,7 +410,8 @@ class TestICache(TestCaseWithSimulator):
     def assert_resp(self, resp: MethodData):
         addr = self.issued_requests.popleft() & ~(self.cp.fetch_block_bytes - 1)
 
-        if (addr & ~((1 << self.cp.offset_bits) - 1)) in self.bad_cache_lines:
+        # The requested fetch block is refilled first, so only its own errors are reported
+        if addr in self.bad_fetch_blocks:
             assert resp["error"]
         else:
             assert not resp["error"]
@@ -403,8 +421,13 @@ class TestICache(TestCaseWithSimulator):
 
             assert resp["fetch_block"] == fetch_block
 
+    async def prefetch(self, sim: TestbenchContext, addr: int):
+        await self.m.prefetch.call(sim, paddr=addr)
+        # Wait until the refill is finished
+        await self.tick(sim, self.cp.fetch_blocks_in_line + 4)
+
     def expect_refill(self, addr: int):
-        assert self.refill_requests.popleft() == addr
+        assert self.refill_requests.popleft() & ~((1 << self.cp.offset_bits) - 1) == addr
 
     async def call_cache(self, sim: TestbenchContext, addr: int):
         await self.send_req(sim, addr)
@@ -526,10 +549,9 @@ class TestICache(TestCaseWithSimulator):
 
             self.m.accept_res.enable(sim)
 
+            # The missed block is returned early, the hit is served after the rest of the line is refilled
+            await self.expect_resp(sim, wait=True)
             await self.expect_resp(sim, wait=True)
-            await self.expect_resp(
-                sim,
-            )
             self.m.accept_res.disable(sim)
 
             await self.tick(sim, 2)
@@ -598,6 +620,8 @@ class TestICache(TestCaseWithSimulator):
 
             await self.call_cache(sim, 0x00010000)
             self.expect_refill(0x00010000)
+            # Wait until the rest of the line is refilled
+            await self.tick(sim, self.cp.fetch_blocks_in_line)
 
             # Try to execute issue_req and flush_cache methods at the same time
             self.issued_requests.append(0x00010000)
@@ -648,6 +672,8 @@ class TestICache(TestCaseWithSimulator):
 
             await self.call_cache(sim, 0x00010008)
             self.expect_refill(0x00010000)
+            # Wait until the refill finishes with an error
+            await self.tick(sim, self.cp.fetch_blocks_in_line)
 
             # Requesting a bad addr again should retrigger refill
             await self.call_cache(sim, 0x00010008)
@@ -664,7 +690,7 @@ class TestICache(TestCaseWithSimulator):
             self.m.accept_res.disable(sim)
 
             # Schedule two requests, the first one causing an error
-            await self.send_req(sim, 0x00020000)
+            await self.send_req(sim, 0x00020008)
             await self.send_req(sim, 0x00011000)
 
             self.m.accept_res.enable(sim)
@@ -677,7 +703,7 @@ class TestICache(TestCaseWithSimulator):
 
             # Schedule two requests, the second one causing an error
             await self.send_req(sim, 0x00021004)
-            await self.send_req(sim, 0x00030000)
+            await self.send_req(sim, 0x00030000 + self.cp.line_size_bytes - self.cp.word_width_bytes)
 
             await self.tick(sim, 10)
 
@@ -690,7 +716,7 @@ class TestICache(TestCaseWithSimulator):
             await self.tick(sim, 3)
 
             # Schedule two requests, both causing an error
-            await self.send_req(sim, 0x00020000)
+            await self.send_req(sim, 0x00020008)
             await self.send_req(sim, 0x00010000)
 
             self.m.accept_res.enable(sim)
@@ -701,7 +727,7 @@ class TestICache(TestCaseWithSimulator):
 
             # The second request will cause an error
             await self.send_req(sim, 0x00021004)
-            await self.send_req(sim, 0x00030000)
+            await self.send_req(sim, 0x00030000 + self.cp.line_size_bytes - self.cp.word_width_bytes)
 
             await self.tick(sim, 10)
 
@@ -722,8 +748,195 @@ class TestICache(TestCaseWithSimulator):
         with self.run_simulation(self.m) as sim:
             sim.add_testbench(cache_process)
 
+    def test_critical_block_first(self):
+        self.init_module(1, 4)
+
+        async def cache_process(sim: TestbenchContext):
+            # The refill starts from the requested block, which is returned before the rest of the line
+            addr = 0x00010000 + self.cp.line_size_bytes - self.cp.fetch_block_bytes
+            await self.call_cache(sim, addr)
+            assert self.refill_requests.popleft() == addr
+            if self.cp.fetch_blocks_in_line > 2:
+                assert self.refill_in_fly
+
+            # The whole line is refilled
+            await self.tick(sim, self.cp.fetch_blocks_in_line)
+            for i in range(self.cp.fetch_blocks_in_line):
+                await self.call_cache(sim, 0x00010000 + i * self.cp.fetch_block_bytes)
+            assert len(self.refill_requests) == 0
+
+            # An error in another block doesn't affect the requested one, but the line is not stored
+            self.add_bad_addr(0x00020000)
+            await self.call_cache(sim, addr + 0x00010000)
+            self.expect_refill(0x00020000)
+            await self.tick(sim, self.cp.fetch_blocks_in_line)
+            await self.call_cache(sim, addr + 0x00010000)
+            self.expect_refill(0x00020000)
+
+        with self.run_simulation(self.m) as sim:
+            sim.add_testbench(cache_process)
+
+    def test_lru_replacement(self):
+        self.init_module(2, 4, ICacheReplacementPolicy.LRU)
+
+        async def cache_process(sim: TestbenchContext):
+            for addr in [0x00010000, 0x00020000, 0x00030000]:
+                await self.call_cache(sim, addr)
+                self.expect_refill(addr)
+                await self.tick(sim, self.cp.fetch_blocks_in_line)
+
+                # Keep the first line hot
+                await self.call_cache(sim, 0x00010000)
+
+            # The least recently used line was evicted
+            await self.call_cache(sim, 0x00010000)
+            await self.call_cache(sim, 0x00030000)
+            assert len(self.refill_requests) == 0
+
+            await self.call_cache(sim, 0x00020000)
+            self.expect_refill(0x00020000)
+
+        with self.run_simulation(self.m) as sim:
+            sim.add_testbench(cache_process)
+
+    def test_way_prediction(self):
+        self.init_module(4, 4, way_prediction=True)
+
+        async def cache_process(sim: TestbenchContext):
+            lines = [0x00010000 + i * 0x00010000 for i in range(4)]
+            for addr in lines:
+                await self.call_cache(sim, addr)
+                self.expect_refill(addr)
+                await self.tick(sim, self.cp.fetch_blocks_in_line)
+
+            # The way allocated last is predicted
+            last_line = lines[-1]
+            self.m.accept_res.enable(sim)
+            for addr in [lines[0], lines[0], lines[3], lines[3], lines[0]]:
+                await self.send_req(sim, addr)
+
+                # A request to another way than the last one is read again in the next cycle
+                if addr != last_line:
+                    *_, done = await self.m.accept_res.sample_outputs_done(sim)
+                    assert not done
+                await self.expect_resp(sim)
+                last_line = addr
+            self.m.accept_res.disable(sim)
+
+            for _ in range(100):
+                await self.call_cache(sim, random.choice(lines) + random.randrange(0, self.cp.line_size_bytes, 4))
+            assert len(self.refill_requests) == 0
+
+        with self.run_simulation(self.m) as sim:
+            sim.add_testbench(cache_process)
+
+    def test_hit_under_miss(self):
+        self.init_module(2, 4)
+
+        async def cache_process(sim: TestbenchContext):
+            await self.call_cache(sim, 0x00010000)
+            self.expect_refill(0x00010000)
+            await self.tick(sim, self.cp.fetch_blocks_in_line)
+
+            # Stall the refill after the requested block
+            self.refill_block_limit = 1
+            await self.call_cache(sim, 0x00020000)
+            self.expect_refill(0x00020000)
+
+            # Other lines can be hit during the refill
+            await self.call_cache(sim, 0x00010000)
+            await self.call_cache(sim, 0x00010000 + self.cp.line_size_bytes - self.cp.fetch_block_bytes)
+
+            # The blocks which already arrived are served from the fill buffer
+            await self.call_cache(sim, 0x00020000)
+            assert len(self.refill_requests) == 0
+
+            if self.cp.fetch_blocks_in_line > 1:
+                # A block which didn't arrive yet has to wait for the refill
+                await self.send_req(sim, 0x00020000 + self.cp.fetch_block_bytes)
+                self.m.accept_res.enable(sim)
+                for _ in range(4):
+                    *_, done = await self.m.accept_res.sample_outputs_done(sim)
+                    assert not done
+
+                self.refill_block_limit = None
+                await self.expect_resp(sim, wait=True)
+                self.m.accept_res.disable(sim)
+                await self.tick(sim, self.cp.fetch_blocks_in_line)
+
+            # A second miss is allocated a fill buffer and refilled after the first one
+            self.refill_block_limit = 1
+            await self.call_cache(sim, 0x00030000 + self.cp.line_size_bytes)
+            self.expect_refill(0x00030000 + self.cp.line_size_bytes)
+            await self.send_req(sim, 0x00040000 + 2 * self.cp.line_size_bytes)
+            await self.tick(sim, 4)
+            if self.cp.fetch_blocks_in_line > 1:
+                assert len(self.refill_requests) == 0
+
+            self.refill_block_limit = None
+            self.m.accept_res.enable(sim)
+            await self.expect_resp(sim, wait=True)
+            self.m.accept_res.disable(sim)
+            self.expect_refill(0x00040000 + 2 * self.cp.line_size_bytes)
+            await self.tick(sim, self.cp.fetch_blocks_in_line)
+
+            # Both lines are in the cache
+            await self.call_cache(sim, 0x00030000 + self.cp.line_size_bytes)
+            await self.call_cache(sim, 0x00040000 + 2 * self.cp.line_size_bytes)
+            assert len(self.refill_requests) == 0
+
+        with self.run_simulation(self.m) as sim:
+            sim.add_testbench(cache_process)
+
+    def test_prefetch(self):
+        self.init_module(2, 4)
+
+        async def cache_process(sim: TestbenchContext):
+            # A prefetched line is refilled in the background and hit by later requests
+            await self.prefetch(sim, 0x00010004)
+            self.expect_refill(0x00010000)
+            await self.call_cache(sim, 0x00010004)
+            assert len(self.refill_requests) == 0
+
+            # Lines already in the cache are not refilled
+            line_addr = 0x00020000 + self.cp.line_size_bytes
+            await self.call_cache(sim, line_addr)
+            self.expect_refill(line_addr)
+            await self.prefetch(sim, line_addr)
+            assert len(self.refill_requests) == 0
+
+            # Errors of prefetches are not reported
+            bad_line_addr = 0x00030000 + 2 * self.cp.line_size_bytes
+            self.add_bad_addr(bad_line_addr)
+            await self.prefetch(sim, bad_line_addr)
+            self.expect_refill(bad_line_addr)
+            await self.call_cache(sim, 0x00010000)
+            assert len(self.refill_requests) == 0
+
+            # And the line is refilled again when requested
+            await self.call_cache(sim, bad_line_addr)
+            self.expect_refill(bad_line_addr)
+
+            # A flush waits for the prefetch refill to finish
+            prefetch_addr = 0x00040000 + 3 * self.cp.line_size_bytes
+            await self.m.prefetch.call(sim, paddr=prefetch_addr)
+            await self.tick(sim, 1)
+            await self.m.flush_cache.call(sim)
+            self.expect_refill(prefetch_addr)
+            await self.call_cache(sim, 0x00010000)
+            self.expect_refill(0x00010000)
+
+        with self.run_simulation(self.m) as sim:
+            sim.add_testbench(cache_process)
+
     def test_random(self):
-        self.init_module(4, 8)
+        self.random_test(way_prediction=False)
+
+    def test_random_way_prediction(self):
+        self.random_test(way_prediction=True)
+
+    def random_test(self, way_prediction: bool):
+        self.init_module(4, 8, way_prediction=way_prediction)
 
         max_addr = 16 * self.cp.line_size_bytes * self.cp.num_of_sets
         iterations = 1000
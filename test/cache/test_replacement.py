@@ -0,0 +1,98 @@
+from parameterized import parameterized_class
+import random
+
+from coreblocks.cache.replacement import CacheReplacement
+from coreblocks.params import ICacheReplacementPolicy
+
+from transactron.testing import TestCaseWithSimulator, TestbenchContext
+
+
+class ReplacementModel:
+    def __init__(self, policy: ICacheReplacementPolicy, ways: int, sets: int):
+        self.policy = policy
+        self.ways = ways
+        self.round_robin = 0
+        # Ways ordered from the least recently used
+        self.lru = [list(range(ways)) for _ in range(sets)]
+        self.plru = [[0] * (ways - 1) for _ in range(sets)]
+
+    def touch(self, index: int, way: int):
+        if self.policy == ICacheReplacementPolicy.LRU:
+            self.lru[index].remove(way)
+            self.lru[index].append(way)
+        elif self.policy == ICacheReplacementPolicy.PLRU:
+            node = self.ways + way
+            while node > 1:
+                # Point towards the other half
+                self.plru[index][node // 2 - 1] = 1 - node % 2
+                node //= 2
+
+    def victim(self, index: int) -> int:
+        if self.ways == 1:
+            return 0
+        if self.policy == ICacheReplacementPolicy.LRU:
+            return self.lru[index][0]
+        if self.policy == ICacheReplacementPolicy.PLRU:
+            node = 1
+            while node < self.ways:
+                node = 2 * node + self.plru[index][node - 1]
+            return node - self.ways
+        return self.round_robin
+
+    def alloc(self, index: int):
+        way = self.victim(index)
+        self.touch(index, way)
+        self.round_robin = (self.round_robin + 1) % self.ways
+
+
+@parameterized_class(
+    ("name", "policy", "ways"),
+    [
+        ("round_robin_4", ICacheReplacementPolicy.ROUND_ROBIN, 4),
+        ("plru_2", ICacheReplacementPolicy.PLRU, 2),
+        ("plru_8", ICacheReplacementPolicy.PLRU, 8),
+        ("lru_1", ICacheReplacementPolicy.LRU, 1),
+        ("lru_4", ICacheReplacementPolicy.LRU, 4),
+        ("lru_6", ICacheReplacementPolicy.LRU, 6),
+    ],
+)
+class TestCacheReplacement(TestCaseWithSimulator):
+    policy: ICacheReplacementPolicy
+    ways: int
+
+    def test_random(self):
+        random.seed(42)
+        sets_bits = 2
+        sets = 2**sets_bits
+
+        m = CacheReplacement(self.policy, self.ways, sets_bits)
+        model = ReplacementModel(self.policy, self.ways, sets)
+
+        async def process(sim: TestbenchContext):
+            for _ in range(1000):
+                touch_en = random.random() < 0.7
+                touch_index = random.randrange(sets)
+                touch_way = random.randrange(self.ways)
+                alloc_en = random.random() < 0.3
+                victim_index = random.randrange(sets)
+
+                sim.set(m.touch_index, touch_index)
+                sim.set(m.touch_ways, 1 << touch_way)
+                sim.set(m.touch_en, touch_en)
+                sim.set(m.victim_index, victim_index)
+                sim.set(m.alloc_en, alloc_en)
+
+                # A hit in the same set is recorded before the victim is selected. A hit
+                # in another set is lost when a victim is allocated.
+                if touch_en and (not alloc_en or touch_index == victim_index):
+                    model.touch(touch_index, touch_way)
+
+                assert sim.get(m.victim) == 1 << model.victim(victim_index)
+
+                if alloc_en:
+                    model.alloc(victim_index)
+
+                await sim.tick()
+
+        with self.run_simulation(m) as sim:
+            sim.add_testbench(process)
@@ -0,0 +1,263 @@
+import pytest
+from collections import deque
+
+from transactron.testing import TestCaseWithSimulator, def_method_mock, SimpleTestCircuit, TestbenchContext
+from transactron.testing.method_mock import MethodMock
+
+from coreblocks.arch import CfiType
+from coreblocks.frontend.bpu.bpu import BranchPredictionUnit
+from coreblocks.params import GenParams, BPUType
+from coreblocks.params import configurations
+
+
+class TestBranchPredictionUnit(TestCaseWithSimulator):
+    @pytest.fixture(autouse=True, params=[BPUType.GSHARE, BPUType.TAGE])
+    def setup(self, request: pytest.FixtureRequest, fixture_initialize_testing_env):
+        self.core_config = configurations.test.replace(
+            fetch_block_bytes_log=3, btb_ways=2, btb_sets_bits=2, bpu_type=request.param, bpu_history_len=32
+        )
+        self.gen_params = GenParams(self.core_config)
+        self.predictions: deque = deque()
+        self.ghist = 0
+        self.ras_ptr = 0
+        self.provider = 0
+        self.loop_idx = 0
+
+        self.bpu = SimpleTestCircuit(BranchPredictionUnit(self.gen_params))
+
+    @def_method_mock(lambda self: self.bpu.write_prediction)
+    def write_prediction_mock(self, pc, ftq_ptr, prediction, meta):
+        @MethodMock.effect
+        def eff():
+            self.predictions.append((pc, prediction))
+            self.ghist = meta["ghist"]
+            self.ras_ptr = meta["ras_ptr"]
+            self.provider = meta["provider"]
+            self.loop_idx = meta["loop_idx"]
+
+    async def predict(self, sim: TestbenchContext, pc: int):
+        await self.bpu.request.call(sim, pc=pc, ftq_ptr={"ptr": 0, "parity": 0})
+        while not self.predictions:
+            await sim.tick()
+        return self.predictions.popleft()
+
+    async def update(
+        self,
+        sim: TestbenchContext,
+        pc: int,
+        taken: int,
+        cfi_type: CfiType,
+        cfi_target: int,
+        ghist: int = 0,
+        provider: int = 0,
+    ):
+        await self.bpu.update.call(
+            sim,
+            fb_addr=pc >> self.gen_params.fetch_block_bytes_log,
+            taken=taken,
+            cfi_idx=(pc % self.gen_params.fetch_block_bytes) >> self.gen_params.min_instr_width_bytes_log,
+            cfi_type=cfi_type,
+            cfi_target=cfi_target,
+            cfi_short=0,
+            ghist=ghist,
+            provider=provider,
+        )
+        # Let the update be written to the BTB
+        await sim.tick()
+
+    def test_btb(self):
+        fb_bytes = self.gen_params.fetch_block_bytes
+        sets = 2**self.gen_params.btb_sets_bits
+
+        async def proc(sim: TestbenchContext):
+            # Empty BTB predicts the next sequential fetch block
+            pc, prediction = await self.predict(sim, 0x100)
+            assert pc == 0x100 + fb_bytes
+            assert prediction.cfi_type == CfiType.INVALID
+
+            await self.update(sim, 0x100, 1, CfiType.JAL, 0x400)
+            pc, prediction = await self.predict(sim, 0x100)
+            assert pc == 0x400
+            assert prediction.cfi_type == CfiType.JAL
+            assert prediction.cfi_target == 0x400
+            assert prediction.cfi_target_valid
+
+            # Not taken branches are not allocated
+            await self.update(sim, 0x200, 0, CfiType.BRANCH, 0x300)
+            pc, prediction = await self.predict(sim, 0x200)
+            assert pc == 0x200 + fb_bytes
+            assert prediction.cfi_type == CfiType.INVALID
+
+            # Fill all ways of the set of 0x100 - the oldest entry gets evicted
+            conflicting = [0x100 + i * sets * fb_bytes for i in range(1, self.gen_params.btb_ways + 1)]
+            for i, addr in enumerate(conflicting):
+                await self.update(sim, addr, 1, CfiType.BRANCH, 0x800 + 4 * i)
+            for i, addr in enumerate(conflicting):
+                pc, prediction = await self.predict(sim, addr)
+                assert pc == 0x800 + 4 * i
+                assert prediction.cfi_type == CfiType.BRANCH
+
+            pc, _ = await self.predict(sim, 0x100)
+            assert pc == 0x100 + fb_bytes
+
+        with self.run_simulation(self.bpu) as sim:
+            sim.add_testbench(proc)
+
+    def test_cfi_before_fetch_start(self):
+        instr_width = self.gen_params.min_instr_width_bytes
+        fb_bytes = self.gen_params.fetch_block_bytes
+
+        async def proc(sim: TestbenchContext):
+            await self.update(sim, 0x100, 1, CfiType.JAL, 0x400)
+
+            # The JAL is located before the first fetched instruction
+            pc, prediction = await self.predict(sim, 0x100 + instr_width)
+            assert pc == 0x100 + fb_bytes
+            assert prediction.cfi_type == CfiType.INVALID
+
+            # ... and after it
+            await self.update(sim, 0x200 + instr_width, 1, CfiType.BRANCH, 0x400)
+            pc, prediction = await self.predict(sim, 0x200)
+            assert pc == 0x400
+            assert prediction.cfi_idx == 1
+
+        with self.run_simulation(self.bpu) as sim:
+            sim.add_testbench(proc)
+
+    def test_direction(self):
+        fb_bytes = self.gen_params.fetch_block_bytes
+        history_mask = 2**self.gen_params.bpu_history_len - 1
+
+        async def proc(sim: TestbenchContext):
+            await self.update(sim, 0x100, 1, CfiType.BRANCH, 0x400)
+
+            # Predicted taken - the history is shifted with each prediction of a branch
+            await self.bpu.restore.call(sim, ghist=0)
+            pc, prediction = await self.predict(sim, 0x100)
+            assert pc == 0x400
+            assert prediction.branch_mask == 1
+            pc, prediction = await self.predict(sim, 0x200)
+            assert self.ghist == 1
+
+            # Train the branch not taken with both histories it may be seen with
+            for _ in range(2):
+                await self.update(sim, 0x100, 0, CfiType.BRANCH, 0x400, ghist=0)
+                await self.update(sim, 0x100, 0, CfiType.BRANCH, 0x400, ghist=history_mask)
+
+            await self.bpu.restore.call(sim, ghist=history_mask)
+            pc, prediction = await self.predict(sim, 0x100)
+            assert pc == 0x100 + fb_bytes
+            assert prediction.cfi_type == CfiType.INVALID
+            # The branch is still marked, so that it is not predicted statically by the fetch unit
+            assert prediction.branch_mask == 1
+            assert self.ghist == history_mask
+
+            pc, prediction = await self.predict(sim, 0x200)
+            assert self.ghist == history_mask - 1
+
+        with self.run_simulation(self.bpu) as sim:
+            sim.add_testbench(proc)
+
+    def test_ras(self):
+        async def proc(sim: TestbenchContext):
+            await self.update(sim, 0x104, 1, CfiType.CALL, 0x400)
+            # The target of a return comes from the stack, not from the BTB
+            await self.update(sim, 0x400, 1, CfiType.RET, 0x1000)
+
+            pc, prediction = await self.predict(sim, 0x100)
+            assert pc == 0x400
+            pc, prediction = await self.predict(sim, 0x100)
+            assert pc == 0x400
+            ras_ptr = self.ras_ptr
+
+            for _ in range(2):
+                pc, prediction = await self.predict(sim, 0x400)
+                assert pc == 0x108
+                assert prediction.cfi_type == CfiType.RET
+                assert prediction.cfi_target == 0x108
+
+            # Restore the stack to the state before the second call
+            await self.bpu.restore.call(sim, ras_ptr=ras_ptr, ras_push=1, ret_addr=0x208)
+            pc, _ = await self.predict(sim, 0x400)
+            assert pc == 0x208
+            pc, _ = await self.predict(sim, 0x400)
+            assert pc == 0x108
+
+        with self.run_simulation(self.bpu) as sim:
+            sim.add_testbench(proc)
+
+    def test_indirect(self):
+        async def proc(sim: TestbenchContext):
+            # The same jump has different targets depending on the history
+            await self.update(sim, 0x200, 1, CfiType.JALR, 0x300, ghist=0)
+            await self.update(sim, 0x200, 1, CfiType.JALR, 0x500, ghist=1)
+
+            for ghist, target in [(0, 0x300), (1, 0x500), (0, 0x300)]:
+                await self.bpu.restore.call(sim, ghist=ghist)
+                pc, prediction = await self.predict(sim, 0x200)
+                assert pc == target
+                assert prediction.cfi_type == CfiType.JALR
+                assert prediction.cfi_target == target
+
+            # An unknown history falls back to the last target recorded in the BTB
+            await self.bpu.restore.call(sim, ghist=2)
+            pc, _ = await self.predict(sim, 0x200)
+            assert pc == 0x500
+
+        with self.run_simulation(self.bpu) as sim:
+            sim.add_testbench(proc)
+
+    def test_loop(self):
+        self.gen_params = GenParams(self.core_config.replace(loop_predictor_enable=True))
+        self.bpu = SimpleTestCircuit(BranchPredictionUnit(self.gen_params))
+
+        trip_count = 3
+
+        async def proc(sim: TestbenchContext):
+            # A backward branch taken three times before falling through
+            for _ in range(6):
+                for _ in range(trip_count):
+                    await self.update(sim, 0x118, 1, CfiType.BRANCH, 0x100)
+                await self.update(sim, 0x118, 0, CfiType.BRANCH, 0x100)
+
+            for _ in range(2):
+                for _ in range(trip_count):
+                    pc, _ = await self.predict(sim, 0x118)
+                    assert pc == 0x100
+                pc, _ = await self.predict(sim, 0x118)
+                assert pc == 0x120
+
+            # Restore the iteration count to the state before the last iteration
+            await self.bpu.restore.call(sim, loop_idx=self.loop_idx, loop_iter=trip_count - 1)
+            pc, _ = await self.predict(sim, 0x118)
+            assert pc == 0x100
+            pc, _ = await self.predict(sim, 0x118)
+            assert pc == 0x120
+
+        with self.run_simulation(self.bpu) as sim:
+            sim.add_testbench(proc)
+
+    def test_long_history(self):
+        if self.gen_params.bpu_type != BPUType.TAGE:
+            pytest.skip("only the TAGE predictor uses long histories")
+
+        fb_bytes = self.gen_params.fetch_block_bytes
+        # Only the table with the longest history sees the difference between the histories.
+        ghist_taken = 1 << (self.gen_params.tage_config.history_lengths[-2] + 1)
+        ghist_not_taken = 0
+
+        async def proc(sim: TestbenchContext):
+            for _ in range(8):
+                await self.update(sim, 0x100, 1, CfiType.BRANCH, 0x400, ghist=ghist_taken)
+                await self.update(sim, 0x100, 0, CfiType.BRANCH, 0x400, ghist=ghist_not_taken)
+
+            await self.bpu.restore.call(sim, ghist=ghist_taken)
+            pc, _ = await self.predict(sim, 0x100)
+            assert pc == 0x400
+
+            await self.bpu.restore.call(sim, ghist=ghist_not_taken)
+            pc, _ = await self.predict(sim, 0x100)
+            assert pc == 0x100 + fb_bytes
+
+        with self.run_simulation(self.bpu) as sim:
+            sim.add_testbench(proc)
@@ -36,16 +36,19 @@ class MockedICache(Elaboratable, CacheInterface):
 
         self.issue_req_io = TestbenchIO(Adapter(i=layouts.issue_req))
         self.accept_res_io = TestbenchIO(Adapter(o=layouts.accept_res))
+        self.prefetch_io = TestbenchIO(Adapter(i=layouts.issue_req))
 
         self.issue_req = self.issue_req_io.adapter.iface
         self.accept_res = self.accept_res_io.adapter.iface
         self.flush = Method()
+        self.prefetch = self.prefetch_io.adapter.iface
 
     def elaborate(self, platform):
         m = Module()
 
         m.submodules.issue_req_io = self.issue_req_io
         m.submodules.accept_res_io = self.accept_res_io
+        m.submodules.prefetch_io = self.prefetch_io
 
         return m
 
@@ -204,7 +207,7 @@ class TestFetchUnit(TestCaseWithSimulator):
         pass
 
     @def_method_mock(lambda self: self.fetch.fetch_writeback)
-    def fetch_writeback_mock(self, ftq_ptr, redirect, stall, cfi_idx, cfi_type, cfi_target):
+    def fetch_writeback_mock(self, ftq_ptr, redirect, stall, cfi_idx, cfi_type, cfi_target, ret_addr):
         # Mirror the FTQ: redirect to `cfi_target` when there is a known target,
         # otherwise stall until the backend resumes us
         @MethodMock.effect
@@ -10,7 +10,12 @@ from transactron.testing import (
 )
 from transactron.testing.method_mock import MethodMock
 
+from amaranth import *
+from transactron import *
+
+from coreblocks.arch import CfiType
 from coreblocks.frontend.ftq import FetchTargetQueue
+from coreblocks.frontend.bpu.bpu import BranchPredictionUnit
 from coreblocks.params import GenParams
 from coreblocks.params import configurations
 
@@ -23,6 +28,9 @@ class TestFetchTargetQueue(TestCaseWithSimulator):
         self.ifu_requests: deque = deque()
         self.bpu_requests: deque = deque()
         self.bpu_flush_count: int = 0
+        self.restored_history: list[int] = []
+        self.restored_ras: list[tuple[int, int, int]] = []
+        self.bpu_updates: list[dict] = []
 
         self.ftq = SimpleTestCircuit(FetchTargetQueue(self.gen_params))
 
@@ -36,27 +44,48 @@ class TestFetchTargetQueue(TestCaseWithSimulator):
         def eff():
             self.bpu_flush_count += 1
 
+    @def_method_mock(lambda self: self.ftq.bpu_update)
+    def bpu_update_mock(self, fb_addr, taken, cfi_idx, cfi_type, cfi_target, cfi_short, ghist, provider):
+        @MethodMock.effect
+        def eff():
+            self.bpu_updates.append({"fb_addr": fb_addr, "taken": taken, "ghist": ghist, "provider": provider})
+
+    @def_method_mock(lambda self: self.ftq.bpu_restore)
+    def bpu_restore_mock(self, ghist, ras_ptr, ras_push, ret_addr, loop_idx, loop_iter):
+        @MethodMock.effect
+        def eff():
+            self.restored_history.append(ghist)
+            self.restored_ras.append((ras_ptr, ras_push, ret_addr))
+
     @def_method_mock(lambda self: self.ftq.bpu_request)
     def bpu_request_mock(self, pc, ftq_ptr):
         @MethodMock.effect
         def eff():
-            self.bpu_requests.append(pc)
+            self.bpu_requests.append((pc, ftq_ptr))
 
     @def_method_mock(lambda self: self.ftq.ifu_request)
-    def ifu_request_mock(self, pc, ftq_ptr):
+    def ifu_request_mock(self, pc, ftq_ptr, prediction):
         @MethodMock.effect
         def eff():
-            self.ifu_requests.append({"pc": pc, "ftq_ptr": ftq_ptr["ptr"]})
+            self.ifu_requests.append({"pc": pc, "ftq_ptr": ftq_ptr["ptr"], "prediction": prediction})
 
     async def auto_bpu_process(self, sim: ProcessContext):
         """Responds to each BPU request by predicting PC+4 as the next PC."""
         while True:
             if self.bpu_requests:
-                pc = self.bpu_requests.popleft()
-                await self.ftq.bpu_response.call(sim, pc=pc + 4, ftq_ptr={"ptr": 0, "parity": 0})
+                pc, ftq_ptr = self.bpu_requests.popleft()
+                await self.ftq.bpu_response.call(sim, pc=pc + 4, ftq_ptr=ftq_ptr)
             else:
                 await sim.tick()
 
+    async def respond_to_bpu_request(self, sim: TestbenchContext, pc: int):
+        """Waits for a BPU request for the given PC and responds to it."""
+        while not any(req_pc == pc for req_pc, _ in self.bpu_requests):
+            await sim.tick()
+        ftq_ptr = next(ftq_ptr for req_pc, ftq_ptr in self.bpu_requests if req_pc == pc)
+        await self.ftq.bpu_response.call(sim, pc=pc + 4, ftq_ptr=ftq_ptr)
+        await sim.tick()
+
     def test_alloc_sends_ifu_request_with_start_pc(self):
         async def proc(sim: TestbenchContext):
             for _ in range(5):
@@ -84,6 +113,30 @@ class TestFetchTargetQueue(TestCaseWithSimulator):
             sim.add_process(self.auto_bpu_process)
             sim.add_testbench(proc)
 
+    def test_prediction_sent_with_ifu_request(self):
+        async def bpu_process(sim: ProcessContext):
+            while True:
+                if self.bpu_requests:
+                    pc, ftq_ptr = self.bpu_requests.popleft()
+                    prediction = {"cfi_idx": 0, "cfi_type": CfiType.JAL, "cfi_target": pc + 0x40, "cfi_target_valid": 1}
+                    await self.ftq.bpu_response.call(sim, pc=pc + 0x40, ftq_ptr=ftq_ptr, prediction=prediction)
+                else:
+                    await sim.tick()
+
+        async def proc(sim: TestbenchContext):
+            for _ in range(20):
+                await sim.tick()
+            assert len(self.ifu_requests) >= 3
+            for i in range(3):
+                req = self.ifu_requests[i]
+                assert req["pc"] == self.start_pc + 0x40 * i
+                assert req["prediction"]["cfi_type"] == CfiType.JAL
+                assert req["prediction"]["cfi_target"] == req["pc"] + 0x40
+
+        with self.run_simulation(self.ftq) as sim:
+            sim.add_process(bpu_process)
+            sim.add_testbench(proc)
+
     def test_ifu_writeback_triggers_bpu_flush(self):
         async def proc(sim: TestbenchContext):
             for _ in range(5):
@@ -98,9 +151,225 @@ class TestFetchTargetQueue(TestCaseWithSimulator):
             sim.add_process(self.auto_bpu_process)
             sim.add_testbench(proc)
 
+    def test_history_repair(self):
+        async def bpu_process(sim: ProcessContext):
+            while True:
+                if self.bpu_requests:
+                    pc, ftq_ptr = self.bpu_requests.popleft()
+                    # Each entry gets a distinct history
+                    await self.ftq.bpu_response.call(
+                        sim, pc=pc + 4, ftq_ptr=ftq_ptr, meta={"ghist": ftq_ptr["ptr"] + 0x10}
+                    )
+                else:
+                    await sim.tick()
+
+        async def proc(sim: TestbenchContext):
+            for _ in range(10):
+                await sim.tick()
+
+            # A taken branch redirected the fetch from entry 1
+            await self.ftq.ifu_writeback.call(
+                sim,
+                ftq_ptr={"ptr": 1, "parity": 0},
+                redirect=1,
+                stall=0,
+                cfi_idx=0,
+                cfi_type=CfiType.BRANCH,
+                cfi_target=0x200,
+            )
+            await sim.tick()
+            assert self.restored_history[-1] == ((0x11 << 1) | 1) & 0xFF
+
+            # A JAL doesn't change the history
+            await self.ftq.ifu_writeback.call(
+                sim,
+                ftq_ptr={"ptr": 2, "parity": 0},
+                redirect=1,
+                stall=0,
+                cfi_idx=0,
+                cfi_type=CfiType.JAL,
+                cfi_target=0x300,
+            )
+            await sim.tick()
+            assert self.restored_history[-1] == 0x12
+
+            # A branch in entry 2 was mispredicted as taken
+            await self.ftq.resolve.call(
+                sim,
+                ftq_ptr={"ptr": 2, "parity": 0},
+                from_pc=0x300,
+                misprediction=1,
+                taken=0,
+                cfi_idx=0,
+                cfi_type=CfiType.BRANCH,
+                cfi_target=0x400,
+            )
+            await self.ftq.backend_redirect.call(sim, ftq_ptr={"ptr": 2, "parity": 0}, pc=0x304)
+            await sim.tick()
+            assert self.restored_history[-1] == (0x12 << 1) & 0xFF
+
+        with self.run_simulation(self.ftq) as sim:
+            sim.add_process(bpu_process)
+            sim.add_testbench(proc)
+
+    def test_ras_repair(self):
+        async def bpu_process(sim: ProcessContext):
+            while True:
+                if self.bpu_requests:
+                    pc, ftq_ptr = self.bpu_requests.popleft()
+                    # Each entry gets a distinct return address stack pointer
+                    await self.ftq.bpu_response.call(
+                        sim, pc=pc + 4, ftq_ptr=ftq_ptr, meta={"ras_ptr": ftq_ptr["ptr"] + 2}
+                    )
+                else:
+                    await sim.tick()
+
+        async def proc(sim: TestbenchContext):
+            for _ in range(10):
+                await sim.tick()
+
+            # An undetected call redirected the fetch from entry 1 - its return address is pushed
+            await self.ftq.ifu_writeback.call(
+                sim,
+                ftq_ptr={"ptr": 1, "parity": 0},
+                redirect=1,
+                stall=0,
+                cfi_idx=0,
+                cfi_type=CfiType.CALL,
+                cfi_target=0x200,
+                ret_addr=0x108,
+            )
+            await sim.tick()
+            assert self.restored_ras[-1] == (3, 1, 0x108)
+
+            # An unpredicted return stalled the fetch at entry 2
+            await self.ftq.ifu_writeback.call(
+                sim,
+                ftq_ptr={"ptr": 2, "parity": 0},
+                redirect=0,
+                stall=1,
+                cfi_idx=0,
+                cfi_type=CfiType.RET,
+                cfi_target=0,
+            )
+            await sim.tick()
+            assert self.restored_ras[-1] == (4, 0, 0)
+
+            # The backend resolves the return and redirects the frontend after it
+            await self.ftq.resolve.call(
+                sim,
+                ftq_ptr={"ptr": 2, "parity": 0},
+                from_pc=0x200,
+                misprediction=1,
+                taken=1,
+                cfi_idx=0,
+                cfi_type=CfiType.RET,
+                cfi_target=0x108,
+            )
+            await self.ftq.backend_redirect.call(sim, ftq_ptr={"ptr": 2, "parity": 0}, pc=0x108)
+            await sim.tick()
+            assert self.restored_ras[-1] == (3, 0, 0x204)
+
+        with self.run_simulation(self.ftq) as sim:
+            sim.add_process(bpu_process)
+            sim.add_testbench(proc)
+
+    def test_resolve_updates_bpu_with_metadata(self):
+        async def bpu_process(sim: ProcessContext):
+            while True:
+                if self.bpu_requests:
+                    pc, ftq_ptr = self.bpu_requests.popleft()
+                    meta = {"ghist": ftq_ptr["ptr"] + 0x10, "provider": ftq_ptr["ptr"] % 2}
+                    await self.ftq.bpu_response.call(sim, pc=pc + 4, ftq_ptr=ftq_ptr, meta=meta)
+                else:
+                    await sim.tick()
+
+        async def proc(sim: TestbenchContext):
+            for _ in range(10):
+                await sim.tick()
+
+            # Resolved CFIs are queued, so that back-to-back resolves don't wait for the BPU
+            for ptr in [3, 2]:
+                await self.ftq.resolve.call(
+                    sim,
+                    ftq_ptr={"ptr": ptr, "parity": 0},
+                    from_pc=0x100 + 4 * ptr,
+                    misprediction=0,
+                    taken=1,
+                    cfi_idx=0,
+                    cfi_type=CfiType.BRANCH,
+                    cfi_target=0x400,
+                )
+            for _ in range(3):
+                await sim.tick()
+
+            fb_bytes_log = self.gen_params.fetch_block_bytes_log
+            assert self.bpu_updates == [
+                {"fb_addr": (0x100 + 4 * ptr) >> fb_bytes_log, "taken": 1, "ghist": ptr + 0x10, "provider": ptr % 2}
+                for ptr in [3, 2]
+            ]
+
+        with self.run_simulation(self.ftq) as sim:
+            sim.add_process(bpu_process)
+            sim.add_testbench(proc)
+
+    def test_loop_replay(self):
+        replay = False
+
+        async def bpu_process(sim: ProcessContext):
+            while True:
+                if self.bpu_requests and not replay:
+                    pc, ftq_ptr = self.bpu_requests.popleft()
+                    await self.ftq.bpu_response.call(
+                        sim, pc=pc + 4, ftq_ptr=ftq_ptr, meta={"ghist": ftq_ptr["ptr"] + 0x10}
+                    )
+                else:
+                    await sim.tick()
+
+        async def proc(sim: TestbenchContext):
+            nonlocal replay
+            for _ in range(6):
+                await sim.tick()
+            replay = True
+            await sim.tick()
+
+            # A loop of entries 1 and 2 is replayed after entry 2
+            await self.ftq.loop_replay_start.call(sim, ftq_ptr={"ptr": 2, "parity": 0})
+            self.bpu_requests.clear()
+            requests = len(self.ifu_requests)
+            for ptr in [3, 4, 5]:
+                ret = await self.ftq.loop_replay_alloc.call(
+                    sim, pc=0x100 + 4 * ptr, distance=2, taken=ptr % 2 == 0, cfi_idx=0, cfi_target=0x104
+                )
+                assert ret.ftq_ptr.ptr == ptr
+            for _ in range(3):
+                await sim.tick()
+            assert len(self.ifu_requests) == requests
+
+            # The replayed entries predict the loop branch
+            await self.ftq.jump_target_req.call(sim, ftq_ptr={"ptr": 4, "parity": 0})
+            resp = await self.ftq.jump_target_resp.call(sim)
+            assert resp.valid and resp.cfi_target == 0x104
+
+            # The BPU state is copied from the previous iteration
+            await self.ftq.backend_redirect.call(sim, ftq_ptr={"ptr": 5, "parity": 0}, pc=0x200)
+            await sim.tick()
+            assert self.restored_history[-1] == 0x11
+
+            # The fetch resumes after the redirect
+            replay = False
+            for _ in range(5):
+                await sim.tick()
+            assert self.ifu_requests[requests]["pc"] == 0x200
+            assert self.ifu_requests[requests]["ftq_ptr"] == 6
+
+        with self.run_simulation(self.ftq) as sim:
+            sim.add_process(bpu_process)
+            sim.add_testbench(proc)
+
     def test_ifu_writeback_restarts_fetch_from_new_pc(self):
         # ifu_writeback calls FAU.ifu_redirect which sets the new PC directly,
-        # so the next alloc uses redirect_pc without needing a BPU response.
+        # so the next alloc uses redirect_pc. The fetch request waits for its prediction.
         redirect_pc = 0x200
 
         async def proc(sim: TestbenchContext):
@@ -113,8 +382,7 @@ class TestFetchTargetQueue(TestCaseWithSimulator):
                 cfi_type=0,
                 cfi_target=redirect_pc,
             )
-            for _ in range(5):
-                await sim.tick()
+            await self.respond_to_bpu_request(sim, redirect_pc)
             assert redirect_pc in [req["pc"] for req in self.ifu_requests]
 
         with self.run_simulation(self.ftq) as sim:
@@ -126,8 +394,7 @@ class TestFetchTargetQueue(TestCaseWithSimulator):
 
         async def proc(sim: TestbenchContext):
             await self.ftq.backend_redirect.call(sim, pc=redirect_pc)
-            for _ in range(5):
-                await sim.tick()
+            await self.respond_to_bpu_request(sim, redirect_pc)
             assert redirect_pc in [req["pc"] for req in self.ifu_requests]
 
         with self.run_simulation(self.ftq) as sim:
@@ -153,14 +420,22 @@ class TestFetchTargetQueueFull(TestCaseWithSimulator):
     def bpu_flush_mock(self):
         pass
 
+    @def_method_mock(lambda self: self.ftq.bpu_update)
+    def bpu_update_mock(self, fb_addr, taken, cfi_idx, cfi_type, cfi_target, cfi_short, ghist, provider):
+        pass
+
+    @def_method_mock(lambda self: self.ftq.bpu_restore)
+    def bpu_restore_mock(self, ghist, ras_ptr, ras_push, ret_addr, loop_idx, loop_iter):
+        pass
+
     @def_method_mock(lambda self: self.ftq.bpu_request)
     def bpu_request_mock(self, pc, ftq_ptr):
         @MethodMock.effect
         def eff():
-            self.bpu_requests.append(pc)
+            self.bpu_requests.append((pc, ftq_ptr))
 
     @def_method_mock(lambda self: self.ftq.ifu_request)
-    def ifu_request_mock(self, pc, ftq_ptr):
+    def ifu_request_mock(self, pc, ftq_ptr, prediction):
         @MethodMock.effect
         def eff():
             self.ifu_requests.append(pc)
@@ -168,8 +443,8 @@ class TestFetchTargetQueueFull(TestCaseWithSimulator):
     async def auto_bpu_process(self, sim: ProcessContext):
         while True:
             if self.bpu_requests:
-                pc = self.bpu_requests.popleft()
-                await self.ftq.bpu_response.call(sim, pc=pc + 4, ftq_ptr={"ptr": 0, "parity": 0})
+                pc, ftq_ptr = self.bpu_requests.popleft()
+                await self.ftq.bpu_response.call(sim, pc=pc + 4, ftq_ptr=ftq_ptr)
             else:
                 await sim.tick()
 
@@ -199,3 +474,171 @@ class TestFetchTargetQueueFull(TestCaseWithSimulator):
         with self.run_simulation(self.ftq) as sim:
             sim.add_process(self.auto_bpu_process)
             sim.add_testbench(proc)
+
+
+class TestFetchTargetQueuePrefetch(TestCaseWithSimulator):
+    @pytest.fixture(autouse=True)
+    def setup(self, fixture_initialize_testing_env):
+        self.start_pc = 0x100
+        self.prefetch_distance = 2
+        self.gen_params = GenParams(
+            configurations.test.replace(start_pc=self.start_pc, icache_prefetch_distance=self.prefetch_distance)
+        )
+        self.ifu_requests: deque = deque()
+        self.ifu_prefetches: deque = deque()
+        self.bpu_requests: deque = deque()
+        self.ifu_enabled = False
+
+        self.ftq = SimpleTestCircuit(FetchTargetQueue(self.gen_params))
+
+    @def_method_mock(lambda self: self.ftq.stall_guard)
+    def stall_guard_mock(self):
+        pass
+
+    @def_method_mock(lambda self: self.ftq.bpu_flush)
+    def bpu_flush_mock(self):
+        pass
+
+    @def_method_mock(lambda self: self.ftq.bpu_update)
+    def bpu_update_mock(self, fb_addr, taken, cfi_idx, cfi_type, cfi_target, cfi_short, ghist, provider):
+        pass
+
+    @def_method_mock(lambda self: self.ftq.bpu_restore)
+    def bpu_restore_mock(self, ghist, ras_ptr, ras_push, ret_addr, loop_idx, loop_iter):
+        pass
+
+    @def_method_mock(lambda self: self.ftq.bpu_request)
+    def bpu_request_mock(self, pc, ftq_ptr):
+        @MethodMock.effect
+        def eff():
+            self.bpu_requests.append((pc, ftq_ptr))
+
+    @def_method_mock(lambda self: self.ftq.ifu_request, enable=lambda self: self.ifu_enabled)
+    def ifu_request_mock(self, pc, ftq_ptr, prediction):
+        @MethodMock.effect
+        def eff():
+            self.ifu_requests.append(pc)
+
+    @def_method_mock(lambda self: self.ftq.ifu_prefetch)
+    def ifu_prefetch_mock(self, pc):
+        @MethodMock.effect
+        def eff():
+            self.ifu_prefetches.append(pc)
+
+    async def auto_bpu_process(self, sim: ProcessContext):
+        while True:
+            if self.bpu_requests:
+                pc, ftq_ptr = self.bpu_requests.popleft()
+                await self.ftq.bpu_response.call(sim, pc=pc + 4, ftq_ptr=ftq_ptr)
+            else:
+                await sim.tick()
+
+    def test_prefetch_runs_ahead_of_fetch(self):
+        async def proc(sim: TestbenchContext):
+            # While the IFU is stalled, only the entries within the prefetch distance are prefetched
+            await self.tick(sim, 20)
+            assert list(self.ifu_prefetches) == [self.start_pc + 4 * i for i in range(self.prefetch_distance)]
+
+            self.ifu_enabled = True
+            await self.tick(sim, 10)
+            self.ifu_enabled = False
+            await self.tick(sim, 20)
+
+            # Prefetching continues from the first block not yet requested, without repeating blocks
+            next_pc = self.ifu_requests[-1] + 4
+            assert list(self.ifu_prefetches)[-self.prefetch_distance :] == [
+                next_pc + 4 * i for i in range(self.prefetch_distance)
+            ]
+            assert list(self.ifu_prefetches) == sorted(set(self.ifu_prefetches))
+
+        with self.run_simulation(self.ftq) as sim:
+            sim.add_process(self.auto_bpu_process)
+            sim.add_testbench(proc)
+
+
+class FetchTargetQueueWithBPU(Elaboratable):
+    """The FTQ connected to the BPU. The frontend is stalled until `start` is called."""
+
+    start: Provided[Method]
+    ifu_request: Required[Method]
+    bpu_update: Provided[Method]
+
+    def __init__(self, gen_params: GenParams):
+        self.ftq = FetchTargetQueue(gen_params)
+        self.bpu = BranchPredictionUnit(gen_params)
+
+        self.start = Method()
+        self.ifu_request = self.ftq.ifu_request
+        self.bpu_update = self.bpu.update
+
+    def elaborate(self, platform):
+        m = TModule()
+
+        m.submodules.ftq = self.ftq
+        m.submodules.bpu = self.bpu
+
+        running = Signal()
+
+        @def_method(m, self.start)
+        def _():
+            m.d.sync += running.eq(1)
+
+        stall_guard = Method()
+
+        @def_method(m, stall_guard, ready=running, nonexclusive=True)
+        def _():
+            pass
+
+        self.ftq.stall_guard.provide(stall_guard)
+        self.ftq.bpu_request.provide(self.bpu.request)
+        self.ftq.bpu_flush.provide(self.bpu.flush)
+        self.ftq.bpu_update.provide(self.bpu.update)
+        self.ftq.bpu_restore.provide(self.bpu.restore)
+        self.bpu.write_prediction.provide(self.ftq.bpu_response)
+
+        return m
+
+
+class TestFetchTargetQueueWithBPU(TestCaseWithSimulator):
+    @pytest.fixture(autouse=True)
+    def setup(self, fixture_initialize_testing_env):
+        self.start_pc = 0x100
+        self.gen_params = GenParams(configurations.test.replace(start_pc=self.start_pc))
+        self.cycle = 0
+        self.ifu_requests: list[tuple[int, int]] = []
+
+        self.dut = SimpleTestCircuit(FetchTargetQueueWithBPU(self.gen_params))
+
+    @def_method_mock(lambda self: self.dut.ifu_request)
+    def ifu_request_mock(self, pc, ftq_ptr, prediction):
+        @MethodMock.effect
+        def eff():
+            self.ifu_requests.append((self.cycle, pc))
+
+    def test_tight_loop_fetches_block_every_cycle(self):
+        async def proc(sim: TestbenchContext):
+            # A jump to itself
+            await self.dut.bpu_update.call(
+                sim,
+                fb_addr=self.start_pc >> self.gen_params.fetch_block_bytes_log,
+                taken=1,
+                cfi_idx=0,
+                cfi_type=CfiType.JAL,
+                cfi_target=self.start_pc,
+            )
+            for _ in range(2):
+                await sim.tick()
+
+            await self.dut.start.call(sim)
+            for self.cycle in range(40):
+                await sim.tick()
+
+            # Nothing is committed, so the queue fills up.
+            assert len(self.ifu_requests) == self.gen_params.ftq_size
+            assert all(pc == self.start_pc for _, pc in self.ifu_requests)
+            # The predicted target is fetched in the cycle following the jump.
+            cycles = [cycle for cycle, _ in self.ifu_requests]
+            assert cycles == list(range(cycles[0], cycles[0] + len(cycles)))
+
+        with self.run_simulation(self.dut) as sim:
+            sim.add_testbench(proc)
@@ -0,0 +1,216 @@
+import pytest
+from collections import deque
+from dataclasses import dataclass
+
+from transactron.testing import TestCaseWithSimulator, def_method_mock, SimpleTestCircuit, TestbenchContext
+from transactron.testing.method_mock import MethodMock
+
+from coreblocks.arch import CfiType
+from coreblocks.frontend.loop_buffer import LoopBuffer
+from coreblocks.params import GenParams
+from coreblocks.params import configurations
+
+ADDI = 0x00108093  # addi x1, x1, 1
+JAL = 0x0080006F  # jal x0, 8
+
+
+def bne(offset: int) -> int:
+    """Encodes `bne x1, x2, offset`."""
+    imm = offset & 0x1FFF
+    return (
+        ((imm >> 12) & 1) << 31
+        | ((imm >> 5) & 0x3F) << 25
+        | 2 << 20
+        | 1 << 15
+        | 1 << 12
+        | ((imm >> 1) & 0xF) << 8
+        | ((imm >> 11) & 1) << 7
+        | 0x63
+    )
+
+
+@dataclass
+class Instr:
+    pc: int
+    instr: int
+    cfi_type: CfiType = CfiType.INVALID
+
+
+class TestLoopBuffer(TestCaseWithSimulator):
+    @pytest.fixture(autouse=True)
+    def setup(self, fixture_initialize_testing_env):
+        self.gen_params = GenParams(
+            configurations.test.replace(frontend_superscalarity=4, fetch_block_bytes_log=3, loop_buffer_size=8)
+        )
+        self.width = self.gen_params.frontend_superscalarity
+
+        self.raw: deque = deque()
+        self.replay_starts: list[int] = []
+        self.allocs: list[dict] = []
+        self.next_alloc_ptr = 0
+        self.ftq_ptr = 0
+
+        self.lb = SimpleTestCircuit(LoopBuffer(self.gen_params))
+
+    def ftq_ptr_val(self, ptr: int) -> dict:
+        return {"ptr": ptr % self.gen_params.ftq_size, "parity": (ptr // self.gen_params.ftq_size) % 2}
+
+    def fetch(self, instrs: list[Instr]):
+        """Splits the instructions into groups like the fetch unit does. A new FTQ entry is started
+        for each fetch block and after a taken CFI."""
+        last_pc = None
+        group = []
+        for instr in instrs:
+            fb_bytes = self.gen_params.fetch_block_bytes
+            if last_pc is not None and (instr.pc // fb_bytes != last_pc // fb_bytes or instr.pc != last_pc + 4):
+                self.ftq_ptr += 1
+            last_pc = instr.pc
+            group.append(
+                {
+                    "instr": instr.instr,
+                    "pc": instr.pc,
+                    "access_fault": 0,
+                    "rvc": 0,
+                    "cfi_type": instr.cfi_type,
+                    "ftq_ptr": self.ftq_ptr,
+                    "ftq_offset": (instr.pc % fb_bytes) // self.gen_params.min_instr_width_bytes,
+                }
+            )
+            if len(group) == self.width or instr.cfi_type != CfiType.INVALID:
+                self.raw.append(group)
+                group = []
+        if group:
+            self.raw.append(group)
+        self.ftq_ptr += 1
+
+    def fetch_result(self, group: list[dict]) -> dict:
+        data = [instr | {"ftq_ptr": self.ftq_ptr_val(instr["ftq_ptr"])} for instr in group]
+        return {"count": len(group), "data": data + [data[0]] * (self.width - len(group))}
+
+    @def_method_mock(lambda self: self.lb.get_raw, enable=lambda self: bool(self.raw))
+    def get_raw_mock(self):
+        @MethodMock.effect
+        def eff():
+            self.raw.popleft()
+
+        return self.fetch_result(self.raw[0])
+
+    @def_method_mock(lambda self: self.lb.peek_raw, enable=lambda self: bool(self.raw))
+    def peek_raw_mock(self):
+        return self.fetch_result(self.raw[0])
+
+    @def_method_mock(lambda self: self.lb.clear_raw)
+    def clear_raw_mock(self):
+        @MethodMock.effect
+        def eff():
+            self.raw.clear()
+
+    @def_method_mock(lambda self: self.lb.fetch_flush)
+    def fetch_flush_mock(self):
+        pass
+
+    @def_method_mock(lambda self: self.lb.replay_start)
+    def replay_start_mock(self, ftq_ptr):
+        @MethodMock.effect
+        def eff():
+            self.replay_starts.append(ftq_ptr["ptr"])
+            self.next_alloc_ptr = ftq_ptr["ptr"] + 1
+
+    @def_method_mock(lambda self: self.lb.replay_alloc)
+    def replay_alloc_mock(self, pc, distance, taken, cfi_idx, cfi_target):
+        @MethodMock.effect
+        def eff():
+            self.allocs.append(
+                {"pc": pc, "distance": distance, "taken": taken, "cfi_idx": cfi_idx, "cfi_target": cfi_target}
+            )
+            self.next_alloc_ptr += 1
+
+        return {"ftq_ptr": self.ftq_ptr_val(self.next_alloc_ptr)}
+
+    async def read_instrs(self, sim: TestbenchContext, n: int) -> list[dict]:
+        instrs = []
+        while len(instrs) < n:
+            group = await self.lb.read.call(sim)
+            assert 0 < group.count <= self.width
+            instrs.extend(group.data[: group.count])
+        return instrs
+
+    def loop(self, start: int, body_len: int, extra: dict[int, Instr] = {}) -> list[Instr]:
+        """A loop of `body_len` instructions, with a backward branch at the end."""
+        instrs = [extra.get(i, Instr(start + 4 * i, ADDI)) for i in range(body_len - 1)]
+        branch_pc = start + 4 * (body_len - 1)
+        instrs.append(Instr(branch_pc, bne(start - branch_pc), CfiType.BRANCH))
+        return instrs
+
+    def test_replay(self):
+        start = 0x100
+        body_len = 6
+        iteration = self.loop(start, body_len)
+        branch_pc = iteration[-1].pc
+
+        self.fetch([Instr(0xF8, ADDI), Instr(0xFC, ADDI)] + iteration)
+        self.fetch(iteration)
+        branch_ftq_ptr = self.ftq_ptr - 1
+        self.fetch(iteration)
+        self.fetch(iteration)
+
+        async def proc(sim: TestbenchContext):
+            # The first two iterations are fetched
+            instrs = await self.read_instrs(sim, 2 + 2 * body_len)
+            assert [instr.pc for instr in instrs] == [0xF8, 0xFC] + [instr.pc for instr in iteration] * 2
+
+            # The next ones are replayed
+            instrs = await self.read_instrs(sim, 3 * body_len)
+            assert self.replay_starts == [branch_ftq_ptr]
+            assert not self.raw
+            assert [(instr.pc, instr.instr) for instr in instrs] == [(i.pc, i.instr) for i in iteration] * 3
+            for instr in instrs:
+                assert instr.ftq_offset == (instr.pc % 8) // 4
+
+            # The fetch blocks of each iteration are allocated in the FTQ
+            blocks = sorted({instr.pc // 8 for instr in iteration})
+            assert (
+                self.allocs
+                == [
+                    {"pc": max(block * 8, start), "distance": 3, "taken": block == blocks[-1], "cfi_idx": 1}
+                    | {"cfi_target": start}
+                    for block in blocks
+                ]
+                * 3
+            )
+            ftq_ptrs = [instr.ftq_ptr.ptr for instr in instrs]
+            assert ftq_ptrs == [
+                (branch_ftq_ptr + 1 + 3 * it + blocks.index(instr.pc // 8)) % self.gen_params.ftq_size
+                for it in range(3)
+                for instr in iteration
+            ]
+
+            # A flush ends the replay
+            await self.lb.flush.call(sim)
+            self.fetch([Instr(branch_pc + 4, ADDI), Instr(branch_pc + 8, ADDI)])
+            instrs = await self.read_instrs(sim, 2)
+            assert [instr.pc for instr in instrs] == [branch_pc + 4, branch_pc + 8]
+
+        with self.run_simulation(self.lb) as sim:
+            sim.add_testbench(proc)
+
+    def check_not_replayed(self, iteration: list[Instr]):
+        for _ in range(4):
+            self.fetch(iteration)
+
+        async def proc(sim: TestbenchContext):
+            instrs = await self.read_instrs(sim, 4 * len(iteration))
+            assert [instr.pc for instr in instrs] == [instr.pc for instr in iteration] * 4
+            assert not self.replay_starts
+
+        with self.run_simulation(self.lb) as sim:
+            sim.add_testbench(proc)
+
+    def test_loop_too_long(self):
+        self.check_not_replayed(self.loop(0x100, self.gen_params.loop_buffer_size + 1))
+
+    def test_taken_jump_in_loop(self):
+        iteration = self.loop(0x100, 6, {1: Instr(0x104, JAL, CfiType.JAL)})
+        # The jump skips an instruction
+        del iteration[2]
+        self.check_not_replayed(iteration)
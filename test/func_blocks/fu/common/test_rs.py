@@ -7,7 +7,7 @@ import itertools
 from transactron.testing import TestCaseWithSimulator, SimpleTestCircuit, TestbenchContext
 
 from coreblocks.func_blocks.fu.common.rs import RS, RSBase
-from coreblocks.func_blocks.fu.common.fifo_rs import FifoRS
+from coreblocks.func_blocks.fu.lsu.lsu_rs import LSURS
 from coreblocks.params import *
 from coreblocks.params import configurations
 from coreblocks.arch import OpType
@@ -54,7 +54,7 @@ def create_data_list(gen_params: GenParams, count: int, optypes: int = 1):
     "rs_type",
     [
         RS,
-        FifoRS,
+        LSURS,
     ],
 )
 @pytest.mark.parametrize("rs_ways", [1, 2])
@@ -4,6 +4,7 @@ from amaranth import *
 
 from transactron.lib import Adapter, AdapterTrans
 from transactron.utils import int_to_signed, signed_to_int
+from transactron.utils.amaranth_ext.elaboratables import ModuleConnector
 from transactron.utils.dependencies import DependencyContext
 from transactron.testing.method_mock import MethodMock
 from transactron.testing import CallTrigger, TestbenchIO, TestCaseWithSimulator, def_method_mock, TestbenchContext
@@ -11,9 +12,16 @@ from coreblocks.params import GenParams
 from coreblocks.func_blocks.fu.lsu.dummyLsu import LSUDummy
 from coreblocks.params import configurations
 from coreblocks.arch import *
-from coreblocks.interface.keys import CoreStateKey, CSRInstancesKey, ExceptionReportKey, SideFxGuardKey
+from coreblocks.interface.keys import (
+    CoreStateKey,
+    CSRInstancesKey,
+    ExceptionReportKey,
+    InstructionCommitKey,
+    ROBIndicesKey,
+    SideFxGuardKey,
+)
 from coreblocks.priv.csr.csr_instances import CSRInstances
-from coreblocks.interface.layouts import ExceptionRegisterLayouts, RetirementLayouts
+from coreblocks.interface.layouts import ExceptionRegisterLayouts, RetirementLayouts, ROBLayouts
 from ...peripherals.bus_mock import BusMockParameters, MockMasterAdapter
 
 
@@ -92,13 +100,22 @@ class DummyLSUTestCircuit(Elaboratable):
         m.submodules.core_state = self.core_state = TestbenchIO(Adapter(o=layouts.core_state, nonexclusive=True))
         DependencyContext.get().add_dependency(CoreStateKey(), self.core_state.adapter.iface)
 
+        m.submodules.rob_indices = self.rob_indices = TestbenchIO(
+            Adapter(o=self.gen.get(ROBLayouts).get_indices, nonexclusive=True)
+        )
+        DependencyContext.get().add_dependency(ROBIndicesKey(), self.rob_indices.adapter.iface)
+
         m.submodules.csr_instances = self.csr_instances = CSRInstances(self.gen)
         DependencyContext.get().add_dependency(CSRInstancesKey(), self.csr_instances)
 
-        m.submodules.func_unit = func_unit = LSUDummy(self.gen, self.bus_master_adapter)
+        m.submodules.func_unit = self.func_unit = func_unit = LSUDummy(self.gen, self.bus_master_adapter)
 
         m.submodules.issue_mock = self.issue = TestbenchIO(AdapterTrans.create(func_unit.issue))
         m.submodules.push_result_mock = self.push_result = TestbenchIO(Adapter.create(func_unit.push_result))
+
+        commit, commit_unifiers = DependencyContext.get().get_dependency(InstructionCommitKey())
+        m.submodules.commit_unifiers = ModuleConnector(*commit_unifiers)
+        m.submodules.commit = self.commit = TestbenchIO(AdapterTrans.create(commit))
         m.submodules.bus_master_adapter = self.bus_master_adapter
         return m
 
@@ -121,7 +138,7 @@ class TestDummyLSULoads(TestCaseWithSimulator):
             # generate new instructions till we generate correct one
             while True:
                 # generate opcode
-                (op, mask, signess) = generate_random_op(ops)
+                op, mask, signess = generate_random_op(ops)
                 # generate rp1, val1 which create addr
                 s1_val = generate_aligned_addr(max_reg_val)
                 imm = generate_imm(max_imm_val)
@@ -342,7 +359,7 @@ class TestDummyLSUStores(TestCaseWithSimulator):
         for i in range(self.tests_number):
             while True:
                 # generate opcode
-                (op, mask, _) = generate_random_op(ops)
+                op, mask, _ = generate_random_op(ops)
                 # generate address
                 s1_val = generate_aligned_addr(max_reg_val)
                 imm = generate_imm(max_imm_val)
@@ -420,6 +437,7 @@ class TestDummyLSUStores(TestCaseWithSimulator):
             assert v["rp_dst"] == 0
             await self.random_wait(sim, self.max_wait)
             self.side_fx_guard_data.pop()  # retire
+            await self.test_module.commit.call(sim, rob_id=rob_id, count=1)
 
     def side_fx_guard_validate(self, rob_id, require_done):
         return len(self.side_fx_guard_data) > 0 and rob_id == self.side_fx_guard_data[-1]
@@ -494,3 +512,158 @@ class TestDummyLSUFence(TestCaseWithSimulator):
 
         with self.run_simulation(self.test_module) as sim:
             sim.add_testbench(self.process)
+
+
+class TestDummyLSUStoreBuffer(TestCaseWithSimulator):
+    def get_instr(self, rob_id, exec_fn, addr, s2_val=0, pc=0):
+        return {"rp_dst": 1, "rob_id": rob_id, "exec_fn": exec_fn, "s1_val": addr, "s2_val": s2_val, "imm": 0, "pc": pc}
+
+    async def process(self, sim: TestbenchContext):
+        sw_fn = {"op_type": OpType.STORE, "funct3": Funct3.W, "funct7": 0}
+        sb_fn = {"op_type": OpType.STORE, "funct3": Funct3.B, "funct7": 0}
+        lbu_fn = {"op_type": OpType.LOAD, "funct3": Funct3.BU, "funct7": 0}
+        lw_fn = {"op_type": OpType.LOAD, "funct3": Funct3.W, "funct7": 0}
+
+        # stores are completed before they are written to memory
+        await self.test_module.issue.call(sim, self.get_instr(1, sw_fn, 0x10, 0x12345678))
+        assert (await self.test_module.push_result.call(sim)).rob_id == 1
+        await self.test_module.issue.call(sim, self.get_instr(2, sb_fn, 0x21, 0xAB))
+        assert (await self.test_module.push_result.call(sim)).rob_id == 2
+
+        # the loaded bytes are forwarded from the youngest store
+        await self.test_module.issue.call(sim, self.get_instr(3, lbu_fn, 0x12))
+        v = await self.test_module.push_result.call(sim)
+        assert v.rob_id == 3 and v.result == 0x34
+
+        # the load has to wait until the store writing only some of the loaded bytes is in memory
+        await self.test_module.issue.call(sim, self.get_instr(4, lw_fn, 0x20))
+        await self.tick(sim, 10)
+        assert not self.writes and not self.reads
+
+        for rob_id in range(1, 4):
+            await self.test_module.commit.call(sim, rob_id=rob_id, count=1)
+        v = await self.test_module.push_result.call(sim)
+        assert v.rob_id == 4 and v.result == 0xCAFE
+
+        assert self.writes == [(0x10 >> 2, 0x12345678, 0xF), (0x20 >> 2, 0xAB00, 0x2)]
+        assert self.reads == [0x20 >> 2]
+
+        # a fence ordering the writes waits until the committed stores are written to memory
+        fence_fn = {"op_type": OpType.FENCE, "funct3": 0, "funct7": 0}
+        await self.test_module.issue.call(sim, self.get_instr(5, sw_fn, 0x30, 0xDEADBEEF))
+        assert (await self.test_module.push_result.call(sim)).rob_id == 5
+        fence = self.get_instr(6, fence_fn, 0)
+        fence["imm"] = (FenceTarget.MEM_W << 4) | FenceTarget.MEM_R
+        await self.test_module.issue.call(sim, fence)
+        await self.tick(sim, 10)
+        assert len(self.writes) == 2
+
+        await self.test_module.commit.call(sim, rob_id=5, count=1)
+        assert (await self.test_module.push_result.call(sim)).rob_id == 6
+        assert self.writes[2:] == [(0x30 >> 2, 0xDEADBEEF, 0xF)]
+
+        # a load which has to wait, but isn't the oldest instruction, is replayed
+        await self.test_module.issue.call(sim, self.get_instr(7, sb_fn, 0x41, 0xCD))
+        assert (await self.test_module.push_result.call(sim)).rob_id == 7
+        self.rob_head = 7
+        await self.test_module.issue.call(sim, self.get_instr(0, lw_fn, 0x40))
+        v = await self.test_module.push_result.call(sim)
+        assert v.rob_id == 0 and v.exception
+        assert self.reports == [(0, ExceptionCause._COREBLOCKS_REPLAY)]
+        assert len(self.reads) == 1
+
+        # a load issued before the older stores is checked against them
+        self.rob_head = 1
+        take_speculative = self.test_module.func_unit.mem_dep_predictor.take_speculative
+        sim.set(take_speculative, 1)
+        await self.test_module.issue.call(sim, self.get_instr(3, lw_fn, 0x50, pc=0x100))
+        sim.set(take_speculative, 0)
+        v = await self.test_module.push_result.call(sim)
+        assert v.rob_id == 3 and not v.exception and v.result == 0xCAFE
+
+        await self.test_module.issue.call(sim, self.get_instr(1, sw_fn, 0x54, 0x1111))
+        v = await self.test_module.push_result.call(sim)
+        assert v.rob_id == 1 and not v.exception
+
+        # the store writing a byte read by the younger load is executed again
+        await self.test_module.issue.call(sim, self.get_instr(2, sb_fn, 0x52, 0xEF))
+        v = await self.test_module.push_result.call(sim)
+        assert v.rob_id == 2 and v.exception
+        assert self.reports[-1] == (2, ExceptionCause._COREBLOCKS_REPLAY)
+
+    def test_store_buffer(self):
+        self.gen_params = GenParams(configurations.test.replace(phys_regs_bits=3, rob_entries_bits=3))
+        self.test_module = DummyLSUTestCircuit(self.gen_params)
+        self.writes = []
+        self.reads = []
+        self.reports = []
+        self.rob_head = None
+
+        @def_method_mock(lambda: self.test_module.exception_report)
+        def exception_consumer(arg):
+            @MethodMock.effect
+            def eff():
+                self.reports.append((arg["rob_id"], arg["cause"]))
+
+        @def_method_mock(
+            lambda: self.test_module.side_fx_guard,
+            validate_arguments=lambda rob_id, require_done: self.rob_head is None or rob_id == self.rob_head,
+        )
+        def side_fx_guarder(rob_id, require_done):
+            return {}
+
+        @def_method_mock(lambda: self.test_module.core_state)
+        def core_state_process():
+            return {"flushing": 0}
+
+        @def_method_mock(lambda: self.test_module.rob_indices)
+        def rob_indices_process():
+            return {"start": self.rob_head or 0, "end": 0}
+
+        pending_writes = 0
+
+        @def_method_mock(lambda: self.test_module.bus_master_adapter.request_write_mock)
+        def request_write(addr, data, sel):
+            @MethodMock.effect
+            def eff():
+                nonlocal pending_writes
+                pending_writes += 1
+                self.writes.append((addr, data, sel))
+
+        @def_method_mock(
+            lambda: self.test_module.bus_master_adapter.get_write_response_mock, enable=lambda: pending_writes
+        )
+        def write_response():
+            @MethodMock.effect
+            def eff():
+                nonlocal pending_writes
+                pending_writes -= 1
+
+            return {"err": 0}
+
+        pending_read = False
+
+        @def_method_mock(
+            lambda: self.test_module.bus_master_adapter.request_read_mock,
+            enable=lambda: not pending_read,
+        )
+        def request_read(addr, sel):
+            @MethodMock.effect
+            def eff():
+                nonlocal pending_read
+                pending_read = True
+                self.reads.append(addr)
+
+        @def_method_mock(
+            lambda: self.test_module.bus_master_adapter.get_read_response_mock, enable=lambda: pending_read
+        )
+        def read_response():
+            @MethodMock.effect
+            def eff():
+                nonlocal pending_read
+                pending_read = False
+
+            return {"data": 0xCAFE, "err": 0}
+
+        with self.run_simulation(self.test_module) as sim:
+            sim.add_testbench(self.process)
@@ -0,0 +1,110 @@
+from amaranth import *
+from transactron.lib import AdapterTrans
+from transactron.testing import TestCaseWithSimulator, SimpleTestCircuit, TestbenchContext, TestbenchIO
+
+from coreblocks.func_blocks.fu.lsu.lsu_rs import LSURS
+from coreblocks.func_blocks.fu.lsu.mem_dep_predictor import MemoryDependencePredictor
+from coreblocks.params import GenParams
+from coreblocks.params import configurations
+from coreblocks.arch import OpType
+
+
+class LSURSTestCircuit(Elaboratable):
+    def __init__(self, gen_params: GenParams):
+        self.predictor = MemoryDependencePredictor(gen_params)
+        self.rs = SimpleTestCircuit(LSURS(gen_params, 4, 0))
+        self.train = TestbenchIO(AdapterTrans.create(self.predictor.train))
+
+    def elaborate(self, platform):
+        m = Module()
+
+        m.submodules.predictor = self.predictor
+        m.submodules.rs = self.rs
+        m.submodules.train = self.train
+
+        return m
+
+
+class TestLSURS(TestCaseWithSimulator):
+    def make_instr(self, rob_id: int, op_type: OpType, rp_s1: int = 0, pc: int = 0):
+        return {
+            "rp_s1": rp_s1,
+            "rp_s2": 0,
+            "rp_dst": 1,
+            "rob_id": rob_id,
+            "exec_fn": {"op_type": op_type, "funct3": 2, "funct7": 0},
+            "s1_val": 0,
+            "s2_val": 0,
+            "imm": 0,
+            "pc": pc,
+            "tag": 0,
+            "ftq_ptr": {"ptr": 0, "parity": 0},
+        }
+
+    async def insert(self, sim: TestbenchContext, instr: dict):
+        rs_entry_id = (await self.m.select.call(sim)).rs_entry_id
+        await self.m.insert.call(sim, rs_entry_id=rs_entry_id, rs_data=instr)
+
+    async def ready_list(self, sim: TestbenchContext) -> int:
+        res = await self.m.get_ready_list[0].call_try(sim)
+        return res.ready_list if res is not None else 0
+
+    async def take(self, sim: TestbenchContext, position: int) -> int:
+        return (await self.m.take.call(sim, rs_entry_id=position)).rob_id
+
+    async def process(self, sim: TestbenchContext):
+        await self.insert(sim, self.make_instr(1, OpType.LOAD, rp_s1=5))
+        await self.insert(sim, self.make_instr(2, OpType.LOAD))
+        await self.insert(sim, self.make_instr(3, OpType.STORE))
+        await self.insert(sim, self.make_instr(4, OpType.LOAD))
+
+        # the second load passes the first one, the store waits for the older loads,
+        # the last load waits for the store
+        assert await self.ready_list(sim) == 0b0010
+        assert await self.take(sim, 1) == 2
+        assert await self.ready_list(sim) == 0
+
+        await self.m.update[0].call(sim, reg_id=5, reg_val=0)
+        assert await self.ready_list(sim) == 0b001
+        assert await self.take(sim, 0) == 1
+        assert await self.ready_list(sim) == 0b01
+        assert await self.take(sim, 0) == 3
+        assert await self.ready_list(sim) == 0b1
+        assert await self.take(sim, 0) == 4
+
+    def test_order(self):
+        self.gen_params = GenParams(configurations.test)
+        self.m = SimpleTestCircuit(LSURS(self.gen_params, 4, 0))
+
+        with self.run_simulation(self.m) as sim:
+            sim.add_testbench(self.process)
+
+    async def speculation_process(self, sim: TestbenchContext):
+        speculate_ready = self.circ.predictor.speculate_ready
+        sim.set(speculate_ready, 1)
+        await self.circ.train.call(sim, pc=0x20)
+
+        await self.insert(sim, self.make_instr(1, OpType.STORE, rp_s1=5))
+        await self.insert(sim, self.make_instr(2, OpType.LOAD, pc=0x10))
+        await self.insert(sim, self.make_instr(3, OpType.LOAD, pc=0x20))
+
+        # the load predicted independent can pass the store, the other one waits
+        assert await self.ready_list(sim) == 0b010
+        sim.set(speculate_ready, 0)
+        assert await self.ready_list(sim) == 0
+        sim.set(speculate_ready, 1)
+        assert await self.take(sim, 1) == 2
+
+        await self.m.update[0].call(sim, reg_id=5, reg_val=0)
+        assert await self.ready_list(sim) == 0b01
+        assert await self.take(sim, 0) == 1
+        assert await self.ready_list(sim) == 0b1
+        assert await self.take(sim, 0) == 3
+
+    def test_speculation(self):
+        self.gen_params = GenParams(configurations.test)
+        self.circ = LSURSTestCircuit(self.gen_params)
+        self.m = self.circ.rs
+
+        with self.run_simulation(self.circ) as sim:
+            sim.add_testbench(self.speculation_process)
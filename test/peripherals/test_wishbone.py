@@ -313,20 +313,26 @@ class TestPipelinedWishboneMaster(TestCaseWithSimulator):
 
 
 class WishboneMemorySlaveCircuit(Elaboratable):
-    def __init__(self, wb_params: WishboneParameters, mem_args: dict):
+    def __init__(self, wb_params: WishboneParameters, mem_args: dict, pipelined: bool = False):
         self.wb_params = wb_params
         self.mem_args = mem_args
+        self.pipelined = pipelined
 
     def elaborate(self, platform):
         m = Module()
 
-        m.submodules.mem_slave = self.mem_slave = WishboneMemorySlave(self.wb_params, **self.mem_args)
-        m.submodules.mem_master = self.mem_master = WishboneMaster(self.wb_params)
+        m.submodules.mem_slave = self.mem_slave = WishboneMemorySlave(
+            self.wb_params, pipelined=self.pipelined, **self.mem_args
+        )
+        if self.pipelined:
+            m.submodules.mem_master = self.mem_master = PipelinedWishboneMaster(self.wb_params)
+            connect(m, self.mem_master.wb, self.mem_slave.bus)
+        else:
+            m.submodules.mem_master = self.mem_master = WishboneMaster(self.wb_params)
+            connect(m, self.mem_master.wb_master, self.mem_slave.bus)
         m.submodules.request = self.request = TestbenchIO(AdapterTrans.create(self.mem_master.request))
         m.submodules.result = self.result = TestbenchIO(AdapterTrans.create(self.mem_master.result))
 
-        connect(m, self.mem_master.wb_master, self.mem_slave.bus)
-
         return m
 
 
@@ -381,3 +387,78 @@ class TestWishboneMemorySlave(TestCaseWithSimulator):
         with self.run_simulation(self.m, max_cycles=3000) as sim:
             sim.add_testbench(request_process)
             sim.add_testbench(result_process)
+
+
+class TestPipelinedWishboneMemorySlave(TestCaseWithSimulator):
+    def setup_method(self):
+        self.memsize = 43
+        self.iters = 300
+
+        self.addr_width = (self.memsize - 1).bit_length()
+        self.wb_params = WishboneParameters(data_width=32, addr_width=self.addr_width, granularity=16)
+        self.m = WishboneMemorySlaveCircuit(
+            wb_params=self.wb_params, mem_args={"depth": self.memsize, "init": []}, pipelined=True
+        )
+
+        self.sel_width = self.wb_params.data_width // self.wb_params.granularity
+
+        random.seed(42)
+
+    def test_randomized(self):
+        res_queue = deque()
+
+        mem_state = [0] * self.memsize
+
+        async def request_process(sim: TestbenchContext):
+            for _ in range(self.iters):
+                req = {
+                    "addr": random.randint(0, self.memsize - 1),
+                    "data": random.randint(0, 2**self.wb_params.data_width - 1),
+                    "we": random.randint(0, 1),
+                    "sel": random.randint(0, 2**self.sel_width - 1),
+                }
+
+                # The requests are executed in order
+                if req["we"]:
+                    for i in range(self.sel_width):
+                        if req["sel"] & (1 << i):
+                            granularity_mask = (2**self.wb_params.granularity - 1) << (i * self.wb_params.granularity)
+                            mem_state[req["addr"]] &= ~granularity_mask
+                            mem_state[req["addr"]] |= req["data"] & granularity_mask
+                    res_queue.appendleft(None)
+                else:
+                    res_queue.appendleft(mem_state[req["addr"]])
+
+                await self.random_wait_geom(sim, 0.5)
+                await self.m.request.call(sim, req)
+
+        async def result_process(sim: TestbenchContext):
+            for _ in range(self.iters):
+                await self.random_wait_geom(sim, 0.5)
+                res = await self.m.result.call(sim)
+                expected = res_queue.pop()
+
+                assert not res["err"]
+                if expected is not None:
+                    assert res["data"] == expected
+
+        with self.run_simulation(self.m, max_cycles=3000) as sim:
+            sim.add_testbench(request_process)
+            sim.add_testbench(result_process)
+
+    def test_throughput(self):
+        # A request is accepted and a response returned in every cycle
+        async def request_process(sim: TestbenchContext):
+            for i in range(self.iters):
+                assert await self.m.request.call_try(sim, addr=i % self.memsize, data=0, we=0, sel=0) is not None
+
+        async def result_process(sim: TestbenchContext):
+            self.m.result.enable(sim)
+            await self.m.result.sample_outputs_until_done(sim)
+            for _ in range(self.iters - 1):
+                *_, done = await self.m.result.sample_outputs_done(sim)
+                assert done
+
+        with self.run_simulation(self.m) as sim:
+            sim.add_testbench(request_process)
+            sim.add_testbench(result_process)
@@ -46,10 +46,17 @@ class CoreTestElaboratable(Elaboratable):
         # Align the size of the memory to the length of a cache line.
         instr_mem_depth = align_to_power_of_two(len(self.instr_mem), self.gen_params.icache_params.line_bytes_log)
         self.wb_mem_slave = WishboneMemorySlave(
-            wb_params=self.gen_params.wb_params, shape=32, depth=instr_mem_depth, init=self.instr_mem
+            wb_params=self.gen_params.wb_params,
+            pipelined=self.gen_params.instr_bus_pipelined,
+            shape=32,
+            depth=instr_mem_depth,
+            init=self.instr_mem,
         )
+        data_mem_depth = len(self.data_mem)
+        if self.gen_params.dcache_params.enable:
+            data_mem_depth = align_to_power_of_two(data_mem_depth, self.gen_params.dcache_params.line_bytes_log)
         self.wb_mem_slave_data = WishboneMemorySlave(
-            wb_params=self.gen_params.wb_params, shape=32, depth=len(self.data_mem), init=self.data_mem
+            wb_params=self.gen_params.wb_params, shape=32, depth=data_mem_depth, init=self.data_mem
         )
 
         self.core = Core(gen_params=self.gen_params)
@@ -182,12 +189,52 @@ class TestCoreAsmSourceBase(TestCoreBase):
     ("name", "source_file", "cycle_count", "expected_regvals", "exit_csr", "configuration"),
     [
         ("fibonacci", "fibonacci.asm", 700, {2: 2971215073}, True, configurations.basic),
+        (
+            "fibonacci_pipelined_bus",
+            "fibonacci.asm",
+            700,
+            {2: 2971215073},
+            True,
+            configurations.basic.replace(instr_bus_pipelined=True),
+        ),
+        (
+            "fibonacci_loop_buffer",
+            "fibonacci.asm",
+            700,
+            {2: 2971215073},
+            True,
+            configurations.basic.replace(loop_buffer_size=8),
+        ),
         ("fibonacci_mem", "fibonacci_mem.asm", 400, {3: 55}, False, configurations.basic),
+        (
+            "fibonacci_mem_loop_buffer",
+            "fibonacci_mem.asm",
+            400,
+            {3: 55},
+            False,
+            configurations.full.replace(loop_buffer_size=16),
+        ),
         ("fibonacci_mem_tiny", "fibonacci_mem.asm", 250, {3: 55}, False, configurations.tiny),
+        (
+            "fibonacci_mem_dcache",
+            "fibonacci_mem.asm",
+            400,
+            {3: 55},
+            False,
+            configurations.basic.replace(dcache_enable=True),
+        ),
         ("csr", "csr.asm", 400, {1: 1, 2: 4}, True, configurations.full),
         ("csr_mmode", "csr_mmode.asm", 1000, {1: 0, 2: 44, 3: 0, 4: 0, 5: 0, 6: 4, 15: 0}, True, configurations.full),
         ("exception", "exception.asm", 200, {1: 1, 2: 2}, False, configurations.basic),
         ("exception_mem", "exception_mem.asm", 200, {1: 1, 2: 2}, False, configurations.basic),
+        (
+            "exception_mem_dcache",
+            "exception_mem.asm",
+            200,
+            {1: 1, 2: 2},
+            False,
+            configurations.basic.replace(dcache_enable=True),
+        ),
         ("exception_handler", "exception_handler.asm", 2000, {2: 987, 11: 0xAAAA, 15: 16}, False, configurations.full),
         ("wfi_no_int", "wfi_no_int.asm", 200, {1: 1}, False, configurations.full),
         ("mtval", "mtval.asm", 2000, {8: 5 * 8}, True, configurations.full),
@@ -197,6 +244,14 @@ class TestCoreAsmSourceBase(TestCoreBase):
         ("pmp_lsu", "pmp_lsu.asm", 1000, {1: 1}, True, configurations.full),
         ("smode_exception", "smode_exception.asm", 800, {5: 1, 6: 1, 7: 1, 8: 1}, False, configurations.full),
         ("sv32_translation", "sv32_translation.asm", 500, {9: 5, 10: 1}, True, configurations.full),
+        (
+            "sv32_translation_dcache",
+            "sv32_translation.asm",
+            500,
+            {9: 5, 10: 1},
+            True,
+            configurations.full.replace(dcache_enable=True),
+        ),
     ],
 )
 @pytest.mark.collection_order(1)